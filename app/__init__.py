@@ -22,7 +22,7 @@ from flask import Flask
 from app.config import get_config
 from app.extensions import db, migrate, login_manager, csrf, socketio, limiter, mail, cors
 
-# Scheduler global para expiración de operaciones
+# Scheduler global para expiración de operaciones (loop registrado en este proceso)
 _scheduler_greenlet = None
 
 
@@ -71,6 +71,18 @@ def create_app(config_name=None):
     # IMPORTANTE: Usar eventlet en lugar de APScheduler para compatibilidad con SocketIO
     start_operation_expiry_scheduler(app)
 
+    # Dispatcher del outbox transaccional (efectos de los cambios de estado)
+    from app.services.outbox import start_dispatcher
+    start_dispatcher(app)
+
+    # Cola de trabajo de operadores por Socket.IO (diffs + alertas de vencidas)
+    from app.services.operator_queue import start_queue
+    start_queue(app)
+
+    # Captura de consultas para flask index-advisor (solo con QUERY_CAPTURE_FILE)
+    from app.services.index_advisor import start_capture
+    start_capture(app)
+
     # Aplicar headers de seguridad HTTP en todas las respuestas
     from app.utils.security import configure_security_headers
     configure_security_headers(app)
@@ -951,6 +963,370 @@ def create_app(config_name=None):
     except Exception as e:
         logging.warning(f"[Migration] daily_closures apertura/cierre columns: {e}")
 
+    # Migración: marca de acumulador en daily_closures (ClosureAccumulator)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            db.session.execute(text(
+                "ALTER TABLE daily_closures ADD COLUMN IF NOT EXISTS accumulated_at TIMESTAMP WITHOUT TIME ZONE"
+            ))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] daily_closures.accumulated_at: {e}")
+
+    # Migración: checkpoints del ledger bancario (BalanceTimeline)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS bank_balance_checkpoints (
+                    id               SERIAL PRIMARY KEY,
+                    as_of            TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                    bank_key         VARCHAR(20) NOT NULL,
+                    currency         VARCHAR(3)  NOT NULL,
+                    balance          NUMERIC(15,2) NOT NULL DEFAULT 0,
+                    last_movement_id INTEGER NOT NULL DEFAULT 0,
+                    movements_count  INTEGER NOT NULL DEFAULT 0,
+                    created_at       TIMESTAMP WITHOUT TIME ZONE,
+                    CONSTRAINT uq_bbc_account_as_of UNIQUE (bank_key, currency, as_of)
+                )
+            """))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_bbc_account_as_of "
+                "ON bank_balance_checkpoints (bank_key, currency, as_of)"
+            ))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] bank_balance_checkpoints: {e}")
+
+    # Migración: saldos de cierre por cuenta y período (PeriodBalanceService)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS account_period_balances (
+                    id           SERIAL PRIMARY KEY,
+                    year         INTEGER NOT NULL,
+                    month        INTEGER NOT NULL,
+                    account_code VARCHAR(10) NOT NULL,
+                    debe         NUMERIC(18,2) NOT NULL DEFAULT 0,
+                    haber        NUMERIC(18,2) NOT NULL DEFAULT 0,
+                    debe_usd     NUMERIC(18,2) NOT NULL DEFAULT 0,
+                    haber_usd    NUMERIC(18,2) NOT NULL DEFAULT 0,
+                    computed_at  TIMESTAMP WITHOUT TIME ZONE,
+                    CONSTRAINT uq_apb_period_account UNIQUE (year, month, account_code)
+                )
+            """))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] account_period_balances: {e}")
+
+    # Migración: índices para filtros de período por rango (app.utils.periods)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            for sql in [
+                "CREATE INDEX IF NOT EXISTS ix_je_status_date ON journal_entries (status, entry_date)",
+                "CREATE INDEX IF NOT EXISTS ix_jel_account_entry ON journal_entry_lines (account_code, journal_entry_id)",
+                "CREATE INDEX IF NOT EXISTS ix_expense_records_expense_date ON expense_records (expense_date)",
+            ]:
+                db.session.execute(text(sql))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] period range indexes: {e}")
+
+    # Migración: cola de exportaciones en segundo plano (ExportJobService)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS export_jobs (
+                    id               VARCHAR(32) PRIMARY KEY,
+                    kind             VARCHAR(40) NOT NULL,
+                    params_json      TEXT DEFAULT '{}',
+                    params_hash      VARCHAR(64) NOT NULL,
+                    status           VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+                    requested_by     INTEGER REFERENCES users(id),
+                    subscribers_json TEXT DEFAULT '[]',
+                    filename         VARCHAR(200),
+                    file_path        VARCHAR(500),
+                    size_bytes       INTEGER,
+                    error            TEXT,
+                    created_at       TIMESTAMP WITHOUT TIME ZONE,
+                    started_at       TIMESTAMP WITHOUT TIME ZONE,
+                    finished_at      TIMESTAMP WITHOUT TIME ZONE,
+                    expires_at       TIMESTAMP WITHOUT TIME ZONE
+                )
+            """))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_export_jobs_hash_status ON export_jobs (params_hash, status)"
+            ))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] export_jobs: {e}")
+
+    # Migración: tiempos por módulo del AuditEngine (AuditReport.timings)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            db.session.execute(text(
+                "ALTER TABLE audit_reports ADD COLUMN IF NOT EXISTS timings_json TEXT DEFAULT '{}'"
+            ))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] audit_reports.timings_json: {e}")
+
+    # Migración: estado de la auditoría incremental (AuditReport.incremental_json)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            db.session.execute(text(
+                "ALTER TABLE audit_reports ADD COLUMN IF NOT EXISTS incremental_json TEXT"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_je_annulled_at ON journal_entries (annulled_at) "
+                "WHERE status = 'anulado'"
+            ))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] audit_reports.incremental_json: {e}")
+
+    # Migración: cronograma de depreciación precalculado (DepreciationSchedule)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS depreciation_schedule (
+                    id               SERIAL PRIMARY KEY,
+                    asset_id         INTEGER NOT NULL REFERENCES fixed_assets(id) ON DELETE CASCADE,
+                    year             INTEGER NOT NULL,
+                    month            INTEGER NOT NULL,
+                    deprec_account   VARCHAR(10) NOT NULL,
+                    amount           NUMERIC(18, 2) NOT NULL,
+                    accumulated      NUMERIC(18, 2) NOT NULL,
+                    net_book_value   NUMERIC(18, 2) NOT NULL,
+                    journal_entry_id INTEGER REFERENCES journal_entries(id),
+                    posted_at        TIMESTAMP WITHOUT TIME ZONE,
+                    CONSTRAINT uq_depreciation_schedule_asset_month UNIQUE (asset_id, year, month)
+                )
+            """))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_depreciation_schedule_period "
+                "ON depreciation_schedule (year, month)"
+            ))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] depreciation_schedule: {e}")
+
+    # Migración: totales por período y prefijo PCGE (AccountTotalsService)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS account_period_totals (
+                    id         SERIAL PRIMARY KEY,
+                    year       INTEGER NOT NULL,
+                    month      INTEGER NOT NULL,
+                    entry_type VARCHAR(30) NOT NULL DEFAULT '',
+                    prefix     VARCHAR(20) NOT NULL,
+                    is_account BOOLEAN NOT NULL DEFAULT FALSE,
+                    debe       NUMERIC(18, 2) NOT NULL DEFAULT 0,
+                    haber      NUMERIC(18, 2) NOT NULL DEFAULT 0,
+                    CONSTRAINT uq_apt_period_type_prefix UNIQUE (year, month, entry_type, prefix, is_account)
+                )
+            """))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_apt_prefix_period "
+                "ON account_period_totals (prefix, is_account, year, month)"
+            ))
+            db.session.execute(text(
+                "ALTER TABLE accounting_periods ADD COLUMN IF NOT EXISTS totals_built_at TIMESTAMP WITHOUT TIME ZONE"
+            ))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] account_period_totals: {e}")
+
+    # Migración: índices del historial paginado de operaciones
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_operations_created_id ON operations (created_at, id)"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_operations_client_created_id "
+                "ON operations (client_id, created_at, id)"
+            ))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] operations_history_indexes: {e}")
+
+    # Migración: tablas hijas de operaciones (abonos, pagos, comprobantes, logs)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            _child_columns = {
+                'operation_deposits': """
+                    amount       NUMERIC(15, 2) NOT NULL DEFAULT 0,
+                    qc_bank      VARCHAR(50),
+                    account      VARCHAR(200),
+                    bank_key     VARCHAR(20) NOT NULL DEFAULT '',
+                    external     BOOLEAN NOT NULL DEFAULT FALSE,
+                    reference    VARCHAR(100),""",
+                'operation_payments': """
+                    amount       NUMERIC(15, 2) NOT NULL DEFAULT 0,
+                    qc_bank      VARCHAR(50),
+                    account      VARCHAR(200),
+                    bank_key     VARCHAR(20) NOT NULL DEFAULT '',
+                    external     BOOLEAN NOT NULL DEFAULT FALSE,""",
+                'operation_proofs': """
+                    url          VARCHAR(500),
+                    comment      TEXT,""",
+                'operation_logs': """
+                    logged_at    TIMESTAMP WITHOUT TIME ZONE,
+                    user_id      INTEGER,
+                    field        VARCHAR(100),""",
+            }
+            for _table, _columns in _child_columns.items():
+                db.session.execute(text(f"""
+                    CREATE TABLE IF NOT EXISTS {_table} (
+                        id           SERIAL PRIMARY KEY,
+                        operation_id INTEGER NOT NULL REFERENCES operations(id) ON DELETE CASCADE,
+                        position     INTEGER NOT NULL,{_columns}
+                        data         TEXT NOT NULL DEFAULT '{{}}'
+                    )
+                """))
+                db.session.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{_table}_operation_id ON {_table} (operation_id)"
+                ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_operation_deposits_bank ON operation_deposits (bank_key, operation_id)"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_operation_payments_bank ON operation_payments (bank_key, operation_id)"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_operation_logs_user ON operation_logs (user_id, logged_at)"
+            ))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] operation_child_tables: {e}")
+
+    # Migración: secuencia de códigos de operación EXP-NNNN (operation_codes)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from app.utils.operation_codes import ensure_sequence
+            ensure_sequence(db.session.connection())
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] operation_code_seq: {e}")
+
+    # Migración: leases de schedulers entre workers (scheduler_coordinator)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS scheduler_leases (
+                    job         VARCHAR(80) PRIMARY KEY,
+                    holder      VARCHAR(120) NOT NULL,
+                    acquired_at TIMESTAMP NOT NULL,
+                    renewed_at  TIMESTAMP NOT NULL,
+                    expires_at  TIMESTAMP NOT NULL
+                )
+            """))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] scheduler_leases: {e}")
+
+    # Migración: índice de la asignación balanceada de operadores
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_operations_operator_id "
+                "ON operations (assigned_operator_id, id)"
+            ))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] operations_operator_index: {e}")
+
+    # Migración: outbox transaccional de efectos (outbox_events)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS outbox_events (
+                    id              SERIAL PRIMARY KEY,
+                    topic           VARCHAR(60) NOT NULL,
+                    idempotency_key VARCHAR(160) NOT NULL UNIQUE,
+                    group_key       VARCHAR(80) NOT NULL,
+                    operation_id    INTEGER REFERENCES operations(id) ON DELETE CASCADE,
+                    payload_json    TEXT NOT NULL DEFAULT '{}',
+                    status          VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+                    attempts        INTEGER NOT NULL DEFAULT 0,
+                    available_at    TIMESTAMP NOT NULL,
+                    locked_at       TIMESTAMP,
+                    last_error      TEXT,
+                    created_at      TIMESTAMP NOT NULL,
+                    processed_at    TIMESTAMP
+                )
+            """))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_outbox_events_status_available ON outbox_events (status, available_at)"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_outbox_events_group ON outbox_events (group_key, id)"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_outbox_events_operation_id ON outbox_events (operation_id)"
+            ))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] outbox_events: {e}")
+
+    # Migración: índices compuestos/parciales de operations (derivados del código, sin medir)
+    try:
+        with app.app_context():
+            from app.extensions import db
+            from sqlalchemy import text
+            for ddl in (
+                "CREATE INDEX IF NOT EXISTS ix_operations_status_created_at ON operations (status, created_at)",
+                "CREATE INDEX IF NOT EXISTS ix_operations_client_id_status ON operations (client_id, status)",
+                "CREATE INDEX IF NOT EXISTS ix_operations_assigned_operator_id_status "
+                "ON operations (assigned_operator_id, status)",
+                "CREATE INDEX IF NOT EXISTS ix_operations_status_completed_at ON operations (status, completed_at)",
+                "CREATE INDEX IF NOT EXISTS ix_operations_origen_created_at_activas ON operations (origen, created_at) "
+                "WHERE status IN ('Pendiente', 'En proceso')",
+            ):
+                db.session.execute(text(ddl))
+            db.session.commit()
+    except Exception as e:
+        logging.warning(f"[Migration] operations_access_indexes: {e}")
+
+    # Backfill inicial de las tablas hijas desde los *_json, en segundo plano y
+    # en un solo worker (lease en scheduler_leases); también por CLI:
+    # flask backfill-operation-children
+    try:
+        from app.services.operation_children import start_backfill
+        start_backfill(app)
+    except Exception as e:
+        logging.warning(f"[Migration] operation_children_backfill: {e}")
+
     # Sembrar competidores FX (idempotente — solo inserta si no existen)
     try:
         with app.app_context():
@@ -1179,6 +1555,8 @@ def register_blueprints(app):
     app.register_blueprint(treasury_bp, url_prefix='/treasury')  # Tesorería
     from app.routes.ai import ai_bp
     app.register_blueprint(ai_bp)                                # Agentes IA: /ai/*
+    from app.routes.exports import exports_bp
+    app.register_blueprint(exports_bp)                           # Exportaciones en segundo plano: /exports/*
 
     # agentes_bp desactivado — panel de Agentes IA removido del sistema
 
@@ -1365,11 +1743,16 @@ def register_shell_context(app):
 
 def start_operation_expiry_scheduler(app):
     """
-    Iniciar scheduler de expiración de operaciones usando eventlet
-    Se ejecuta en un greenlet separado cada 60 segundos
+    Iniciar scheduler de expiración de operaciones usando eventlet.
+
+    La expiración por tiempo límite corre en el motor por deadline
+    (OperationExpiryService.start_engine), que despierta al vencer cada
+    operación. Este greenlet conserva los jobs de cada 60 segundos: cierre
+    diario 10pm, sesiones del bot y exportaciones vencidas.
 
-    IMPORTANTE: Solo se inicia UNA vez globalmente, incluso si gunicorn
-    tiene múltiples workers. Usamos una variable global para evitar duplicados.
+    IMPORTANTE: Ambos loops son jobs del coordinador (scheduler_coordinator):
+    aunque gunicorn tenga múltiples workers, solo uno los corre a la vez.
+    La variable global evita registrarlos dos veces en el mismo proceso.
     """
     global _scheduler_greenlet
 
@@ -1379,22 +1762,23 @@ def start_operation_expiry_scheduler(app):
         return
 
     def scheduler_loop():
-        """Loop infinito que expira operaciones cada 60 segundos"""
+        """Loop infinito de jobs periódicos cada 60 segundos"""
         logging.info("[SCHEDULER] ✅ Scheduler de expiración de operaciones iniciado")
 
         while True:
             try:
                 with app.app_context():
                     from app.services.operation_expiry_service import OperationExpiryService
-                    expired_count = OperationExpiryService.expire_old_operations()
-                    if expired_count > 0:
-                        logging.info(f"[SCHEDULER] ⏱️ {expired_count} operaciones canceladas automáticamente")
                     eod_count = OperationExpiryService.cancel_end_of_day_operations()
                     if eod_count > 0:
                         logging.info(f"[SCHEDULER] 🌙 {eod_count} operaciones canceladas por cierre 10pm")
                     session_count = OperationExpiryService.expire_inactive_bot_sessions()
                     if session_count > 0:
                         logging.info(f"[SCHEDULER] 🔒 {session_count} sesiones bot cerradas por inactividad")
+                    from app.services.export_jobs import ExportJobService
+                    purged = ExportJobService.purge_expired()
+                    if purged > 0:
+                        logging.info(f"[SCHEDULER] 🗑️ {purged} exportaciones vencidas eliminadas")
             except Exception as e:
                 logging.error(f"[SCHEDULER] ❌ Error en scheduler de expiración: {str(e)}")
                 import traceback
@@ -1403,15 +1787,25 @@ def start_operation_expiry_scheduler(app):
             # Esperar 60 segundos antes de la próxima verificación
             eventlet.sleep(60)
 
-    # Iniciar el scheduler en un greenlet separado
-    _scheduler_greenlet = eventlet.spawn(scheduler_loop)
-    logging.info("[SCHEDULER] 🚀 Greenlet de scheduler spawneado")
+    # Motor de expiración por deadline (despierta al vencer cada operación)
+    from app.services.operation_expiry_service import OperationExpiryService
+    OperationExpiryService.start_engine(app)
+
+    # Iniciar el scheduler como job único entre workers
+    from app.services.scheduler_coordinator import run_singleton
+    _scheduler_greenlet = scheduler_loop  # marca: ya registrado en este proceso
+    run_singleton(app, 'operation_jobs', scheduler_loop)
+    logging.info("[SCHEDULER] 🚀 Scheduler registrado en el coordinador")
 
 
 def start_market_schedulers(app):
-    """Iniciar greenlets para jobs del módulo Mercado (precios, noticias, macro, fx_monitor)"""
+    """
+    Iniciar greenlets para jobs del módulo Mercado (precios, noticias, macro, fx_monitor).
+    Cada loop es un job del coordinador: corre en un solo worker a la vez.
+    """
+    from app.services.scheduler_coordinator import run_singleton
 
-    def _run_every(interval_sec, job_name, fn):
+    def _run_every(interval_sec, job, job_name, fn):
         def loop():
             logging.info(f"[MARKET] ✅ {job_name} iniciado (cada {interval_sec//60} min)")
             eventlet.sleep(30)  # pequeño delay al arrancar para no saturar el inicio
@@ -1430,7 +1824,7 @@ def start_market_schedulers(app):
                 import gc
                 gc.collect()
                 eventlet.sleep(interval_sec)
-        eventlet.spawn(loop)
+        run_singleton(app, job, loop)
 
     def _prices():
         from app.services.market.market_service import MarketService
@@ -1460,12 +1854,12 @@ def start_market_schedulers(app):
         r = MarketService.run_calendar_cycle()
         logging.info(f"[MARKET] Calendario: {r}")
 
-    _run_every(5  * 60, 'Precios de mercado',   _prices)
-    _run_every(15 * 60, 'Noticias RSS',          _news)
-    _run_every(6  * 3600, 'Indicadores macro',   _macro)
+    _run_every(5  * 60, 'market_prices', 'Precios de mercado',   _prices)
+    _run_every(15 * 60, 'market_news',   'Noticias RSS',          _news)
+    _run_every(6  * 3600, 'market_macro', 'Indicadores macro',   _macro)
     # FX Monitor: loop back-to-back con watchdog de dos niveles.
     # Nivel 1 — inner loop: captura errores por ciclo, reintenta en 2s.
-    # Nivel 2 — watchdog: si el greenlet muere por cualquier razón, lo respawnea.
+    # Nivel 2 — coordinador: si el greenlet muere por cualquier razón, lo respawnea.
     def _fx_monitor_loop():
         import eventlet as _ev
         import gc as _gc
@@ -1501,19 +1895,8 @@ def start_market_schedulers(app):
                 backoff = min(2 * consecutive_errors, 30)
                 _ev.sleep(backoff)
 
-    def _fx_monitor_watchdog():
-        import eventlet as _ev
-        _log = logging.getLogger(__name__)
-        gt = eventlet.spawn(_fx_monitor_loop)
-        _log.info('[FX-WATCH] Watchdog activo')
-        while True:
-            _ev.sleep(15)
-            if gt.dead:
-                _log.critical('[FX-WATCH] 🚨 Loop muerto — respawneando automáticamente')
-                gt = eventlet.spawn(_fx_monitor_loop)
-
-    eventlet.spawn(_fx_monitor_watchdog)
-    _run_every(24 * 3600, 'Calendario económico', _calendar)
+    run_singleton(app, 'fx_monitor', _fx_monitor_loop)
+    _run_every(24 * 3600, 'market_calendar', 'Calendario económico', _calendar)
 
     # Análisis diario a las 8:30 AM Lima, lunes a viernes
     def _daily_analysis_at_time():
@@ -1550,7 +1933,7 @@ def start_market_schedulers(app):
                     import traceback
                     logging.error(f"[MARKET] ❌ Análisis diario: {e}\n{traceback.format_exc()}")
 
-        eventlet.spawn(loop)
+        run_singleton(app, 'market_daily_analysis', loop)
 
     _daily_analysis_at_time()
 
@@ -1580,7 +1963,7 @@ def start_market_schedulers(app):
                     logging.error(f'[LEAD_HUNTER] ❌ {e}\n{traceback.format_exc()}')
                     eventlet.sleep(3600)  # reintentar en 1h si falla
 
-        eventlet.spawn(loop)
+        run_singleton(app, 'lead_hunter', loop)
 
     _lead_hunter_daily()
 
@@ -1644,6 +2027,42 @@ def register_cli_commands(app):
         else:
             print("✓ Backfill completado.\n")
 
+    @app.cli.command("balance-checkpoints")
+    @click.option('--desde', default=None, help='Fecha inicial YYYY-MM-DD (default: primer movimiento).')
+    @click.option('--hasta', default=None, help='Fecha final YYYY-MM-DD (default: ayer).')
+    @click.option('--cada', default=1, type=int, help='Días entre checkpoints (default: 1).')
+    def balance_checkpoints(desde, hasta, cada):
+        """
+        Genera checkpoints de fin de día del ledger BankMovement para consultas
+        de saldo histórico (BalanceTimeline). Idempotente: no duplica as_of.
+        """
+        from datetime import date as _date
+        from app.services.balance_timeline import BalanceTimeline
+
+        start = _date.fromisoformat(desde) if desde else None
+        end   = _date.fromisoformat(hasta) if hasta else None
+        written = BalanceTimeline.backfill_checkpoints(start=start, end=end, every_days=cada)
+        print(f"\n✓ Checkpoints escritos: {written}\n")
+
+    @app.cli.command("period-balances")
+    def period_balances():
+        """
+        Materializa los saldos de cierre por cuenta de los períodos ya cerrados
+        (en orden cronológico). Idempotente: reescribe cada período.
+        """
+        from app.extensions import db
+        from app.models.accounting_period import AccountingPeriod
+        from app.services.accounting.period_balances import PeriodBalanceService
+
+        closed = AccountingPeriod.query.filter_by(status='cerrado').order_by(
+            AccountingPeriod.year.asc(), AccountingPeriod.month.asc()
+        ).all()
+        for p in closed:
+            n = PeriodBalanceService.snapshot_period(p.year, p.month)
+            db.session.commit()
+            print(f"  {p.label}: {n} cuentas" if n else f"  {p.label}: omitido (período anterior abierto)")
+        print(f"\n✓ Períodos procesados: {len(closed)}\n")
+
     @app.cli.command("backfill-bank-names")
     def backfill_bank_names():
         """
@@ -1718,7 +2137,8 @@ def register_cli_commands(app):
         from app.extensions import db
         from app.models.operation import Operation
         from app.models.journal_entry import JournalEntry
-        from app.services.accounting.journal_service import JournalService
+        from app.services.accounting.account_totals import AccountTotalsService
+        from app.services.accounting.bulk_journal import run_bulk_operation_entries
         from app.utils.formatters import now_peru
         from datetime import datetime, time
         import traceback
@@ -1728,45 +2148,233 @@ def register_cli_commands(app):
             inicio = datetime.combine(hoy, time.min)
             fin    = datetime.combine(hoy, time.max)
 
-            ops = Operation.query.filter(
+            op_ids = [r[0] for r in db.session.query(Operation.id).filter(
                 Operation.status == 'Completada',
                 Operation.created_at >= inicio,
                 Operation.created_at <= fin,
-            ).all()
-            print(f"  Operaciones completadas hoy ({hoy}): {len(ops)}")
-
-            anulados = 0
-            recreados = 0
-
-            for op in ops:
-                # Anular asientos existentes de esta operación
-                existing = JournalEntry.query.filter_by(
-                    source_type='operation',
-                    source_id=op.id,
-                    status='activo'
-                ).all()
-                for entry in existing:
-                    entry.status = 'anulado'
-                    entry.annulled_at = now_peru()
-                    entry.annulled_reason = 'Regenerado vía flask regenerate-journal-entries'
-                    anulados += 1
-                db.session.flush()
-
-                # Recrear asiento con lógica corregida
-                nuevo = JournalService.create_entry_for_completed_operation(op)
-                if nuevo:
-                    recreados += 1
-                    print(f"  ✓ {op.operation_id} → {nuevo.entry_number}")
-                else:
-                    print(f"  ✗ {op.operation_id} — asiento no generado (sin amount_pen?)")
+            ).all()]
+            print(f"  Operaciones completadas hoy ({hoy}): {len(op_ids)}")
+            if not op_ids:
+                return
 
-            print(f"✓ Anulados: {anulados}  |  Recreados: {recreados}")
+            # Anular asientos existentes de estas operaciones (un solo UPDATE)
+            activos = JournalEntry.query.filter(
+                JournalEntry.source_type == 'operation',
+                JournalEntry.source_id.in_(op_ids),
+                JournalEntry.status == 'activo',
+            )
+            fechas = [d for (d,) in activos.with_entities(JournalEntry.entry_date).distinct()]
+            anulados = activos.update({
+                'status':          'anulado',
+                'annulled_at':     now_peru(),
+                'annulled_reason': 'Regenerado vía flask regenerate-journal-entries',
+            }, synchronize_session=False)
+            AccountTotalsService.invalidate_dates(fechas)
+            db.session.flush()
+
+            # Recrear asientos con lógica corregida (el primer bloque confirma la anulación)
+            result = run_bulk_operation_entries(operation_ids=op_ids, dry_run=False)
+            for e in result['detalle_errores']:
+                print(f"  ✗ {e['operation_id']} — asiento no generado ({e['error']})")
+
+            print(f"✓ Anulados: {anulados}  |  Recreados: {result['generados']}")
 
         except Exception as e:
             db.session.rollback()
             print(f"✗ Error: {e}")
             traceback.print_exc()
 
+    @app.cli.command("bulk-journal")
+    @click.option('--year', type=int, default=None, help='Año de completed_at.')
+    @click.option('--month', type=int, default=None, help='Mes de completed_at (requiere --year).')
+    @click.option('--chunk', type=int, default=500, help='Operaciones por bloque (default: 500).')
+    @click.option('--apply', is_flag=True, default=False,
+                  help='Escribe los asientos. Sin este flag corre en dry-run.')
+    def bulk_journal(year, month, chunk, apply):
+        """
+        Genera en bloque los asientos de operaciones Completadas sin asiento
+        activo (números reservados por bloque, INSERT multi-fila, un commit por
+        bloque). Reanudable: volver a correrlo retoma lo pendiente.
+        """
+        from app.services.accounting.bulk_journal import run_bulk_operation_entries
+
+        dry_run = not apply
+        if dry_run:
+            print('\n[DRY-RUN] No se escribirá nada. Usa --apply para aplicar.\n')
+
+        r = run_bulk_operation_entries(year=year, month=month, dry_run=dry_run,
+                                       chunk_size=chunk)
+        print(f"  Operaciones sin asiento      : {r['total_sin_asiento']}")
+        print(f"  Asientos {'a generar' if dry_run else 'generados'}         : {r['generados']}")
+        print(f"  Omitidas (período cerrado)   : {r['omitidos_periodo_cerrado']}")
+        print(f"  Errores                      : {r['errores']}")
+        for e in r['detalle_errores']:
+            print(f"    - {e['operation_id']}: {e['error']}")
+        print(f"  Bloques / tiempo             : {r['bloques']} / {r['elapsed_seconds']}s\n")
+
+    @app.cli.command("bench-journal-numbering")
+    @click.option('--threads', type=int, default=8, help='Hilos concurrentes (default: 8).')
+    @click.option('--per-thread', type=int, default=25, help='Asientos por hilo (default: 25).')
+    def bench_journal_numbering(threads, per_thread):
+        """
+        Benchmark de numeración de asientos: throughput con N hilos completando
+        a la vez, numerando al inicio vs. al commit. Escribe y borra asientos de
+        un año aislado; usar en staging / local.
+        """
+        from app.services.accounting.numbering_benchmark import run_numbering_benchmark
+
+        r = run_numbering_benchmark(app, threads=threads, per_thread=per_thread)
+        for modo in ('inicio', 'commit'):
+            m = r[modo]
+            print(f"  {modo:7}: {m['asientos']} asientos en {m['segundos']}s → "
+                  f"{m['asientos_seg']}/s  (p50 {m['p50_ms']} ms, p95 {m['p95_ms']} ms)")
+        print(f"\n  Speedup: {r['speedup']}x  |  Numeración sin huecos: {r['sin_huecos']}\n")
+
+    @app.cli.command("bench-operation-serializer")
+    @click.option('--limit', type=int, default=1000, help='Últimas N operaciones (default: 1000).')
+    @click.option('--fields', default=None, help='Campos del formato compacto, separados por coma.')
+    @click.option('--repeat', type=int, default=3, help='Corridas por formato; se toma la mejor (default: 3).')
+    def bench_operation_serializer(limit, fields, repeat):
+        """
+        Benchmark de tamaño y tiempo: to_dict() de las listas de operaciones
+        vs. el formato compacto v1 (registros y columnar). Solo lectura.
+        """
+        from app.services.serializer_benchmark import run_serializer_benchmark
+
+        r = run_serializer_benchmark(limit=limit, fields=fields, repeat=repeat)
+        print(f"  {r['operaciones']} operaciones | campos: {', '.join(r['campos'])}\n")
+        for modo in ('to_dict', 'todos', 'registros', 'columnar'):
+            m = r[modo]
+            extra = (f"  ({m['tamaño_pct']}% del tamaño, {m['speedup']}x)"
+                     if modo != 'to_dict' else '')
+            print(f"  {modo:9}: {m['kb']:>9} KB  {m['ms']:>8} ms{extra}")
+        print()
+
+    @app.cli.command("bench-operator-assignment")
+    @click.option('--operators', type=int, multiple=True, help='Cantidad de operadores activos (repetible; default: 5, 25, 100).')
+    @click.option('--repeat', type=int, default=20, help='Corridas por algoritmo; se toma la mejor (default: 20).')
+    def bench_operator_assignment(operators, repeat):
+        """
+        Benchmark de la asignación balanceada de operadores: 1 + N COUNT(*)
+        (anterior) vs. una consulta agrupada (actual). Los operadores
+        sintéticos se crean en una transacción que se revierte.
+        """
+        from app.services.assignment_benchmark import run_assignment_benchmark
+
+        for r in run_assignment_benchmark(operators=operators or (5, 25, 100), repeat=repeat):
+            a, c = r['anterior'], r['actual']
+            print(f"  {r['operadores']:>4} operadores | anterior: {a['ms']:>8} ms ({a['consultas']} consultas)"
+                  f" | actual: {c['ms']:>8} ms ({c['consultas']} consultas) | {r['speedup']}x")
+        print()
+
+    @app.cli.command("index-advisor")
+    @click.argument('capture_files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+    @click.option('--table', default='operations', help='Tabla a analizar (default: operations).')
+    @click.option('--min-calls', type=int, default=1, help='Ignorar formas con menos llamadas.')
+    @click.option('--top', type=int, default=10, help='Cantidad máxima de propuestas (default: 10).')
+    @click.option('--explain', is_flag=True, help='EXPLAIN ANALYZE antes/después de cada propuesta (revierte todo).')
+    def index_advisor(capture_files, table, min_calls, top, explain):
+        """
+        Propone índices compuestos o parciales a partir de consultas capturadas
+        con QUERY_CAPTURE_FILE. Con --explain mide la consulta más lenta de
+        cada propuesta sin y con el índice (usar en staging / local).
+        """
+        from app.extensions import db
+        from app.services.index_advisor import load_shapes, propose, ddl, existing_indexes, explain_compare
+
+        shapes = load_shapes(*capture_files)
+        with db.engine.connect() as conn:
+            existing = existing_indexes(conn, table)
+        proposals = propose(shapes, table, existing, min_calls=min_calls)[:top]
+        print(f"\n  {len(shapes)} formas de consulta, {len(proposals)} índice(s) propuesto(s)\n")
+        for p in proposals:
+            print(f"  {ddl(p)};")
+            print(f"      {p.calls} llamadas, {p.total_ms} ms en total, {len(p.shapes)} forma(s)")
+            if explain:
+                slowest = max((shapes[k] for k in p.shapes), key=lambda s: s['total_ms'] / max(s['calls'], 1))
+                try:
+                    r = explain_compare(db.engine, p, slowest)
+                    a, d = r['antes'], r['despues']
+                    print(f"      EXPLAIN: {a['ms']} ms {a['indices'] or ['seq scan']} → "
+                          f"{d['ms']} ms {d['indices'] or ['seq scan']}")
+                except Exception as e:
+                    print(f"      EXPLAIN no disponible: {e}")
+            print()
+
+    @app.cli.command("outbox-drain")
+    @click.option('--limit', type=int, default=None, help='Máximo de eventos a procesar (default: todos los disponibles).')
+    @click.option('--retry-failed', is_flag=True, help='Reencolar antes los eventos fallidos.')
+    def outbox_drain(limit, retry_failed):
+        """
+        Procesa ahora los efectos pendientes del outbox (asientos, facturas,
+        emails...) en este proceso y muestra el estado de la cola.
+        """
+        from sqlalchemy import text
+        from app.extensions import db
+        from app.services.outbox import drain
+        from app.utils.formatters import now_peru
+
+        if retry_failed:
+            n = db.session.execute(text(
+                "UPDATE outbox_events SET status = 'pendiente', attempts = 0, available_at = :now "
+                "WHERE status = 'fallido'"
+            ), {'now': now_peru()}).rowcount
+            db.session.commit()
+            print(f"  Reencolados: {n}")
+        r = drain(limit)
+        print(f"  Procesados: {r['hechos']} | con error: {r['con_error']}")
+        for status, n in db.session.execute(text(
+            "SELECT status, COUNT(*) FROM outbox_events GROUP BY status ORDER BY status"
+        )):
+            print(f"  {status:11}: {n}")
+        print()
+
+    @app.cli.command("depreciation-schedule")
+    @click.option('--asset-id', type=int, multiple=True, help='Solo estos activos (repetible).')
+    def depreciation_schedule(asset_id):
+        """
+        Regenera el cronograma de depreciación (cuotas pendientes) de los
+        activos fijos. Las cuotas ya contabilizadas no se modifican.
+        """
+        from app.services.accounting.depreciation_schedule import rebuild_schedule
+
+        n = rebuild_schedule(list(asset_id) or None)
+        print(f"  Cuotas pendientes generadas: {n}\n")
+
+    @app.cli.command("rebuild-account-totals")
+    @click.option('--year', type=int, default=None, help='Solo los períodos de este año.')
+    def rebuild_account_totals(year):
+        """
+        Recalcula desde el Libro Diario los totales por período y prefijo PCGE
+        (AccountPeriodTotal) que leen el Estado de Resultados y el Balance.
+        """
+        from app.extensions import db
+        from app.models.accounting_period import AccountingPeriod
+        from app.services.accounting.account_totals import AccountTotalsService
+
+        q = AccountingPeriod.query
+        if year:
+            q = q.filter_by(year=year)
+        for p in q.order_by(AccountingPeriod.year, AccountingPeriod.month).all():
+            n = AccountTotalsService.rebuild_period(p.year, p.month)
+            db.session.commit()
+            print(f"  {p.year}/{p.month:02d}: {n} fila(s)")
+
+    @app.cli.command("backfill-operation-children")
+    @click.option('--batch', type=int, default=500, help='Operaciones por bloque (default: 500).')
+    def backfill_operation_children(batch):
+        """
+        Reconstruye operation_deposits / _payments / _proofs / _logs desde las
+        columnas *_json de todas las operaciones. Idempotente.
+        """
+        from app.services.operation_children import backfill
+
+        r = backfill(batch=batch)
+        print(f"  Operaciones: {r.pop('operaciones')}")
+        for table, n in r.items():
+            print(f"  {table:20}: {n} fila(s)")
+        print()
+
     @app.cli.command("create-tables")
     def create_tables():
         """Crea todas las tablas faltantes usando db.create_all() (seguro, idempotente)."""
@@ -1969,7 +2577,7 @@ def register_cli_commands(app):
         from app.services.accounting.journal_service import JournalService
         from datetime import date, datetime
         from decimal import Decimal
-        from sqlalchemy import extract
+        from app.utils.periods import in_month
         import traceback
 
         # ── Buscar un cliente existente para las Operaciones del LIG ────────
@@ -1992,16 +2600,14 @@ def register_cli_commands(app):
             # Chequeo de idempotencia: ¿ya existen asientos demo en este mes?
             existing = db.session.query(JournalService._model()).filter(
                 JournalService._model().source_type == 'demo',
-                extract('year',  JournalService._model().entry_date) == year,
-                extract('month', JournalService._model().entry_date) == month,
+                in_month(JournalService._model().entry_date, year, month),
             ).first() if hasattr(JournalService, '_model') else None
 
             # Usamos JournalEntry directamente para la verificación
             from app.models.journal_entry import JournalEntry
             existing = JournalEntry.query.filter(
                 JournalEntry.source_type == 'demo',
-                extract('year',  JournalEntry.entry_date) == year,
-                extract('month', JournalEntry.entry_date) == month,
+                in_month(JournalEntry.entry_date, year, month),
             ).first()
             if existing:
                 print(f"  · Asientos demo {month_tag} ya existen — saltando")
@@ -2236,7 +2842,7 @@ def register_cli_commands(app):
         from app.models.journal_entry_line import JournalEntryLine
         from app.models.expense_record import ExpenseRecord
         from app.models.operation import Operation
-        from sqlalchemy import extract
+        from app.utils.periods import in_month
         import traceback
 
         YEAR = 2026
@@ -2250,15 +2856,13 @@ def register_cli_commands(app):
             for month in [1, 2, 3]:
                 # Expense records
                 er_del = ExpenseRecord.query.filter(
-                    db.extract('year',  ExpenseRecord.expense_date) == YEAR,
-                    db.extract('month', ExpenseRecord.expense_date) == month,
+                    in_month(ExpenseRecord.expense_date, YEAR, month),
                 ).delete(synchronize_session=False)
 
                 # Journal entries (cascade a lines via source_type='demo')
                 je_ids = [r[0] for r in db.session.query(JournalEntry.id).filter(
                     JournalEntry.source_type == 'demo',
-                    extract('year',  JournalEntry.entry_date) == YEAR,
-                    extract('month', JournalEntry.entry_date) == month,
+                    in_month(JournalEntry.entry_date, YEAR, month),
                 ).all()]
                 if je_ids:
                     JournalEntryLine.query.filter(
@@ -2267,6 +2871,8 @@ def register_cli_commands(app):
                     JournalEntry.query.filter(JournalEntry.id.in_(je_ids)).delete(
                         synchronize_session=False)
 
+                from app.services.accounting.account_totals import AccountTotalsService
+                AccountTotalsService.invalidate(YEAR, month)
                 period = AccountingPeriod.query.filter_by(year=YEAR, month=month).first()
                 if period:
                     db.session.delete(period)
@@ -2474,6 +3080,8 @@ def register_cli_commands(app):
                         source_type='operation', source_id=op.id
                     ).first()
                     if je:
+                        from app.services.accounting.account_totals import AccountTotalsService
+                        AccountTotalsService.invalidate_dates([je.entry_date])
                         JournalEntryLine.query.filter_by(
                             journal_entry_id=je.id
                         ).delete(synchronize_session=False)
@@ -2535,7 +3143,7 @@ def register_cli_commands(app):
             ClientRiskProfile, ComplianceAlert, RestrictiveListCheck,
             TransactionMonitoring, ComplianceDocument, ComplianceAudit,
         )
-        from sqlalchemy import extract
+        from app.utils.periods import in_month, in_year
         import traceback
 
         DEMO_DNI  = '72345678'
@@ -2634,14 +3242,12 @@ def register_cli_commands(app):
             # ── 6. Asientos demo (source_type='demo') + gastos por mes ──────
             for month in DEMO_MONTHS:
                 er_del = ExpenseRecord.query.filter(
-                    extract('year',  ExpenseRecord.expense_date) == DEMO_YEAR,
-                    extract('month', ExpenseRecord.expense_date) == month,
+                    in_month(ExpenseRecord.expense_date, DEMO_YEAR, month),
                 ).delete(synchronize_session=False)
 
                 je_ids = [r[0] for r in db.session.query(JournalEntry.id).filter(
                     JournalEntry.source_type == 'demo',
-                    extract('year',  JournalEntry.entry_date) == DEMO_YEAR,
-                    extract('month', JournalEntry.entry_date) == month,
+                    in_month(JournalEntry.entry_date, DEMO_YEAR, month),
                 ).all()]
                 if je_ids:
                     JournalEntryLine.query.filter(
@@ -2661,7 +3267,7 @@ def register_cli_commands(app):
             # ── 7. Asiento de apertura demo (si existe) ─────────────────────
             apertura_del = JournalEntry.query.filter(
                 JournalEntry.entry_type == 'apertura',
-                extract('year', JournalEntry.entry_date) == DEMO_YEAR,
+                in_year(JournalEntry.entry_date, DEMO_YEAR),
             ).all()
             for ap in apertura_del:
                 JournalEntryLine.query.filter_by(
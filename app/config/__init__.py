@@ -83,6 +83,21 @@ class Config:
     COMPANY_PROVINCE = os.environ.get('COMPANY_PROVINCE', 'LIMA')
     COMPANY_DEPARTMENT = os.environ.get('COMPANY_DEPARTMENT', 'LIMA')
 
+    # Exportaciones en segundo plano (app/services/export_jobs.py)
+    EXPORT_DIR = os.environ.get('EXPORT_DIR')  # default: <tmp>/qoricash_exports
+    EXPORT_TTL_MINUTES = int(os.environ.get('EXPORT_TTL_MINUTES', 30))
+    EXPORT_MAX_CONCURRENT = int(os.environ.get('EXPORT_MAX_CONCURRENT', 1))
+
+    # AuditEngine: carga del período y módulos en paralelo (cada loader usa una
+    # conexión del pool mientras corre)
+    AUDIT_MAX_WORKERS = int(os.environ.get('AUDIT_MAX_WORKERS', 3))
+    # Auditoría incremental: re-auditoría completa del período cada N días
+    AUDIT_FULL_EVERY_DAYS = int(os.environ.get('AUDIT_FULL_EVERY_DAYS', 7))
+
+    # Libro Diario: el número AS-YYYY-NNNN se asigna justo antes del commit
+    # (lock de JournalSequence solo en ese tramo). 'false' = numerar al inicio.
+    JOURNAL_NUMBER_AT_COMMIT = os.environ.get('JOURNAL_NUMBER_AT_COMMIT', 'true').lower() == 'true'
+
 
 class DevelopmentConfig(Config):
     """Configuración para desarrollo"""
@@ -4,6 +4,7 @@ Modelos de la aplicación QoriCash Trading V2
 from app.models.user import User
 from app.models.client import Client
 from app.models.operation import Operation
+from app.models.operation_child import OperationDeposit, OperationPayment, OperationProof, OperationLog
 from app.models.audit_log import AuditLog
 from app.models.trader_goal import TraderGoal
 from app.models.trader_daily_profit import TraderDailyProfit
@@ -23,7 +24,10 @@ from app.models.journal_entry import JournalEntry
 from app.models.journal_entry_line import JournalEntryLine
 from app.models.expense_record import ExpenseRecord
 from app.models.fixed_asset import FixedAsset
+from app.models.depreciation_schedule import DepreciationSchedule
 from app.models.journal_sequence import JournalSequence
+from app.models.account_period_balance import AccountPeriodBalance
+from app.models.account_period_total import AccountPeriodTotal
 from app.models.system_config import SystemConfig
 from app.models.accounting_match import AccountingMatch
 from app.models.accounting_batch import AccountingBatch
@@ -39,17 +43,24 @@ from app.models.datatec_rate import DatatecRate
 from app.models.notification import Notification
 from app.models.comercial_envio import ComercialEnvio
 from app.models.bank_movement import BankMovement
+from app.models.bank_balance_checkpoint import BankBalanceCheckpoint
 from app.models.daily_closure import DailyClosure
 from app.models.audit_report import AuditReport
 from app.models.internal_transfer import InternalTransfer
+from app.models.export_job import ExportJob
+from app.models.scheduler_lease import SchedulerLease
+from app.models.outbox_event import OutboxEvent
 __all__ = [
     'User', 'Client', 'Operation', 'AuditLog', 'TraderGoal', 'TraderDailyProfit',
     'BankBalance', 'BankBalanceHistory', 'Invoice', 'ExchangeRate', 'Complaint',
     'Competitor', 'CompetitorRateHistory', 'CompetitorRateCurrent', 'CompetitorRateChangeEvent',
     'SanctionsEntry',
+    # Tablas hijas de operaciones
+    'OperationDeposit', 'OperationPayment', 'OperationProof', 'OperationLog',
     # Módulo contable
     'AccountingAccount', 'AccountingPeriod',
-    'JournalEntry', 'JournalEntryLine', 'ExpenseRecord', 'FixedAsset', 'JournalSequence',
+    'JournalEntry', 'JournalEntryLine', 'ExpenseRecord', 'FixedAsset', 'DepreciationSchedule', 'JournalSequence',
+    'AccountPeriodBalance', 'AccountPeriodTotal',
     'SystemConfig',
     # Módulo amarres
     'AccountingMatch', 'AccountingBatch',
@@ -67,7 +78,13 @@ __all__ = [
     # Comercial
     'ComercialEnvio',
     # Tesorería
-    'BankMovement', 'DailyClosure', 'InternalTransfer',
+    'BankMovement', 'BankBalanceCheckpoint', 'DailyClosure', 'InternalTransfer',
     # Auditoría IA
     'AuditReport',
+    # Exportaciones en segundo plano
+    'ExportJob',
+    # Leases de schedulers entre workers
+    'SchedulerLease',
+    # Outbox transaccional
+    'OutboxEvent',
 ]
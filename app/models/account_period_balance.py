@@ -0,0 +1,34 @@
+"""
+Saldos de cierre por cuenta y período (arrastre de saldos iniciales).
+
+Cada fila guarda el acumulado DEBE/HABER de una cuenta PCGE desde el inicio
+de la contabilidad hasta el último día del período (year, month). Se escribe
+al cerrar el período y se borra al reabrirlo (o al reabrir uno anterior),
+de modo que el saldo inicial del período siguiente es una lectura por clave
+en lugar de un SUM sobre todo el Libro Diario.
+"""
+from app.extensions import db
+from app.utils.formatters import now_peru
+
+
+class AccountPeriodBalance(db.Model):
+    __tablename__ = 'account_period_balances'
+
+    id           = db.Column(db.Integer, primary_key=True)
+    year         = db.Column(db.Integer, nullable=False)
+    month        = db.Column(db.Integer, nullable=False)       # 1–12
+    account_code = db.Column(db.String(10), nullable=False)
+    # Acumulado en PEN (moneda del Libro Diario)
+    debe         = db.Column(db.Numeric(18, 2), nullable=False, default=0)
+    haber        = db.Column(db.Numeric(18, 2), nullable=False, default=0)
+    # Acumulado amount_usd por lado (Libro Caja y Bancos auxiliar, cuentas ME)
+    debe_usd     = db.Column(db.Numeric(18, 2), nullable=False, default=0)
+    haber_usd    = db.Column(db.Numeric(18, 2), nullable=False, default=0)
+    computed_at  = db.Column(db.DateTime, default=now_peru)
+
+    __table_args__ = (
+        db.UniqueConstraint('year', 'month', 'account_code', name='uq_apb_period_account'),
+    )
+
+    def __repr__(self):
+        return f'<AccountPeriodBalance {self.year}/{self.month:02d} {self.account_code} D:{self.debe} H:{self.haber}>'
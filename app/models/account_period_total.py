@@ -0,0 +1,37 @@
+"""
+Totales del Libro Diario por período, cuenta y tipo de asiento.
+
+Cada fila guarda Σ debe / Σ haber de los asientos ACTIVOS de (year, month)
+con un entry_type dado, para un prefijo PCGE:
+
+  is_account = False   rollup por nivel: elemento (1 dígito), rubro (2),
+                       cuenta (3) y subcuenta (4) — '6', '68', '681', '6814'
+  is_account = True    la cuenta exacta del asiento ('6814', '104101', ...)
+
+La mantiene AccountTotalsService al crear y anular asientos; el Estado de
+Resultados y el Balance General la leen en lugar de sumar líneas.
+"""
+from app.extensions import db
+
+
+class AccountPeriodTotal(db.Model):
+    __tablename__ = 'account_period_totals'
+
+    id         = db.Column(db.Integer, primary_key=True)
+    year       = db.Column(db.Integer, nullable=False)
+    month      = db.Column(db.Integer, nullable=False)       # 1–12
+    entry_type = db.Column(db.String(30), nullable=False, default='')
+    prefix     = db.Column(db.String(20), nullable=False)
+    is_account = db.Column(db.Boolean, nullable=False, default=False)
+    debe       = db.Column(db.Numeric(18, 2), nullable=False, default=0)
+    haber      = db.Column(db.Numeric(18, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('year', 'month', 'entry_type', 'prefix', 'is_account',
+                            name='uq_apt_period_type_prefix'),
+        db.Index('ix_apt_prefix_period', 'prefix', 'is_account', 'year', 'month'),
+    )
+
+    def __repr__(self):
+        kind = 'cta' if self.is_account else 'nivel'
+        return f'<AccountPeriodTotal {self.year}/{self.month:02d} {self.prefix} ({kind}) D:{self.debe} H:{self.haber}>'
@@ -24,6 +24,9 @@ class AccountingPeriod(db.Model):
     reopened_by    = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     reopen_reason  = db.Column(db.String(500), nullable=True)
 
+    # Totales por cuenta (AccountPeriodTotal) al día; NULL → se reconstruyen al leer
+    totals_built_at = db.Column(db.DateTime, nullable=True)
+
     __table_args__ = (
         db.UniqueConstraint('year', 'month', name='uq_accounting_period_year_month'),
     )
@@ -69,6 +69,11 @@ class AuditReport(db.Model):
     trigger             = db.Column(db.String(20), default='cron')
     # Tiempo de ejecución en segundos
     execution_seconds   = db.Column(db.Numeric(8, 2), nullable=True)
+    # JSON: {prefetch_ms: {loader: ms}, checks_ms: {módulo: ms}, workers}
+    timings_json        = db.Column(db.Text, default='{}')
+    # JSON: estado de la auditoría incremental del período (marcas de agua,
+    # acumulados y pendientes — app/services/audit/incremental.py)
+    incremental_json    = db.Column(db.Text, nullable=True)
     error_message       = db.Column(db.Text, nullable=True)
 
     executed_by     = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
@@ -115,6 +120,28 @@ class AuditReport(db.Model):
     def conciliacion(self, val: dict):
         self.conciliacion_json = json.dumps(val, ensure_ascii=False, default=str)
 
+    @property
+    def timings(self) -> dict:
+        try:
+            return json.loads(self.timings_json or '{}')
+        except Exception:
+            return {}
+
+    @timings.setter
+    def timings(self, val: dict):
+        self.timings_json = json.dumps(val, ensure_ascii=False, default=str)
+
+    @property
+    def incremental(self):
+        try:
+            return json.loads(self.incremental_json) if self.incremental_json else None
+        except Exception:
+            return None
+
+    @incremental.setter
+    def incremental(self, val):
+        self.incremental_json = json.dumps(val, ensure_ascii=False, default=str) if val else None
+
     # ── Helpers ──────────────────────────────────────────────────────────────
 
     def add_hallazgo(self, modulo: str, severidad: str, titulo: str,
@@ -140,6 +167,19 @@ class AuditReport(db.Model):
             if self.estado != ESTADO_CRITICO:
                 self.estado = ESTADO_OBSERVADO
 
+    def reset_hallazgos(self, keep: list = None):
+        """
+        Reemplaza los hallazgos por `keep` y recalcula contadores y estado
+        (la corrida incremental regenera los hallazgos del período).
+        """
+        self.hallazgos = []
+        self.total_hallazgos = 0
+        self.hallazgos_criticos = 0
+        self.estado = ESTADO_APROBADO
+        for h in keep or []:
+            self.add_hallazgo(h['modulo'], h['severidad'], h['titulo'],
+                              h['detalle'], h.get('accion_sugerida'))
+
     def to_dict(self) -> dict:
         return {
             'id':                       self.id,
@@ -162,6 +202,7 @@ class AuditReport(db.Model):
             'ir_pago_cuenta_pen':       float(self.ir_pago_cuenta_pen or 0),
             'trigger':                  self.trigger,
             'execution_seconds':        float(self.execution_seconds or 0),
+            'timings':                  self.timings,
             'error_message':            self.error_message,
             'created_at':               self.created_at.isoformat() if self.created_at else None,
         }
@@ -84,6 +84,7 @@ class BankBalance(db.Model):
         try:
             from app.config.bank_accounts import QORICASH_ACCOUNTS
             from app.models.bank_movement import BankMovement
+            from app.services.closure_accumulator import ClosureAccumulator
 
             _banco_accts = {}
             for _b, _monedas in QORICASH_ACCOUNTS.items():
@@ -223,6 +224,7 @@ class BankBalance(db.Model):
                     closure_date   = now_peru().date(),
                 )
                 db.session.add(mv)
+                ClosureAccumulator.apply_movement(mv)
 
             if operation.operation_type == 'Compra':
                 # Depósitos: cliente → QoriCash en USD (inflows)
@@ -0,0 +1,52 @@
+"""
+BankBalanceCheckpoint — Checkpoints del ledger de movimientos bancarios
+========================================================================
+Snapshot completo del saldo acumulado de cada cuenta (bank_key × currency)
+calculado desde BankMovement a un instante dado (as_of).
+
+Junto con los movimientos posteriores (deltas) permite responder
+"¿cuál era el saldo de cada banco a las 11:30 del martes?" sin sumar todo el
+historial: saldo(T) = checkpoint(as_of <= T) + Σ movimientos (as_of, T].
+
+last_movement_id guarda el mayor BankMovement.id existente al tomar el
+checkpoint; los movimientos registrados después con fecha retroactiva
+(id > last_movement_id y movement_date <= as_of) se suman como corrección,
+así un backfill no invalida los checkpoints ya tomados.
+
+Complementa a BankBalanceHistory (saldos reales ingresados en Posición):
+ese historial refleja lo que el operador registró; este, lo que dice el ledger.
+"""
+from app.extensions import db
+from app.utils.formatters import now_peru
+
+
+class BankBalanceCheckpoint(db.Model):
+    __tablename__ = 'bank_balance_checkpoints'
+
+    id               = db.Column(db.Integer, primary_key=True)
+    as_of            = db.Column(db.DateTime, nullable=False)
+    bank_key         = db.Column(db.String(20), nullable=False)   # BCP | INTERBANK | BANBIF
+    currency         = db.Column(db.String(3),  nullable=False)   # USD | PEN
+    balance          = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    last_movement_id = db.Column(db.Integer, nullable=False, default=0)
+    movements_count  = db.Column(db.Integer, nullable=False, default=0)
+    created_at       = db.Column(db.DateTime, default=now_peru)
+
+    __table_args__ = (
+        db.UniqueConstraint('bank_key', 'currency', 'as_of', name='uq_bbc_account_as_of'),
+        db.Index('ix_bbc_account_as_of', 'bank_key', 'currency', 'as_of'),
+    )
+
+    def to_dict(self):
+        return {
+            'id':               self.id,
+            'as_of':            self.as_of.isoformat() if self.as_of else None,
+            'bank_key':         self.bank_key,
+            'currency':         self.currency,
+            'balance':          float(self.balance or 0),
+            'last_movement_id': self.last_movement_id,
+            'movements_count':  self.movements_count,
+        }
+
+    def __repr__(self):
+        return f'<BankBalanceCheckpoint {self.bank_key} {self.currency} @ {self.as_of} = {self.balance}>'
@@ -18,6 +18,8 @@ Tipos de movimiento:
   gasto            — egreso por gasto operativo
   saldo_inicial    — apertura de período / saldo inicial registrado
 """
+from sqlalchemy import event
+
 from app.extensions import db
 from app.utils.formatters import now_peru
 
@@ -115,13 +117,20 @@ class BankMovement(db.Model):
     def compute_running_balance(bank_key: str, currency: str, up_to_id: int = None,
                                 up_to_date=None) -> float:
         """
-        Calcula el saldo acumulado desde el primer movimiento.
+        Calcula el saldo acumulado desde el primer movimiento (sin los de
+        traslados anulados, ver balance_timeline.counted).
         Útil para reconstruir la posición en cualquier punto del tiempo.
+        Con solo up_to_date delega en BalanceTimeline (checkpoint + deltas).
         """
         from sqlalchemy import func
+        if up_to_date and not up_to_id:
+            from app.services.balance_timeline import BalanceTimeline
+            return BalanceTimeline.balance_at(bank_key, currency, up_to_date)
+        from app.services.balance_timeline import counted
         q = BankMovement.query.filter(
             BankMovement.bank_key == bank_key,
             BankMovement.currency == currency,
+            counted(BankMovement.id),
         )
         if up_to_id:
             q = q.filter(BankMovement.id <= up_to_id)
@@ -149,3 +158,23 @@ class BankMovement(db.Model):
     def __repr__(self):
         sign = '+' if float(self.amount) >= 0 else ''
         return f'<BankMovement {self.bank_key} {self.currency} {sign}{self.amount} [{self.movement_type}]>'
+
+
+@event.listens_for(BankMovement, 'after_insert')
+def _checkpoints_on_insert(mapper, connection, target):
+    """Un movimiento con fecha pasada invalida los checkpoints posteriores a ella"""
+    from app.services.balance_timeline import movement_changed
+    movement_changed(connection, target, 'insert')
+
+
+@event.listens_for(BankMovement, 'after_update')
+def _checkpoints_on_update(mapper, connection, target):
+    """Cambio de monto, fecha o cuenta → invalidar checkpoints desde la fecha más antigua"""
+    from app.services.balance_timeline import movement_changed
+    movement_changed(connection, target, 'update')
+
+
+@event.listens_for(BankMovement, 'after_delete')
+def _checkpoints_on_delete(mapper, connection, target):
+    from app.services.balance_timeline import movement_changed
+    movement_changed(connection, target, 'delete')
@@ -67,6 +67,11 @@ class DailyClosure(db.Model):
     # ── Notas ─────────────────────────────────────────────────────────────
     notes = db.Column(db.Text)
 
+    # ── Acumulador ────────────────────────────────────────────────────────
+    # Último recálculo completo. Mientras no sea NULL, ClosureAccumulator
+    # mantiene los totales del borrador al completar ops / registrar movimientos.
+    accumulated_at = db.Column(db.DateTime, nullable=True)
+
     # ── Saldo Inicial del Día (apertura) ──────────────────────────────────────
     # Se registra una vez al inicio de la jornada. No sobreescribible.
     opening_balance_json   = db.Column(db.Text, default='{}')
@@ -250,6 +255,7 @@ class DailyClosure(db.Model):
             'max_discrepancy_pen':       float(self.max_discrepancy_pen or 0),
             'discrepancy_reason':        self.discrepancy_reason,
             'notes':                     self.notes,
+            'accumulated_at':            self.accumulated_at.isoformat() if self.accumulated_at else None,
             'validated_by':              self.validator.username if self.validator else None,
             'validated_at':              self.validated_at.isoformat() if self.validated_at else None,
             'created_at':                self.created_at.isoformat() if self.created_at else None,
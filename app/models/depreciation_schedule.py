@@ -0,0 +1,55 @@
+"""
+Cronograma de depreciación — QoriCash
+======================================
+Una fila por activo y mes con la cuota de depreciación lineal, la
+depreciación acumulada y el valor neto en libros al cierre de ese mes.
+La precalcula depreciation_schedule.rebuild_schedule() para toda la vida
+útil restante del activo; el Balance, el workbook contable y la proyección
+de gasto la leen en lugar de recalcular.
+
+posted_at marca la cuota como contabilizada (run_depreciacion_mensual) y
+journal_entry_id apunta al asiento consolidado de su cuenta 39xx. Las filas
+contabilizadas no se recalculan nunca; las pendientes se regeneran cuando
+cambia el activo (alta, baja, ajuste de vida útil).
+"""
+from app.extensions import db
+
+
+class DepreciationSchedule(db.Model):
+    __tablename__ = 'depreciation_schedule'
+
+    id               = db.Column(db.Integer, primary_key=True)
+    asset_id         = db.Column(db.Integer, db.ForeignKey('fixed_assets.id', ondelete='CASCADE'),
+                                 nullable=False)
+    year             = db.Column(db.Integer, nullable=False)
+    month            = db.Column(db.Integer, nullable=False)
+    # Cuenta 39xx del activo al generar la fila (agrupa el asiento consolidado)
+    deprec_account   = db.Column(db.String(10), nullable=False)
+    amount           = db.Column(db.Numeric(18, 2), nullable=False)
+    # Depreciación acumulada y valor neto DESPUÉS de esta cuota
+    accumulated      = db.Column(db.Numeric(18, 2), nullable=False)
+    net_book_value   = db.Column(db.Numeric(18, 2), nullable=False)
+
+    journal_entry_id = db.Column(db.Integer, db.ForeignKey('journal_entries.id'), nullable=True)
+    posted_at        = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('asset_id', 'year', 'month', name='uq_depreciation_schedule_asset_month'),
+        db.Index('ix_depreciation_schedule_period', 'year', 'month'),
+    )
+
+    def to_dict(self):
+        return {
+            'asset_id':         self.asset_id,
+            'year':             self.year,
+            'month':            self.month,
+            'deprec_account':   self.deprec_account,
+            'amount':           float(self.amount),
+            'accumulated':      float(self.accumulated),
+            'net_book_value':   float(self.net_book_value),
+            'journal_entry_id': self.journal_entry_id,
+            'posted':           self.posted_at is not None,
+        }
+
+    def __repr__(self):
+        return f'<DepreciationSchedule asset={self.asset_id} {self.year}/{self.month:02d} {self.amount}>'
@@ -24,7 +24,7 @@ class ExpenseRecord(db.Model):
 
     id               = db.Column(db.Integer, primary_key=True)
     period_id        = db.Column(db.Integer, db.ForeignKey('accounting_periods.id'), nullable=False, index=True)
-    expense_date     = db.Column(db.Date, nullable=False)
+    expense_date     = db.Column(db.Date, nullable=False, index=True)
     # Código PCGE de la cuenta de gasto: '6391', '6381', '621', '3361', etc.
     category         = db.Column(db.String(50), nullable=False)
     description      = db.Column(db.Text, nullable=False)
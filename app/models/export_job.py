@@ -0,0 +1,85 @@
+"""
+ExportJob — Exportaciones generadas en segundo plano
+=====================================================
+Cada fila es un archivo (.xlsx) generado fuera del request por
+ExportJobService. El artefacto vive en disco local hasta expires_at.
+
+Ciclo: pendiente → procesando → listo | error; listo → expirado (purga).
+
+params_hash identifica (kind, parámetros normalizados): una solicitud idéntica
+mientras el job está en curso o su artefacto sigue vigente reutiliza la misma
+fila y se agrega a subscribers_json para recibir la notificación.
+"""
+import json
+
+from app.extensions import db
+from app.utils.formatters import now_peru
+
+STATUS_PENDIENTE  = 'pendiente'
+STATUS_PROCESANDO = 'procesando'
+STATUS_LISTO      = 'listo'
+STATUS_ERROR      = 'error'
+STATUS_EXPIRADO   = 'expirado'
+
+
+class ExportJob(db.Model):
+    __tablename__ = 'export_jobs'
+
+    id               = db.Column(db.String(32), primary_key=True)   # uuid4 hex
+    kind             = db.Column(db.String(40), nullable=False)
+    params_json      = db.Column(db.Text, default='{}')
+    params_hash      = db.Column(db.String(64), nullable=False)
+    status           = db.Column(db.String(20), nullable=False, default=STATUS_PENDIENTE)
+    requested_by     = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    # JSON: [user_id, ...] — usuarios a notificar (room user_{id}) al terminar
+    subscribers_json = db.Column(db.Text, default='[]')
+    filename         = db.Column(db.String(200))
+    file_path        = db.Column(db.String(500))
+    size_bytes       = db.Column(db.Integer)
+    error            = db.Column(db.Text)
+    created_at       = db.Column(db.DateTime, default=now_peru)
+    started_at       = db.Column(db.DateTime)
+    finished_at      = db.Column(db.DateTime)
+    expires_at       = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_export_jobs_hash_status', 'params_hash', 'status'),
+    )
+
+    @property
+    def params(self) -> dict:
+        try:
+            return json.loads(self.params_json or '{}')
+        except (TypeError, ValueError):
+            return {}
+
+    @property
+    def subscribers(self) -> list:
+        try:
+            return json.loads(self.subscribers_json or '[]')
+        except (TypeError, ValueError):
+            return []
+
+    def add_subscriber(self, user_id):
+        subs = self.subscribers
+        if user_id and user_id not in subs:
+            subs.append(user_id)
+            self.subscribers_json = json.dumps(subs)
+
+    def to_dict(self):
+        return {
+            'id':          self.id,
+            'kind':        self.kind,
+            'params':      self.params,
+            'status':      self.status,
+            'filename':    self.filename,
+            'size_bytes':  self.size_bytes,
+            'error':       self.error,
+            'created_at':  self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'expires_at':  self.expires_at.isoformat() if self.expires_at else None,
+            'download_url': f'/exports/api/jobs/{self.id}/download' if self.status == STATUS_LISTO else None,
+        }
+
+    def __repr__(self):
+        return f'<ExportJob {self.id} {self.kind} {self.status}>'
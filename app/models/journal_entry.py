@@ -35,6 +35,8 @@ class JournalEntry(db.Model):
 
     __table_args__ = (
         db.Index('idx_je_source', 'source_type', 'source_id'),
+        # Filtros por período: status = 'activo' AND entry_date en [inicio, fin)
+        db.Index('ix_je_status_date', 'status', 'entry_date'),
     )
 
     # Relaciones
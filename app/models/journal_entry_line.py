@@ -22,6 +22,11 @@ class JournalEntryLine(db.Model):
     exchange_rate    = db.Column(db.Numeric(10, 4), nullable=True)
     line_order       = db.Column(db.Integer, nullable=True)
 
+    __table_args__ = (
+        # Mayor / saldos por cuenta: account_code → join a journal_entries
+        db.Index('ix_jel_account_entry', 'account_code', 'journal_entry_id'),
+    )
+
     def __repr__(self):
         return f'<JournalEntryLine {self.account_code} D:{self.debe} H:{self.haber}>'
 
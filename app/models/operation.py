@@ -1,11 +1,21 @@
 """
 Modelo de Operación para QoriCash Trading V2
 """
+from sqlalchemy import event
+
 from app.extensions import db
 from app.utils.formatters import now_peru
 import json
 
 
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _num(value):
+    return float(value) if value is not None else None
+
+
 class Operation(db.Model):
     """Modelo de Operación de cambio de divisas"""
 
@@ -131,20 +141,54 @@ class Operation(db.Model):
             'exchange_rate > 0',
             name='check_exchange_rate_positive'
         ),
+        # Historial paginado por keyset sobre (created_at, id)
+        db.Index('ix_operations_created_id', 'created_at', 'id'),
+        db.Index('ix_operations_client_created_id', 'client_id', 'created_at', 'id'),
+        # Última operación asignada por operador (desempate round-robin de la asignación)
+        db.Index('ix_operations_operator_id', 'assigned_operator_id', 'id'),
+        # Formas de consulta frecuentes (flask index-advisor)
+        db.Index('ix_operations_status_created_at', 'status', 'created_at'),
+        db.Index('ix_operations_client_id_status', 'client_id', 'status'),
+        db.Index('ix_operations_assigned_operator_id_status', 'assigned_operator_id', 'status'),
+        db.Index('ix_operations_status_completed_at', 'status', 'completed_at'),
+        # Expiración y bandejas de trabajo: solo las operaciones vivas
+        db.Index('ix_operations_origen_created_at_activas', 'origen', 'created_at',
+                 postgresql_where=db.text("status IN ('Pendiente', 'En proceso')")),
     )
 
     # === PROPIEDADES PARA ACCEDER A LOS JSON ===
 
-    @property
-    def client_deposits(self):
-        """Obtener abonos del cliente como lista"""
+    def _decode_json(self, column):
+        """Decodificar una columna JSON de lista (lista vacía si está corrupta)"""
         try:
-            return json.loads(self.client_deposits_json or '[]')
+            return json.loads(getattr(self, column) or '[]')
         except (json.JSONDecodeError, TypeError, ValueError):
             import logging
-            logging.getLogger(__name__).error(f'JSON corrupto en client_deposits op={self.id}')
+            logging.getLogger(__name__).error(
+                f'JSON corrupto en {column[:-len("_json")]} op={self.id}')
             return []
 
+    def _json_list(self, column):
+        """
+        Lista decodificada de SOLO LECTURA, cacheada en la instancia mientras
+        el texto de la columna no cambie. to_dict() y los totales leen cada
+        blob varias veces; las propiedades siguen devolviendo copias nuevas
+        porque el código que las usa las modifica y las vuelve a asignar.
+        """
+        raw = getattr(self, column)
+        cache = self.__dict__.setdefault('_json_cache', {})
+        hit = cache.get(column)
+        if hit is not None and hit[0] is raw:
+            return hit[1]
+        value = self._decode_json(column)
+        cache[column] = (raw, value)
+        return value
+
+    @property
+    def client_deposits(self):
+        """Obtener abonos del cliente como lista"""
+        return self._decode_json('client_deposits_json')
+
     @client_deposits.setter
     def client_deposits(self, value):
         """Guardar abonos del cliente"""
@@ -153,12 +197,7 @@ class Operation(db.Model):
     @property
     def client_payments(self):
         """Obtener pagos al cliente como lista"""
-        try:
-            return json.loads(self.client_payments_json or '[]')
-        except (json.JSONDecodeError, TypeError, ValueError):
-            import logging
-            logging.getLogger(__name__).error(f'JSON corrupto en client_payments op={self.id}')
-            return []
+        return self._decode_json('client_payments_json')
 
     @client_payments.setter
     def client_payments(self, value):
@@ -168,12 +207,7 @@ class Operation(db.Model):
     @property
     def operator_proofs(self):
         """Obtener comprobantes del operador como lista"""
-        try:
-            return json.loads(self.operator_proofs_json or '[]')
-        except (json.JSONDecodeError, TypeError, ValueError):
-            import logging
-            logging.getLogger(__name__).error(f'JSON corrupto en operator_proofs op={self.id}')
-            return []
+        return self._decode_json('operator_proofs_json')
 
     @operator_proofs.setter
     def operator_proofs(self, value):
@@ -183,20 +217,12 @@ class Operation(db.Model):
     @property
     def modification_logs(self):
         """Obtener logs de modificación como lista"""
-        try:
-            return json.loads(self.modification_logs_json or '[]')
-        except (json.JSONDecodeError, TypeError, ValueError):
-            import logging
-            logging.getLogger(__name__).error(f'JSON corrupto en modification_logs op={self.id}')
-            return []
+        return self._decode_json('modification_logs_json')
 
     @property
     def notes_read_by(self):
         """Obtener lista de IDs de usuarios que leyeron las notas"""
-        try:
-            return json.loads(self.notes_read_by_json or '[]')
-        except (json.JSONDecodeError, TypeError, ValueError):
-            return []
+        return self._decode_json('notes_read_by_json')
 
     @notes_read_by.setter
     def notes_read_by(self, value):
@@ -230,7 +256,7 @@ class Operation(db.Model):
 
     def has_user_read_notes(self, user_id):
         """Verificar si un usuario ya leyó las notas"""
-        return user_id in self.notes_read_by
+        return user_id in self._json_list('notes_read_by_json')
 
     def has_unread_notes(self, user_id):
         """Verificar si hay notas sin leer para un usuario"""
@@ -238,11 +264,11 @@ class Operation(db.Model):
 
     def get_total_deposits(self):
         """Calcular suma total de abonos"""
-        return sum(float(d.get('importe', 0)) for d in self.client_deposits)
+        return sum(float(d.get('importe', 0)) for d in self._json_list('client_deposits_json'))
 
     def get_total_payments(self):
         """Calcular suma total de pagos"""
-        return sum(float(p.get('importe', 0)) for p in self.client_payments)
+        return sum(float(p.get('importe', 0)) for p in self._json_list('client_payments_json'))
 
     def validate_deposits_sum(self):
         """
@@ -272,6 +298,98 @@ class Operation(db.Model):
 
         return abs(total_payments - expected) < 0.01  # Tolerancia de centavos
 
+    # Estados del backend → formato esperado por el frontend
+    STATUS_MAP = {
+        'Pendiente': 'pendiente',
+        'En proceso': 'en_proceso',
+        'Completada': 'completado',
+        'Cancelado': 'cancelado',
+        'Expirada': 'expirado'
+    }
+
+    def _status_key(self):
+        return self.STATUS_MAP.get(self.status, self.status.lower().replace(' ', '_'))
+
+    def _banks_display(self):
+        """
+        Bancos involucrados, derivados de los pagos/depósitos reales.
+        Prioridad: qc_bank en client_payments/deposits → fallback source/destination_bank_name.
+        """
+        try:
+            _pay_banks = list(dict.fromkeys(
+                p.get('qc_bank') for p in self._json_list('client_payments_json') if p.get('qc_bank')
+            ))
+            _dep_banks = list(dict.fromkeys(
+                d.get('qc_bank') for d in self._json_list('client_deposits_json') if d.get('qc_bank')
+            ))
+            if _pay_banks or _dep_banks:
+                _out = ' + '.join(_pay_banks) if _pay_banks else None
+                _in = ' + '.join(_dep_banks) if _dep_banks else None
+                if _out and _in:
+                    return f"{_out} → {_in}"
+                return _out or _in
+            _src = self.source_bank_name or 'N/A'
+            _dst = self.destination_bank_name or 'N/A'
+            return f"{_src} / {_dst}"
+        except Exception:
+            return f"{self.source_bank_name or 'N/A'} / {self.destination_bank_name or 'N/A'}"
+
+    def _client_name(self):
+        """Nombre del cliente según su tipo (con manejo defensivo)"""
+        if not self.client:
+            return None
+        try:
+            if self.client.document_type == 'RUC':
+                return self.client.razon_social or f"RUC {self.client.dni}"
+            # full_name puede retornar None si no hay datos
+            client_full_name = self.client.full_name
+            return client_full_name if client_full_name else f"Cliente {self.client.dni}"
+        except Exception:
+            # Fallback si hay algún error accediendo a los atributos del cliente
+            return f"Cliente {self.client.dni if self.client.dni else 'Desconocido'}"
+
+    def _bank_names(self):
+        """
+        (banco origen, banco destino). Prioridad: (1) lookup por número de
+        cuenta en las cuentas del cliente, (2) nombre almacenado en la operación.
+        """
+        if not self.client:
+            return 'N/A', 'N/A'
+        try:
+            bank_accounts = self.client.bank_accounts or []
+            source_bank = None
+            destination_bank = None
+
+            for account in bank_accounts:
+                if account.get('account_number') == self.source_account:
+                    source_bank = account.get('bank_name')
+                if account.get('account_number') == self.destination_account:
+                    destination_bank = account.get('bank_name')
+
+            # Fallback al nombre almacenado cuando el lookup falla
+            # (ocurre cuando el cliente actualiza sus cuentas bancarias)
+            if not source_bank:
+                source_bank = self.source_bank_name
+            if not destination_bank:
+                destination_bank = self.destination_bank_name
+
+            return source_bank or 'N/A', destination_bank or 'N/A'
+        except Exception:
+            return self.source_bank_name or 'N/A', self.destination_bank_name or 'N/A'
+
+    def _user_name(self):
+        try:
+            return self.user.username if self.user else None
+        except Exception:
+            return None
+
+    def _assigned_operator_name(self):
+        if not self.assigned_operator_id:
+            return None
+        from app.models.user import User
+        assigned_operator = db.session.get(User, self.assigned_operator_id)
+        return assigned_operator.username if assigned_operator else None
+
     def to_dict(self, include_relations=False):
         """
         Convertir a diccionario
@@ -281,15 +399,10 @@ class Operation(db.Model):
 
         Returns:
             dict: Representación de la operación
+
+        Para listas grandes ver COMPACT_FIELDS (app/utils/compact.py).
         """
-        # Mapear estados del backend al formato esperado por el frontend
-        status_map = {
-            'Pendiente': 'pendiente',
-            'En proceso': 'en_proceso',
-            'Completada': 'completado',
-            'Cancelado': 'cancelado',
-            'Expirada': 'expirado'
-        }
+        status = self._status_key()
 
         data = {
             'id': self.id,
@@ -313,8 +426,8 @@ class Operation(db.Model):
             'payment_proof_url': self.payment_proof_url,
             'operator_proof_url': self.operator_proof_url,
             'comprobante_url': self.payment_proof_url,  # Para frontend
-            'status': status_map.get(self.status, self.status.lower().replace(' ', '_')),
-            'estado': status_map.get(self.status, self.status.lower().replace(' ', '_')),  # Para frontend
+            'status': status,
+            'estado': status,  # Para frontend
             'notes': self.notes,
             'notas': self.notes,  # Para frontend
             'coupon_code': self.coupon_code,
@@ -335,94 +448,22 @@ class Operation(db.Model):
             'total_payments': self.get_total_payments(),
             'notes_read_by': self.notes_read_by,
             'assigned_operator_id': self.assigned_operator_id,
+            # Campo calculado: bancos involucrados
+            'banks_display': self._banks_display(),
         }
 
-        # Campo calculado: bancos involucrados, derivado de los pagos/depósitos reales.
-        # Prioridad: qc_bank en client_payments/deposits → fallback source/destination_bank_name.
-        try:
-            _pay_banks = list(dict.fromkeys(
-                p.get('qc_bank') for p in self.client_payments if p.get('qc_bank')
-            ))
-            _dep_banks = list(dict.fromkeys(
-                d.get('qc_bank') for d in self.client_deposits if d.get('qc_bank')
-            ))
-            if _pay_banks or _dep_banks:
-                _out = ' + '.join(_pay_banks) if _pay_banks else None
-                _in = ' + '.join(_dep_banks) if _dep_banks else None
-                if _out and _in:
-                    data['banks_display'] = f"{_out} → {_in}"
-                else:
-                    data['banks_display'] = _out or _in
-            else:
-                _src = self.source_bank_name or 'N/A'
-                _dst = self.destination_bank_name or 'N/A'
-                data['banks_display'] = f"{_src} / {_dst}"
-        except Exception:
-            data['banks_display'] = f"{self.source_bank_name or 'N/A'} / {self.destination_bank_name or 'N/A'}"
-
         if include_relations:
-            # Obtener nombre del cliente según su tipo (con manejo defensivo)
-            if self.client:
-                try:
-                    if self.client.document_type == 'RUC':
-                        data['client_name'] = self.client.razon_social or f"RUC {self.client.dni}"
-                    else:
-                        # full_name puede retornar None si no hay datos
-                        client_full_name = self.client.full_name
-                        data['client_name'] = client_full_name if client_full_name else f"Cliente {self.client.dni}"
-                except Exception as e:
-                    # Fallback si hay algún error accediendo a los atributos del cliente
-                    data['client_name'] = f"Cliente {self.client.dni if self.client.dni else 'Desconocido'}"
-
-                # Incluir cuentas bancarias del cliente con manejo defensivo
-                try:
-                    data['client_bank_accounts'] = self.client.bank_accounts or []
-                except Exception:
-                    data['client_bank_accounts'] = []
-
-                # Obtener nombres de bancos de origen y destino con manejo defensivo.
-                # Prioridad: (1) nombre almacenado en la operación, (2) lookup por número de cuenta.
-                try:
-                    bank_accounts = self.client.bank_accounts or []
-                    source_bank = None
-                    destination_bank = None
-
-                    for account in bank_accounts:
-                        if account.get('account_number') == self.source_account:
-                            source_bank = account.get('bank_name')
-                        if account.get('account_number') == self.destination_account:
-                            destination_bank = account.get('bank_name')
-
-                    # Fallback al nombre almacenado cuando el lookup falla
-                    # (ocurre cuando el cliente actualiza sus cuentas bancarias)
-                    if not source_bank:
-                        source_bank = self.source_bank_name
-                    if not destination_bank:
-                        destination_bank = self.destination_bank_name
-
-                    data['source_bank_name'] = source_bank or 'N/A'
-                    data['destination_bank_name'] = destination_bank or 'N/A'
-                except Exception:
-                    data['source_bank_name'] = self.source_bank_name or 'N/A'
-                    data['destination_bank_name'] = self.destination_bank_name or 'N/A'
-            else:
-                data['client_name'] = None
-                data['client_bank_accounts'] = []
-                data['source_bank_name'] = 'N/A'
-                data['destination_bank_name'] = 'N/A'
+            data['client_name'] = self._client_name()
 
+            # Incluir cuentas bancarias del cliente con manejo defensivo
             try:
-                data['user_name'] = self.user.username if self.user else None
+                data['client_bank_accounts'] = (self.client.bank_accounts or []) if self.client else []
             except Exception:
-                data['user_name'] = None
+                data['client_bank_accounts'] = []
 
-            # Obtener nombre del operador asignado
-            if self.assigned_operator_id:
-                from app.models.user import User
-                assigned_operator = db.session.get(User, self.assigned_operator_id)
-                data['assigned_operator_name'] = assigned_operator.username if assigned_operator else None
-            else:
-                data['assigned_operator_name'] = None
+            data['source_bank_name'], data['destination_bank_name'] = self._bank_names()
+            data['user_name'] = self._user_name()
+            data['assigned_operator_name'] = self._assigned_operator_name()
 
             # Agregar facturas electrónicas de la operación
             if self.invoices:
@@ -432,6 +473,57 @@ class Operation(db.Model):
 
         return data
 
+    # Getters del formato compacto (app/utils/compact.py): un nombre por campo,
+    # sin alias. Los de cliente/usuario necesitan las relaciones precargadas.
+    COMPACT_FIELDS = {
+        'id':                      lambda op: op.id,
+        'operation_id':            lambda op: op.operation_id,
+        'client_id':               lambda op: op.client_id,
+        'user_id':                 lambda op: op.user_id,
+        'operation_type':          lambda op: op.operation_type,
+        'origen':                  lambda op: op.origen,
+        'amount_usd':              lambda op: _num(op.amount_usd),
+        'exchange_rate':           lambda op: _num(op.exchange_rate),
+        'base_rate':               lambda op: _num(op.base_rate),
+        'pips':                    lambda op: _num(op.pips),
+        'amount_pen':              lambda op: _num(op.amount_pen),
+        'source_account':          lambda op: op.source_account,
+        'destination_account':     lambda op: op.destination_account,
+        'payment_proof_url':       lambda op: op.payment_proof_url,
+        'operator_proof_url':      lambda op: op.operator_proof_url,
+        'status':                  lambda op: op._status_key(),
+        'notes':                   lambda op: op.notes,
+        'coupon_code':             lambda op: op.coupon_code,
+        'created_at':              lambda op: _iso(op.created_at),
+        'updated_at':              lambda op: _iso(op.updated_at),
+        'completed_at':            lambda op: _iso(op.completed_at),
+        'in_process_since':        lambda op: _iso(op.in_process_since),
+        'time_in_process_minutes': lambda op: op.get_time_in_process_minutes(),
+        'client_deposits':         lambda op: op._json_list('client_deposits_json'),
+        'client_payments':         lambda op: op._json_list('client_payments_json'),
+        'operator_proofs':         lambda op: op._json_list('operator_proofs_json'),
+        'modification_logs':       lambda op: op._json_list('modification_logs_json'),
+        'notes_read_by':           lambda op: op._json_list('notes_read_by_json'),
+        'operator_comments':       lambda op: op.operator_comments,
+        'total_deposits':          lambda op: op.get_total_deposits(),
+        'total_payments':          lambda op: op.get_total_payments(),
+        'assigned_operator_id':    lambda op: op.assigned_operator_id,
+        'banks_display':           lambda op: op._banks_display(),
+        'client_name':             lambda op: op._client_name(),
+        'source_bank_name':        lambda op: op._bank_names()[0],
+        'destination_bank_name':   lambda op: op._bank_names()[1],
+        'user_name':               lambda op: op._user_name(),
+        'assigned_operator_name':  lambda op: op._assigned_operator_name(),
+    }
+
+    # Columnas que muestran las tablas de operaciones (list / operator_list)
+    COMPACT_DEFAULT = (
+        'id', 'operation_id', 'client_id', 'client_name', 'operation_type',
+        'amount_usd', 'exchange_rate', 'amount_pen', 'status', 'created_at',
+        'in_process_since', 'time_in_process_minutes', 'banks_display',
+        'user_name', 'assigned_operator_id', 'assigned_operator_name',
+    )
+
     def is_pending(self):
         """Verificar si está pendiente"""
         return self.status == 'Pendiente'
@@ -508,22 +600,47 @@ class Operation(db.Model):
     @staticmethod
     def generate_operation_id():
         """
-        Generar ID de operación secuencial.
-        Parsea el número del último operation_id (EXP-XXXX) para mantener
-        el correlativo correcto independientemente del PK autoincremental.
+        Generar ID de operación secuencial (EXP-XXXX).
+
+        En PostgreSQL sale de la secuencia operation_code_seq (nextval atómico,
+        seguro con creaciones en paralelo; ver app/utils/operation_codes.py).
+        En otras bases parsea el número del último operation_id para mantener
+        el correlativo independientemente del PK autoincremental.
         """
         from app.extensions import db
+        from app.utils.operation_codes import next_code, parse_code, format_code, FIRST
+
+        conn = db.session.connection()
+        if conn.dialect.name == 'postgresql':
+            return next_code(conn)
+
         last = db.session.query(Operation.operation_id).filter(
             Operation.operation_id.like('EXP-%')
         ).order_by(Operation.id.desc()).first()
-        if last:
-            try:
-                last_num = int(last[0].split('-')[1])
-            except (IndexError, ValueError):
-                last_num = 1000
-        else:
-            last_num = 1000
-        return f'EXP-{last_num + 1}'
+        last_num = (parse_code(last[0]) if last else None) or FIRST - 1
+        return format_code(last_num + 1)
 
     def __repr__(self):
         return f'<Operation {self.operation_id} - {self.operation_type} ${self.amount_usd}>'
+
+
+@event.listens_for(Operation, 'after_insert')
+@event.listens_for(Operation, 'after_update')
+def _sync_operation_children(mapper, connection, target):
+    """Mantener operation_deposits / _payments / _proofs / _logs al día con los *_json"""
+    from app.services.operation_children import sync_operation
+    sync_operation(connection, target)
+
+
+@event.listens_for(Operation, 'after_insert')
+def _schedule_expiry(mapper, connection, target):
+    """Registrar el deadline de expiración (15 min) en el motor de expiración"""
+    from app.services.operation_expiry_service import OperationExpiryService
+    OperationExpiryService.schedule(target)
+
+
+@event.listens_for(Operation, 'after_update')
+def _track_operator_queue(mapper, connection, target):
+    """Anotar el cambio para empujar el diff de la cola del operador tras el commit"""
+    from app.services.operator_queue import track
+    track(target)
@@ -0,0 +1,91 @@
+"""
+Tablas hijas de Operation — QoriCash
+=====================================
+Abonos, pagos, comprobantes del operador y logs de modificación de cada
+operación, una fila por elemento. Operation sigue guardando las listas en sus
+columnas *_json (el frontend y los endpoints las leen así); estas tablas son
+su copia indexada, que reescribe operation_children.sync_operation() en el
+mismo flush cada vez que cambia una de esas columnas.
+
+Sirven para consultar sin decodificar JSON: la atribución de abonos y pagos
+por banco de QoriCash (reconciliación, sync de saldos, backfill del ledger)
+se agrega en SQL sobre operation_deposits / operation_payments.
+
+bank_key es el banco de QoriCash normalizado (BCP / INTERBANK / BANBIF) a
+partir de qc_bank o, si falta, de la cuenta del cliente; '' si no se
+reconoce. external marca las filas con banco informado pero no reconocido.
+data guarda el elemento original completo.
+"""
+from app.extensions import db
+
+
+class OperationDeposit(db.Model):
+    """Abono del cliente a QoriCash (client_deposits_json)"""
+    __tablename__ = 'operation_deposits'
+
+    id           = db.Column(db.Integer, primary_key=True)
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id', ondelete='CASCADE'),
+                             nullable=False, index=True)
+    position     = db.Column(db.Integer, nullable=False)
+    amount       = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    qc_bank      = db.Column(db.String(50))
+    account      = db.Column(db.String(200))       # cuenta_cargo del cliente
+    bank_key     = db.Column(db.String(20), nullable=False, default='')
+    external     = db.Column(db.Boolean, nullable=False, default=False)
+    reference    = db.Column(db.String(100))       # codigo_operacion del voucher
+    data         = db.Column(db.Text, nullable=False, default='{}')
+
+    __table_args__ = (
+        db.Index('ix_operation_deposits_bank', 'bank_key', 'operation_id'),
+    )
+
+
+class OperationPayment(db.Model):
+    """Pago de QoriCash al cliente (client_payments_json)"""
+    __tablename__ = 'operation_payments'
+
+    id           = db.Column(db.Integer, primary_key=True)
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id', ondelete='CASCADE'),
+                             nullable=False, index=True)
+    position     = db.Column(db.Integer, nullable=False)
+    amount       = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    qc_bank      = db.Column(db.String(50))
+    account      = db.Column(db.String(200))       # cuenta_destino del cliente
+    bank_key     = db.Column(db.String(20), nullable=False, default='')
+    external     = db.Column(db.Boolean, nullable=False, default=False)
+    data         = db.Column(db.Text, nullable=False, default='{}')
+
+    __table_args__ = (
+        db.Index('ix_operation_payments_bank', 'bank_key', 'operation_id'),
+    )
+
+
+class OperationProof(db.Model):
+    """Comprobante subido por el operador (operator_proofs_json)"""
+    __tablename__ = 'operation_proofs'
+
+    id           = db.Column(db.Integer, primary_key=True)
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id', ondelete='CASCADE'),
+                             nullable=False, index=True)
+    position     = db.Column(db.Integer, nullable=False)
+    url          = db.Column(db.String(500))
+    comment      = db.Column(db.Text)
+    data         = db.Column(db.Text, nullable=False, default='{}')
+
+
+class OperationLog(db.Model):
+    """Log de modificación de la operación (modification_logs_json)"""
+    __tablename__ = 'operation_logs'
+
+    id           = db.Column(db.Integer, primary_key=True)
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id', ondelete='CASCADE'),
+                             nullable=False, index=True)
+    position     = db.Column(db.Integer, nullable=False)
+    logged_at    = db.Column(db.DateTime)
+    user_id      = db.Column(db.Integer)
+    field        = db.Column(db.String(100))
+    data         = db.Column(db.Text, nullable=False, default='{}')
+
+    __table_args__ = (
+        db.Index('ix_operation_logs_user', 'user_id', 'logged_at'),
+    )
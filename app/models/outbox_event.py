@@ -0,0 +1,56 @@
+"""
+OutboxEvent — Outbox transaccional de efectos secundarios
+==========================================================
+Cada fila es un efecto pendiente de un cambio de estado (asiento contable,
+saldos bancarios, factura NubeFact, email, WhatsApp, notificaciones push,
+compliance). Se inserta en la MISMA transacción que el cambio de estado, así
+que o se graban ambos o ninguno; app/services/outbox.py los despacha en
+segundo plano con reintentos.
+
+  idempotency_key  único: encolar dos veces el mismo efecto es un no-op.
+  group_key        los efectos de un mismo grupo (una operación) se procesan
+                   en orden de id: el email no sale antes que la factura.
+
+Ciclo: pendiente → procesando → hecho | pendiente (reintento con
+available_at) | fallido (agotó MAX_ATTEMPTS; se puede reencolar por CLI).
+"""
+import json
+
+from app.extensions import db
+from app.utils.formatters import now_peru
+
+STATUS_PENDIENTE  = 'pendiente'
+STATUS_PROCESANDO = 'procesando'
+STATUS_HECHO      = 'hecho'
+STATUS_FALLIDO    = 'fallido'
+
+
+class OutboxEvent(db.Model):
+    __tablename__ = 'outbox_events'
+
+    id              = db.Column(db.Integer, primary_key=True)
+    topic           = db.Column(db.String(60), nullable=False)
+    idempotency_key = db.Column(db.String(160), nullable=False, unique=True)
+    group_key       = db.Column(db.String(80), nullable=False)
+    operation_id    = db.Column(db.Integer, db.ForeignKey('operations.id', ondelete='CASCADE'),
+                                nullable=True, index=True)
+    payload_json    = db.Column(db.Text, nullable=False, default='{}')
+    status          = db.Column(db.String(20), nullable=False, default=STATUS_PENDIENTE)
+    attempts        = db.Column(db.Integer, nullable=False, default=0)
+    available_at    = db.Column(db.DateTime, nullable=False, default=now_peru)
+    locked_at       = db.Column(db.DateTime)
+    last_error      = db.Column(db.Text)
+    created_at      = db.Column(db.DateTime, nullable=False, default=now_peru)
+    processed_at    = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_outbox_events_status_available', 'status', 'available_at'),
+        db.Index('ix_outbox_events_group', 'group_key', 'id'),
+    )
+
+    @property
+    def payload(self) -> dict:
+        try:
+            return json.loads(self.payload_json or '{}')
+        except (TypeError, ValueError):
+            return {}
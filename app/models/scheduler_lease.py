@@ -0,0 +1,22 @@
+"""
+SchedulerLease — Lease de jobs en segundo plano entre workers
+==============================================================
+Una fila por job (precios de mercado, FX monitor, expiración de operaciones,
+lead hunter, agentes...). Solo el worker que figura en holder con
+expires_at vigente corre el job; lo renueva cada pocos segundos y, si muere,
+otro worker lo toma cuando vence. Ver app/services/scheduler_coordinator.py.
+
+Las marcas de tiempo son del reloj de la base (LOCALTIMESTAMP), no de cada
+worker, para que comparar expires_at no dependa del reloj de cada máquina.
+"""
+from app.extensions import db
+
+
+class SchedulerLease(db.Model):
+    __tablename__ = 'scheduler_leases'
+
+    job         = db.Column(db.String(80), primary_key=True)
+    holder      = db.Column(db.String(120), nullable=False)   # host:pid:token del worker
+    acquired_at = db.Column(db.DateTime, nullable=False)
+    renewed_at  = db.Column(db.DateTime, nullable=False)
+    expires_at  = db.Column(db.DateTime, nullable=False)
@@ -17,13 +17,13 @@ import logging
 from datetime import date, datetime
 
 from flask import (Blueprint, render_template, jsonify, request,
-                   send_file, redirect, url_for)
+                   redirect, url_for, Response, stream_with_context)
 from flask_login import login_required, current_user
-from io import BytesIO
 
 from app.extensions import db, csrf
 from app.utils.decorators import require_role
 from app.utils.formatters import now_peru
+from app.utils.periods import in_month
 
 _log = logging.getLogger(__name__)
 
@@ -178,10 +178,8 @@ def api_ultimo():
     ).order_by(AuditReport.id.desc()).first()
 
     # Si piden período específico
-    from sqlalchemy import extract
     report = AuditReport.query.filter(
-        extract('year',  AuditReport.audit_date) == year,
-        extract('month', AuditReport.audit_date) == month,
+        in_month(AuditReport.audit_date, year, month),
     ).order_by(AuditReport.id.desc()).first()
 
     if not report:
@@ -190,69 +188,47 @@ def api_ultimo():
     return jsonify({'success': True, 'report': report.to_dict()})
 
 
-# ── PLE Export: Libro Diario ──────────────────────────────────────────────────
+# ── PLE Export (streaming): diario | mayor | compras ─────────────────────────
 
-@auditoria_bp.route('/ple/diario')
+@auditoria_bp.route('/ple/<libro>')
 @login_required
 @require_role('Master')
-def ple_diario():
-    from app.services.audit.ple_export import (
-        export_libro_diario_simplificado, get_filename
-    )
+def ple_export(libro):
+    """
+    Descarga el libro PLE del período. El archivo se genera en streaming
+    (cursor del servidor → líneas latin-1 → respuesta) sin armarlo en memoria.
+    """
+    from app.services.audit.ple_export import stream_ple, get_filename, LIBROS
     from app.models.system_config import SystemConfig
 
-    year  = request.args.get('year',  type=int, default=date.today().year)
-    month = request.args.get('month', type=int, default=date.today().month)
-
-    try:
-        ruc      = SystemConfig.get('RUC', '20615113698')
-        content  = export_libro_diario_simplificado(year, month)
-        filename = get_filename('diario', year, month, ruc)
-
-        output = BytesIO(content)
-        output.seek(0)
-
-        return send_file(
-            output,
-            mimetype='text/plain',
-            as_attachment=True,
-            download_name=filename,
-        )
-    except Exception as exc:
-        _log.exception('[PLE] Error exportando Libro Diario')
-        return jsonify({'success': False, 'error': str(exc)}), 500
-
-
-# ── PLE Export: Registro de Compras ──────────────────────────────────────────
-
-@auditoria_bp.route('/ple/compras')
-@login_required
-@require_role('Master')
-def ple_compras():
-    from app.services.audit.ple_export import export_registro_compras, get_filename
-    from app.models.system_config import SystemConfig
+    if libro not in LIBROS:
+        return jsonify({'success': False, 'error': f'Libro PLE no soportado: {libro}'}), 404
 
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
 
     try:
         ruc      = SystemConfig.get('RUC', '20615113698')
-        content  = export_registro_compras(year, month)
-        filename = get_filename('compras', year, month, ruc)
-
-        output = BytesIO(content)
-        output.seek(0)
-
-        return send_file(
-            output,
-            mimetype='text/plain',
-            as_attachment=True,
-            download_name=filename,
-        )
+        filename = get_filename(libro, year, month, ruc)
+        chunks   = stream_ple(libro, year, month)
     except Exception as exc:
-        _log.exception('[PLE] Error exportando Registro Compras')
+        _log.exception(f'[PLE] Error preparando libro {libro}')
         return jsonify({'success': False, 'error': str(exc)}), 500
 
+    def _generate():
+        try:
+            yield from chunks
+        except Exception:
+            # La respuesta ya empezó: solo queda registrar y cortar el archivo
+            _log.exception(f'[PLE] Error exportando libro {libro} {year}/{month:02d}')
+            raise
+
+    return Response(
+        stream_with_context(_generate()),
+        mimetype='text/plain; charset=latin-1',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
 
 # ── Depreciación mensual manual ───────────────────────────────────────────────
 
@@ -274,7 +250,7 @@ def depreciar():
             'resultado': resultado,
             'message': (
                 f'{resultado["generados"]} asiento(s) de depreciación generado(s) '
-                f'para {month:02d}/{year}. '
+                f'({resultado["activos"]} activo(s)) para {month:02d}/{year}. '
                 f'Total: S/ {resultado["total_depreciation"]:,.2f}.'
             ),
         })
@@ -298,7 +274,6 @@ def regenerar_asientos():
     """
     from datetime import date as date_type
     from decimal import Decimal
-    from app.models.operation import Operation
     from app.models.expense_record import ExpenseRecord
     from app.models.journal_entry import JournalEntry
     from app.services.accounting.journal_service import JournalService
@@ -311,35 +286,15 @@ def regenerar_asientos():
     gastos_err = 0
     errores = []
 
-    # ── 1. Operaciones completadas sin asiento ──────────────────────────────
-    ops = Operation.query.filter(
-        Operation.status == 'Completada',
-        Operation.completed_at >= DESDE,
-    ).order_by(Operation.completed_at.asc()).all()
+    # ── 1. Operaciones completadas sin asiento (carga masiva por bloques) ───
+    from app.services.accounting.bulk_journal import run_bulk_operation_entries
 
-    # IDs de operaciones que ya tienen asiento
-    existing_op_ids = set(
-        row[0] for row in db.session.query(JournalEntry.source_id).filter(
-            JournalEntry.source_type == 'operation',
-            JournalEntry.status == 'activo',
-        ).all() if row[0]
+    bulk = run_bulk_operation_entries(
+        desde=DESDE, dry_run=False, created_by=current_user.id,
     )
-
-    for op in ops:
-        if op.id in existing_op_ids:
-            continue
-        try:
-            entry = JournalService.create_entry_for_completed_operation(
-                op, created_by_id=current_user.id
-            )
-            if entry:
-                ops_ok += 1
-            else:
-                ops_err += 1
-                errores.append(f'Op {op.operation_id}: create_entry retornó None')
-        except Exception as exc:
-            ops_err += 1
-            errores.append(f'Op {op.operation_id}: {exc}')
+    ops_ok  = bulk['generados']
+    ops_err = bulk['errores']
+    errores.extend(f'Op {e["operation_id"]}: {e["error"]}' for e in bulk['detalle_errores'])
 
     # ── 2. Gastos sin asiento ───────────────────────────────────────────────
     gastos = ExpenseRecord.query.filter(
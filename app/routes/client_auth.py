@@ -1028,6 +1028,7 @@ def get_client_operations(dni):
     Query params:
         - status: filtrar por estado (Pendiente, En proceso, etc.)
         - limit: limitar resultados
+        - fields / format: formato compacto opt-in (app/utils/compact.py)
 
     Returns:
         JSON: {"success": true, "operations": [...]}
@@ -1060,6 +1061,13 @@ def get_client_operations(dni):
 
         operations = query.all()
 
+        # Formato compacto opt-in (?fields= / ?format=columnar)
+        from app.utils.compact import compact_payload
+        compact = compact_payload(operations, request.args,
+                                  Operation.COMPACT_FIELDS, Operation.COMPACT_DEFAULT)
+        if compact is not None:
+            return jsonify({'success': True, **compact}), 200
+
         return jsonify({
             'success': True,
             'operations': [op.to_dict(include_relations=True) for op in operations]
@@ -1,7 +1,7 @@
 """
 Rutas de Clientes para QoriCash Trading V2
 """
-from flask import Blueprint, render_template, request, jsonify, send_file, current_app
+from flask import Blueprint, render_template, request, jsonify, current_app
 from flask_login import login_required, current_user
 from app.services.client_service import ClientService
 from app.services.file_service import FileService
@@ -9,8 +9,6 @@ from app.services.notification_service import NotificationService
 from app.utils.decorators import require_role
 from app.utils.formatters import now_peru
 from app.extensions import db, csrf
-import io
-import csv
 from datetime import datetime
 import json
 import logging
@@ -650,27 +648,32 @@ def export_csv():
     API: Exportar clientes a Excel con formato de tabla
     """
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from openpyxl.utils import get_column_letter
-
-        # Obtener todos los clientes con eager loading (excluir demo)
+        from sqlalchemy import func, case
         from sqlalchemy.orm import joinedload
         from app.models.client import Client
+        from app.models.operation import Operation
         from app.models.user import User
+        from app.services.excel_export import ExcelExport, iter_query
+
+        # Obtener todos los clientes con eager loading (excluir demo)
         _demo_id = User.get_demo_user_id()
         _q = Client.query.options(joinedload(Client.creator))
         if _demo_id:
             _q = _q.filter(Client.created_by != _demo_id)
-        clients = _q.order_by(Client.created_at.desc()).all()
+        _q = _q.order_by(Client.created_at.desc(), Client.id.desc())
 
-        if not clients:
+        if not db.session.query(_q.exists()).scalar():
             return jsonify({'success': False, 'message': 'No hay clientes para exportar'}), 404
 
-        # Crear workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Clientes"
+        # Conteo de operaciones de todos los clientes en un solo GROUP BY
+        op_counts = {
+            cid: (int(total or 0), int(done or 0))
+            for cid, total, done in db.session.query(
+                Operation.client_id,
+                func.count(Operation.id),
+                func.sum(case((Operation.status == 'Completada', 1), else_=0)),
+            ).group_by(Operation.client_id).all()
+        }
 
         # Definir columnas en orden específico (ahora con más detalle)
         headers = [
@@ -697,94 +700,50 @@ def export_csv():
             'Cuenta Bancaria 5',
             'Cuenta Bancaria 6'
         ]
-
-        # Escribir encabezados con formato
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num, value=header)
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-
-        # Escribir datos
-        for row_num, client in enumerate(clients, 2):
-            col = 1
-            ws.cell(row=row_num, column=col, value=client.id); col += 1
-            ws.cell(row=row_num, column=col, value=client.document_type); col += 1
-            ws.cell(row=row_num, column=col, value=client.dni); col += 1
-            ws.cell(row=row_num, column=col, value=client.full_name or ''); col += 1
-
-            # Persona de contacto (solo para RUC)
-            ws.cell(row=row_num, column=col, value=client.persona_contacto if client.document_type == 'RUC' else ''); col += 1
-
-            ws.cell(row=row_num, column=col, value=client.email); col += 1
-            ws.cell(row=row_num, column=col, value=client.phone or ''); col += 1
-
-            # Dirección separada en columnas
-            ws.cell(row=row_num, column=col, value=client.direccion or ''); col += 1
-            ws.cell(row=row_num, column=col, value=client.distrito or ''); col += 1
-            ws.cell(row=row_num, column=col, value=client.provincia or ''); col += 1
-            ws.cell(row=row_num, column=col, value=client.departamento or ''); col += 1
-
-            ws.cell(row=row_num, column=col, value=client.creator.email if client.creator else 'N/A'); col += 1
-            ws.cell(row=row_num, column=col, value=client.created_at.strftime('%d/%m/%Y %H:%M') if client.created_at else ''); col += 1
-            ws.cell(row=row_num, column=col, value=client.status); col += 1
-            ws.cell(row=row_num, column=col, value=client.get_total_operations()); col += 1
-            ws.cell(row=row_num, column=col, value=client.get_completed_operations()); col += 1
+        # ID, documento, nombre, contacto, email, teléfono, dirección (4),
+        # usuario, fecha, estado, total ops, ops completadas, cuentas (6)
+        widths = [8, 15, 18, 35, 30, 30, 15, 30, 20, 20, 20, 30, 18, 12, 18, 20] + [50] * 6
+
+        xl = ExcelExport()
+        ws = xl.sheet('Clientes', widths=widths, freeze='A2')
+        ws.header(headers)
+
+        for client in iter_query(_q):
+            total_ops, completed_ops = op_counts.get(client.id, (0, 0))
+            row = [
+                client.id,
+                client.document_type,
+                client.dni,
+                client.full_name or '',
+                # Persona de contacto (solo para RUC)
+                client.persona_contacto if client.document_type == 'RUC' else '',
+                client.email,
+                client.phone or '',
+                # Dirección separada en columnas
+                client.direccion or '',
+                client.distrito or '',
+                client.provincia or '',
+                client.departamento or '',
+                client.creator.email if client.creator else 'N/A',
+                client.created_at.strftime('%d/%m/%Y %H:%M') if client.created_at else '',
+                client.status,
+                total_ops,
+                completed_ops,
+            ]
 
             # Cuentas bancarias (hasta 6)
             bank_accounts = client.bank_accounts or []
             for i in range(6):
                 if i < len(bank_accounts):
                     account = bank_accounts[i]
-                    account_str = f"{account.get('bank_name', '')} | {account.get('account_type', '')} | {account.get('currency', '')} | {account.get('account_number', '')}"
-                    ws.cell(row=row_num, column=col, value=account_str)
+                    row.append(f"{account.get('bank_name', '')} | {account.get('account_type', '')} | {account.get('currency', '')} | {account.get('account_number', '')}")
                 else:
-                    ws.cell(row=row_num, column=col, value='')
-                col += 1
-
-        # Ajustar ancho de columnas
-        column_widths = {
-            'A': 8,   # ID
-            'B': 15,  # Tipo Documento
-            'C': 18,  # Número Documento
-            'D': 35,  # Nombre Completo
-            'E': 30,  # Persona Contacto
-            'F': 30,  # Email
-            'G': 15,  # Teléfono
-            'H': 30,  # Dirección
-            'I': 20,  # Distrito
-            'J': 20,  # Provincia
-            'K': 20,  # Departamento
-            'L': 30,  # Usuario Registro
-            'M': 18,  # Fecha Registro
-            'N': 12,  # Estado
-            'O': 18,  # Total Ops
-            'P': 20,  # Ops Completadas
-            'Q': 50,  # Cuenta 1
-            'R': 50,  # Cuenta 2
-            'S': 50,  # Cuenta 3
-            'T': 50,  # Cuenta 4
-            'U': 50,  # Cuenta 5
-            'V': 50   # Cuenta 6
-        }
-
-        for col, width in column_widths.items():
-            ws.column_dimensions[col].width = width
-
-        # Guardar en memoria
-        excel_file = io.BytesIO()
-        wb.save(excel_file)
-        excel_file.seek(0)
+                    row.append('')
+            ws.append(row)
 
         # Nombre del archivo con fecha
         filename = f"clientes_qoricash_{now_peru().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-        return send_file(
-            excel_file,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return xl.to_response(filename)
 
     except Exception as e:
         import traceback
@@ -1383,19 +1342,32 @@ def export_client_history(client_id):
     Query params opcionales:
         start_date: Fecha inicio (formato: YYYY-MM-DD)
         end_date:   Fecha fin   (formato: YYYY-MM-DD)
+
+    Para historiales grandes preferir el job en segundo plano
+    (POST /exports/api/jobs, kind='client_history').
     """
-    import openpyxl
-    from openpyxl.styles import Font, Alignment, PatternFill
-    from io import BytesIO
+    from app.routes.operations import _operations_xl_with_user
+
+    xl, filename = build_client_history(
+        client_id,
+        request.args.get('start_date'),
+        request.args.get('end_date'),
+        _operations_xl_with_user(current_user.role),
+    )
+    return xl.to_response(filename)
+
+
+def build_client_history(client_id: int, start_date: str = None, end_date: str = None,
+                         with_user: bool = False):
+    """Historial de operaciones de un cliente. Retorna (ExcelExport, filename)."""
+    from sqlalchemy.orm import selectinload
     from app.models.client import Client
     from app.models.operation import Operation
     from app.routes.operations import get_bank_account_info
+    from app.services.excel_export import ExcelExport, iter_query
 
     client = db.get_or_404(Client, client_id)
 
-    start_date = request.args.get('start_date')
-    end_date   = request.args.get('end_date')
-
     query = Operation.query.filter_by(client_id=client_id)
 
     if start_date:
@@ -1412,70 +1384,42 @@ def export_client_history(client_id):
         except ValueError:
             pass
 
-    operations = query.order_by(Operation.created_at.desc()).all()
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Historial de Operaciones"
-
-    header_fill      = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font      = Font(color="FFFFFF", bold=True)
-    header_alignment = Alignment(horizontal="center", vertical="center")
+    operations = iter_query(query.options(selectinload(Operation.user)).order_by(
+        Operation.created_at.desc(), Operation.id.desc(),
+    ))
+
+    headers = ['ID OP.', 'DOCUMENTO', 'CLIENTE', 'USD', 'T.C.', 'PEN',
+               'CUENTA CARGO', 'CUENTA DESTINO', 'CANAL', 'ESTADO', 'FECHA']
+    widths  = [12, 15, 30, 12, 10, 12, 35, 35, 12, 15, 18]
+    styles  = ['qc_cell_soft'] * 3 + ['qc_num_soft'] * 3 + ['qc_cell_soft'] * 5
+    if with_user:
+        headers.append('USUARIO')
+        widths.append(30)
+        styles.append('qc_cell_soft')
+
+    xl = ExcelExport()
+    ws = xl.sheet('Historial de Operaciones', widths=widths, freeze='A2')
+    ws.header(headers)
+
+    for op in operations:
+        row = [
+            op.operation_id,
+            client.dni,
+            client.full_name,
+            float(op.amount_usd),
+            float(op.exchange_rate),
+            float(op.amount_pen),
+            get_bank_account_info(op, op.source_account),
+            get_bank_account_info(op, op.destination_account),
+            'Web' if op.origen == 'plataforma' else 'Sistema',
+            op.status,
+            op.created_at.strftime('%d/%m/%Y %H:%M') if op.created_at else '-',
+        ]
+        if with_user:
+            row.append(op.user.email if op.user else '-')
+        ws.append(row, styles=styles)
 
-    if current_user.role in ['Master', 'Presidente de Negocios', 'Operador']:
-        headers = ['ID OP.', 'DOCUMENTO', 'CLIENTE', 'USD', 'T.C.', 'PEN',
-                   'CUENTA CARGO', 'CUENTA DESTINO', 'CANAL', 'ESTADO', 'FECHA', 'USUARIO']
-    else:
-        headers = ['ID OP.', 'DOCUMENTO', 'CLIENTE', 'USD', 'T.C.', 'PEN',
-                   'CUENTA CARGO', 'CUENTA DESTINO', 'CANAL', 'ESTADO', 'FECHA']
-
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_alignment
-
-    for row_num, op in enumerate(operations, 2):
-        ws.cell(row=row_num, column=1, value=op.operation_id)
-        ws.cell(row=row_num, column=2, value=op.client.dni if op.client else '-')
-        ws.cell(row=row_num, column=3, value=op.client.full_name if op.client else '-')
-        ws.cell(row=row_num, column=4, value=float(op.amount_usd))
-        ws.cell(row=row_num, column=5, value=float(op.exchange_rate))
-        ws.cell(row=row_num, column=6, value=float(op.amount_pen))
-        ws.cell(row=row_num, column=7, value=get_bank_account_info(op, op.source_account))
-        ws.cell(row=row_num, column=8, value=get_bank_account_info(op, op.destination_account))
-        ws.cell(row=row_num, column=9, value='Web' if op.origen == 'plataforma' else 'Sistema')
-        ws.cell(row=row_num, column=10, value=op.status)
-        ws.cell(row=row_num, column=11, value=op.created_at.strftime('%d/%m/%Y %H:%M') if op.created_at else '-')
-        if current_user.role in ['Master', 'Presidente de Negocios', 'Operador']:
-            ws.cell(row=row_num, column=12, value=op.user.email if op.user else '-')
-
-    ws.column_dimensions['A'].width = 12
-    ws.column_dimensions['B'].width = 15
-    ws.column_dimensions['C'].width = 30
-    ws.column_dimensions['D'].width = 12
-    ws.column_dimensions['E'].width = 10
-    ws.column_dimensions['F'].width = 12
-    ws.column_dimensions['G'].width = 35
-    ws.column_dimensions['H'].width = 35
-    ws.column_dimensions['I'].width = 12
-    ws.column_dimensions['J'].width = 15
-    ws.column_dimensions['K'].width = 18
-    if current_user.role in ['Master', 'Presidente de Negocios', 'Operador']:
-        ws.column_dimensions['L'].width = 30
-
-    excel_file = BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
-
-    filename = f"historial_{client.dni}_{now_peru().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-    return send_file(
-        excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=filename
-    )
+    return xl, f"historial_{client.dni}_{now_peru().strftime('%Y%m%d_%H%M%S')}.xlsx"
 
 
 @clients_bp.route('/<int:client_id>/download-ficha-ruc')
@@ -3,16 +3,19 @@ Rutas del módulo contable QoriCash — Libro Diario, Gastos, Períodos.
 Solo accesible por rol Master.
 """
 from flask import Blueprint, render_template, request, jsonify, send_file
-from sqlalchemy.orm import joinedload
 from flask_login import login_required, current_user
 from app.extensions import db, csrf
 from app.utils.decorators import require_role
 from app.utils.formatters import now_peru
+from app.utils.periods import in_month, in_year
+from app.services.accounting.period_balances import PeriodBalanceService
+from app.services.closure_accumulator import ClosureAccumulator
+from app.services.excel_export import ExcelExport, iter_query
 from datetime import date, datetime
 from decimal import Decimal
 from io import BytesIO
 import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.styles import Font, Alignment, PatternFill
 
 contabilidad_bp = Blueprint('contabilidad', __name__)
 
@@ -55,6 +58,18 @@ def _company_info() -> dict:
         return {'razon_social': 'QORICASH SAC', 'ruc': '20615113698'}
 
 
+def _xl_title(ws, ncols: int, *lines):
+    """
+    Encabezado SUNAT (M-03) de una hoja ExcelExport: razón social, RUC y las
+    líneas de título adicionales [(texto, estilo)], combinadas sobre ncols.
+    """
+    co = _company_info()
+    ws.title_block(
+        [(co['razon_social'], 'qc_company'), (f'RUC: {co["ruc"]}', 'qc_center'), *lines],
+        ncols=ncols,
+    )
+
+
 # ── Dashboard contable ─────────────────────────────────────────────────────────
 
 @contabilidad_bp.route('/')
@@ -64,7 +79,7 @@ def _company_info() -> dict:
 def dashboard():
     from app.models.journal_entry import JournalEntry
     from app.models.expense_record import ExpenseRecord
-    from sqlalchemy import func, extract
+    from sqlalchemy import func
 
     year, month = _current_period_defaults()
 
@@ -73,8 +88,7 @@ def dashboard():
 
     # Asientos del mes actual
     entries_this_month = JournalEntry.query.filter(
-        extract('year', JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
     ).order_by(JournalEntry.entry_date.desc()).limit(10).all()
 
@@ -84,8 +98,7 @@ def dashboard():
         func.sum(JournalEntry.total_haber).label('haber'),
         func.count(JournalEntry.id).label('count'),
     ).filter(
-        extract('year', JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
     ).first()
 
@@ -100,14 +113,9 @@ def dashboard():
         from app.models.accounting_match import AccountingMatch
         from app.models.operation import Operation as _Op
         from app.models.user import User as _User
-        _start = date(year, month, 1)
-        import calendar as _cal
-        _last  = _cal.monthrange(year, month)[1]
-        _end   = date(year, month, _last)
         _ops   = _Op.query.filter(
             _Op.status == 'Completada',
-            func.date(_Op.created_at) >= _start,
-            func.date(_Op.created_at) <= _end,
+            in_month(_Op.created_at, year, month),
         ).all()
         _demo_id = _User.query.filter_by(username='demo_trader').with_entities(_User.id).scalar()
         _unmatched = 0
@@ -146,29 +154,90 @@ def dashboard():
 
 # ── Libro Diario ───────────────────────────────────────────────────────────────
 
+# Tipos de asiento conocidos (sugerencias del filtro del Libro Diario)
+_ENTRY_TYPES = (
+    'operacion_completada', 'calce_netting', 'calce_match', 'calce_match_reverso',
+    'gasto', 'pago_proveedor', 'cuota_prestamo', 'activo_fijo', 'depreciacion',
+    'ajuste_fx', 'ajuste_conciliacion', 'traslado_interno', 'apertura',
+    'manual', 'anulacion', 'reversal_operacion',
+)
+
+_DIARIO_PAGE_SIZE = 100
+
+
 @contabilidad_bp.route('/diario')
 @login_required
 @require_role('Master')
 def diario():
+    """
+    Libro Diario paginado por keyset sobre (entry_date, id): ?after= / ?before=
+    llevan el cursor de la última / primera fila vista, así cualquier página
+    cuesta lo mismo. Filtros en el servidor: cuenta (prefijo, EXISTS sobre
+    ix_jel_account_entry), tipo, rango de importe y texto. Las líneas se cargan
+    al expandir cada asiento (/diario/<id>/lines).
+    """
+    from sqlalchemy import exists, or_
     from app.models.journal_entry import JournalEntry
+    from app.models.journal_entry_line import JournalEntryLine
+    from app.utils.keyset import decode_cursor, encode_cursor, seek, page_window, estimate_count
 
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
     status_filter = request.args.get('status', 'activo')
+    filtros = {
+        'account': (request.args.get('account') or '').strip(),
+        'type':    (request.args.get('type') or '').strip(),
+        'min':     request.args.get('min', type=float),
+        'max':     request.args.get('max', type=float),
+        'q':       (request.args.get('q') or '').strip(),
+    }
 
     q = JournalEntry.query.filter_by(status=status_filter)
 
     if year and month:
-        from sqlalchemy import extract
         q = q.filter(
-            extract('year',  JournalEntry.entry_date) == year,
-            extract('month', JournalEntry.entry_date) == month,
+            in_month(JournalEntry.entry_date, year, month),
         )
     elif year:
-        from sqlalchemy import extract
-        q = q.filter(extract('year', JournalEntry.entry_date) == year)
-
-    entries = q.order_by(JournalEntry.entry_date.asc(), JournalEntry.id.asc()).all()
+        q = q.filter(in_year(JournalEntry.entry_date, year))
+
+    if filtros['account']:
+        q = q.filter(exists().where(
+            JournalEntryLine.journal_entry_id == JournalEntry.id,
+            JournalEntryLine.account_code.like(f"{filtros['account']}%"),
+        ))
+    if filtros['type']:
+        q = q.filter(JournalEntry.entry_type == filtros['type'])
+    if filtros['min'] is not None:
+        q = q.filter(JournalEntry.total_debe >= Decimal(str(filtros['min'])))
+    if filtros['max'] is not None:
+        q = q.filter(JournalEntry.total_debe <= Decimal(str(filtros['max'])))
+    if filtros['q']:
+        like = f"%{filtros['q']}%"
+        q = q.filter(or_(JournalEntry.description.ilike(like),
+                         JournalEntry.entry_number.ilike(like)))
+
+    total, total_exacto = estimate_count(q)
+
+    keyset = (JournalEntry.entry_date, JournalEntry.id)
+    after  = decode_cursor(request.args.get('after'),  (date, int))
+    before = decode_cursor(request.args.get('before'), (date, int)) if after is None else None
+    backwards = before is not None
+
+    page_q = q
+    if after is not None:
+        page_q = page_q.filter(seek(keyset, after))
+    elif backwards:
+        page_q = page_q.filter(seek(keyset, before, backwards=True))
+    order = ((JournalEntry.entry_date.desc(), JournalEntry.id.desc()) if backwards
+             else (JournalEntry.entry_date.asc(), JournalEntry.id.asc()))
+    rows = page_q.order_by(*order).limit(_DIARIO_PAGE_SIZE + 1).all()
+    entries, more = page_window(rows, _DIARIO_PAGE_SIZE, backwards)
+
+    has_next = more if not backwards else True
+    has_prev = more if backwards else after is not None
+    next_cursor = encode_cursor((entries[-1].entry_date, entries[-1].id)) if entries and has_next else None
+    prev_cursor = encode_cursor((entries[0].entry_date, entries[0].id)) if entries and has_prev else None
 
     periods = _get_all_periods()
 
@@ -179,6 +248,13 @@ def diario():
         selected_year=year,
         selected_month=month,
         status_filter=status_filter,
+        filtros=filtros,
+        entry_types=_ENTRY_TYPES,
+        total=total,
+        total_exacto=total_exacto,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
+        page_size=_DIARIO_PAGE_SIZE,
         user=current_user,
     )
 
@@ -315,6 +391,9 @@ def anular_asiento(entry_id):
         entry.annulled_at     = now_peru()
         entry.annulled_by     = current_user.id
         entry.annulled_reason = motivo
+        ClosureAccumulator.apply_expenses(entry.entry_date, entry.lines, reverse=True)
+        from app.services.accounting.account_totals import AccountTotalsService
+        AccountTotalsService.apply_lines(entry.entry_date, entry.entry_type, entry.lines, reverse=True)
         db.session.flush()
 
         # Crear asiento inverso en la misma fecha del original (M-05)
@@ -358,9 +437,15 @@ def anular_asiento(entry_id):
 def entry_lines(entry_id):
     """API: líneas de un asiento (para el acordeón del diario)."""
     from app.models.journal_entry import JournalEntry
+    from app.models.journal_entry_line import JournalEntryLine as JEL
 
-    entry = db.get_or_404(JournalEntry, entry_id)
-    lines = entry.lines
+    # Solo las columnas que pinta el acordeón (sin cargar la cabecera)
+    lines = db.session.query(
+        JEL.account_code, JEL.description, JEL.debe, JEL.haber,
+        JEL.currency, JEL.amount_usd, JEL.exchange_rate,
+    ).filter(JEL.journal_entry_id == entry_id).order_by(JEL.line_order, JEL.id).all()
+    if not lines:
+        db.get_or_404(JournalEntry, entry_id)
 
     return jsonify([{
         'account_code': l.account_code,
@@ -377,89 +462,71 @@ def entry_lines(entry_id):
 @login_required
 @require_role('Master')
 def export_diario():
-    """Exportar Libro Diario en Excel."""
+    """Exportar Libro Diario en Excel (write-only, líneas leídas en bloques)."""
     from app.models.journal_entry import JournalEntry
-    from sqlalchemy import extract
+    from app.models.journal_entry_line import JournalEntryLine
 
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
 
-    entries = JournalEntry.query.options(
-        joinedload(JournalEntry.lines),
+    q = db.session.query(
+        JournalEntry.id,
+        JournalEntry.entry_number,
+        JournalEntry.entry_date,
+        JournalEntry.entry_type,
+        JournalEntry.description,
+        JournalEntry.total_debe,
+        JournalEntry.total_haber,
+        JournalEntryLine.account_code,
+        JournalEntryLine.description.label('line_desc'),
+        JournalEntryLine.debe,
+        JournalEntryLine.haber,
+    ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
     ).filter(
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
-    ).order_by(JournalEntry.entry_date.asc(), JournalEntry.id.asc()).all()
+    ).order_by(
+        JournalEntry.entry_date.asc(), JournalEntry.id.asc(),
+        JournalEntryLine.line_order.asc(), JournalEntryLine.id.asc(),
+    )
 
-    co = _company_info()
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = 'Libro Diario'
+    xl = ExcelExport()
+    ws = xl.sheet('Libro Diario', widths=[16, 12, 22, 48, 8, 40, 14, 14], freeze='A7')
 
     # Encabezado SUNAT (M-03)
-    ws.merge_cells('A1:H1')
-    ws['A1'] = co['razon_social']
-    ws['A1'].font = Font(bold=True, size=12)
-    ws['A1'].alignment = Alignment(horizontal='center')
-    ws.merge_cells('A2:H2')
-    ws['A2'] = f'RUC: {co["ruc"]}'
-    ws['A2'].alignment = Alignment(horizontal='center')
-    ws.merge_cells('A3:H3')
-    ws['A3'] = f'LIBRO DIARIO — {_month_name(month)} {year} — Folio 0001'
-    ws['A3'].font = Font(bold=True)
-    ws['A3'].alignment = Alignment(horizontal='center')
-    ws.merge_cells('A4:H4')
-    ws['A4'] = 'Régimen MYPE Tributario — PCGE'
-    ws['A4'].alignment = Alignment(horizontal='center')
-
-    # Headers tabla
-    header_fill = PatternFill(start_color='1B3A6B', end_color='1B3A6B', fill_type='solid')
-    header_font = Font(bold=True, color='FFFFFF')
-    headers = ['N° Asiento', 'Fecha', 'Tipo', 'Descripción', 'Cta.', 'Glosa línea', 'DEBE (S/)', 'HABER (S/)']
-    for col, h in enumerate(headers, 1):
-        c = ws.cell(row=6, column=col, value=h)
-        c.fill = header_fill
-        c.font = header_font
-        c.alignment = Alignment(horizontal='center')
-
-    row = 7
-    thin = Side(style='thin')
-    border = Border(left=thin, right=thin, top=thin, bottom=thin)
-
-    for entry in entries:
-        lines = entry.lines
-        first_line = True
-        for line in lines:
-            ws.cell(row=row, column=1, value=entry.entry_number if first_line else '').border = border
-            ws.cell(row=row, column=2, value=entry.entry_date.strftime('%d/%m/%Y') if first_line else '').border = border
-            ws.cell(row=row, column=3, value=entry.entry_type if first_line else '').border = border
-            ws.cell(row=row, column=4, value=entry.description if first_line else '').border = border
-            ws.cell(row=row, column=5, value=line.account_code).border = border
-            ws.cell(row=row, column=6, value=line.description or '').border = border
-            ws.cell(row=row, column=7, value=float(line.debe or 0)).border = border
-            ws.cell(row=row, column=8, value=float(line.haber or 0)).border = border
-            first_line = False
-            row += 1
-        # Fila de totales del asiento
-        ws.cell(row=row, column=5, value='TOTAL ASIENTO').font = Font(bold=True)
-        ws.cell(row=row, column=7, value=float(entry.total_debe)).font = Font(bold=True)
-        ws.cell(row=row, column=8, value=float(entry.total_haber)).font = Font(bold=True)
-        row += 1
-
-    # Ajuste anchos
-    widths = [16, 12, 22, 48, 8, 40, 14, 14]
-    for i, w in enumerate(widths, 1):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(i)].width = w
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    filename = f'libro_diario_qoricash_{year}{month:02d}.xlsx'
-    return send_file(output,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                     as_attachment=True,
-                     download_name=filename)
+    _xl_title(ws, 8,
+              (f'LIBRO DIARIO — {_month_name(month)} {year} — Folio 0001', 'qc_title'),
+              ('Régimen MYPE Tributario — PCGE', 'qc_center'))
+    ws.blank()
+    ws.header(['N° Asiento', 'Fecha', 'Tipo', 'Descripción', 'Cta.', 'Glosa línea', 'DEBE (S/)', 'HABER (S/)'])
+
+    line_styles  = ['qc_cell', 'qc_date', 'qc_cell', 'qc_cell', 'qc_cell', 'qc_cell', 'qc_num', 'qc_num']
+    total_styles = [None, None, None, None, 'qc_bold', None, 'qc_bold_num', 'qc_bold_num']
+
+    def _total_row(r):
+        ws.append(['', '', '', '', 'TOTAL ASIENTO', '', float(r.total_debe or 0), float(r.total_haber or 0)],
+                  styles=total_styles)
+
+    prev = None
+    for r in iter_query(q):
+        first_line = prev is None or prev.id != r.id
+        if first_line and prev is not None:
+            _total_row(prev)
+        ws.append([
+            r.entry_number if first_line else '',
+            r.entry_date   if first_line else '',
+            r.entry_type   if first_line else '',
+            r.description  if first_line else '',
+            r.account_code,
+            r.line_desc or '',
+            float(r.debe  or 0),
+            float(r.haber or 0),
+        ], styles=line_styles)
+        prev = r
+    if prev is not None:
+        _total_row(prev)
+
+    return xl.to_response(f'libro_diario_qoricash_{year}{month:02d}.xlsx')
 
 
 # ── Gastos ─────────────────────────────────────────────────────────────────────
@@ -470,14 +537,12 @@ def export_diario():
 def gastos():
     from app.models.expense_record import ExpenseRecord
     from app.models.journal_entry import JournalEntry
-    from sqlalchemy import extract
 
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
 
     records = ExpenseRecord.query.filter(
-        extract('year',  ExpenseRecord.expense_date) == year,
-        extract('month', ExpenseRecord.expense_date) == month,
+        in_month(ExpenseRecord.expense_date, year, month),
     ).order_by(ExpenseRecord.expense_date.desc()).all()
 
     # IDs de gastos que ya tienen asiento de pago registrado
@@ -570,6 +635,7 @@ def _apply_expense_to_bank_balance(account_code: str, amount_pen: Decimal, recor
         created_by     = record.created_by if record else None,
     )
     db.session.add(mv)
+    ClosureAccumulator.apply_movement(mv)
 
 
 @contabilidad_bp.route('/gastos/nuevo', methods=['POST'])
@@ -737,6 +803,9 @@ def nuevo_gasto():
                 created_by=current_user.id,
             )
             db.session.add(fixed_asset)
+            db.session.flush()
+            from app.services.accounting.depreciation_schedule import rebuild_schedule
+            rebuild_schedule([fixed_asset.id], commit=False)
 
         db.session.commit()
 
@@ -779,7 +848,6 @@ def cuota_prestamo():
     from app.models.expense_record import ExpenseRecord
     from app.models.journal_entry import JournalEntry
     from app.models.journal_entry_line import JournalEntryLine
-    from app.models.journal_sequence import JournalSequence
     from app.models.accounting_period import AccountingPeriod
     from app.services.accounting.journal_service import JournalService
 
@@ -840,18 +908,9 @@ def cuota_prestamo():
                       'description': f'Pago cuota – {description}',
                       'debe': Decimal('0'), 'haber': total})
 
-        # Secuencia de asiento (SELECT FOR UPDATE evita huecos)
-        seq = db.session.query(JournalSequence).filter_by(
-            year=expense_date.year).with_for_update().first()
-        if not seq:
-            seq = JournalSequence(year=expense_date.year, last_number=0)
-            db.session.add(seq)
-            db.session.flush()
-        seq.last_number += 1
-        entry_number = f'AS-{expense_date.year}-{str(seq.last_number).zfill(4)}'
-
+        # Número definitivo justo antes del commit (assign_entry_number)
         entry = JournalEntry(
-            entry_number=entry_number,
+            entry_number=JournalService.provisional_entry_number(),
             period_id=period.id,
             entry_date=expense_date,
             description=f'Cuota préstamo: {description}',
@@ -878,6 +937,9 @@ def cuota_prestamo():
             ))
 
         record.journal_entry_id = entry.id
+        from app.services.accounting.account_totals import AccountTotalsService
+        AccountTotalsService.apply_lines(expense_date, 'cuota_prestamo', lines)
+        entry_number = JournalService.assign_entry_number(entry)
         db.session.commit()
 
         # Reflejar débito en BankBalance + crear BankMovement para Tesorería
@@ -968,9 +1030,11 @@ def recalcular_movimiento_cuota():
                 'diferencia': 0,
             })
 
-        # Actualizar BankMovement al monto correcto
+        # Actualizar BankMovement al monto correcto (y el borrador del cierre diario)
+        ClosureAccumulator.apply_movement(mv, reverse=True)
         mv.amount      = round(-total_correcto, 2)
         mv.description = (mv.description or '') + f' [corregido: +{diferencia:.2f}]'
+        ClosureAccumulator.apply_movement(mv)
 
         # Actualizar BankBalance (descontar la diferencia faltante)
         bb = BankBalance.query.filter(
@@ -1295,13 +1359,12 @@ _CONTRAPARTIDA_OPTIONS = [
 @require_role('Master')
 def apertura():
     from app.models.journal_entry import JournalEntry
-    from sqlalchemy import extract
 
     year = request.args.get('year', type=int, default=date.today().year)
 
     # Verificar si ya existe un asiento de apertura para este año
     existing = JournalEntry.query.filter(
-        extract('year', JournalEntry.entry_date) == year,
+        in_year(JournalEntry.entry_date, year),
         JournalEntry.entry_type == 'apertura',
         JournalEntry.status == 'activo',
     ).first()
@@ -1323,7 +1386,6 @@ def apertura():
 def crear_apertura():
     from app.models.journal_entry import JournalEntry
     from app.services.accounting.journal_service import JournalService
-    from sqlalchemy import extract
 
     data = request.get_json() or {}
 
@@ -1337,7 +1399,7 @@ def crear_apertura():
 
         # Verificar duplicado
         existing = JournalEntry.query.filter(
-            extract('year', JournalEntry.entry_date) == year,
+            in_year(JournalEntry.entry_date, year),
             JournalEntry.entry_type == 'apertura',
             JournalEntry.status == 'activo',
         ).first()
@@ -1357,6 +1419,8 @@ def crear_apertura():
             existing.annulled_at   = now_peru()
             existing.annulled_by   = current_user.id
             existing.annulled_reason = 'Reemplazado por nuevo asiento de apertura'
+            from app.services.accounting.account_totals import AccountTotalsService
+            AccountTotalsService.apply_entry(existing, reverse=True)
             db.session.flush()
 
         # Construir líneas DEBE
@@ -1507,6 +1571,9 @@ def reabrir_periodo():
         period.reopened_by   = current_user.id
         period.reopen_reason = motivo
 
+        # Los saldos de cierre de este período y posteriores dejan de ser válidos
+        PeriodBalanceService.invalidate_from(year, month)
+
         AuditLog.log_action(
             user_id    = current_user.id,
             action     = 'REOPEN_PERIOD',
@@ -1537,37 +1604,20 @@ def generar_asientos_retroactivos():
     no tienen asiento registrado. Útil cuando el módulo contable se desplegó
     después de que las operaciones ya estaban completadas.
     """
-    from app.models import Operation
-    from app.models.journal_entry import JournalEntry
-    from app.services.accounting.journal_service import JournalService
-    from sqlalchemy import extract
-
-    data  = request.get_json() or {}
-    year  = int(data.get('year',  date.today().year))
-    month = int(data.get('month', date.today().month))
+    from app.services.accounting.bulk_journal import run_bulk_operation_entries
 
-    # IDs de operaciones que ya tienen asiento activo
-    existing_ids = {
-        r[0] for r in db.session.query(JournalEntry.source_id).filter(
-            JournalEntry.source_type == 'operation',
-            JournalEntry.status == 'activo',
-        ).all() if r[0] is not None
-    }
+    data    = request.get_json() or {}
+    year    = int(data.get('year',  date.today().year))
+    month   = int(data.get('month', date.today().month))
+    dry_run = bool(data.get('dry_run', False))
 
-    # Operaciones completadas en el período sin asiento (excluir demo)
-    from app.models.user import User as _User
-    _demo_id = _User.get_demo_user_id()
-    _ops_q = Operation.query.filter(
-        Operation.status == 'Completada',
-        extract('year',  Operation.completed_at) == year,
-        extract('month', Operation.completed_at) == month,
-        ~Operation.id.in_(existing_ids) if existing_ids else True,
+    # Bloques con números reservados de una vez e INSERT multi-fila
+    # (operaciones Completadas sin asiento activo, sin demo)
+    result = run_bulk_operation_entries(
+        year=year, month=month, dry_run=dry_run, created_by=current_user.id,
     )
-    if _demo_id:
-        _ops_q = _ops_q.filter(Operation.user_id != _demo_id)
-    ops = _ops_q.order_by(Operation.completed_at.asc()).all()
 
-    if not ops:
+    if not result['total_sin_asiento']:
         return jsonify({
             'success': True,
             'message': 'Todas las operaciones del período ya tienen asiento contable.',
@@ -1575,25 +1625,17 @@ def generar_asientos_retroactivos():
             'errores': 0,
         })
 
-    generados = 0
-    errores   = []
-
-    for op in ops:
-        entry = JournalService.create_entry_for_completed_operation(
-            op, created_by_id=current_user.id
-        )
-        if entry:
-            generados += 1
-        else:
-            errores.append(op.operation_id)
-
     return jsonify({
         'success': True,
-        'message': f'{generados} asiento(s) generado(s). {len(errores)} error(es).',
-        'generados': generados,
-        'errores': len(errores),
-        'operaciones_con_error': errores,
-        'total_sin_asiento': len(ops),
+        'message': (f'{"[DRY-RUN] " if dry_run else ""}{result["generados"]} asiento(s) '
+                    f'generado(s). {result["errores"]} error(es).'),
+        'generados': result['generados'],
+        'errores': result['errores'],
+        'operaciones_con_error': result['operaciones_con_error'],
+        'omitidos_periodo_cerrado': result['omitidos_periodo_cerrado'],
+        'total_sin_asiento': result['total_sin_asiento'],
+        'dry_run': dry_run,
+        'elapsed_seconds': result['elapsed_seconds'],
     })
 
 
@@ -1609,6 +1651,7 @@ def generar_movimientos_bancarios():
     """
     from app.models.bank_balance import BankBalance
     from app.models.bank_movement import BankMovement
+    from app.models.operation import Operation
 
     data  = request.get_json() or {}
     year  = int(data.get('year',  date.today().year))
@@ -1628,8 +1671,7 @@ def generar_movimientos_bancarios():
     _demo_id = _User.get_demo_user_id()
     _ops_q = Operation.query.filter(
         Operation.status == 'Completada',
-        extract('year',  Operation.completed_at) == year,
-        extract('month', Operation.completed_at) == month,
+        in_month(Operation.completed_at, year, month),
         ~Operation.id.in_(existing_op_ids) if existing_op_ids else True,
     )
     if op_code:
@@ -1715,7 +1757,6 @@ def _caja_movimientos(year: int, month: int, account_code: str):
     """
     from app.models.journal_entry import JournalEntry
     from app.models.journal_entry_line import JournalEntryLine
-    from sqlalchemy import func, extract
 
     currency_label = _ACCOUNT_LABELS.get(account_code, ('', 'PEN', ''))[1]
     is_usd = (currency_label == 'USD')
@@ -1723,35 +1764,10 @@ def _caja_movimientos(year: int, month: int, account_code: str):
     # ── Saldo anterior (períodos previos al actual) ────────────────────────────
     first_day = date(year, month, 1)
 
-    _prev_join    = JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-    _prev_filters = [
-        JournalEntryLine.account_code == account_code,
-        JournalEntry.entry_date < first_day,
-        JournalEntry.status == 'activo',
-    ]
-
-    if is_usd:
-        # Cuentas ME: acumular amount_usd (separando DEBE y HABER) para
-        # obtener el saldo anterior en dólares sin tocar el diario en PEN.
-        prev_d_usd = (
-            db.session.query(func.sum(JournalEntryLine.amount_usd))
-            .join(*_prev_join)
-            .filter(*_prev_filters, JournalEntryLine.debe > 0)
-            .scalar()
-        ) or 0
-        prev_h_usd = (
-            db.session.query(func.sum(JournalEntryLine.amount_usd))
-            .join(*_prev_join)
-            .filter(*_prev_filters, JournalEntryLine.haber > 0)
-            .scalar()
-        ) or 0
-        saldo_ant_journal = Decimal(str(prev_d_usd)) - Decimal(str(prev_h_usd))
-    else:
-        prev = db.session.query(
-            func.sum(JournalEntryLine.debe).label('d'),
-            func.sum(JournalEntryLine.haber).label('h'),
-        ).join(*_prev_join).filter(*_prev_filters).first()
-        saldo_ant_journal = Decimal(str(prev.d or 0)) - Decimal(str(prev.h or 0))
+    # Cuentas ME: acumulado amount_usd (separando DEBE y HABER) para obtener
+    # el saldo anterior en dólares sin tocar el diario en PEN.
+    openings = PeriodBalanceService.opening_balances(year, month, codes=[account_code])
+    saldo_ant_journal = PeriodBalanceService.opening_saldo(openings, account_code, usd=is_usd)
 
     # Prioridad: snapshot real de Posición como saldo anterior.
     # Se incluyen snapshots hasta el primer día del período (<=) para capturar
@@ -1791,8 +1807,7 @@ def _caja_movimientos(year: int, month: int, account_code: str):
     ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
     ).filter(
         JournalEntryLine.account_code == account_code,
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
     ).order_by(
         JournalEntry.entry_date.asc(), JournalEntry.id.asc()
@@ -2056,92 +2071,46 @@ def export_caja():
     accounts = [_caja_movimientos(year, month, c) for c in codes]
     accounts = [a for a in accounts if a['movimientos'] or a['saldo_ant'] != 0 or a['kind'] == 'banco']
 
-    co = _company_info()
-    wb = openpyxl.Workbook()
-    wb.remove(wb.active)  # quitamos hoja vacía default
-
-    hfill  = PatternFill(start_color='1B3A6B', end_color='1B3A6B', fill_type='solid')
-    sfill  = PatternFill(start_color='D6E4F0', end_color='D6E4F0', fill_type='solid')
-    tfill  = PatternFill(start_color='E8F5E9', end_color='E8F5E9', fill_type='solid')
-    thin   = Side(style='thin')
-    bdr    = Border(left=thin, right=thin, top=thin, bottom=thin)
+    xl = ExcelExport()
+    mov_styles = ['qc_cell', 'qc_date', 'qc_cell', 'qc_cell', 'qc_num', 'qc_num', 'qc_num']
 
     for folio, acc in enumerate(accounts, 1):
-        ws = wb.create_sheet(f"{acc['code']} {acc['label']}"[:31])
+        ws = xl.sheet(f"{acc['code']} {acc['label']}", widths=[5, 12, 16, 54, 14, 14, 14])
 
         # Encabezado SUNAT (M-03)
-        ws.merge_cells('A1:G1')
-        ws['A1'] = co['razon_social']
-        ws['A1'].font = Font(bold=True, size=12)
-        ws['A1'].alignment = Alignment(horizontal='center')
-        ws.merge_cells('A2:G2')
-        ws['A2'] = f'RUC: {co["ruc"]}'
-        ws['A2'].alignment = Alignment(horizontal='center')
-        ws.merge_cells('A3:G3')
-        ws['A3'] = (f"LIBRO CAJA Y BANCOS — {acc['code']} {acc['label']} "
-                    f"({acc['currency']}) — {_month_name(month)} {year} — Folio {folio:04d}")
-        ws['A3'].font = Font(bold=True)
-        ws['A3'].alignment = Alignment(horizontal='center')
+        _xl_title(ws, 7, (
+            f"LIBRO CAJA Y BANCOS — {acc['code']} {acc['label']} "
+            f"({acc['currency']}) — {_month_name(month)} {year} — Folio {folio:04d}",
+            'qc_title',
+        ))
+        ws.blank()
 
         # Saldo anterior
-        ws.merge_cells('A5:D5')
-        ws['A5'] = 'SALDO ANTERIOR (al inicio del período)'
-        ws['A5'].font = Font(bold=True)
-        ws['A5'].fill = sfill
-        ws['E5'] = float(max(acc['saldo_ant'], Decimal('0')))
-        ws['F5'] = float(max(-acc['saldo_ant'], Decimal('0')))
-        for c in 'ABCDEF':
-            ws[f'{c}5'].border = bdr
-
-        # Headers
-        hdrs = ['N°', 'Fecha', 'N° Asiento', 'Descripción', 'DEBE', 'HABER', 'SALDO']
-        for col, h in enumerate(hdrs, 1):
-            cell = ws.cell(row=6, column=col, value=h)
-            cell.fill = hfill
-            cell.font = Font(bold=True, color='FFFFFF')
-            cell.alignment = Alignment(horizontal='center')
-            cell.border = bdr
-
-        row = 7
+        ws.append([
+            'SALDO ANTERIOR (al inicio del período)', None, None, None,
+            float(max(acc['saldo_ant'], Decimal('0'))),
+            float(max(-acc['saldo_ant'], Decimal('0'))),
+        ], styles=['qc_section', 'qc_section', 'qc_section', 'qc_section', 'qc_num', 'qc_num'])
+        ws.merge(1, 4)
+
+        ws.header(['N°', 'Fecha', 'N° Asiento', 'Descripción', 'DEBE', 'HABER', 'SALDO'])
+
         for n, m in enumerate(acc['movimientos'], 1):
-            ws.cell(row=row, column=1, value=n).border = bdr
-            ws.cell(row=row, column=2, value=m['date'].strftime('%d/%m/%Y')).border = bdr
-            ws.cell(row=row, column=3, value=m['entry_number']).border = bdr
-            ws.cell(row=row, column=4, value=m['description']).border = bdr
-            ws.cell(row=row, column=5, value=float(m['debe'])).border = bdr
-            ws.cell(row=row, column=6, value=float(m['haber'])).border = bdr
-            ws.cell(row=row, column=7, value=float(m['saldo'])).border = bdr
-            row += 1
+            ws.append([n, m['date'], m['entry_number'], m['description'],
+                       float(m['debe']), float(m['haber']), float(m['saldo'])], styles=mov_styles)
 
         # Totales
-        ws.cell(row=row, column=4, value='TOTAL DEL PERÍODO').font = Font(bold=True)
-        ws.cell(row=row, column=5, value=float(acc['total_debe'])).font  = Font(bold=True)
-        ws.cell(row=row, column=6, value=float(acc['total_haber'])).font = Font(bold=True)
-        for c in range(1, 8):
-            ws.cell(row=row, column=c).fill   = tfill
-            ws.cell(row=row, column=c).border = bdr
-        row += 1
-
-        ws.cell(row=row, column=4, value='SALDO FINAL').font = Font(bold=True)
-        ws.cell(row=row, column=7, value=float(acc['saldo_final'])).font = Font(bold=True)
-        for c in range(1, 8):
-            ws.cell(row=row, column=c).border = bdr
-
-        widths = [5, 12, 16, 54, 14, 14, 14]
-        for i, w in enumerate(widths, 1):
-            ws.column_dimensions[openpyxl.utils.get_column_letter(i)].width = w
-
-    if not wb.worksheets:
-        ws = wb.create_sheet('Sin movimientos')
-        ws['A1'] = 'No hay movimientos en cuentas de caja/bancos para el período seleccionado.'
+        ws.append(['', '', '', 'TOTAL DEL PERÍODO',
+                   float(acc['total_debe']), float(acc['total_haber']), ''],
+                  styles=['qc_total'] * 4 + ['qc_total_num'] * 3)
+        ws.append(['', '', '', 'SALDO FINAL', '', '', float(acc['saldo_final'])],
+                  styles=['qc_cell', 'qc_cell', 'qc_cell', 'qc_bold', 'qc_cell', 'qc_cell', 'qc_bold_num'])
 
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    return send_file(output,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                     as_attachment=True,
-                     download_name=f'libro_caja_bancos_{year}{month:02d}.xlsx')
+    if not accounts:
+        ws = xl.sheet('Sin movimientos')
+        ws.append(['No hay movimientos en cuentas de caja/bancos para el período seleccionado.'])
+
+    return xl.to_response(f'libro_caja_bancos_{year}{month:02d}.xlsx')
 
 
 # ── Libro de Ingresos y Gastos (LIG) ─────────────────────────────────────────
@@ -2163,7 +2132,7 @@ def _gastos_journal(year: int, month: int) -> list:
     from app.models.journal_entry import JournalEntry as _JE
     from app.models.journal_entry_line import JournalEntryLine as _JEL
     from app.models.expense_record import ExpenseRecord as _ER
-    from sqlalchemy import func, extract as _ex
+    from sqlalchemy import func
 
     rows = db.session.query(
         _JE.id.label('entry_id'),
@@ -2177,8 +2146,7 @@ def _gastos_journal(year: int, month: int) -> list:
     ).join(_JEL, _JEL.journal_entry_id == _JE.id
     ).filter(
         _JEL.account_code.like('6%'),
-        _ex('year',  _JE.entry_date) == year,
-        _ex('month', _JE.entry_date) == month,
+        in_month(_JE.entry_date, year, month),
         _JE.status == 'activo',
     ).group_by(
         _JE.id, _JE.entry_date, _JE.entry_number,
@@ -2193,8 +2161,7 @@ def _gastos_journal(year: int, month: int) -> list:
     exp_map = {
         e.journal_entry_id: e
         for e in _ER.query.filter(
-            _ex('year',  _ER.expense_date) == year,
-            _ex('month', _ER.expense_date) == month,
+            in_month(_ER.expense_date, year, month),
         ).all()
         if e.journal_entry_id
     }
@@ -2245,7 +2212,6 @@ def lig():
     from app.models.journal_entry import JournalEntry
     from app.models.journal_entry_line import JournalEntryLine
     from app.models.expense_record import ExpenseRecord
-    from sqlalchemy import extract, func
 
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
@@ -2264,8 +2230,7 @@ def lig():
     ).filter(
         JournalEntryLine.account_code.like('7%'),
         JournalEntryLine.haber > 0,
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
     ).order_by(
         JournalEntry.entry_date.asc(), JournalEntry.id.asc()
@@ -2310,12 +2275,11 @@ def export_lig():
     from app.models.journal_entry import JournalEntry
     from app.models.journal_entry_line import JournalEntryLine
     from app.models.expense_record import ExpenseRecord
-    from sqlalchemy import extract as sa_extract
 
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
 
-    rows = db.session.query(
+    q_ingresos = db.session.query(
         JournalEntry.entry_date,
         JournalEntry.entry_number,
         JournalEntry.description.label('entry_desc'),
@@ -2327,126 +2291,54 @@ def export_lig():
     ).filter(
         JournalEntryLine.account_code.like('7%'),
         JournalEntryLine.haber > 0,
-        sa_extract('year',  JournalEntry.entry_date) == year,
-        sa_extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
-    ).order_by(JournalEntry.entry_date.asc(), JournalEntry.id.asc()).all()
-
-    ingresos = [{
-        'fecha':        r.entry_date,
-        'entry_number': r.entry_number,
-        'account_code': r.account_code,
-        'tipo_ingreso': _INGRESO_LABELS.get(r.account_code[:2], r.account_code),
-        'description':  r.line_desc or r.entry_desc,
-        'importe':      float(r.haber or 0),
-    } for r in rows]
+    ).order_by(JournalEntry.entry_date.asc(), JournalEntry.id.asc())
 
     # Gastos: fuente única → Libro Diario (6xxx), misma que Estado de Resultados
     gastos = _gastos_journal(year, month)
 
-    wb = openpyxl.Workbook()
-
-    header_fill = PatternFill(start_color='1B3A6B', end_color='1B3A6B', fill_type='solid')
-    hfont = Font(bold=True, color='FFFFFF')
-    center = Alignment(horizontal='center')
-    thin  = Side(style='thin')
-    bdr   = Border(left=thin, right=thin, top=thin, bottom=thin)
-
-    co = _company_info()
-
-    def title_rows(ws, titulo, ncols):
-        col_letter = openpyxl.utils.get_column_letter(ncols)
-        ws.merge_cells(f'A1:{col_letter}1')
-        ws['A1'] = co['razon_social']
-        ws['A1'].font = Font(bold=True, size=12)
-        ws['A1'].alignment = center
-        ws.merge_cells(f'A2:{col_letter}2')
-        ws['A2'] = f'RUC: {co["ruc"]}'
-        ws['A2'].alignment = center
-        ws.merge_cells(f'A3:{col_letter}3')
-        ws['A3'] = titulo
-        ws['A3'].font = Font(bold=True)
-        ws['A3'].alignment = center
-        ws.merge_cells(f'A4:{col_letter}4')
-        ws['A4'] = f'Período: {_month_name(month)} {year}  —  R.M. MYPE Tributario'
-        ws['A4'].alignment = center
+    xl = ExcelExport()
+    periodo = (f'Período: {_month_name(month)} {year}  —  R.M. MYPE Tributario', 'qc_center')
 
     # ── Hoja 1: INGRESOS ──────────────────────────────────────────────────────
-    ws1 = wb.active
-    ws1.title = 'Ingresos'
-    title_rows(ws1, f'LIBRO DE INGRESOS — {_month_name(month).upper()} {year}', 7)
-
-    hdrs = ['N°', 'Fecha', 'N° Asiento', 'Tipo de Ingreso', 'Cuenta PCGE', 'Descripción', 'Importe S/']
-    for c, h in enumerate(hdrs, 1):
-        cell = ws1.cell(row=5, column=c, value=h)
-        cell.fill = header_fill
-        cell.font = hfont
-        cell.alignment = center
-        cell.border = bdr
-
-    row = 6
-    for n, ing in enumerate(ingresos, 1):
-        ws1.cell(row=row, column=1, value=n).border = bdr
-        ws1.cell(row=row, column=2, value=ing['fecha'].strftime('%d/%m/%Y')).border = bdr
-        ws1.cell(row=row, column=3, value=ing['entry_number']).border = bdr
-        ws1.cell(row=row, column=4, value=ing['tipo_ingreso']).border = bdr
-        ws1.cell(row=row, column=5, value=ing['account_code']).border = bdr
-        ws1.cell(row=row, column=6, value=ing['description']).border = bdr
-        ws1.cell(row=row, column=7, value=ing['importe']).border = bdr
-        row += 1
+    ws1 = xl.sheet('Ingresos', widths=[5, 12, 16, 28, 12, 54, 14])
+    _xl_title(ws1, 7, (f'LIBRO DE INGRESOS — {_month_name(month).upper()} {year}', 'qc_title'), periodo)
+    ws1.header(['N°', 'Fecha', 'N° Asiento', 'Tipo de Ingreso', 'Cuenta PCGE', 'Descripción', 'Importe S/'])
+
+    total_i = 0.0
+    ing_styles = ['qc_cell', 'qc_date', 'qc_cell', 'qc_cell', 'qc_cell', 'qc_cell', 'qc_num']
+    for n, r in enumerate(iter_query(q_ingresos), 1):
+        importe = float(r.haber or 0)
+        total_i += importe
+        ws1.append([
+            n, r.entry_date, r.entry_number,
+            _INGRESO_LABELS.get(r.account_code[:2], r.account_code),
+            r.account_code, r.line_desc or r.entry_desc, importe,
+        ], styles=ing_styles)
 
     # Fila de total
-    ws1.cell(row=row, column=6, value='TOTAL').font = Font(bold=True)
-    total_i = sum(i['importe'] for i in ingresos)
-    ws1.cell(row=row, column=7, value=total_i).font = Font(bold=True)
-    ws1.cell(row=row, column=7).fill = PatternFill(start_color='D4EDDA', end_color='D4EDDA', fill_type='solid')
-
-    widths1 = [5, 12, 16, 28, 12, 54, 14]
-    for i, w in enumerate(widths1, 1):
-        ws1.column_dimensions[openpyxl.utils.get_column_letter(i)].width = w
+    ws1.append(['', '', '', '', '', 'TOTAL', total_i], styles=[None] * 5 + ['qc_bold', 'qc_total_ok'])
 
     # ── Hoja 2: GASTOS ────────────────────────────────────────────────────────
-    ws2 = wb.create_sheet('Gastos')
-    title_rows(ws2, f'LIBRO DE GASTOS — {_month_name(month).upper()} {year}', 9)
-
-    hdrs2 = ['N°', 'Fecha', 'Proveedor', 'RUC', 'Tipo Comprobante',
-             'N° Comprobante', 'Cta. PCGE', 'Importe S/', 'Descripción']
-    for c, h in enumerate(hdrs2, 1):
-        cell = ws2.cell(row=5, column=c, value=h)
-        cell.fill = header_fill
-        cell.font = hfont
-        cell.alignment = center
-        cell.border = bdr
-
-    row2 = 6
+    ws2 = xl.sheet('Gastos', widths=[5, 12, 36, 14, 18, 16, 10, 14, 48])
+    _xl_title(ws2, 9, (f'LIBRO DE GASTOS — {_month_name(month).upper()} {year}', 'qc_title'), periodo)
+    ws2.header(['N°', 'Fecha', 'Proveedor', 'RUC', 'Tipo Comprobante',
+                'N° Comprobante', 'Cta. PCGE', 'Importe S/', 'Descripción'])
+
+    gasto_styles = ['qc_cell', 'qc_date'] + ['qc_cell'] * 5 + ['qc_num', 'qc_cell']
     for n, g in enumerate(gastos, 1):
-        ws2.cell(row=row2, column=1, value=n).border = bdr
-        ws2.cell(row=row2, column=2, value=g['expense_date'].strftime('%d/%m/%Y')).border = bdr
-        ws2.cell(row=row2, column=3, value=g['supplier_name'] or '—').border = bdr
-        ws2.cell(row=row2, column=4, value=g['supplier_ruc']  or '—').border = bdr
-        ws2.cell(row=row2, column=5, value=g['voucher_type']  or '—').border = bdr
-        ws2.cell(row=row2, column=6, value=g['voucher_number'] or '—').border = bdr
-        ws2.cell(row=row2, column=7, value=g['category']).border = bdr
-        ws2.cell(row=row2, column=8, value=float(g['amount_pen'])).border = bdr
-        ws2.cell(row=row2, column=9, value=g['description']).border = bdr
-        row2 += 1
-
-    ws2.cell(row=row2, column=7, value='TOTAL').font = Font(bold=True)
-    total_g = sum(float(g['amount_pen']) for g in gastos)
-    ws2.cell(row=row2, column=8, value=total_g).font = Font(bold=True)
-    ws2.cell(row=row2, column=8).fill = PatternFill(start_color='F8D7DA', end_color='F8D7DA', fill_type='solid')
+        ws2.append([
+            n, g['expense_date'],
+            g['supplier_name'] or '—', g['supplier_ruc'] or '—',
+            g['voucher_type'] or '—', g['voucher_number'] or '—',
+            g['category'], float(g['amount_pen']), g['description'],
+        ], styles=gasto_styles)
 
-    widths2 = [5, 12, 36, 14, 18, 16, 10, 14, 48]
-    for i, w in enumerate(widths2, 1):
-        ws2.column_dimensions[openpyxl.utils.get_column_letter(i)].width = w
+    total_g = sum(float(g['amount_pen']) for g in gastos)
+    ws2.append(['', '', '', '', '', '', 'TOTAL', total_g], styles=[None] * 6 + ['qc_bold', 'qc_total_bad'])
 
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    return send_file(output,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                     as_attachment=True,
-                     download_name=f'LIG_qoricash_{year}{month:02d}.xlsx')
+    return xl.to_response(f'LIG_qoricash_{year}{month:02d}.xlsx')
 
 
 @contabilidad_bp.route('/lig/export_ple')
@@ -2467,7 +2359,6 @@ def export_lig_ple():
     from app.models.journal_entry_line import JournalEntryLine
     from app.models.expense_record import ExpenseRecord
     from app.models.system_config import SystemConfig
-    from sqlalchemy import extract
 
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
@@ -2482,8 +2373,7 @@ def export_lig_ple():
         JournalEntry, JEL
     ).join(JEL, JEL.journal_entry_id == JournalEntry.id
     ).filter(
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
         JEL.account_code.like('7%'),
         JEL.haber > 0,                        # solo líneas con ingreso real
@@ -2570,6 +2460,38 @@ def export_lig_ple():
 
 # ── Libro Mayor ────────────────────────────────────────────────────────────────
 
+def _mayor_rows_by_account(year: int, month: int):
+    """
+    Movimientos del período de TODAS las cuentas en una sola consulta,
+    ordenados por cuenta → fecha → asiento, leída en bloques con cursor del
+    servidor. Genera (account_code, [rows]) — una cuenta en memoria a la vez.
+    """
+    from itertools import groupby
+    from app.models.journal_entry import JournalEntry
+    from app.models.journal_entry_line import JournalEntryLine
+
+    rows = db.session.query(
+        JournalEntryLine.account_code,
+        JournalEntry.entry_date,
+        JournalEntry.entry_number,
+        JournalEntry.description.label('entry_desc'),
+        JournalEntryLine.description.label('line_desc'),
+        JournalEntryLine.debe,
+        JournalEntryLine.haber,
+    ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
+    ).filter(
+        in_month(JournalEntry.entry_date, year, month),
+        JournalEntry.status == 'activo',
+    ).order_by(
+        JournalEntryLine.account_code.asc(),
+        JournalEntry.entry_date.asc(),
+        JournalEntry.id.asc(),
+    )
+
+    for code, group in groupby(iter_query(rows), key=lambda r: r.account_code):
+        yield code, list(group)
+
+
 @contabilidad_bp.route('/mayor')
 @login_required
 @require_role('Master')
@@ -2578,61 +2500,20 @@ def mayor():
     Libro Mayor — agrupa movimientos del Libro Diario por cuenta PCGE,
     con saldo acumulado (saldo anterior + movimientos del período).
     Requerido SUNAT para presentación de libros contables (M-04).
+    Saldo anterior desde AccountPeriodBalance; movimientos en una sola consulta.
     """
-    from app.models.journal_entry import JournalEntry
-    from app.models.journal_entry_line import JournalEntryLine
-    from app.models.accounting_account import AccountingAccount
-    from sqlalchemy import func, extract
-
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
 
     current_period = _get_period(year, month)
 
-    # Todas las cuentas con movimientos en el período
-    active_codes = [
-        r.account_code for r in
-        db.session.query(JournalEntryLine.account_code).join(
-            JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-        ).filter(
-            extract('year',  JournalEntry.entry_date) == year,
-            extract('month', JournalEntry.entry_date) == month,
-            JournalEntry.status == 'activo',
-        ).distinct().order_by(JournalEntryLine.account_code).all()
-    ]
-
-    catalog = _get_accounts_catalog()
-    first_day = date(year, month, 1)
+    # Saldo anterior de todas las cuentas: cierre del mes previo (lectura por clave)
+    openings = PeriodBalanceService.opening_balances(year, month)
+    catalog  = _get_accounts_catalog()
 
     cuentas = []
-    for code in active_codes:
-        # Saldo anterior (todo lo contabilizado antes del período)
-        prev = db.session.query(
-            func.sum(JournalEntryLine.debe).label('d'),
-            func.sum(JournalEntryLine.haber).label('h'),
-        ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-        ).filter(
-            JournalEntryLine.account_code == code,
-            JournalEntry.entry_date < first_day,
-            JournalEntry.status == 'activo',
-        ).first()
-        saldo_ant = Decimal(str(prev.d or 0)) - Decimal(str(prev.h or 0))
-
-        # Movimientos del período
-        rows = db.session.query(
-            JournalEntry.entry_date,
-            JournalEntry.entry_number,
-            JournalEntry.description.label('entry_desc'),
-            JournalEntryLine.description.label('line_desc'),
-            JournalEntryLine.debe,
-            JournalEntryLine.haber,
-        ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-        ).filter(
-            JournalEntryLine.account_code == code,
-            extract('year',  JournalEntry.entry_date) == year,
-            extract('month', JournalEntry.entry_date) == month,
-            JournalEntry.status == 'activo',
-        ).order_by(JournalEntry.entry_date.asc(), JournalEntry.id.asc()).all()
+    for code, rows in _mayor_rows_by_account(year, month):
+        saldo_ant = PeriodBalanceService.opening_saldo(openings, code)
 
         movs  = []
         saldo = saldo_ant
@@ -2678,126 +2559,44 @@ def mayor():
 @login_required
 @require_role('Master')
 def export_mayor():
-    """Exporta el Libro Mayor del período a Excel."""
-    from app.models.journal_entry import JournalEntry
-    from app.models.journal_entry_line import JournalEntryLine
-    from app.models.accounting_account import AccountingAccount
-    from app.models.system_config import SystemConfig
-    from sqlalchemy import func, extract
-
+    """Exporta el Libro Mayor del período a Excel (una hoja por cuenta)."""
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
 
-    razon_social = SystemConfig.get('RAZON_SOCIAL', 'QORICASH SAC')
-    ruc          = SystemConfig.get('RUC', '20615113698')
-
-    active_codes = [
-        r.account_code for r in
-        db.session.query(JournalEntryLine.account_code).join(
-            JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-        ).filter(
-            extract('year',  JournalEntry.entry_date) == year,
-            extract('month', JournalEntry.entry_date) == month,
-            JournalEntry.status == 'activo',
-        ).distinct().order_by(JournalEntryLine.account_code).all()
-    ]
-
-    catalog = _get_accounts_catalog()
-    first_day = date(year, month, 1)
-
-    wb = openpyxl.Workbook()
-    wb.remove(wb.active)   # eliminar hoja por defecto
+    openings = PeriodBalanceService.opening_balances(year, month)
+    catalog  = _get_accounts_catalog()
 
-    header_fill  = PatternFill(start_color='1B3A6B', end_color='1B3A6B', fill_type='solid')
-    sub_fill     = PatternFill(start_color='D6E4F0', end_color='D6E4F0', fill_type='solid')
-    folio = 1
+    xl = ExcelExport()
+    mov_styles = ['qc_date', None, None, 'qc_num', 'qc_num', 'qc_num', None]
 
-    for code in active_codes:
+    for folio, (code, rows_db) in enumerate(_mayor_rows_by_account(year, month), 1):
         acc  = catalog.get(code)
         name = acc.name if acc else f'Cuenta {code}'
-        ws   = wb.create_sheet(title=f'{code}')
+        ws   = xl.sheet(f'{code}', widths=[12, 14, 42, 12, 12, 12, 4])
 
         # Encabezado SUNAT
-        ws.merge_cells('A1:G1')
-        ws['A1'] = razon_social
-        ws['A1'].font = Font(bold=True, size=11)
-        ws['A1'].alignment = Alignment(horizontal='center')
-        ws.merge_cells('A2:G2')
-        ws['A2'] = f'RUC: {ruc}'
-        ws['A2'].alignment = Alignment(horizontal='center')
-        ws.merge_cells('A3:G3')
-        ws['A3'] = f'LIBRO MAYOR — {_month_name(month)} {year} — Folio {folio:04d}'
-        ws['A3'].font = Font(bold=True)
-        ws['A3'].alignment = Alignment(horizontal='center')
-        ws.merge_cells('A4:G4')
-        ws['A4'] = f'Cuenta: {code} — {name}'
-        ws['A4'].font = Font(bold=True)
-        ws['A4'].fill = sub_fill
-
-        headers = ['Fecha', 'N° Asiento', 'Descripción', 'DEBE S/', 'HABER S/', 'Saldo S/', 'D/A']
-        for col, h in enumerate(headers, 1):
-            c = ws.cell(row=6, column=col, value=h)
-            c.fill = header_fill
-            c.font = Font(bold=True, color='FFFFFF')
-            c.alignment = Alignment(horizontal='center')
+        _xl_title(ws, 7,
+                  (f'LIBRO MAYOR — {_month_name(month)} {year} — Folio {folio:04d}', 'qc_title'),
+                  (f'Cuenta: {code} — {name}', 'qc_section'))
+        ws.blank()
+        ws.header(['Fecha', 'N° Asiento', 'Descripción', 'DEBE S/', 'HABER S/', 'Saldo S/', 'D/A'])
 
         # Saldo anterior
-        prev = db.session.query(
-            func.sum(JournalEntryLine.debe).label('d'),
-            func.sum(JournalEntryLine.haber).label('h'),
-        ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-        ).filter(
-            JournalEntryLine.account_code == code,
-            JournalEntry.entry_date < first_day,
-            JournalEntry.status == 'activo',
-        ).first()
-        saldo_ant = Decimal(str(prev.d or 0)) - Decimal(str(prev.h or 0))
-
-        row_num = 7
-        ws.cell(row=row_num, column=1, value='Saldo anterior')
-        ws.cell(row=row_num, column=6, value=float(saldo_ant))
-        row_num += 1
-
-        rows_db = db.session.query(
-            JournalEntry.entry_date,
-            JournalEntry.entry_number,
-            JournalEntry.description.label('entry_desc'),
-            JournalEntryLine.description.label('line_desc'),
-            JournalEntryLine.debe,
-            JournalEntryLine.haber,
-        ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-        ).filter(
-            JournalEntryLine.account_code == code,
-            extract('year',  JournalEntry.entry_date) == year,
-            extract('month', JournalEntry.entry_date) == month,
-            JournalEntry.status == 'activo',
-        ).order_by(JournalEntry.entry_date.asc(), JournalEntry.id.asc()).all()
+        saldo_ant = PeriodBalanceService.opening_saldo(openings, code)
+        ws.append(['Saldo anterior', None, None, None, None, float(saldo_ant)],
+                  styles=[None] * 5 + ['qc_num'])
 
         saldo = saldo_ant
         for r in rows_db:
             d = Decimal(str(r.debe  or 0))
             h = Decimal(str(r.haber or 0))
             saldo += d - h
-            ws.cell(row=row_num, column=1, value=r.entry_date.strftime('%d/%m/%Y'))
-            ws.cell(row=row_num, column=2, value=r.entry_number)
-            ws.cell(row=row_num, column=3, value=r.line_desc or r.entry_desc)
-            ws.cell(row=row_num, column=4, value=float(d))
-            ws.cell(row=row_num, column=5, value=float(h))
-            ws.cell(row=row_num, column=6, value=float(saldo))
-            ws.cell(row=row_num, column=7, value='D' if saldo >= 0 else 'A')
-            row_num += 1
-
-        for i, w in enumerate([12, 14, 42, 12, 12, 12, 4], 1):
-            ws.column_dimensions[openpyxl.utils.get_column_letter(i)].width = w
-        folio += 1
+            ws.append([
+                r.entry_date, r.entry_number, r.line_desc or r.entry_desc,
+                float(d), float(h), float(saldo), 'D' if saldo >= 0 else 'A',
+            ], styles=mov_styles)
 
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    return send_file(output,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                     as_attachment=True,
-                     download_name=f'libro_mayor_{year}{month:02d}.xlsx')
+    return xl.to_response(f'libro_mayor_{year}{month:02d}.xlsx')
 
 
 # ── Balance de Comprobación ────────────────────────────────────────────────────
@@ -2814,13 +2613,11 @@ def balance():
     from app.models.journal_entry import JournalEntry
     from app.models.journal_entry_line import JournalEntryLine
     from app.models.accounting_account import AccountingAccount
-    from sqlalchemy import func, extract
+    from sqlalchemy import func
 
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
 
-    first_day = date(year, month, 1)
-
     # Cuentas con movimientos en el período
     rows = db.session.query(
         JournalEntryLine.account_code,
@@ -2829,8 +2626,7 @@ def balance():
     ).join(
         JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
     ).filter(
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
     ).group_by(
         JournalEntryLine.account_code
@@ -2838,7 +2634,8 @@ def balance():
         JournalEntryLine.account_code
     ).all()
 
-    catalog = _get_accounts_catalog()
+    catalog  = _get_accounts_catalog()
+    openings = PeriodBalanceService.opening_balances(year, month)
     accounts = []
     grand_debe = grand_haber = Decimal('0')
     grand_sd_ini = grand_sa_ini = Decimal('0')
@@ -2850,19 +2647,8 @@ def balance():
         td   = Decimal(str(r.total_debe  or 0))
         th   = Decimal(str(r.total_haber or 0))
 
-        # Saldo anterior acumulado (antes del período)
-        prev = db.session.query(
-            func.sum(JournalEntryLine.debe).label('d'),
-            func.sum(JournalEntryLine.haber).label('h'),
-        ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-        ).filter(
-            JournalEntryLine.account_code == code,
-            JournalEntry.entry_date < first_day,
-            JournalEntry.status == 'activo',
-        ).first()
-        ant_d = Decimal(str(prev.d or 0))
-        ant_h = Decimal(str(prev.h or 0))
-        saldo_ant = ant_d - ant_h  # puede ser negativo para cuentas acreedoras
+        # Saldo anterior acumulado (cierre del mes previo)
+        saldo_ant = PeriodBalanceService.opening_saldo(openings, code)  # puede ser negativo para cuentas acreedoras
 
         if acc:
             acc_type   = acc.type
@@ -2933,74 +2719,44 @@ def export_balance():
     from app.models.journal_entry import JournalEntry
     from app.models.journal_entry_line import JournalEntryLine
     from app.models.accounting_account import AccountingAccount
-    from sqlalchemy import func, extract
+    from sqlalchemy import func
 
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
 
-    first_day = date(year, month, 1)
-
     rows = db.session.query(
         JournalEntryLine.account_code,
         func.sum(JournalEntryLine.debe).label('total_debe'),
         func.sum(JournalEntryLine.haber).label('total_haber'),
     ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
     ).filter(
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
     ).group_by(JournalEntryLine.account_code
     ).order_by(JournalEntryLine.account_code).all()
 
-    catalog = _get_accounts_catalog()
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = 'Balance Comprobación'
-
-    co = _company_info()
-    ws.merge_cells('A1:I1')
-    ws['A1'] = co['razon_social']
-    ws['A1'].font = Font(bold=True, size=12)
-    ws['A1'].alignment = Alignment(horizontal='center')
-    ws.merge_cells('A2:I2')
-    ws['A2'] = f'RUC: {co["ruc"]}'
-    ws['A2'].alignment = Alignment(horizontal='center')
-    ws.merge_cells('A3:I3')
-    ws['A3'] = f'BALANCE DE COMPROBACIÓN — {_month_name(month)} {year}'
-    ws['A3'].font = Font(bold=True)
-    ws['A3'].alignment = Alignment(horizontal='center')
+    catalog  = _get_accounts_catalog()
+    openings = PeriodBalanceService.opening_balances(year, month)
 
-    header_fill = PatternFill(start_color='1B3A6B', end_color='1B3A6B', fill_type='solid')
-    headers = [
+    xl = ExcelExport()
+    ws = xl.sheet('Balance Comprobación', widths=[10, 40, 12, 14, 14, 14, 14, 14, 14], freeze='A6')
+    _xl_title(ws, 9, (f'BALANCE DE COMPROBACIÓN — {_month_name(month)} {year}', 'qc_title'))
+    ws.blank()
+    ws.header([
         'Código', 'Cuenta', 'Tipo',
         'Saldo Ant. Deudor', 'Saldo Ant. Acreedor',
         'DEBE (S/)', 'HABER (S/)',
         'Saldo Final Deudor', 'Saldo Final Acreedor',
-    ]
-    for col, h in enumerate(headers, 1):
-        c = ws.cell(row=5, column=col, value=h)
-        c.fill = header_fill
-        c.font = Font(bold=True, color='FFFFFF')
-        c.alignment = Alignment(horizontal='center')
+    ])
 
-    row = 6
+    row_styles = [None, None, None] + ['qc_num'] * 6
     for r in rows:
         code = r.account_code
         acc  = catalog.get(code)
         td   = float(r.total_debe  or 0)
         th   = float(r.total_haber or 0)
 
-        prev = db.session.query(
-            func.sum(JournalEntryLine.debe).label('d'),
-            func.sum(JournalEntryLine.haber).label('h'),
-        ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-        ).filter(
-            JournalEntryLine.account_code == code,
-            JournalEntry.entry_date < first_day,
-            JournalEntry.status == 'activo',
-        ).first()
-        ant = float(prev.d or 0) - float(prev.h or 0)
+        ant = float(PeriodBalanceService.opening_saldo(openings, code))
         is_deudora = (acc.nature == 'deudora') if acc else not code.startswith(('4', '5', '7'))
         sd_ini = max(ant, 0) if is_deudora else max(ant, 0)
         sa_ini = max(-ant, 0)
@@ -3008,27 +2764,14 @@ def export_balance():
         sd_fin = max(fin, 0) if is_deudora else max(fin, 0)
         sa_fin = max(-fin, 0)
 
-        ws.cell(row=row, column=1, value=code)
-        ws.cell(row=row, column=2, value=acc.name if acc else '(sin descripción)')
-        ws.cell(row=row, column=3, value=acc.type if acc else _infer_type(code))
-        ws.cell(row=row, column=4, value=sd_ini)
-        ws.cell(row=row, column=5, value=sa_ini)
-        ws.cell(row=row, column=6, value=td)
-        ws.cell(row=row, column=7, value=th)
-        ws.cell(row=row, column=8, value=sd_fin)
-        ws.cell(row=row, column=9, value=sa_fin)
-        row += 1
-
-    for i, w in enumerate([10, 40, 12, 14, 14, 14, 14, 14, 14], 1):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(i)].width = w
+        ws.append([
+            code,
+            acc.name if acc else '(sin descripción)',
+            acc.type if acc else _infer_type(code),
+            sd_ini, sa_ini, td, th, sd_fin, sa_fin,
+        ], styles=row_styles)
 
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    return send_file(output,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                     as_attachment=True,
-                     download_name=f'balance_comprobacion_{year}{month:02d}.xlsx')
+    return xl.to_response(f'balance_comprobacion_{year}{month:02d}.xlsx')
 
 
 # ── Estado de Resultados ───────────────────────────────────────────────────────
@@ -3062,34 +2805,11 @@ def _ir_mype(utilidad: Decimal) -> Decimal:
         return (t1 + t2).quantize(Decimal('0.01'))
 
 
-@contabilidad_bp.route('/resultados')
-@login_required
-@require_role('Master')
-def resultados():
-    from app.models.journal_entry import JournalEntry
-    from app.models.journal_entry_line import JournalEntryLine
-    from app.models.accounting_account import AccountingAccount
-    from sqlalchemy import func, extract
-
-    year  = request.args.get('year',  type=int, default=date.today().year)
-    month = request.args.get('month', type=int, default=date.today().month)
-
-    # Incluir entry_type para filtrar por origen del asiento
-    rows = db.session.query(
-        JournalEntryLine.account_code,
-        JournalEntry.entry_type,
-        func.sum(JournalEntryLine.debe).label('total_debe'),
-        func.sum(JournalEntryLine.haber).label('total_haber'),
-    ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-    ).filter(
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
-        JournalEntry.status == 'activo',
-    ).group_by(JournalEntryLine.account_code, JournalEntry.entry_type
-    ).order_by(JournalEntryLine.account_code).all()
-
-    catalog = _get_accounts_catalog()
-
+def _estado_resultados(cuentas: dict, catalog: dict) -> dict:
+    """
+    Estado de Resultados a partir de {(cuenta, entry_type): (Σ debe, Σ haber)}
+    del período (AccountTotalsService).
+    """
     # Tipos de asiento que producen gastos operativos reales (registrados en /gastos)
     _GASTOS_OP = {'gasto', 'activo_fijo', 'manual'}
     # Tipos que NO deben aparecer en P&L como gastos
@@ -3099,11 +2819,8 @@ def resultados():
     gastos      = []
     fx_losses   = Decimal('0')   # 6762 de calce_netting — se neta contra ingresos
 
-    for r in rows:
-        code       = r.account_code
-        etype      = r.entry_type or ''
-        td = Decimal(str(r.total_debe  or 0))
-        th = Decimal(str(r.total_haber or 0))
+    for (code, etype), (td, th) in sorted(cuentas.items()):
+        etype = etype or ''
 
         # Ajustes de conciliación y depreciación: no van en P&L de resultados
         if etype in _EXCLUIR:
@@ -3136,19 +2853,35 @@ def resultados():
     total_gastos      = sum(g['monto'] for g in gastos)
     utilidad_antes_ir = total_ingresos   # gastos son informativos, no restan utilidad FX
     ir_estimado       = _ir_mype(utilidad_antes_ir)
-    utilidad_neta     = utilidad_antes_ir - ir_estimado
+    return {
+        'ingresos':          ingresos,
+        'gastos':            gastos,
+        'total_ingresos':    total_ingresos,
+        'total_gastos':      total_gastos,
+        'utilidad_antes_ir': utilidad_antes_ir,
+        'ir_estimado':       ir_estimado,
+        'utilidad_neta':     utilidad_antes_ir - ir_estimado,
+    }
+
+
+@contabilidad_bp.route('/resultados')
+@login_required
+@require_role('Master')
+def resultados():
+    from app.services.accounting.account_totals import AccountTotalsService, accounts
+
+    year  = request.args.get('year',  type=int, default=date.today().year)
+    month = request.args.get('month', type=int, default=date.today().month)
+
+    # Totales por (cuenta, entry_type) del período, ya materializados
+    totals = AccountTotalsService.period_totals([(year, month)], is_account=True)[(year, month)]
+    er = _estado_resultados(accounts(totals), _get_accounts_catalog())
 
     periods = _get_all_periods()
 
     return render_template(
         'contabilidad/resultados.html',
-        ingresos=ingresos,
-        gastos=gastos,
-        total_ingresos=total_ingresos,
-        total_gastos=total_gastos,
-        utilidad_antes_ir=utilidad_antes_ir,
-        ir_estimado=ir_estimado,
-        utilidad_neta=utilidad_neta,
+        **er,
         periods=periods,
         selected_year=year,
         selected_month=month,
@@ -3158,40 +2891,64 @@ def resultados():
     )
 
 
+@contabilidad_bp.route('/resultados/api/comparativo')
+@login_required
+@require_role('Master')
+def api_resultados_comparativo():
+    """
+    Estado de Resultados de varios meses lado a lado (year, desde..hasta),
+    desde los totales materializados: una sola consulta para todos los meses.
+    """
+    from app.services.accounting.account_totals import AccountTotalsService, accounts
+
+    year  = request.args.get('year',  type=int, default=date.today().year)
+    desde = min(max(request.args.get('desde', type=int, default=1), 1), 12)
+    hasta = min(max(request.args.get('hasta', type=int, default=12), desde), 12)
+
+    catalog = _get_accounts_catalog()
+    por_mes = AccountTotalsService.period_totals(
+        [(year, m) for m in range(desde, hasta + 1)], is_account=True)
+
+    meses = []
+    for (y, m), totals in sorted(por_mes.items()):
+        er = _estado_resultados(accounts(totals), catalog)
+        meses.append({
+            'year': y, 'month': m, 'label': f'{_month_name(m)} {y}',
+            'ingresos': [{**i, 'monto': float(i['monto'])} for i in er['ingresos']],
+            'gastos':   [{**g, 'monto': float(g['monto'])} for g in er['gastos']],
+            'total_ingresos': float(er['total_ingresos']),
+            'total_gastos':   float(er['total_gastos']),
+            'ir_estimado':    float(er['ir_estimado']),
+            'utilidad_neta':  float(er['utilidad_neta']),
+        })
+    return jsonify({'year': year, 'meses': meses})
+
+
 @contabilidad_bp.route('/resultados/export')
 @login_required
 @require_role('Master')
 def export_resultados():
-    from app.models.journal_entry import JournalEntry
-    from app.models.journal_entry_line import JournalEntryLine
-    from app.models.accounting_account import AccountingAccount
-    from sqlalchemy import func, extract
+    from app.services.accounting.account_totals import AccountTotalsService, accounts
 
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
 
-    rows = db.session.query(
-        JournalEntryLine.account_code,
-        func.sum(JournalEntryLine.debe).label('total_debe'),
-        func.sum(JournalEntryLine.haber).label('total_haber'),
-    ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-    ).filter(
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
-        JournalEntry.status == 'activo',
-    ).group_by(JournalEntryLine.account_code
-    ).order_by(JournalEntryLine.account_code).all()
+    # Σ por cuenta (todos los entry_type) desde los totales materializados
+    por_cuenta = {}
+    totals = AccountTotalsService.period_totals([(year, month)], is_account=True)[(year, month)]
+    for (code, _), (d, h) in accounts(totals).items():
+        pd, ph = por_cuenta.get(code, (Decimal('0'), Decimal('0')))
+        por_cuenta[code] = (pd + d, ph + h)
 
     catalog = _get_accounts_catalog()
 
     ingresos, gastos = [], []
-    for r in rows:
-        code = r.account_code
+    for code, (d, h) in sorted(por_cuenta.items()):
         acc  = catalog.get(code)
         acc_type = acc.type if acc else _infer_type(code)
         acc_name = acc.name if acc else f'Cuenta {code}'
-        td = float(r.total_debe or 0)
-        th = float(r.total_haber or 0)
+        td = float(d)
+        th = float(h)
         if acc_type == 'ingreso':
             neto = max(th - td, 0)
             if neto > 0:
@@ -3324,14 +3081,12 @@ def balance_general():
     La 'brecha' entre activo real y patrimonio contable se muestra
     como 'Diferencia pendiente de conciliar' — no se oculta.
     """
-    from app.models.fixed_asset import FixedAsset
     from app.models.bank_balance import BankBalance
     from app.models.bank_balance_history import BankBalanceHistory
     from app.models.exchange_rate import ExchangeRate
     from sqlalchemy import func
     import calendar
 
-    from sqlalchemy import extract as _extract
     year  = request.args.get('year',  type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
     _, last_day = calendar.monthrange(year, month)
@@ -3339,28 +3094,18 @@ def balance_general():
     end_of_month = date(year, month, last_day)
     corte = min(end_of_month, date.today())
 
-    def saldo_d(prefix): return _saldo_acumulado_hasta(prefix, corte, 'deudora')
-    def saldo_a(prefix): return _saldo_acumulado_hasta(prefix, corte, 'acreedora')
-
-    # Helper filtrado por año — para P&L (6xxx, 7xxx) que no deben acumular entre años
-    def _saldo_año(prefix, side):
-        from app.models.journal_entry_line import JournalEntryLine as _JEL
-        from app.models.journal_entry import JournalEntry as _JE
-        row = db.session.query(
-            func.coalesce(func.sum(_JEL.debe),  0).label('d'),
-            func.coalesce(func.sum(_JEL.haber), 0).label('h'),
-        ).join(_JE, _JEL.journal_entry_id == _JE.id).filter(
-            _JEL.account_code.like(f'{prefix}%'),
-            _extract('year', _JE.entry_date) == year,
-            _JE.entry_date <= corte,
-            _JE.status == 'activo',
-        ).one()
-        d = Decimal(str(row.d or 0))
-        h = Decimal(str(row.h or 0))
-        return max(d - h, Decimal('0')) if side == 'deudora' else max(h - d, Decimal('0'))
-
-    def saldo_d_año(prefix): return _saldo_año(prefix, 'deudora')
-    def saldo_a_año(prefix): return _saldo_año(prefix, 'acreedora')
+    # Acumulados por prefijo PCGE desde los totales materializados
+    # (AccountTotalsService): dos lecturas en lugar de un SUM por rubro
+    from app.services.accounting.account_totals import AccountTotalsService, saldo
+    acumulado = AccountTotalsService.cumulative(corte)
+    del_año   = AccountTotalsService.cumulative(corte, year=year)
+
+    def saldo_d(prefix): return saldo(acumulado, prefix, 'deudora')
+    def saldo_a(prefix): return saldo(acumulado, prefix, 'acreedora')
+
+    # P&L (6xxx, 7xxx) solo del año seleccionado — no acumula entre ejercicios
+    def saldo_d_año(prefix): return max(saldo(del_año, prefix, 'deudora'), Decimal('0'))
+    def saldo_a_año(prefix): return max(saldo(del_año, prefix, 'acreedora'), Decimal('0'))
 
     # ── TC para conversión USD → PEN ──────────────────────────────────────────
     rates = ExchangeRate.get_current_rates()
@@ -3398,12 +3143,11 @@ def balance_general():
     ctas_cobrar      = saldo_d('121')
     activo_corriente = caja_mn + caja_me + bancos_pen + bancos_usd + ctas_cobrar
 
-    # Activos fijos netos
-    activos_netos = Decimal('0')
-    fixed_assets  = FixedAsset.query.filter_by(status='activo').all()
-    for fa in fixed_assets:
-        activos_netos += fa.net_book_value
-    if not fixed_assets:
+    # Activos fijos netos (cronograma de depreciación al corte)
+    from app.services.accounting.depreciation_schedule import net_book_values
+    valores_af    = net_book_values(corte)
+    activos_netos = sum(valores_af.values(), Decimal('0'))
+    if not valores_af:
         costo_af    = sum(saldo_d(c) for c in ('3321', '3351', '3361', '3362'))
         deprec_acum = sum(saldo_a(c) for c in ('3921', '3951', '3961', '3962'))
         activos_netos = costo_af - deprec_acum
@@ -3496,108 +3240,59 @@ def api_activos_list():
 @require_role('Master')
 def depreciar_activos():
     """
-    Registra la depreciación mensual de todos los activos activos.
-    Genera un asiento por activo: DEBE 6814 / HABER 3951/3961/3962.
-    Se debe ejecutar una vez por mes (el sistema previene duplicados por period_id + source_id).
+    Registra la depreciación mensual de todos los activos activos a partir
+    del cronograma: un asiento por cuenta 39xx (DEBE 6814 / HABER 3951/3961/3962).
+    Idempotente: las cuotas ya contabilizadas no se vuelven a registrar.
     """
     from app.models.fixed_asset import FixedAsset
-    from app.services.accounting.journal_service import JournalService
-    from app.models.journal_entry import JournalEntry
+    from app.services.accounting.depreciation_schedule import post_depreciation
 
     data          = request.get_json() or {}
     dep_year      = int(data.get('year',  date.today().year))
     dep_month     = int(data.get('month', date.today().month))
-    dep_date      = date(dep_year, dep_month, 1)
 
-    assets = FixedAsset.query.filter_by(status='activo').all()
-    if not assets:
+    if not FixedAsset.query.filter_by(status='activo').first():
         return jsonify({'success': False, 'error': 'No hay activos fijos activos registrados.'})
 
-    period = JournalService.get_or_create_period(dep_date)
-    if period.status == 'cerrado':
-        return jsonify({
-            'success': False,
-            'error': f'El período {dep_date.strftime("%m/%Y")} está cerrado.'
-        }), 409
-
-    generados = 0
-    omitidos  = 0
-    errores   = []
-
-    for asset in assets:
-        if asset.is_fully_depreciated:
-            asset.status = 'depreciado'
-            db.session.flush()
-            omitidos += 1
-            continue
-
-        # Verificar si ya existe asiento de depreciación para este activo en este período
-        existing = JournalEntry.query.filter_by(
-            entry_type='depreciacion',
-            source_type='fixed_asset',
-            source_id=asset.id,
-            period_id=period.id,
-        ).first()
-        if existing:
-            omitidos += 1
-            continue
-
-        cuota = Decimal(str(asset.monthly_depreciation))
-
-        entry = JournalService.create_entry(
-            entry_type='depreciacion',
-            description=f'Depreciación {asset.asset_code} – {asset.name} '
-                        f'({asset.months_depreciated + 1}/{asset.useful_life_months})',
-            lines=[
-                {
-                    'account_code': '6814',
-                    'description':  f'Deprec. {asset.asset_code}',
-                    'debe':         cuota,
-                    'haber':        Decimal('0'),
-                    'currency':     'PEN',
-                },
-                {
-                    'account_code': asset.deprec_account,
-                    'description':  f'Deprec. acum. {asset.asset_code}',
-                    'debe':         Decimal('0'),
-                    'haber':        cuota,
-                    'currency':     'PEN',
-                },
-            ],
-            source_type='fixed_asset',
-            source_id=asset.id,
-            entry_date=dep_date,
-            created_by=current_user.id,
-        )
-
-        if entry:
-            asset.months_depreciated    = (asset.months_depreciated or 0) + 1
-            asset.accumulated_depreciation = (
-                Decimal(str(asset.accumulated_depreciation or 0)) + cuota
-            )
-            if asset.is_fully_depreciated:
-                asset.status = 'depreciado'
-            generados += 1
-        else:
-            errores.append(asset.asset_code)
-
     try:
-        db.session.commit()
+        r = post_depreciation(dep_year, dep_month, created_by=current_user.id)
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+    if r['periodo_cerrado']:
+        return jsonify({
+            'success': False,
+            'error': f'El período {dep_month:02d}/{dep_year} está cerrado.'
+        }), 409
+
     return jsonify({
         'success': True,
-        'message': f'{generados} asiento(s) de depreciación generado(s). '
-                   f'{omitidos} activo(s) omitido(s) (ya depreciado o duplicado). '
-                   f'{len(errores)} error(es).',
-        'generados': generados,
-        'omitidos': omitidos,
-        'errores': errores,
+        'message': f'{r["generados"]} asiento(s) de depreciación generado(s) '
+                   f'({r["activos"]} activo(s), S/ {r["total_depreciation"]:,.2f}). '
+                   f'{r["omitidos"]} activo(s) omitido(s) (ya depreciado o sin cuota). '
+                   f'{len(r["errores"])} error(es).',
+        'generados': r['generados'],
+        'activos': r['activos'],
+        'omitidos': r['omitidos'],
+        'errores': r['errores'],
+        'total_depreciation': r['total_depreciation'],
     })
 
 
+@contabilidad_bp.route('/activos-fijos/api/proyeccion')
+@login_required
+@require_role('Master')
+def api_activos_proyeccion():
+    """Gasto de depreciación programado (cronograma) por mes y cuenta 39xx."""
+    from app.services.accounting.depreciation_schedule import projection
+
+    year   = request.args.get('year',  type=int, default=date.today().year)
+    month  = request.args.get('month', type=int, default=date.today().month)
+    months = min(max(request.args.get('months', type=int, default=12), 1), 120)
+    return jsonify(projection(year, month, months))
+
+
 @contabilidad_bp.route('/activos-fijos/<int:asset_id>/baja', methods=['POST'])
 @csrf.exempt
 @login_required
@@ -3611,6 +3306,9 @@ def dar_baja_activo(asset_id):
     asset.baja_date  = date.today()
     asset.baja_notes = data.get('notes', '')
     try:
+        from app.services.accounting.depreciation_schedule import rebuild_schedule
+        db.session.flush()
+        rebuild_schedule([asset.id], commit=False)   # elimina las cuotas pendientes
         db.session.commit()
         return jsonify({'success': True, 'message': f'Activo {asset.asset_code} dado de baja.'})
     except Exception as e:
@@ -3654,16 +3352,25 @@ def exportar_excel():
       4. Registro de Compras
       5. Activos Fijos
       6. Cuadre Diario
+
+    Para períodos grandes preferir el job en segundo plano
+    (POST /exports/api/jobs, kind='contabilidad_excel').
     """
+    year  = request.args.get('year',  type=int, default=date.today().year)
+    month = request.args.get('month', type=int, default=date.today().month)
+    xl, filename = build_contabilidad_workbook(year, month)
+    return xl.to_response(filename)
+
+
+def build_contabilidad_workbook(year: int, month: int):
+    """Arma el workbook contable del período. Retorna (ExcelExport, filename)."""
     from app.models.journal_entry import JournalEntry
     from app.models.journal_entry_line import JournalEntryLine
     from app.models.expense_record import ExpenseRecord
     from app.models.fixed_asset import FixedAsset
-    from sqlalchemy import func, extract
+    from sqlalchemy import func
     import calendar
 
-    year  = request.args.get('year',  type=int, default=date.today().year)
-    month = request.args.get('month', type=int, default=date.today().month)
     _, last_day = calendar.monthrange(year, month)
     corte = date(year, month, last_day)
 
@@ -3672,111 +3379,76 @@ def exportar_excel():
     ruc     = info['ruc']
     mes_label = f"{['Enero','Febrero','Marzo','Abril','Mayo','Junio','Julio','Agosto','Septiembre','Octubre','Noviembre','Diciembre'][month-1]} {year}"
 
-    # ── Estilos comunes ───────────────────────────────────────────────────────
-    H_FILL  = PatternFill('solid', fgColor='1F3864')   # azul oscuro
-    H_FONT  = Font(color='FFFFFF', bold=True, size=10)
-    T_FONT  = Font(bold=True, size=11)
-    S_FONT  = Font(bold=True, size=9, color='444444')
-    NUM_FMT = '#,##0.00'
-    BORDER  = Border(
-        bottom=Side(style='thin', color='CCCCCC'),
-        top=Side(style='thin', color='CCCCCC'),
-    )
-
-    def header_row(ws, cols, row=1):
-        for c, (title, width) in enumerate(cols, 1):
-            cell = ws.cell(row=row, column=c, value=title)
-            cell.font      = H_FONT
-            cell.fill      = H_FILL
-            cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-            ws.column_dimensions[openpyxl.utils.get_column_letter(c)].width = width
-        ws.row_dimensions[row].height = 22
+    xl = ExcelExport()
 
     def title_block(ws, title, subtitle=''):
-        ws['A1'] = company
-        ws['A1'].font = T_FONT
-        ws['A2'] = f'RUC: {ruc}'
-        ws['A2'].font = Font(size=9, color='555555')
-        ws['A3'] = title
-        ws['A3'].font = Font(bold=True, size=12)
-        ws['A4'] = subtitle
-        ws['A4'].font = Font(italic=True, size=9, color='777777')
-        ws.append([])   # row 5 blank
-
-    wb = openpyxl.Workbook()
-    wb.remove(wb.active)   # remove default sheet
+        ws.title_block([
+            (company, 'qc_company_l'),
+            (f'RUC: {ruc}', 'qc_muted'),
+            (title, 'qc_title_l'),
+            (subtitle, 'qc_note'),
+        ])
+        ws.blank()   # fila 5 en blanco
 
     # ══════════════════════════════════════════════════════════════════════════
     # HOJA 1 — Libro Diario
     # ══════════════════════════════════════════════════════════════════════════
-    ws1 = wb.create_sheet('Libro Diario')
+    ws1 = xl.sheet('Libro Diario', widths=[14, 12, 14, 40, 10, 28, 14, 14], freeze='A7')
     title_block(ws1, 'LIBRO DIARIO', mes_label)
+    ws1.header(['Nro Asiento', 'Fecha', 'Tipo', 'Descripción',
+                'Cuenta', 'Nombre Cuenta', 'DEBE', 'HABER'], style='qc_header_sm', height=22)
 
-    cols1 = [
-        ('Nro Asiento', 14), ('Fecha', 12), ('Tipo', 14), ('Descripción', 40),
-        ('Cuenta', 10), ('Nombre Cuenta', 28), ('DEBE', 14), ('HABER', 14),
-    ]
-    header_row(ws1, cols1, row=6)
+    from app.models.accounting_account import AccountingAccount
+    _catalog_names = dict(db.session.query(AccountingAccount.code, AccountingAccount.name).all())
 
-    entries = JournalEntry.query.options(
-        joinedload(JournalEntry.lines),
+    lines_q = db.session.query(
+        JournalEntry.id, JournalEntry.entry_number, JournalEntry.entry_date,
+        JournalEntry.entry_type, JournalEntry.description,
+        JournalEntryLine.account_code, JournalEntryLine.debe, JournalEntryLine.haber,
+    ).join(
+        JournalEntryLine, JournalEntryLine.journal_entry_id == JournalEntry.id,
     ).filter(
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
-    ).order_by(JournalEntry.entry_date, JournalEntry.id).all()
-
-    from app.models.accounting_account import AccountingAccount
-    _catalog_names = {a.code: a.name for a in AccountingAccount.query.all()}
+    ).order_by(JournalEntry.entry_date, JournalEntry.id, JournalEntryLine.id)
 
-    r = 7
+    st_odd  = ['qc_cell_soft', 'qc_date', 'qc_cell_soft', 'qc_cell_soft',
+               'qc_cell_soft', 'qc_cell_soft', 'qc_num_soft', 'qc_num_soft']
+    st_even = ['qc_cell_even', 'qc_date', 'qc_cell_even', 'qc_cell_even',
+               'qc_cell_even', 'qc_cell_even', 'qc_num_even', 'qc_num_even']
     total_debe = Decimal('0')
     total_haber = Decimal('0')
-    alt_fill = PatternFill('solid', fgColor='EFF3FB')
-
-    for entry in entries:
-        for i, line in enumerate(entry.lines):
-            row_fill = alt_fill if (entry.id % 2 == 0) else None
-            cells = [
-                entry.entry_number or '',
-                entry.entry_date,
-                entry.entry_type or '',
-                entry.description[:80] if entry.description else '',
-                line.account_code,
-                _catalog_names.get(line.account_code, ''),
-                float(line.debe or 0),
-                float(line.haber or 0),
-            ]
-            for c, val in enumerate(cells, 1):
-                cell = ws1.cell(row=r, column=c, value=val)
-                if row_fill:
-                    cell.fill = row_fill
-                if c in (7, 8):
-                    cell.number_format = NUM_FMT
-                    cell.alignment = Alignment(horizontal='right')
-                if c == 2 and isinstance(val, date):
-                    cell.number_format = 'DD/MM/YYYY'
-            total_debe  += Decimal(str(line.debe or 0))
-            total_haber += Decimal(str(line.haber or 0))
-            r += 1
+
+    for ln in iter_query(lines_q):
+        ws1.append([
+            ln.entry_number or '',
+            ln.entry_date,
+            ln.entry_type or '',
+            ln.description[:80] if ln.description else '',
+            ln.account_code,
+            _catalog_names.get(ln.account_code, ''),
+            float(ln.debe or 0),
+            float(ln.haber or 0),
+        ], styles=st_even if ln.id % 2 == 0 else st_odd)
+        total_debe  += Decimal(str(ln.debe or 0))
+        total_haber += Decimal(str(ln.haber or 0))
 
     # Totales
-    ws1.cell(row=r, column=6, value='TOTALES').font = Font(bold=True)
-    ws1.cell(row=r, column=7, value=float(total_debe)).number_format  = NUM_FMT
-    ws1.cell(row=r, column=8, value=float(total_haber)).number_format = NUM_FMT
-    ws1.cell(row=r, column=7).font = Font(bold=True)
-    ws1.cell(row=r, column=8).font = Font(bold=True)
-    ws1.freeze_panes = 'A7'
+    ws1.append(['', '', '', '', '', 'TOTALES', float(total_debe), float(total_haber)],
+               styles=[None] * 5 + ['qc_bold', 'qc_bold_num', 'qc_bold_num'])
 
     # ══════════════════════════════════════════════════════════════════════════
     # HOJA 2 — Balance General
     # ══════════════════════════════════════════════════════════════════════════
-    ws2 = wb.create_sheet('Balance General')
+    ws2 = xl.sheet('Balance General', widths=[40, 18])
     title_block(ws2, 'BALANCE GENERAL (Estado de Situación Financiera)',
                 f'Al {corte.strftime("%d/%m/%Y")}')
 
-    def saldo_d(prefix): return _saldo_acumulado_hasta(prefix, corte, 'deudora')
-    def saldo_a(prefix): return _saldo_acumulado_hasta(prefix, corte, 'acreedora')
+    from app.services.accounting.account_totals import AccountTotalsService, saldo
+    acumulado = AccountTotalsService.cumulative(corte)
+
+    def saldo_d(prefix): return saldo(acumulado, prefix, 'deudora')
+    def saldo_a(prefix): return saldo(acumulado, prefix, 'acreedora')
 
     # Bancos desde Posición (misma lógica que balance_general())
     from app.models.bank_balance import BankBalance as _BB
@@ -3805,8 +3477,9 @@ def exportar_excel():
     ctas_cobrar = saldo_d('121')
     activo_corriente = caja_mn + caja_me + bancos_pen + bancos_usd + ctas_cobrar
 
-    fixed_assets = FixedAsset.query.filter_by(status='activo').all()
-    activos_netos = sum(fa.net_book_value for fa in fixed_assets) if fixed_assets else (
+    from app.services.accounting.depreciation_schedule import net_book_values
+    valores_af    = net_book_values(corte)
+    activos_netos = sum(valores_af.values(), Decimal('0')) if valores_af else (
         sum(saldo_d(c) for c in ('3321','3351','3361','3362')) -
         sum(saldo_a(c) for c in ('3921','3951','3961','3962'))
     )
@@ -3831,8 +3504,6 @@ def exportar_excel():
     total_patrimonio    = (capital_exp + utilidades_acc_exp -
                            perdidas_acc_exp + resultado_ejercicio)
 
-    BG_SECTION = PatternFill('solid', fgColor='D9E1F2')
-
     bal_rows = [
         ('ACTIVO', '', True),
         ('ACTIVO CORRIENTE', '', False),
@@ -3869,22 +3540,14 @@ def exportar_excel():
         ('TOTAL PASIVO + PATRIMONIO', float(total_pasivo + total_patrimonio), True),
     ]
 
-    header_row(ws2, [('Concepto', 40), ('Importe (S/)', 18)], row=6)
-    for i, (label, amount, bold) in enumerate(bal_rows, 7):
-        c1 = ws2.cell(row=i, column=1, value=label)
-        c2 = ws2.cell(row=i, column=2, value=amount if amount != '' else '')
-        if bold:
-            c1.font = Font(bold=True)
-            c2.font = Font(bold=True)
-            c1.fill = c2.fill = BG_SECTION
-        if isinstance(amount, float):
-            c2.number_format = NUM_FMT
-            c2.alignment = Alignment(horizontal='right')
+    ws2.header(['Concepto', 'Importe (S/)'], style='qc_header_sm', height=22)
+    for label, amount, bold in bal_rows:
+        ws2.append([label, amount], styles=['qc_section', 'qc_section_num'] if bold else [None, 'qc_num_soft' if amount != '' else None])
 
     # ══════════════════════════════════════════════════════════════════════════
     # HOJA 3 — Estado de Resultados
     # ══════════════════════════════════════════════════════════════════════════
-    ws3 = wb.create_sheet('Estado de Resultados')
+    ws3 = xl.sheet('Estado de Resultados', widths=[40, 18])
     title_block(ws3, 'ESTADO DE RESULTADOS', mes_label)
 
     # Ingresos por tipo de asiento (calce_netting = utilidad de operaciones)
@@ -3892,8 +3555,7 @@ def exportar_excel():
         JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
     ).filter(
         JournalEntryLine.account_code.like('77%'),
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
     ).scalar() or Decimal('0')
 
@@ -3903,8 +3565,7 @@ def exportar_excel():
     ).join(JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
     ).filter(
         JournalEntryLine.account_code.like('6%'),
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
     ).scalar() or Decimal('0')
 
@@ -3913,14 +3574,12 @@ def exportar_excel():
         JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
     ).filter(
         JournalEntryLine.account_code == '6814',
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
     ).scalar() or Decimal('0')
 
     utilidad_bruta = Decimal(str(ingresos_op)) - Decimal(str(gastos_q))
 
-    ER_FILL = PatternFill('solid', fgColor='E2EFDA')
     er_rows = [
         ('INGRESOS', '', True),
         ('7711 – Utilidad por diferencia de cambio', float(ingresos_op), False),
@@ -3934,115 +3593,75 @@ def exportar_excel():
         ('RESULTADO NETO DEL PERÍODO', float(utilidad_bruta - Decimal(str(deprec_mes))), True),
     ]
 
-    header_row(ws3, [('Concepto', 40), ('Importe (S/)', 18)], row=6)
-    for i, (label, amount, bold) in enumerate(er_rows, 7):
-        c1 = ws3.cell(row=i, column=1, value=label)
-        c2 = ws3.cell(row=i, column=2, value=amount if amount != '' else '')
-        if bold:
-            c1.font = c2.font = Font(bold=True)
-            c1.fill = c2.fill = ER_FILL
-        if isinstance(amount, float):
-            c2.number_format = NUM_FMT
-            c2.alignment = Alignment(horizontal='right')
+    ws3.header(['Concepto', 'Importe (S/)'], style='qc_header_sm', height=22)
+    for label, amount, bold in er_rows:
+        ws3.append([label, amount], styles=['qc_total', 'qc_total_num'] if bold else [None, 'qc_num_soft' if amount != '' else None])
 
     # ══════════════════════════════════════════════════════════════════════════
     # HOJA 4 — Registro de Compras / Gastos
     # ══════════════════════════════════════════════════════════════════════════
-    ws4 = wb.create_sheet('Registro de Compras')
+    ws4 = xl.sheet('Registro de Compras', widths=[12, 12, 14, 14, 28, 14, 36, 13, 13, 13], freeze='A7')
     title_block(ws4, 'REGISTRO DE COMPRAS / GASTOS', mes_label)
+    ws4.header(['Fecha', 'Tipo Comp.', 'Nro Comp.', 'RUC Proveedor', 'Proveedor',
+                'Tipo Gasto', 'Descripción', 'Base (S/)', 'IGV (S/)', 'Total (S/)'],
+               style='qc_header_sm', height=22)
 
-    cols4 = [
-        ('Fecha', 12), ('Tipo Comp.', 12), ('Nro Comp.', 14), ('RUC Proveedor', 14),
-        ('Proveedor', 28), ('Tipo Gasto', 14), ('Descripción', 36),
-        ('Base (S/)', 13), ('IGV (S/)', 13), ('Total (S/)', 13),
-    ]
-    header_row(ws4, cols4, row=6)
-
-    gastos = ExpenseRecord.query.filter(
-        extract('year',  ExpenseRecord.expense_date) == year,
-        extract('month', ExpenseRecord.expense_date) == month,
-    ).order_by(ExpenseRecord.expense_date).all()
+    gastos_q = ExpenseRecord.query.filter(
+        in_month(ExpenseRecord.expense_date, year, month),
+    ).order_by(ExpenseRecord.expense_date, ExpenseRecord.id)
 
+    st4_odd  = ['qc_date'] + ['qc_cell_soft'] * 6 + ['qc_num_soft'] * 3
+    st4_even = ['qc_date'] + ['qc_cell_even'] * 6 + ['qc_num_even'] * 3
     g_total_base = g_total_igv = g_total = Decimal('0')
-    for i, g in enumerate(gastos, 7):
+    for g in iter_query(gastos_q):
         base = float(g.base_pen or g.amount_pen or 0)
         igv  = float(g.igv_pen or 0)
         total = float(g.amount_pen or 0)
-        row_fill = alt_fill if i % 2 == 0 else None
-        vals = [
+        ws4.append([
             g.expense_date, g.voucher_type or '', g.voucher_number or '',
             g.supplier_ruc or '', g.supplier_name or '',
             g.expense_type or 'servicio', g.description[:60] if g.description else '',
             base, igv, total,
-        ]
-        for c, val in enumerate(vals, 1):
-            cell = ws4.cell(row=i, column=c, value=val)
-            if row_fill:
-                cell.fill = row_fill
-            if c in (8, 9, 10):
-                cell.number_format = NUM_FMT
-                cell.alignment = Alignment(horizontal='right')
-            if c == 1 and isinstance(val, date):
-                cell.number_format = 'DD/MM/YYYY'
+        ], styles=st4_even if (ws4.row_num + 1) % 2 == 0 else st4_odd)
         g_total_base += Decimal(str(base))
         g_total_igv  += Decimal(str(igv))
         g_total      += Decimal(str(total))
 
-    r4 = len(gastos) + 7
-    ws4.cell(row=r4, column=7, value='TOTALES').font = Font(bold=True)
-    for c, val in [(8, float(g_total_base)), (9, float(g_total_igv)), (10, float(g_total))]:
-        cell = ws4.cell(row=r4, column=c, value=val)
-        cell.number_format = NUM_FMT
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal='right')
-    ws4.freeze_panes = 'A7'
+    ws4.append(['', '', '', '', '', '', 'TOTALES',
+                float(g_total_base), float(g_total_igv), float(g_total)],
+               styles=[None] * 6 + ['qc_bold'] + ['qc_bold_num'] * 3)
 
     # ══════════════════════════════════════════════════════════════════════════
     # HOJA 5 — Control de Activos Fijos
     # ══════════════════════════════════════════════════════════════════════════
-    ws5 = wb.create_sheet('Activos Fijos')
+    ws5 = xl.sheet('Activos Fijos', widths=[12, 30, 14, 12, 12, 13, 13, 12, 14, 13, 8, 10, 10], freeze='A7')
     title_block(ws5, 'CONTROL DE ACTIVOS FIJOS', f'Al {corte.strftime("%d/%m/%Y")}')
-
-    cols5 = [
-        ('Código', 12), ('Descripción', 30), ('Categoría', 14),
-        ('Cta. Activo', 12), ('Cta. Deprec.', 12), ('Fecha Adq.', 13),
-        ('Costo (S/)', 13), ('Deprec./mes', 12), ('Deprec. Acum.', 14),
-        ('Valor Neto', 13), ('Meses', 8), ('Vida Útil', 10), ('Estado', 10),
-    ]
-    header_row(ws5, cols5, row=6)
-
-    all_assets = FixedAsset.query.order_by(FixedAsset.acquisition_date).all()
-    for i, a in enumerate(all_assets, 7):
-        row_fill = alt_fill if i % 2 == 0 else None
-        vals = [
+    ws5.header(['Código', 'Descripción', 'Categoría', 'Cta. Activo', 'Cta. Deprec.',
+                'Fecha Adq.', 'Costo (S/)', 'Deprec./mes', 'Deprec. Acum.', 'Valor Neto',
+                'Meses', 'Vida Útil', 'Estado'], style='qc_header_sm', height=22)
+
+    st5_odd  = ['qc_cell_soft'] * 5 + ['qc_date'] + ['qc_num_soft'] * 4 + ['qc_cell_soft'] * 3
+    st5_even = ['qc_cell_even'] * 5 + ['qc_date'] + ['qc_num_even'] * 4 + ['qc_cell_even'] * 3
+    all_assets = FixedAsset.query.order_by(FixedAsset.acquisition_date, FixedAsset.id)
+    for a in iter_query(all_assets):
+        neto = valores_af.get(a.id, a.net_book_value)   # al corte, según cronograma
+        ws5.append([
             a.asset_code, a.name, a.category,
             a.account_code, a.deprec_account,
             a.acquisition_date, float(a.cost_pen),
             float(a.monthly_depreciation),
-            float(a.accumulated_depreciation or 0),
-            float(a.net_book_value),
+            float(Decimal(str(a.cost_pen)) - neto),
+            float(neto),
             a.months_depreciated or 0, a.useful_life_months, a.status,
-        ]
-        for c, val in enumerate(vals, 1):
-            cell = ws5.cell(row=i, column=c, value=val)
-            if row_fill:
-                cell.fill = row_fill
-            if c in (7, 8, 9, 10):
-                cell.number_format = NUM_FMT
-                cell.alignment = Alignment(horizontal='right')
-            if c == 6 and isinstance(val, date):
-                cell.number_format = 'DD/MM/YYYY'
-
-    ws5.freeze_panes = 'A7'
+        ], styles=st5_even if (ws5.row_num + 1) % 2 == 0 else st5_odd)
 
     # ══════════════════════════════════════════════════════════════════════════
     # HOJA 6 — Cuadre Diario
     # ══════════════════════════════════════════════════════════════════════════
-    ws6 = wb.create_sheet('Cuadre Diario')
+    ws6 = xl.sheet('Cuadre Diario', widths=[12, 14, 14, 14, 14], freeze='A7')
     title_block(ws6, 'CUADRE DIARIO DE ASIENTOS', mes_label)
-
-    cols6 = [('Fecha', 12), ('Nro Asientos', 14), ('Total DEBE', 14), ('Total HABER', 14), ('Diferencia', 14)]
-    header_row(ws6, cols6, row=6)
+    ws6.header(['Fecha', 'Nro Asientos', 'Total DEBE', 'Total HABER', 'Diferencia'],
+               style='qc_header_sm', height=22)
 
     daily = db.session.query(
         JournalEntry.entry_date,
@@ -4050,39 +3669,20 @@ def exportar_excel():
         func.sum(JournalEntry.total_debe).label('debe'),
         func.sum(JournalEntry.total_haber).label('haber'),
     ).filter(
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
+        in_month(JournalEntry.entry_date, year, month),
         JournalEntry.status == 'activo',
     ).group_by(JournalEntry.entry_date).order_by(JournalEntry.entry_date).all()
 
-    for i, row in enumerate(daily, 7):
+    for row in daily:
         debe  = float(row.debe  or 0)
         haber = float(row.haber or 0)
         diff  = debe - haber
-        vals  = [row.entry_date, row.count, debe, haber, diff]
-        for c, val in enumerate(vals, 1):
-            cell = ws6.cell(row=i, column=c, value=val)
-            if c in (3, 4, 5):
-                cell.number_format = NUM_FMT
-                cell.alignment = Alignment(horizontal='right')
-            if c == 1:
-                cell.number_format = 'DD/MM/YYYY'
-            if c == 5 and abs(diff) > 0.01:
-                cell.font = Font(color='FF0000', bold=True)
-
-    ws6.freeze_panes = 'A7'
-
-    # ── Enviar archivo ────────────────────────────────────────────────────────
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    filename = f'QoriCash_Contabilidad_{year}{month:02d}.xlsx'
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    )
+        ws6.append([row.entry_date, row.count, debe, haber, diff], styles=[
+            'qc_date', None, 'qc_num_soft', 'qc_num_soft',
+            'qc_total_bad' if abs(diff) > 0.01 else 'qc_num_soft',
+        ])
+
+    return xl, f'QoriCash_Contabilidad_{year}{month:02d}.xlsx'
 
 
 # ── Amarres y Lotes de Neteo ───────────────────────────────────────────────────
@@ -4444,16 +4044,6 @@ def amarres_export():
     co      = _company_info()
     now_str = date.today().strftime('%d/%m/%Y')
 
-    H_FILL   = PatternFill('solid', fgColor='1B3A6B')
-    H_FONT   = Font(bold=True, color='FFFFFF', size=10)
-    T_FONT   = Font(bold=True, size=11)
-    SUB_FILL = PatternFill('solid', fgColor='E8EDF4')
-    TOT_FONT = Font(bold=True, size=10)
-    NUM_FMT  = '#,##0.00'
-    thin     = Side(style='thin', color='CCCCCC')
-    BRD      = Border(left=thin, right=thin, top=thin, bottom=thin)
-    EVEN     = PatternFill('solid', fgColor='F4F7FB')
-
     TIPO_MAP = {
         'client_to_client': 'C2C',
         'self_match':       'Self-match',
@@ -4461,56 +4051,57 @@ def amarres_export():
     }
 
     def title_block(ws, title):
-        ws['A1'] = co['razon_social'];     ws['A1'].font = T_FONT
-        ws['A2'] = f'RUC: {co["ruc"]}';   ws['A2'].font = Font(size=9, color='555555')
-        ws['A3'] = title;                  ws['A3'].font = Font(bold=True, size=12)
-        ws['A4'] = f'Generado: {now_str}'; ws['A4'].font = Font(italic=True, size=9, color='777777')
-
-    def hrow(ws, row_n, headers_widths):
-        for col, (h, w) in enumerate(headers_widths, 1):
-            c = ws.cell(row=row_n, column=col, value=h)
-            c.fill = H_FILL; c.font = H_FONT; c.border = BRD
-            c.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-            ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = w
-        ws.row_dimensions[row_n].height = 28
-
-    def wnum(ws, r, c, v):
-        cell = ws.cell(row=r, column=c, value=round(float(v or 0), 2))
-        cell.number_format = NUM_FMT; cell.border = BRD
-        return cell
-
-    def wtxt(ws, r, c, v, **kw):
-        cell = ws.cell(row=r, column=c, value=v or '')
-        cell.border = BRD
-        for k, val in kw.items(): setattr(cell, k, val)
-        return cell
-
-    user_map = {u.id: u.username for u in User.query.all()}
-    wb = openpyxl.Workbook()
+        ws.title_block([
+            (co['razon_social'],     'qc_company_l'),
+            (f'RUC: {co["ruc"]}',    'qc_muted'),
+            (title,                  'qc_title_l'),
+            (f'Generado: {now_str}', 'qc_note'),
+        ])
+        ws.blank()
+
+    def row_styles(ws, kinds):
+        """kinds: 't' texto, 'n' número, 's+' / 's-' estado activo / inactivo."""
+        even = (ws.row_num + 1) % 2 == 0
+        out = []
+        for k in kinds:
+            if k == 'n':
+                out.append('qc_num_even' if even else 'qc_num_soft')
+            elif k in ('s+', 's-'):
+                out.append('qc_status_on' if k == 's+' else 'qc_status_off')
+            else:
+                out.append('qc_cell_even' if even else 'qc_cell_soft')
+        return out
+
+    def totals_row(ws, ncols, label_col, values):
+        """Fila TOTALES: etiqueta en label_col y {col: valor} con estilo de subtotal."""
+        vals   = [''] * ncols
+        styles = [None] * ncols
+        vals[label_col - 1]   = 'TOTALES'
+        styles[label_col - 1] = 'qc_bold'
+        for col, v in values.items():
+            vals[col - 1]   = round(float(v or 0), 2)
+            styles[col - 1] = 'qc_subtotal_num'
+        ws.append(vals, styles=styles)
+
+    user_map = dict(db.session.query(User.id, User.username).all())
+    xl = ExcelExport()
 
     # ══════════════════════════════════════════════════════════════════════
     # HOJA 1 — AMARRES
     # ══════════════════════════════════════════════════════════════════════
-    ws1 = wb.active
-    ws1.title = 'Amarres'
+    ws1 = xl.sheet('Amarres', freeze='A7', widths=[
+        5, 11, 11, 14, 24, 18, 14, 24, 18, 13, 10, 10, 10, 10, 15, 18, 18, 16, 9, 9,
+    ])
     title_block(ws1, 'REPORTE DE AMARRES')
-    ws1.freeze_panes = 'A7'
-
-    h1 = [
-        ('ID',              5), ('Tipo',          11), ('Fecha',          11),
-        ('Op. Compra',     14), ('Cliente Compra', 24), ('Trader Compra',  18),
-        ('Op. Venta',      14), ('Cliente Venta',  24), ('Trader Venta',   18),
-        ('USD Amarrado',   13), ('TC Compra',      10), ('TC Venta',       10),
-        ('Base Compra',    10), ('Base Venta',     10),
-        ('Util. Total S/', 15),
-        ('Util. Tdr. Compra S/', 18),
-        ('Util. Tdr. Venta S/',  18),
-        ('Util. QoriCash S/',    16),
-        ('Lote',            9), ('Estado',          9),
-    ]
-    hrow(ws1, 6, h1)
-
-    row = 7
+    ws1.header([
+        'ID', 'Tipo', 'Fecha', 'Op. Compra', 'Cliente Compra', 'Trader Compra',
+        'Op. Venta', 'Cliente Venta', 'Trader Venta', 'USD Amarrado', 'TC Compra',
+        'TC Venta', 'Base Compra', 'Base Venta', 'Util. Total S/',
+        'Util. Tdr. Compra S/', 'Util. Tdr. Venta S/', 'Util. QoriCash S/',
+        'Lote', 'Estado',
+    ], style='qc_header_sm', height=28)
+
+    kinds1 = ['t'] * 9 + ['n'] * 9 + ['t']
     t_usd = t_util = t_ubuy = t_usell = t_uhouse = 0
     for m in matches:
         buy_op  = m.buy_operation
@@ -4523,90 +4114,63 @@ def amarres_export():
         usel = float(m.trader_sell_profit_pen   or 0)
         uhou = float(m.house_profit_pen         or 0)
         t_usd += usd; t_util += util; t_ubuy += ubuy; t_usell += usel; t_uhouse += uhou
-        fill = EVEN if row % 2 == 0 else None
-
-        def wr(col, val, is_num=False, **kw):
-            c = wnum(ws1, row, col, val) if is_num else wtxt(ws1, row, col, val, **kw)
-            if fill: c.fill = fill
-            return c
-
-        wr(1,  m.id)
-        wr(2,  TIPO_MAP.get(m.match_type, m.match_type or 'C2C'))
-        wr(3,  m.created_at.strftime('%d/%m/%Y') if m.created_at else '')
-        wr(4,  buy_op.operation_id            if buy_op  else '—')
-        wr(5,  buy_op.client.full_name        if buy_op  and buy_op.client  else '—')
-        wr(6,  bt)
-        wr(7,  sell_op.operation_id           if sell_op else '—')
-        wr(8,  sell_op.client.full_name       if sell_op and sell_op.client else '—')
-        wr(9,  st)
-        wr(10, usd,  True); wr(11, float(m.buy_exchange_rate),  True)
-        wr(12, float(m.sell_exchange_rate), True)
-        wr(13, float(m.buy_base_rate  or 0), True)
-        wr(14, float(m.sell_base_rate or 0), True)
-        wr(15, util, True); wr(16, ubuy, True); wr(17, usel, True); wr(18, uhou, True)
-        wr(19, f'#{m.batch_id}' if m.batch_id else '—')
-        ec = wr(20, m.status)
-        ec.font = Font(bold=True, color='1D7A3A' if m.status == 'Activo' else '888888')
-        row += 1
+
+        ws1.append([
+            m.id,
+            TIPO_MAP.get(m.match_type, m.match_type or 'C2C'),
+            m.created_at.strftime('%d/%m/%Y') if m.created_at else '',
+            buy_op.operation_id            if buy_op  else '—',
+            buy_op.client.full_name        if buy_op  and buy_op.client  else '—',
+            bt,
+            sell_op.operation_id           if sell_op else '—',
+            sell_op.client.full_name       if sell_op and sell_op.client else '—',
+            st,
+            round(usd, 2),
+            round(float(m.buy_exchange_rate), 2),
+            round(float(m.sell_exchange_rate), 2),
+            round(float(m.buy_base_rate  or 0), 2),
+            round(float(m.sell_base_rate or 0), 2),
+            round(util, 2), round(ubuy, 2), round(usel, 2), round(uhou, 2),
+            f'#{m.batch_id}' if m.batch_id else '—',
+            m.status or '',
+        ], styles=row_styles(ws1, kinds1 + ['s+' if m.status == 'Activo' else 's-']))
 
     # Totales hoja 1
-    ws1.cell(row=row, column=9, value='TOTALES').font = TOT_FONT
-    for col, val in [(10, t_usd), (15, t_util), (16, t_ubuy), (17, t_usell), (18, t_uhouse)]:
-        c = wnum(ws1, row, col, val); c.fill = SUB_FILL; c.font = TOT_FONT
+    totals_row(ws1, 18, 9, {10: t_usd, 15: t_util, 16: t_ubuy, 17: t_usell, 18: t_uhouse})
 
     # ══════════════════════════════════════════════════════════════════════
     # HOJA 2 — LOTES DE NETEO
     # ══════════════════════════════════════════════════════════════════════
-    ws2 = wb.create_sheet('Lotes de Neteo')
+    ws2 = xl.sheet('Lotes de Neteo', widths=[14, 36, 13, 12, 13, 16, 9], freeze='A7')
     title_block(ws2, 'LOTES DE NETEO')
-    ws2.freeze_panes = 'A7'
-
-    h2 = [
-        ('Código',        14), ('Descripción',    36), ('Fecha Neteo',  13),
-        ('N° Amarres',    12), ('USD Total',       13), ('Util. Total S/', 16),
-        ('Estado',         9),
-    ]
-    hrow(ws2, 6, h2)
+    ws2.header(['Código', 'Descripción', 'Fecha Neteo', 'N° Amarres', 'USD Total',
+                'Util. Total S/', 'Estado'], style='qc_header_sm', height=28)
 
-    row2 = 7; bt_usd = bt_util = 0
+    bt_usd = bt_util = 0
     for b in batches:
         usd_b  = float(b.total_buys_usd or 0) + float(b.total_sells_usd or 0)
         util_b = float(b.total_profit_pen or 0)
         bt_usd += usd_b; bt_util += util_b
-        fill = EVEN if row2 % 2 == 0 else None
-
-        def wb2(col, val, is_num=False, **kw):
-            c = wnum(ws2, row2, col, val) if is_num else wtxt(ws2, row2, col, val, **kw)
-            if fill: c.fill = fill
-            return c
-
-        wb2(1, b.batch_code or str(b.id))
-        wb2(2, b.description or '')
-        wb2(3, b.netting_date.strftime('%d/%m/%Y') if b.netting_date else '')
-        wb2(4, b.num_matches or 0)
-        wb2(5, usd_b,  True); wb2(6, util_b, True)
-        ec = wb2(7, b.status)
-        ec.font = Font(bold=True, color='1D7A3A' if b.status == 'Abierto' else '888888')
-        row2 += 1
-
-    ws2.cell(row=row2, column=4, value='TOTALES').font = TOT_FONT
-    for col, val in [(5, bt_usd), (6, bt_util)]:
-        c = wnum(ws2, row2, col, val); c.fill = SUB_FILL; c.font = TOT_FONT
+        ws2.append([
+            b.batch_code or str(b.id),
+            b.description or '',
+            b.netting_date.strftime('%d/%m/%Y') if b.netting_date else '',
+            b.num_matches or 0,
+            round(usd_b, 2), round(util_b, 2),
+            b.status or '',
+        ], styles=row_styles(ws2, ['t', 't', 't', 't', 'n', 'n',
+                                   's+' if b.status == 'Abierto' else 's-']))
+
+    totals_row(ws2, 6, 4, {5: bt_usd, 6: bt_util})
 
     # ══════════════════════════════════════════════════════════════════════
     # HOJA 3 — RESUMEN POR TRADER
     # ══════════════════════════════════════════════════════════════════════
-    ws3 = wb.create_sheet('Resumen por Trader')
+    ws3 = xl.sheet('Resumen por Trader', widths=[20, 14, 14, 13, 13, 20, 20, 20], freeze='A7')
     title_block(ws3, 'UTILIDAD POR TRADER')
-    ws3.freeze_panes = 'A7'
-
-    h3 = [
-        ('Trader',           20), ('Amarres Compra', 14), ('Amarres Venta',  14),
-        ('Total Amarres',    13), ('USD Operado',    13),
-        ('Util. Comprador S/', 20), ('Util. Vendedor S/', 20),
-        ('Util. Total Trader S/', 20),
-    ]
-    hrow(ws3, 6, h3)
+    ws3.header(['Trader', 'Amarres Compra', 'Amarres Venta', 'Total Amarres', 'USD Operado',
+                'Util. Comprador S/', 'Util. Vendedor S/', 'Util. Total Trader S/'],
+               style='qc_header_sm', height=28)
 
     stats = defaultdict(lambda: {
         'bc': 0, 'sc': 0, 'usd': 0.0, 'ubuy': 0.0, 'usell': 0.0
@@ -4630,43 +4194,23 @@ def amarres_export():
                 stats[t]['usd'] += usd
             stats[t]['usell'] += float(m.trader_sell_profit_pen or 0)
 
-    row3 = 7; gt_usd = gt_ubuy = gt_usell = 0
+    gt_usd = gt_ubuy = gt_usell = 0
     for tname in sorted(stats):
         s = stats[tname]
         total = s['ubuy'] + s['usell']
-        fill  = EVEN if row3 % 2 == 0 else None
-
-        def wt3(col, val, is_num=False, bold=False):
-            c = wnum(ws3, row3, col, val) if is_num else wtxt(ws3, row3, col, val)
-            if fill:  c.fill = fill
-            if bold:  c.font = Font(bold=True)
-            return c
-
-        wt3(1, tname); wt3(2, s['bc']); wt3(3, s['sc'])
-        wt3(4, s['bc'] + s['sc'])
-        wt3(5, s['usd'],   True)
-        wt3(6, s['ubuy'],  True)
-        wt3(7, s['usell'], True)
-        wt3(8, total,      True, bold=True)
+        styles = row_styles(ws3, ['t', 't', 't', 't', 'n', 'n', 'n', 'n'])
+        styles[7] = 'qc_bold_num'
+        ws3.append([
+            tname, s['bc'], s['sc'], s['bc'] + s['sc'],
+            round(s['usd'], 2), round(s['ubuy'], 2), round(s['usell'], 2), round(total, 2),
+        ], styles=styles)
         gt_usd += s['usd']; gt_ubuy += s['ubuy']; gt_usell += s['usell']
-        row3 += 1
 
-    ws3.cell(row=row3, column=4, value='TOTALES').font = TOT_FONT
-    for col, val in [(5, gt_usd), (6, gt_ubuy), (7, gt_usell), (8, gt_ubuy + gt_usell)]:
-        c = wnum(ws3, row3, col, val); c.fill = SUB_FILL; c.font = TOT_FONT
+    totals_row(ws3, 8, 4, {5: gt_usd, 6: gt_ubuy, 7: gt_usell, 8: gt_ubuy + gt_usell})
 
     # ── Generar archivo ────────────────────────────────────────────────────
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
     suffix   = f'{(fecha_inicio or "todo").replace("-", "")}_{(fecha_fin or "hoy").replace("-", "")}'
-    filename = f'amarres_qoricash_{suffix}.xlsx'
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=filename,
-    )
+    return xl.to_response(f'amarres_qoricash_{suffix}.xlsx')
 
 
 @contabilidad_bp.route('/api/unmatched_count')
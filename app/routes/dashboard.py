@@ -1626,3 +1626,36 @@ def api_toggle_precio_base_trader():
         db.session.rollback()
         return jsonify({'ok': False, 'error': str(exc)}), 500
     return jsonify({'ok': True, 'user_id': trader.id, 'ver_precio_base': bool(enabled)})
+
+
+@dashboard_bp.route('/api/system/schedulers', methods=['GET'])
+@login_required
+@require_role('Master')
+def api_scheduler_status():
+    """
+    API: Qué worker corre cada job en segundo plano (scheduler_leases).
+    alive=False indica un lease vencido: el job queda sin dueño hasta que
+    otro worker lo tome en su próxima renovación.
+    """
+    from app.services import scheduler_coordinator as coordinator
+    try:
+        with db.engine.connect() as conn:
+            rows = coordinator.leases(conn)
+    except Exception as exc:
+        return jsonify({'ok': False, 'error': str(exc)}), 500
+    me = coordinator.holder()
+    return jsonify({
+        'ok': True,
+        'worker': me,
+        'running_here': coordinator.held_jobs(),
+        'lease_seconds': coordinator.LEASE_SECONDS,
+        'jobs': [{
+            'job': r['job'],
+            'holder': r['holder'],
+            'alive': bool(r['alive']),
+            'this_worker': r['holder'] == me,
+            'acquired_at': r['acquired_at'].isoformat() if r['acquired_at'] else None,
+            'renewed_at': r['renewed_at'].isoformat() if r['renewed_at'] else None,
+            'expires_at': r['expires_at'].isoformat() if r['expires_at'] else None,
+        } for r in rows],
+    })
@@ -0,0 +1,68 @@
+"""
+Exportaciones en segundo plano — API de jobs (ExportJobService)
+"""
+import os
+
+from flask import Blueprint, jsonify, request
+from flask_login import login_required, current_user
+
+from app.models.export_job import STATUS_LISTO
+from app.services.export_jobs import ExportJobService
+
+exports_bp = Blueprint('exports', __name__, url_prefix='/exports')
+
+
+@exports_bp.route('/api/jobs', methods=['POST'])
+@login_required
+def create_job():
+    """
+    Encola un export. Body: {kind, params}.
+    202 con el job nuevo; 200 si se reutilizó uno idéntico (en curso o listo).
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        job, created = ExportJobService.enqueue(data.get('kind'), data.get('params') or {}, current_user)
+    except PermissionError as e:
+        return jsonify({'success': False, 'message': str(e)}), 403
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'created': created, 'job': job.to_dict()}), 202 if created else 200
+
+
+@exports_bp.route('/api/jobs')
+@login_required
+def list_jobs():
+    """Jobs recientes del usuario (últimas 24h)."""
+    limit = min(request.args.get('limit', 20, type=int), 50)
+    return jsonify({'success': True, 'jobs': [j.to_dict() for j in ExportJobService.list_for_user(current_user, limit)]})
+
+
+@exports_bp.route('/api/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    job = ExportJobService.get_for_user(job_id, current_user)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Exportación no encontrada'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+
+@exports_bp.route('/api/jobs/<job_id>/download')
+@login_required
+def download(job_id):
+    """Envía el artefacto mientras esté vigente (EXPORT_TTL_MINUTES)."""
+    from flask import send_file
+    from app.services.excel_export import XLSX_MIMETYPE
+
+    job = ExportJobService.get_for_user(job_id, current_user)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Exportación no encontrada'}), 404
+    if job.status != STATUS_LISTO or not job.file_path or not os.path.exists(job.file_path):
+        return jsonify({'success': False, 'message': 'El archivo no está disponible', 'job': job.to_dict()}), 410
+
+    return send_file(
+        job.file_path,
+        mimetype=XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=job.filename,
+        conditional=True,
+    )
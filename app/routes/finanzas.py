@@ -22,7 +22,7 @@ APIs (todas consumen FinanceEngine — fuente única de verdad):
   GET  /finanzas/api/cierre/historial — historial de cierres
 """
 import logging
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 
 from flask import Blueprint, render_template, jsonify, request, abort
 from flask_login import login_required, current_user
@@ -291,57 +291,20 @@ def api_ledger_backfill():
 def api_cierre_calcular():
     _require_role()
     try:
-        from app.models import DailyClosure, Operation, AccountingMatch, AccountingBatch
+        from app.services.closure_accumulator import ClosureAccumulator
 
         data      = request.get_json() or {}
         fecha_str = data.get('fecha', date.today().isoformat())
         fecha     = date.fromisoformat(fecha_str)
-        start     = datetime.combine(fecha, datetime.min.time())
-        end       = start + timedelta(days=1)
-
-        # Datos del día usando FinanceEngine
-        ops_day    = FinanceEngine.get_daily_ops(fecha)
-        profit_day = FinanceEngine.get_profit(fecha, fecha)
-        position   = FinanceEngine.get_open_position()
-        balances   = FinanceEngine.get_balances()
-
-        pending_count = Operation.query.filter(
-            Operation.status.in_(['Pendiente', 'En proceso'])
-        ).count()
-
-        open_matches = AccountingMatch.query.filter(
-            AccountingMatch.status == 'Activo',
-        ).outerjoin(
-            AccountingBatch, AccountingMatch.batch_id == AccountingBatch.id, isouter=True
-        ).filter(
-            db.or_(AccountingMatch.batch_id.is_(None), AccountingBatch.status != 'Cerrado')
-        ).count()
-
-        # Obtener o crear cierre
-        closure = DailyClosure.query.filter_by(closure_date=fecha).first()
-        if not closure:
-            closure = DailyClosure(
-                closure_date=fecha,
-                status=DailyClosure.STATUS_BORRADOR,
-                created_by=current_user.id,
-            )
-            db.session.add(closure)
+        recompute = bool(data.get('recalcular', False))
 
-        closure.system_balances         = balances['by_bank']
-        closure.operations_completed    = ops_day['total_ops']
-        closure.total_volume_usd        = ops_day['volume_usd']
-        closure.total_bought_usd        = ops_day['buy_usd']
-        closure.total_sold_usd          = ops_day['sell_usd']
-        closure.avg_buy_rate            = ops_day['avg_buy_rate']
-        closure.avg_sell_rate           = ops_day['avg_sell_rate']
-        closure.gross_spread_pen        = profit_day['total_pen']
-        closure.net_profit_pen          = profit_day['total_pen']
-        closure.pending_operations      = pending_count
-        closure.unmatched_completed_usd = abs(position['neto_usd'])
-        closure.open_matches            = open_matches
+        # Borrador precalculado — recálculo completo solo si se pide o no está sembrado
+        closure, recomputed = ClosureAccumulator.calcular(
+            fecha, user_id=current_user.id, recompute=recompute,
+        )
         db.session.commit()
 
-        return jsonify({'ok': True, 'cierre': closure.to_dict()})
+        return jsonify({'ok': True, 'recalculado': recomputed, 'cierre': closure.to_dict()})
 
     except Exception as exc:
         db.session.rollback()
@@ -415,6 +378,13 @@ def api_cierre_confirmar():
         closure.validated_at       = now_peru()
 
         BankMovement.query.filter_by(closure_date=fecha).update({'is_validated': True})
+
+        try:
+            from app.services.balance_timeline import BalanceTimeline
+            BalanceTimeline.take_checkpoint(fecha)
+        except Exception as cp_err:
+            _log.warning(f'[Finanzas] Checkpoint de saldos no registrado: {cp_err}')
+
         db.session.commit()
 
         return jsonify({
@@ -1381,6 +1351,8 @@ def api_admin_fix_journal_line():
         line.account_code = to_account
 
     try:
+        from app.services.accounting.account_totals import AccountTotalsService
+        AccountTotalsService.invalidate_dates([entry.entry_date])
         db.session.commit()
     except Exception as e:
         db.session.rollback()
@@ -1,19 +1,15 @@
 """
 Rutas de Operaciones para QoriCash Trading V2
 """
-from flask import Blueprint, render_template, request, jsonify, send_file
+from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
 from app.services.operation_service import OperationService
 from app.services.invoice_service import InvoiceService
 from app.services.file_service import FileService
 from app.services.notification_service import NotificationService
-from app.services.compliance_service import ComplianceService
 from app.utils.decorators import require_role
 from app.extensions import csrf
 from app.utils.formatters import now_peru
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
-from io import BytesIO
 from datetime import datetime
 import logging
 
@@ -132,6 +128,11 @@ def create_page():
                          user=current_user)
 
 
+_HISTORY_PAGE_SIZE = 25
+_HISTORY_MAX_PAGE_SIZE = 100
+_HISTORY_STATUSES = ('Pendiente', 'En proceso', 'Completada', 'Cancelado', 'Expirada')
+
+
 @operations_bp.route('/history')
 @login_required
 def history():
@@ -141,27 +142,98 @@ def history():
     Muestra todas las operaciones de todos los estados y fechas
     Disponible para todos los roles (Master, Trader, Operador, App, Web)
 
+    La tabla se llena por páginas desde /operations/api/history (keyset +
+    filtros en el servidor); la página solo carga los filtros.
+
     Filtrado:
     - Trader/App/Web: Solo ve operaciones de sus clientes
     - Otros roles: Ven todas las operaciones
     """
-    from app.models.operation import Operation
-    from app.models.client import Client
-
-    # Filtrar operaciones según el rol
-    if current_user.role in ['Trader', 'App', 'Web']:
-        # Trader/App/Web solo ven operaciones de sus clientes
-        operations = Operation.query.join(Client).filter(
-            Client.created_by == current_user.id
-        ).order_by(Operation.created_at.desc()).all()
-    else:
-        # Otros roles ven todas las operaciones (excepto demo)
+    traders = []
+    if current_user.role not in ['Trader', 'App', 'Web']:
         from app.models.user import User
-        operations = OperationService.get_all_operations(include_relations=False, exclude_user_id=User.get_demo_user_id())
+        traders = User.query.filter(
+            User.role.in_(['Master', 'Trader', 'Presidente de Negocios'])
+        ).order_by(User.username).all()
 
     return render_template('operations/history.html',
                          user=current_user,
-                         operations=operations)
+                         traders=traders)
+
+
+def _history_page(args):
+    """
+    Una página del historial, por keyset sobre (created_at, id) descendente.
+
+    ?after= lleva el cursor de la última fila vista (página más antigua),
+    ?before= el de la primera (página más reciente). Filtros: status,
+    client_id, trader_id, date_from, date_to (YYYY-MM-DD), q; limit ≤ 100.
+    """
+    from datetime import date
+    from app.models.operation import Operation
+    from app.utils.keyset import decode_cursor, encode_cursor, seek, page_window, estimate_count
+
+    def _date(name):
+        try:
+            return date.fromisoformat(args.get(name) or '')
+        except ValueError:
+            return None
+
+    status = args.get('status') or None
+    filters = {
+        'status':    status if status in _HISTORY_STATUSES else None,
+        'client_id': args.get('client_id', type=int),
+        'trader_id': args.get('trader_id', type=int),
+        'date_from': _date('date_from'),
+        'date_to':   _date('date_to'),
+        'q':         (args.get('q') or '').strip(),
+    }
+    limit = min(max(args.get('limit', type=int) or _HISTORY_PAGE_SIZE, 1), _HISTORY_MAX_PAGE_SIZE)
+
+    query = OperationService.history_query(current_user, filters)
+    total, total_exacto = estimate_count(query)
+
+    keyset = (Operation.created_at, Operation.id)
+    after  = decode_cursor(args.get('after'),  (datetime, int))
+    before = decode_cursor(args.get('before'), (datetime, int)) if after is None else None
+    backwards = before is not None
+
+    # Orden natural descendente: "after" busca hacia atrás en (created_at, id)
+    if backwards:
+        page_q = query.filter(seek(keyset, before)).order_by(
+            Operation.created_at.asc(), Operation.id.asc())
+    else:
+        if after is not None:
+            query = query.filter(seek(keyset, after, backwards=True))
+        page_q = query.order_by(Operation.created_at.desc(), Operation.id.desc())
+    rows, more = page_window(page_q.limit(limit + 1).all(), limit, backwards)
+
+    has_next = more if not backwards else True
+    has_prev = more if backwards else after is not None
+    with_user = current_user.role in ['Master', 'Presidente de Negocios', 'Operador']
+
+    return {
+        'success': True,
+        'operations': [OperationService.history_row(r, with_user) for r in rows],
+        'next_cursor': encode_cursor((rows[-1].created_at, rows[-1].id)) if rows and has_next else None,
+        'prev_cursor': encode_cursor((rows[0].created_at, rows[0].id)) if rows and has_prev else None,
+        'total': total,
+        'total_exacto': total_exacto,
+        'limit': limit,
+    }
+
+
+@operations_bp.route('/api/history')
+@login_required
+def api_history():
+    """
+    API: Historial de operaciones paginado (ver _history_page)
+
+    Filtrado por rol:
+        - Trader/App/Web: Solo operaciones de sus clientes
+        - Otros roles: Todas las operaciones (excepto demo)
+    """
+    return jsonify(_history_page(request.args))
 
 
 def get_bank_account_info(operation, account_number):
@@ -188,6 +260,53 @@ def get_bank_account_info(operation, account_number):
     return account_number
 
 
+_OPS_XL_HEADERS = ['ID OP.', 'DOCUMENTO', 'CLIENTE', 'USD', 'T.C.', 'BASE', 'PIPS', 'PEN',
+                   'CUENTA CARGO', 'CUENTA DESTINO', 'CANAL', 'ESTADO', 'FECHA']
+# CUENTA CARGO / DESTINO más anchas para banco + número
+_OPS_XL_WIDTHS  = [12, 15, 30, 12, 10, 10, 10, 12, 35, 35, 12, 15, 18]
+_OPS_XL_STYLES  = ['qc_cell_soft'] * 3 + ['qc_num_soft'] * 5 + ['qc_cell_soft'] * 5
+
+
+def _operations_xl_with_user(role: str) -> bool:
+    """Master y Operador incluyen columna de Usuario (email); Trader no."""
+    return role in ['Master', 'Presidente de Negocios', 'Operador']
+
+
+def _operations_workbook(operations, sheet_title: str, with_user: bool):
+    """Arma el Excel de operaciones (motor write-only, ver app/services/excel_export)."""
+    from app.services.excel_export import ExcelExport
+
+    headers = _OPS_XL_HEADERS + (['USUARIO'] if with_user else [])
+    widths  = _OPS_XL_WIDTHS  + ([30] if with_user else [])
+    styles  = _OPS_XL_STYLES  + (['qc_cell_soft'] if with_user else [])
+
+    xl = ExcelExport()
+    ws = xl.sheet(sheet_title, widths=widths, freeze='A2')
+    ws.header(headers)
+
+    for op in operations:
+        row = [
+            op.operation_id,
+            op.client.dni if op.client else '-',
+            op.client.full_name if op.client else '-',
+            float(op.amount_usd),
+            float(op.exchange_rate),
+            float(op.base_rate) if op.base_rate else None,
+            float(op.pips) if op.pips else None,
+            float(op.amount_pen),
+            get_bank_account_info(op, op.source_account),
+            get_bank_account_info(op, op.destination_account),
+            'Web' if op.origen == 'plataforma' else 'Sistema',
+            op.status,
+            op.created_at.strftime('%d/%m/%Y %H:%M') if op.created_at else '-',
+        ]
+        if with_user:
+            row.append(op.user.email if op.user else '-')
+        ws.append(row, styles=styles)
+
+    return xl
+
+
 @operations_bp.route('/api/export_today')
 @login_required
 def export_today():
@@ -201,80 +320,9 @@ def export_today():
     from app.models.user import User
     operations = OperationService.get_today_operations(exclude_user_id=User.get_demo_user_id())
 
-    # Crear libro de Excel
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Operaciones del Día"
-
-    # Estilos
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(color="FFFFFF", bold=True)
-    header_alignment = Alignment(horizontal="center", vertical="center")
-
-    # Definir encabezados según el rol
-    if current_user.role in ['Master', 'Presidente de Negocios', 'Operador']:
-        headers = ['ID OP.', 'DOCUMENTO', 'CLIENTE', 'USD', 'T.C.', 'BASE', 'PIPS', 'PEN', 'CUENTA CARGO', 'CUENTA DESTINO', 'CANAL', 'ESTADO', 'FECHA', 'USUARIO']
-    else:
-        headers = ['ID OP.', 'DOCUMENTO', 'CLIENTE', 'USD', 'T.C.', 'BASE', 'PIPS', 'PEN', 'CUENTA CARGO', 'CUENTA DESTINO', 'CANAL', 'ESTADO', 'FECHA']
-
-    # Escribir encabezados
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_alignment
-
-    # Escribir datos
-    for row_num, op in enumerate(operations, 2):
-        ws.cell(row=row_num, column=1, value=op.operation_id)
-        ws.cell(row=row_num, column=2, value=op.client.dni if op.client else '-')
-        ws.cell(row=row_num, column=3, value=op.client.full_name if op.client else '-')
-        ws.cell(row=row_num, column=4, value=float(op.amount_usd))
-        ws.cell(row=row_num, column=5, value=float(op.exchange_rate))
-        ws.cell(row=row_num, column=6, value=float(op.base_rate) if op.base_rate else None)
-        ws.cell(row=row_num, column=7, value=float(op.pips) if op.pips else None)
-        ws.cell(row=row_num, column=8, value=float(op.amount_pen))
-        ws.cell(row=row_num, column=9, value=get_bank_account_info(op, op.source_account))
-        ws.cell(row=row_num, column=10, value=get_bank_account_info(op, op.destination_account))
-        ws.cell(row=row_num, column=11, value='Web' if op.origen == 'plataforma' else 'Sistema')
-        ws.cell(row=row_num, column=12, value=op.status)
-        ws.cell(row=row_num, column=13, value=op.created_at.strftime('%d/%m/%Y %H:%M') if op.created_at else '-')
-
-        # Solo agregar columna de usuario para Master y Operador
-        if current_user.role in ['Master', 'Presidente de Negocios', 'Operador']:
-            ws.cell(row=row_num, column=14, value=op.user.email if op.user else '-')
-
-    # Ajustar ancho de columnas
-    ws.column_dimensions['A'].width = 12
-    ws.column_dimensions['B'].width = 15
-    ws.column_dimensions['C'].width = 30
-    ws.column_dimensions['D'].width = 12
-    ws.column_dimensions['E'].width = 10
-    ws.column_dimensions['F'].width = 10  # BASE
-    ws.column_dimensions['G'].width = 10  # PIPS
-    ws.column_dimensions['H'].width = 12
-    ws.column_dimensions['I'].width = 35  # CUENTA CARGO (más ancho para banco + número)
-    ws.column_dimensions['J'].width = 35  # CUENTA DESTINO (más ancho para banco + número)
-    ws.column_dimensions['K'].width = 12  # CANAL
-    ws.column_dimensions['L'].width = 15  # ESTADO
-    ws.column_dimensions['M'].width = 18  # FECHA
-    if current_user.role in ['Master', 'Presidente de Negocios', 'Operador']:
-        ws.column_dimensions['N'].width = 30  # USUARIO
-
-    # Guardar en memoria
-    excel_file = BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
-
-    # Nombre del archivo con fecha actual
-    filename = f"operaciones_del_dia_{now_peru().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-    return send_file(
-        excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=filename
-    )
+    xl = _operations_workbook(operations, 'Operaciones del Día',
+                              _operations_xl_with_user(current_user.role))
+    return xl.to_response(f"operaciones_del_dia_{now_peru().strftime('%Y%m%d_%H%M%S')}.xlsx")
 
 
 @operations_bp.route('/api/export_history')
@@ -290,17 +338,26 @@ def export_history():
     Las columnas varían según el rol:
     - Master y Operador: Incluyen columna de Usuario (email)
     - Trader: No incluye columna de Usuario
+
+    Para rangos grandes preferir el job en segundo plano
+    (POST /exports/api/jobs, kind='operations_history').
     """
-    from app.models.operation import Operation
-    from datetime import datetime
-    from app.utils.formatters import now_peru
+    xl, filename = build_operations_history(
+        request.args.get('start_date'),
+        request.args.get('end_date'),
+        _operations_xl_with_user(current_user.role),
+    )
+    return xl.to_response(filename)
 
-    # Obtener parámetros de filtro de fechas
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
 
-    # Construir query base (excluir operaciones del usuario demo)
+def build_operations_history(start_date: str = None, end_date: str = None, with_user: bool = False):
+    """Historial de operaciones (excluye usuario demo). Retorna (ExcelExport, filename)."""
+    from app.models.operation import Operation
     from app.models.user import User
+    from app.services.excel_export import iter_query
+    from sqlalchemy.orm import selectinload
+
+    # Construir query base (excluir operaciones del usuario demo)
     demo_id = User.get_demo_user_id()
     query = Operation.query.filter(Operation.user_id != demo_id) if demo_id else Operation.query
 
@@ -321,83 +378,32 @@ def export_history():
         except ValueError:
             pass
 
-    # Ordenar por fecha descendente
-    operations = query.order_by(Operation.created_at.desc()).all()
+    # Ordenar por fecha descendente; se recorre en bloques con cursor del servidor
+    operations = iter_query(query.options(
+        selectinload(Operation.client), selectinload(Operation.user),
+    ).order_by(Operation.created_at.desc(), Operation.id.desc()))
 
-    # Crear libro de Excel
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Historial de Operaciones"
+    xl = _operations_workbook(operations, 'Historial de Operaciones', with_user)
+    return xl, f"historial_operaciones_{now_peru().strftime('%Y%m%d_%H%M%S')}.xlsx"
 
-    # Estilos
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(color="FFFFFF", bold=True)
-    header_alignment = Alignment(horizontal="center", vertical="center")
 
-    # Definir encabezados según el rol
-    if current_user.role in ['Master', 'Presidente de Negocios', 'Operador']:
-        headers = ['ID OP.', 'DOCUMENTO', 'CLIENTE', 'USD', 'T.C.', 'BASE', 'PIPS', 'PEN', 'CUENTA CARGO', 'CUENTA DESTINO', 'CANAL', 'ESTADO', 'FECHA', 'USUARIO']
-    else:
-        headers = ['ID OP.', 'DOCUMENTO', 'CLIENTE', 'USD', 'T.C.', 'BASE', 'PIPS', 'PEN', 'CUENTA CARGO', 'CUENTA DESTINO', 'CANAL', 'ESTADO', 'FECHA']
-
-    # Escribir encabezados
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_alignment
-
-    # Escribir datos
-    for row_num, op in enumerate(operations, 2):
-        ws.cell(row=row_num, column=1, value=op.operation_id)
-        ws.cell(row=row_num, column=2, value=op.client.dni if op.client else '-')
-        ws.cell(row=row_num, column=3, value=op.client.full_name if op.client else '-')
-        ws.cell(row=row_num, column=4, value=float(op.amount_usd))
-        ws.cell(row=row_num, column=5, value=float(op.exchange_rate))
-        ws.cell(row=row_num, column=6, value=float(op.base_rate) if op.base_rate else None)
-        ws.cell(row=row_num, column=7, value=float(op.pips) if op.pips else None)
-        ws.cell(row=row_num, column=8, value=float(op.amount_pen))
-        ws.cell(row=row_num, column=9, value=get_bank_account_info(op, op.source_account))
-        ws.cell(row=row_num, column=10, value=get_bank_account_info(op, op.destination_account))
-        ws.cell(row=row_num, column=11, value='Web' if op.origen == 'plataforma' else 'Sistema')
-        ws.cell(row=row_num, column=12, value=op.status)
-        ws.cell(row=row_num, column=13, value=op.created_at.strftime('%d/%m/%Y %H:%M') if op.created_at else '-')
-
-        # Solo agregar columna de usuario para Master y Operador
-        if current_user.role in ['Master', 'Presidente de Negocios', 'Operador']:
-            ws.cell(row=row_num, column=14, value=op.user.email if op.user else '-')
-
-    # Ajustar ancho de columnas
-    ws.column_dimensions['A'].width = 12
-    ws.column_dimensions['B'].width = 15
-    ws.column_dimensions['C'].width = 30
-    ws.column_dimensions['D'].width = 12
-    ws.column_dimensions['E'].width = 10
-    ws.column_dimensions['F'].width = 10  # BASE
-    ws.column_dimensions['G'].width = 10  # PIPS
-    ws.column_dimensions['H'].width = 12
-    ws.column_dimensions['I'].width = 35  # CUENTA CARGO (más ancho para banco + número)
-    ws.column_dimensions['J'].width = 35  # CUENTA DESTINO (más ancho para banco + número)
-    ws.column_dimensions['K'].width = 12  # CANAL
-    ws.column_dimensions['L'].width = 15  # ESTADO
-    ws.column_dimensions['M'].width = 18  # FECHA
-    if current_user.role in ['Master', 'Presidente de Negocios', 'Operador']:
-        ws.column_dimensions['N'].width = 30  # USUARIO
-
-    # Guardar en memoria
-    excel_file = BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
-
-    # Nombre del archivo con fecha actual
-    filename = f"historial_operaciones_{now_peru().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-    return send_file(
-        excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=filename
-    )
+def _operations_response(operations):
+    """
+    Lista de operaciones: to_dict(include_relations=True) de siempre, o el
+    formato compacto v1 si el request pidió ?fields= / ?format=columnar
+    (ver app/utils/compact.py).
+    """
+    from app.models.operation import Operation
+    from app.utils.compact import compact_payload
+
+    compact = compact_payload(operations, request.args,
+                              Operation.COMPACT_FIELDS, Operation.COMPACT_DEFAULT)
+    if compact is not None:
+        return jsonify({'success': True, **compact})
+    return jsonify({
+        'success': True,
+        'operations': [op.to_dict(include_relations=True) for op in operations]
+    })
 
 
 @operations_bp.route('/api/list')
@@ -407,16 +413,17 @@ def api_list():
     API: Listar operaciones del día actual
 
     Query params:
-        status: Filtrar por estado (opcional)
-        client_id: Filtrar por cliente (opcional)
-        all: Si es 'true', devuelve todas las operaciones (para historial)
+        all: Si es 'true', devuelve UNA página del historial, igual que
+             /api/history: 25 filas por defecto (limit ≤ 100), cursores
+             after/before y filtros status, client_id, trader_id,
+             date_from, date_to, q. Antes devolvía el historial completo;
+             los clientes deben seguir next_cursor para recorrerlo.
+        fields / format: formato compacto opt-in (ver _operations_response)
 
     Filtrado por rol:
         - Trader/App/Web: Solo operaciones de sus clientes
         - Master/Operador/Middle Office: Todas las operaciones
     """
-    status = request.args.get('status')
-    client_id = request.args.get('client_id', type=int)
     show_all = request.args.get('all', 'false').lower() == 'true'
 
     from app.models.operation import Operation
@@ -428,18 +435,8 @@ def api_list():
     demo_id = User.get_demo_user_id()
 
     if show_all:
-        # Para el historial, mostrar todas las operaciones
-        if status:
-            operations = OperationService.get_operations_by_status(status, exclude_user_id=demo_id)
-        elif client_id:
-            operations = OperationService.get_operations_by_client(client_id)
-        else:
-            operations = OperationService.get_all_operations(include_relations=True, exclude_user_id=demo_id)
-            # Filtrar según rol - por clientes del trader/app/web
-            if current_user.role in ['Trader', 'App', 'Web']:
-                trader_client_ids = [c.id for c in Client.query.filter_by(created_by=current_user.id).all()]
-                operations = [op for op in operations if op.get('client_id') in trader_client_ids]
-            return jsonify({'success': True, 'operations': operations})
+        # Historial: paginado y filtrado en el servidor (mismos parámetros que /api/history)
+        return jsonify(_history_page(request.args))
     else:
         # Por defecto, solo operaciones del día actual
         if current_user.role in ['Trader', 'App', 'Web']:
@@ -468,11 +465,7 @@ def api_list():
             # Otros roles (Master, Operador, Middle Office) ven todas las operaciones del día
             operations = OperationService.get_today_operations(exclude_user_id=demo_id)
 
-        # get_today_operations devuelve objetos, necesitamos convertir a dict
-        return jsonify({
-            'success': True,
-            'operations': [op.to_dict(include_relations=True) for op in operations]
-        })
+        return _operations_response(operations)
 
 
 @operations_bp.route('/api/create', methods=['POST'])
@@ -597,21 +590,9 @@ def update_status(operation_id):
     )
     
     if success:
-        # Notificar según el nuevo estado
+        # Notificar según el nuevo estado (al completar, la notificación de
+        # completada y el perfil de riesgo van por el outbox)
         NotificationService.notify_operation_updated(operation, old_status)
-
-        if new_status == 'Completada':
-            NotificationService.notify_operation_completed(operation)
-            # Recalcular perfil de riesgo automáticamente al completar la operación
-            try:
-                ComplianceService.update_client_risk_profile(
-                    operation.client_id,
-                    user_id=None,
-                    auto_commit=True
-                )
-            except Exception as e:
-                logger.warning(f'[Risk] No se pudo recalcular perfil cliente {operation.client_id}: {e}')
-
         NotificationService.notify_dashboard_update()
         NotificationService.notify_position_update()
         
@@ -813,10 +794,7 @@ def get_today_operations():
     """
     from app.models.user import User
     operations = OperationService.get_today_operations(exclude_user_id=User.get_demo_user_id())
-    return jsonify({
-        'success': True,
-        'operations': [op.to_dict(include_relations=True) for op in operations]
-    })
+    return _operations_response(operations)
 
 
 @operations_bp.route('/api/for_operator')
@@ -828,10 +806,7 @@ def get_for_operator():
     """
     from app.models.user import User
     operations = OperationService.get_operations_for_operator(exclude_user_id=User.get_demo_user_id())
-    return jsonify({
-        'success': True,
-        'operations': [op.to_dict(include_relations=True) for op in operations]
-    })
+    return _operations_response(operations)
 
 
 # === NUEVOS ENDPOINTS ===
@@ -1066,19 +1041,23 @@ def send_to_process(operation_id):
                    (f' y asignada al operador ID {assigned_operator_id}' if assigned_operator_id else '')
         )
 
+        # Notificar al operador asignado (notificación persistente + web push) vía outbox
+        if assigned_operator_id:
+            from app.services.operation_effects import enqueue_effects, ASSIGN_EFFECTS
+            enqueue_effects(operation, ASSIGN_EFFECTS,
+                            f"En proceso@{operation.in_process_since:%Y%m%d%H%M%S%f}",
+                            actor_id=current_user.id, operator_id=assigned_operator_id)
+
         db.session.commit()
 
+        if assigned_operator_id:
+            from app.services.outbox import wake
+            wake()
+
         # Notificar actualización general
         NotificationService.notify_operation_updated(operation, 'Pendiente')
         NotificationService.notify_dashboard_update()
 
-        # Notificar al operador asignado
-        if assigned_operator_id:
-            from app.models.user import User
-            assigned_operator = db.session.get(User, assigned_operator_id)
-            if assigned_operator:
-                NotificationService.notify_operation_assigned(operation, assigned_operator)
-
         return jsonify({
             'success': True,
             'message': 'Operación enviada a proceso correctamente',
@@ -1171,7 +1150,8 @@ def complete_operation(operation_id):
         operator_proofs: array (optional) - Comprobantes del operador
         operator_comments: string (optional) - Comentarios
 
-    Cambia estado a 'Completada'
+    Cambia estado a 'Completada'. Asiento, saldos, factura, email, WhatsApp y
+    notificaciones se encolan en el outbox (app/services/operation_effects.py).
     """
     from app.extensions import db
     from app.models.operation import Operation
@@ -1242,162 +1222,26 @@ def complete_operation(operation_id):
             details=f'Operación {operation_code} completada'
         )
 
-        db.session.commit()
-
-        # CONTABILIDAD: Asiento automático al completar — completamente aislado
-        try:
-            from app.services.accounting.journal_service import JournalService
-            JournalService.create_entry_for_completed_operation(
-                operation,
-                created_by_id=current_user.id,
-            )
-        except Exception as e:
-            logger.error(
-                f'[Accounting] Error al registrar asiento contable '
-                f'para {operation_code}: {str(e)}'
-            )
-            try:
-                db.session.rollback()
-            except Exception:
-                pass
-
-        # SALDOS BANCARIOS: Actualizar balance automáticamente al completar
-        try:
-            from app.models.bank_balance import BankBalance
-            BankBalance.apply_operation(operation)
-        except Exception as e:
-            logger.error(f'[BankBalance] Error en auto-update para {operation_code}: {str(e)}')
-        finally:
-            # Limpiar sesión siempre antes de continuar con factura y email
-            try:
-                db.session.rollback()
-            except Exception:
-                pass
+        # Cierre diario: acumular la operación en el borrador del día
+        from app.services.closure_accumulator import ClosureAccumulator
+        ClosureAccumulator.apply_operation(operation)
 
-        # Validación post-completado: detectar si apply_operation falló silenciosamente
-        try:
-            from app.models.bank_movement import BankMovement as _BM
-            _mv_count = _BM.query.filter_by(
-                source_type='operation', operation_id=operation_db_id
-            ).count()
-            if _mv_count == 0:
-                logger.error(
-                    f'[Treasury] ALERTA: {operation_code} completada sin BankMovements. '
-                    f'Posible constraint activo en bank_balances o banco no determinable.'
-                )
-            else:
-                logger.info(f'[Treasury] OK: {operation_code} → {_mv_count} movimiento(s) en ledger.')
-        except Exception as _ve:
-            logger.warning(f'[Treasury] No se pudo validar movimientos para {operation_code}: {_ve}')
+        # Asiento, saldos, referido, factura, email, WhatsApp, notificaciones y
+        # riesgo: al outbox en la misma transacción; los ejecuta el dispatcher
+        from app.services.operation_effects import enqueue_effects, completion, COMPLETE_EFFECTS
+        enqueue_effects(operation, COMPLETE_EFFECTS, completion(operation), actor_id=current_user.id)
 
-        # Otorgar beneficio de referido si aplica
-        try:
-            from app.services.referral_service import referral_service
-            referral_service.grant_referral_benefit(operation)
-        except Exception as e:
-            logger.warning(f"⚠️ Error al otorgar beneficio de referido: {str(e)}")
-            try:
-                db.session.rollback()
-            except Exception:
-                pass
-
-        # Generar factura electrónica
-        invoice_generated = False
-        try:
-            from app.services.invoice_service import InvoiceService
-
-            logger.info(f'[OPERATION-{operation_code}] ========== INICIANDO PROCESO DE FACTURACIÓN ==========')
-
-            if InvoiceService.is_enabled():
-                logger.info(f'[OPERATION-{operation_code}] Facturacion electronica HABILITADA — generando...')
-
-                success_invoice, message_invoice, invoice = InvoiceService.generate_invoice_for_operation(operation_db_id)
-
-                if success_invoice and invoice:
-                    logger.info(f'[OPERATION-{operation_code}] Factura generada: {invoice.invoice_number}')
-                    invoice_generated = True
-                else:
-                    logger.error(f'[OPERATION-{operation_code}] ERROR al generar factura: {message_invoice}')
-            else:
-                logger.warning(f'[OPERATION-{operation_code}] Facturacion electronica DESHABILITADA en configuracion')
-
-            logger.info(f'[OPERATION-{operation_code}] ========== FIN PROCESO DE FACTURACIÓN ==========')
-
-        except Exception as e:
-            logger.error(f'[OPERATION-{operation_code}] Excepcion al generar factura: {str(e)}')
-            logger.exception(e)
-
-        # Recargar operación fresca desde DB para email/notificaciones
-        # (evita acceso a atributos sobre objeto expirado tras múltiples rollbacks)
-        try:
-            fresh_op = db.session.get(Operation, operation_db_id)
-        except Exception:
-            fresh_op = operation
-
-        # Enviar email de confirmación
-        try:
-            logger.info(f'[COMPLETE] Enviando email para {operation_code}...')
-            from app.services.email_service import EmailService
-            success, message = EmailService.send_completed_operation_email(fresh_op or operation)
-            if success:
-                logger.info(f'[COMPLETE] Email enviado para {operation_code}')
-            else:
-                logger.warning(f'[COMPLETE] Error email para {operation_code}: {message}')
-        except Exception as e:
-            logger.error(f'[COMPLETE] Excepcion email para {operation_code}: {str(e)}')
-            logger.exception(e)
+        db.session.commit()
 
-        # Notificar vía WhatsApp al cliente usando plantilla aprobada por Meta
-        # (funciona aunque el cliente no haya escrito al bot previamente)
-        try:
-            from app.services.wa_bot import wa_notify_operacion_completada
-            _op_ref = fresh_op or operation
-            _client = getattr(_op_ref, 'client', None)
-            _titular = _client.full_name or _client.razon_social if _client else _op_ref.operation_id
-            _email_raw = (getattr(_client, 'email', '') or '')
-            _emails = [e.strip() for e in _email_raw.split(';') if e.strip() and '@' in e]
-            _email_txt = _emails[0] if _emails else 'correo registrado'
-            wa_notify_operacion_completada(_client, _op_ref.operation_id, _titular, _email_txt)
-            logger.info(f'[COMPLETE] WhatsApp template enviado para {operation_code}')
-        except Exception as e_wa:
-            logger.warning(f'[COMPLETE] Error WhatsApp para {operation_code}: {e_wa}')
+        from app.services.outbox import wake
+        wake()
 
-        # Notificar
-        try:
-            NotificationService.notify_operation_completed(fresh_op or operation)
-        except Exception as e_notif:
-            logger.warning(f'[COMPLETE] Error notificacion completada {operation_code}: {e_notif}')
         try:
             NotificationService.notify_dashboard_update()
         except Exception as e_dash:
             logger.warning(f'[COMPLETE] Error notificacion dashboard {operation_code}: {e_dash}')
 
-        # Recalcular score de riesgo del cliente automáticamente
-        try:
-            client_id = (fresh_op or operation).client_id
-            ComplianceService.update_client_risk_profile(
-                client_id,
-                user_id=None,
-                auto_commit=True
-            )
-        except Exception as e_risk:
-            logger.warning(f'[COMPLETE] No se pudo actualizar score de riesgo: {e_risk}')
-            try:
-                db.session.rollback()
-            except Exception:
-                pass
-
-        # Limpiar sesión antes del to_dict para evitar transacción abortada
-        try:
-            db.session.rollback()
-        except Exception:
-            pass
-
-        try:
-            op_dict = (fresh_op or operation).to_dict(include_relations=True)
-        except Exception as e_dict:
-            logger.error(f'[COMPLETE] Error en to_dict para {operation_code}: {e_dict}')
-            op_dict = {'id': operation_db_id, 'operation_id': operation_code, 'status': 'completado'}
+        op_dict = operation.to_dict(include_relations=True)
 
         return jsonify({
             'success': True,
@@ -1630,14 +1474,13 @@ def mark_notes_read(operation_id):
 @login_required
 def check_pending_operations():
     """
-    API: Verificar operaciones en estado 'En proceso' que requieren atención (Operador)
+    API: Operaciones 'En proceso' del operador con 10 minutos o más
 
-    Retorna operaciones que:
-    - Están en estado 'En proceso'
-    - Han estado en ese estado por 10 minutos o más
+    Respaldo para clientes sin Socket.IO: la interfaz recibe la cola y las
+    alertas por el evento 'cola_operador' (app/services/operator_queue.py).
 
     Returns:
-        JSON con lista de operaciones que necesitan atención y tiempo transcurrido
+        JSON con las filas vencidas de la cola del operador
     """
     # Si el usuario no es Operador, retornar vacío (no error)
     if current_user.role != 'Operador':
@@ -1647,52 +1490,13 @@ def check_pending_operations():
             'count': 0
         })
 
-    from app.extensions import db
-    from app.models.operation import Operation
-    from sqlalchemy import and_
-    from datetime import datetime
+    from app.services.operator_queue import snapshot
 
     try:
-        # Obtener fecha actual en Perú
-        now = now_peru()
-        start_of_day = datetime(now.year, now.month, now.day, 0, 0, 0)
-        end_of_day = datetime(now.year, now.month, now.day, 23, 59, 59)
-
-        # Obtener operaciones en proceso asignadas al operador actual DEL DÍA ACTUAL
-        operations = Operation.query.filter(
-            and_(
-                Operation.status == 'En proceso',
-                Operation.in_process_since.isnot(None),
-                Operation.assigned_operator_id == current_user.id,  # Solo sus operaciones asignadas
-                Operation.created_at >= start_of_day,  # Solo operaciones del día actual
-                Operation.created_at <= end_of_day
-            )
-        ).all()
+        pending_operations = [row for row in snapshot(current_user.id) if row['overdue']]
     except Exception as e:
-        # Si falla la consulta por otra razón, retornar vacío
-        return jsonify({
-            'success': True,
-            'pending_operations': [],
-            'count': 0
-        })
-
-    pending_operations = []
-    current_time = now_peru()
-
-    for operation in operations:
-        time_in_process = operation.get_time_in_process_minutes()
-
-        # Solo incluir si ha pasado 10 minutos o más
-        if time_in_process and time_in_process >= 10:
-            # Determinar si debe mostrar notificación
-            # Primera notificación: a los 10 minutos
-            # Notificaciones subsiguientes: cada 10 minutos (20, 30, 40, etc.)
-            should_alert = (time_in_process % 10 == 0)
-
-            op_data = operation.to_dict(include_relations=True)
-            op_data['time_in_process_minutes'] = time_in_process
-            op_data['should_alert'] = should_alert
-            pending_operations.append(op_data)
+        logger.error(f'Error consultando cola del operador {current_user.id}: {e}')
+        pending_operations = []
 
     return jsonify({
         'success': True,
@@ -1862,8 +1666,8 @@ def revert_completed_operation(operation_id):
     from app.models.journal_entry import JournalEntry
     from app.models.journal_entry_line import JournalEntryLine
     from app.models.audit_log import AuditLog
-    from app.models.journal_sequence import JournalSequence
     from app.models.accounting_period import AccountingPeriod
+    from app.services.accounting.journal_service import JournalService
     from decimal import Decimal
     from datetime import date as date_type
 
@@ -1893,6 +1697,7 @@ def revert_completed_operation(operation_id):
         if journal_entry:
             # 2. Marcar asiento original como anulado
             journal_entry.status = 'anulado'
+            journal_entry.annulled_at = now_peru()
             journal_anulado_number = journal_entry.entry_number
             db.session.flush()
 
@@ -1912,19 +1717,9 @@ def revert_completed_operation(operation_id):
                 db.session.add(period)
                 db.session.flush()
 
-            # 5. Generar numero de asiento (SELECT FOR UPDATE para evitar duplicados)
-            seq = (
-                db.session.query(JournalSequence)
-                .filter_by(year=today.year)
-                .with_for_update()
-                .first()
-            )
-            if not seq:
-                seq = JournalSequence(year=today.year, last_number=0)
-                db.session.add(seq)
-                db.session.flush()
-            seq.last_number += 1
-            reversal_entry_number = 'AS-' + str(today.year) + '-' + str(seq.last_number).zfill(4)
+            # 5. Numero provisional; el definitivo se asigna justo antes del
+            #    commit (lock de JournalSequence solo en ese tramo)
+            reversal_entry_number = JournalService.provisional_entry_number()
 
             # 6. Crear el contra-asiento (DEBE/HABER invertidos)
             total_debe  = sum(l.haber or Decimal('0') for l in original_lines)
@@ -1960,11 +1755,20 @@ def revert_completed_operation(operation_id):
                 )
                 db.session.add(rline)
 
-        # 7. Revertir estado de la operacion
+            from app.services.accounting.account_totals import AccountTotalsService
+            AccountTotalsService.apply_entry(journal_entry, reverse=True)
+            AccountTotalsService.apply_entry(reversal_entry)
+
+        # 7. Revertir estado de la operacion (y su aporte al cierre del dia)
+        from app.services.closure_accumulator import ClosureAccumulator
+        ClosureAccumulator.apply_operation(operation, reverse=True)
         operation.status = 'En proceso'
         operation.completed_at = None
         operation.in_process_since = now_peru()
 
+        if journal_entry:
+            reversal_entry_number = JournalService.assign_entry_number(reversal_entry)
+
         # 8. Registrar en audit log
         AuditLog.log_action(
             user_id=current_user.id,
@@ -714,6 +714,13 @@ def get_my_operations(dni):
         operations = OperationService.get_operations_by_client(client.id)
         logger.info(f'📦 [MY OPERATIONS] Operaciones encontradas: {len(operations)}')
 
+        # Formato compacto opt-in (?fields= / ?format=columnar)
+        from app.utils.compact import compact_payload
+        compact = compact_payload(operations, request.args,
+                                  Operation.COMPACT_FIELDS, Operation.COMPACT_DEFAULT)
+        if compact is not None:
+            return jsonify({'success': True, **compact}), 200
+
         # Convertir a dict
         operations_data = [op.to_dict(include_relations=True) for op in operations]
         logger.info(f'✅ [MY OPERATIONS] Retornando {len(operations_data)} operaciones')
@@ -448,6 +448,31 @@ def ping():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def _bank_movements(conditions, banco_accts, fallback_origin, fallback_dest):
+    """
+    Movimientos por cuenta de QoriCash de las operaciones que cumplen
+    `conditions`: abonos/pagos atribuidos por banco agregados en SQL
+    (operation_children.bank_flows) + el monto completo al banco de fallback
+    para los lados sin banco atribuible.
+
+    Retorna { full_bank_name: { 'USD': float, 'PEN': float } }
+    """
+    from app.services.operation_children import bank_flows, fallback_movements
+
+    flows, fallback = bank_flows(conditions, unknown_bank='INTERBANK')
+    moves = [(banco, moneda, delta) for (banco, moneda), delta in flows.items()]
+    moves += fallback_movements(fallback, fallback_origin, fallback_dest)
+
+    acct_mvmt = {}
+    for banco, moneda, delta in moves:
+        full_name = banco_accts.get(banco, {}).get(moneda)
+        if not full_name:
+            continue
+        mv = acct_mvmt.setdefault(full_name, {'USD': 0.0, 'PEN': 0.0})
+        mv[moneda] += delta
+    return acct_mvmt
+
+
 @position_bp.route('/api/bank_reconciliation')
 @login_required
 @require_role('Master', 'Operador')
@@ -484,24 +509,15 @@ def get_bank_reconciliation():
 
         # Obtener SOLO operaciones COMPLETADAS del día (excluir demo)
         demo_id = User.get_demo_user_id()
-        rec_query = Operation.query.filter(
-            Operation.status == 'Completada',
-            Operation.created_at >= inicio_dia,
-            Operation.created_at <= fin_dia
-        )
+        day_conditions = [Operation.created_at >= inicio_dia, Operation.created_at <= fin_dia]
         if demo_id:
-            rec_query = rec_query.filter(Operation.user_id != demo_id)
-        completed_ops = rec_query.all()
+            day_conditions.append(Operation.user_id != demo_id)
+        rec_conditions  = [Operation.status == 'Completada', *day_conditions]
+        pend_conditions = [Operation.status.in_(['Pendiente', 'En proceso']), *day_conditions]
+        completed_ops = Operation.query.filter(*rec_conditions).all()
 
         # Obtener operaciones PENDIENTES / EN PROCESO del día
-        pend_query = Operation.query.filter(
-            Operation.status.in_(['Pendiente', 'En proceso']),
-            Operation.created_at >= inicio_dia,
-            Operation.created_at <= fin_dia
-        )
-        if demo_id:
-            pend_query = pend_query.filter(Operation.user_id != demo_id)
-        pending_ops = pend_query.all()
+        pending_ops = Operation.query.filter(*pend_conditions).all()
 
         logger.debug(f'Reconciliación {fecha_consulta}: {len(completed_ops)} operaciones completadas, {len(pending_ops)} pendientes')
 
@@ -563,17 +579,6 @@ def get_bank_reconciliation():
                     return banco
             return 'INTERBANK'  # banco externo desconocido → cobro/pago vía INTERBANK
 
-        # acct_mvmt: { full_bank_name: { 'USD': float, 'PEN': float } }
-        acct_mvmt = {}
-
-        def _add_mvmt(full_name, usd_delta, pen_delta):
-            if not full_name:
-                return
-            if full_name not in acct_mvmt:
-                acct_mvmt[full_name] = {'USD': 0.0, 'PEN': 0.0}
-            acct_mvmt[full_name]['USD'] += usd_delta
-            acct_mvmt[full_name]['PEN'] += pen_delta
-
         def _fallback_banco(op):
             """Banco fallback para el lado ORIGEN (Compra-USD / Venta-PEN)."""
             try:
@@ -604,137 +609,12 @@ def get_bank_reconciliation():
                 pass
             return _fallback_banco(op)  # último recurso: usar banco origen
 
-        for op in completed_ops:
-            _usd = float(op.amount_usd)
-            _pen = float(op.amount_pen)
-            _payments = op.client_payments or []
-            _deposits = op.client_deposits or []
-            _has_pay_banks = any(p.get('qc_bank') for p in _payments)
-            _has_dep_banks = any(d.get('qc_bank') for d in _deposits)
-
-            if op.operation_type == 'Compra':
-                # Depósitos USD: cliente → QoriCash  (banco = cuenta origen del cliente)
-                if _has_dep_banks:
-                    _usd_attr = 0.0
-                    for dep in _deposits:
-                        _b = _normalize_banco(dep.get('qc_bank', '')) or _normalize_banco(dep.get('cuenta_cargo', ''))
-                        _amt = float(dep.get('importe', 0))
-                        if _b and _amt > 0:
-                            _add_mvmt(_banco_accts.get(_b, {}).get('USD'), +_amt, 0.0)
-                            _usd_attr += _amt
-                    if _usd_attr == 0 and _usd > 0:
-                        _add_mvmt(_banco_accts.get(_fallback_banco(op), {}).get('USD'), +_usd, 0.0)
-                else:
-                    _add_mvmt(_banco_accts.get(_fallback_banco(op), {}).get('USD'), +_usd, 0.0)
-                # Pagos PEN: QoriCash → cliente  (banco = cuenta DESTINO del cliente)
-                if _has_pay_banks:
-                    _pen_attr = 0.0
-                    for pay in _payments:
-                        _b = _normalize_banco(pay.get('qc_bank', '')) or _normalize_banco(pay.get('cuenta_destino', ''))
-                        _amt = float(pay.get('importe', 0))
-                        if _b and _amt > 0:
-                            _add_mvmt(_banco_accts.get(_b, {}).get('PEN'), 0.0, -_amt)
-                            _pen_attr += _amt
-                    if _pen_attr == 0 and _pen > 0:
-                        _add_mvmt(_banco_accts.get(_fallback_banco_dest(op), {}).get('PEN'), 0.0, -_pen)
-                else:
-                    _add_mvmt(_banco_accts.get(_fallback_banco_dest(op), {}).get('PEN'), 0.0, -_pen)
-            else:  # Venta
-                # Depósitos PEN: cliente → QoriCash  (banco = cuenta origen del cliente)
-                if _has_dep_banks:
-                    _pen_attr = 0.0
-                    for dep in _deposits:
-                        _b = _normalize_banco(dep.get('qc_bank', '')) or _normalize_banco(dep.get('cuenta_cargo', ''))
-                        _amt = float(dep.get('importe', 0))
-                        if _b and _amt > 0:
-                            _add_mvmt(_banco_accts.get(_b, {}).get('PEN'), 0.0, +_amt)
-                            _pen_attr += _amt
-                    if _pen_attr == 0 and _pen > 0:
-                        _add_mvmt(_banco_accts.get(_fallback_banco(op), {}).get('PEN'), 0.0, +_pen)
-                else:
-                    _add_mvmt(_banco_accts.get(_fallback_banco(op), {}).get('PEN'), 0.0, +_pen)
-                # Pagos USD: QoriCash → cliente  (banco = cuenta DESTINO del cliente)
-                if _has_pay_banks:
-                    _usd_attr = 0.0
-                    for pay in _payments:
-                        _b = _normalize_banco(pay.get('qc_bank', '')) or _normalize_banco(pay.get('cuenta_destino', ''))
-                        _amt = float(pay.get('importe', 0))
-                        if _b and _amt > 0:
-                            _add_mvmt(_banco_accts.get(_b, {}).get('USD'), -_amt, 0.0)
-                            _usd_attr += _amt
-                    if _usd_attr == 0 and _usd > 0:
-                        _add_mvmt(_banco_accts.get(_fallback_banco_dest(op), {}).get('USD'), -_usd, 0.0)
-                else:
-                    _add_mvmt(_banco_accts.get(_fallback_banco_dest(op), {}).get('USD'), -_usd, 0.0)
+        # acct_mvmt: { full_bank_name: { 'USD': float, 'PEN': float } }
+        acct_mvmt = _bank_movements(rec_conditions, _banco_accts,
+                                    _fallback_banco, _fallback_banco_dest)
         # Movimientos proyectados de operaciones pendientes / en proceso
-        acct_mvmt_pend = {}
-
-        def _add_mvmt_pend(full_name, usd_delta, pen_delta):
-            if not full_name:
-                return
-            if full_name not in acct_mvmt_pend:
-                acct_mvmt_pend[full_name] = {'USD': 0.0, 'PEN': 0.0}
-            acct_mvmt_pend[full_name]['USD'] += usd_delta
-            acct_mvmt_pend[full_name]['PEN'] += pen_delta
-
-        for op in pending_ops:
-            _usd = float(op.amount_usd)
-            _pen = float(op.amount_pen)
-            _payments = op.client_payments or []
-            _deposits = op.client_deposits or []
-            _has_pay_banks = any(p.get('qc_bank') for p in _payments)
-            _has_dep_banks = any(d.get('qc_bank') for d in _deposits)
-
-            if op.operation_type == 'Compra':
-                if _has_dep_banks:
-                    _usd_attr = 0.0
-                    for dep in _deposits:
-                        _b = _normalize_banco(dep.get('qc_bank', '')) or _normalize_banco(dep.get('cuenta_cargo', ''))
-                        _amt = float(dep.get('importe', 0))
-                        if _b and _amt > 0:
-                            _add_mvmt_pend(_banco_accts.get(_b, {}).get('USD'), +_amt, 0.0)
-                            _usd_attr += _amt
-                    if _usd_attr == 0 and _usd > 0:
-                        _add_mvmt_pend(_banco_accts.get(_fallback_banco(op), {}).get('USD'), +_usd, 0.0)
-                else:
-                    _add_mvmt_pend(_banco_accts.get(_fallback_banco(op), {}).get('USD'), +_usd, 0.0)
-                if _has_pay_banks:
-                    _pen_attr = 0.0
-                    for pay in _payments:
-                        _b = _normalize_banco(pay.get('qc_bank', '')) or _normalize_banco(pay.get('cuenta_destino', ''))
-                        _amt = float(pay.get('importe', 0))
-                        if _b and _amt > 0:
-                            _add_mvmt_pend(_banco_accts.get(_b, {}).get('PEN'), 0.0, -_amt)
-                            _pen_attr += _amt
-                    if _pen_attr == 0 and _pen > 0:
-                        _add_mvmt_pend(_banco_accts.get(_fallback_banco_dest(op), {}).get('PEN'), 0.0, -_pen)
-                else:
-                    _add_mvmt_pend(_banco_accts.get(_fallback_banco_dest(op), {}).get('PEN'), 0.0, -_pen)
-            else:
-                if _has_dep_banks:
-                    _pen_attr = 0.0
-                    for dep in _deposits:
-                        _b = _normalize_banco(dep.get('qc_bank', '')) or _normalize_banco(dep.get('cuenta_cargo', ''))
-                        _amt = float(dep.get('importe', 0))
-                        if _b and _amt > 0:
-                            _add_mvmt_pend(_banco_accts.get(_b, {}).get('PEN'), 0.0, +_amt)
-                            _pen_attr += _amt
-                    if _pen_attr == 0 and _pen > 0:
-                        _add_mvmt_pend(_banco_accts.get(_fallback_banco(op), {}).get('PEN'), 0.0, +_pen)
-                else:
-                    _add_mvmt_pend(_banco_accts.get(_fallback_banco(op), {}).get('PEN'), 0.0, +_pen)
-                if _has_pay_banks:
-                    _usd_attr = 0.0
-                    for pay in _payments:
-                        _b = _normalize_banco(pay.get('qc_bank', '')) or _normalize_banco(pay.get('cuenta_destino', ''))
-                        _amt = float(pay.get('importe', 0))
-                        if _b and _amt > 0:
-                            _add_mvmt_pend(_banco_accts.get(_b, {}).get('USD'), -_amt, 0.0)
-                            _usd_attr += _amt
-                    if _usd_attr == 0 and _usd > 0:
-                        _add_mvmt_pend(_banco_accts.get(_fallback_banco_dest(op), {}).get('USD'), -_usd, 0.0)
-                else:
-                    _add_mvmt_pend(_banco_accts.get(_fallback_banco_dest(op), {}).get('USD'), -_usd, 0.0)
+        acct_mvmt_pend = _bank_movements(pend_conditions, _banco_accts,
+                                         _fallback_banco, _fallback_banco_dest)
         # ─────────────────────────────────────────────────────────────────────
 
         # Calcular totales esperados y diferencias usando movimientos por cuenta
@@ -985,14 +865,13 @@ def sync_balances():
         fin_dia    = dt.combine(fecha_consulta, time.max)
 
         demo_id = User.get_demo_user_id()
-        rec_query = Operation.query.filter(
+        rec_conditions = [
             Operation.status == 'Completada',
             Operation.created_at >= inicio_dia,
-            Operation.created_at <= fin_dia
-        )
+            Operation.created_at <= fin_dia,
+        ]
         if demo_id:
-            rec_query = rec_query.filter(Operation.user_id != demo_id)
-        completed_ops = rec_query.all()
+            rec_conditions.append(Operation.user_id != demo_id)
 
         from app.config.bank_accounts import QORICASH_ACCOUNTS
         _banco_accts = {}
@@ -1042,76 +921,7 @@ def sync_balances():
                 pass
             return _fallback(op)
 
-        acct_mvmt = {}
-
-        def _add(full_name, usd_d, pen_d):
-            if not full_name:
-                return
-            if full_name not in acct_mvmt:
-                acct_mvmt[full_name] = {'USD': 0.0, 'PEN': 0.0}
-            acct_mvmt[full_name]['USD'] += usd_d
-            acct_mvmt[full_name]['PEN'] += pen_d
-
-        for op in completed_ops:
-            _usd  = float(op.amount_usd)
-            _pen  = float(op.amount_pen)
-            _pays = op.client_payments or []
-            _deps = op.client_deposits or []
-            _hp   = any(p.get('qc_bank') for p in _pays)
-            _hd   = any(d.get('qc_bank') for d in _deps)
-            _fb   = _fallback(op)
-            _fbd  = _fallback_dest(op)
-
-            if op.operation_type == 'Compra':
-                if _hd:
-                    _ua = 0.0
-                    for d in _deps:
-                        _b = _norm(d.get('qc_bank','')) or _norm(d.get('cuenta_cargo',''))
-                        _a = float(d.get('importe', 0))
-                        if _b and _a > 0:
-                            _add(_banco_accts.get(_b,{}).get('USD'), +_a, 0.0)
-                            _ua += _a
-                    if _ua == 0 and _usd > 0:
-                        _add(_banco_accts.get(_fb,{}).get('USD'), +_usd, 0.0)
-                else:
-                    _add(_banco_accts.get(_fb,{}).get('USD'), +_usd, 0.0)
-                if _hp:
-                    _pa = 0.0
-                    for p in _pays:
-                        _b = _norm(p.get('qc_bank','')) or _norm(p.get('cuenta_destino',''))
-                        _a = float(p.get('importe', 0))
-                        if _b and _a > 0:
-                            _add(_banco_accts.get(_b,{}).get('PEN'), 0.0, -_a)
-                            _pa += _a
-                    if _pa == 0 and _pen > 0:
-                        _add(_banco_accts.get(_fbd,{}).get('PEN'), 0.0, -_pen)
-                else:
-                    _add(_banco_accts.get(_fbd,{}).get('PEN'), 0.0, -_pen)
-            else:  # Venta
-                if _hd:
-                    _pa = 0.0
-                    for d in _deps:
-                        _b = _norm(d.get('qc_bank','')) or _norm(d.get('cuenta_cargo',''))
-                        _a = float(d.get('importe', 0))
-                        if _b and _a > 0:
-                            _add(_banco_accts.get(_b,{}).get('PEN'), 0.0, +_a)
-                            _pa += _a
-                    if _pa == 0 and _pen > 0:
-                        _add(_banco_accts.get(_fb,{}).get('PEN'), 0.0, +_pen)
-                else:
-                    _add(_banco_accts.get(_fb,{}).get('PEN'), 0.0, +_pen)
-                if _hp:
-                    _ua = 0.0
-                    for p in _pays:
-                        _b = _norm(p.get('qc_bank','')) or _norm(p.get('cuenta_destino',''))
-                        _a = float(p.get('importe', 0))
-                        if _b and _a > 0:
-                            _add(_banco_accts.get(_b,{}).get('USD'), -_a, 0.0)
-                            _ua += _a
-                    if _ua == 0 and _usd > 0:
-                        _add(_banco_accts.get(_fbd,{}).get('USD'), -_usd, 0.0)
-                else:
-                    _add(_banco_accts.get(_fbd,{}).get('USD'), -_usd, 0.0)
+        acct_mvmt = _bank_movements(rec_conditions, _banco_accts, _fallback, _fallback_dest)
 
         all_banks = BankBalance.query.all()
         updated = []
@@ -2400,15 +2400,9 @@ def api_email_toggle(eid):
 @require_role("Master")
 def api_export_excel():
     """Exporta todos los prospectos a Excel."""
-    import openpyxl
-    from io import BytesIO
-    from openpyxl.styles import Font, PatternFill, Alignment
+    from app.services.excel_export import ExcelExport, iter_query
 
-    prospectos_list = _base_query().order_by(Prospecto.actualizado_en.desc()).all()
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Prospectos"
+    prospectos_q = _base_query().order_by(Prospecto.actualizado_en.desc(), Prospecto.id.desc())
 
     headers = [
         "ID", "Razón Social", "RUC", "Tipo", "Rubro",
@@ -2423,20 +2417,13 @@ def api_export_excel():
         "Creado En", "Actualizado En",
     ]
 
-    header_fill = PatternFill("solid", fgColor="1a1a2e")
-    header_font = Font(bold=True, color="FFFFFF")
-    ws.append(headers)
-    for cell in ws[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal="center")
+    col_widths = [6,30,14,10,20,15,12,12,25,25,20,30,30,14,14,12,14,8,16,12,20,12,12,14,16,16,16,6,40,15,14,16,40,16,16]
+    xl = ExcelExport()
+    ws = xl.sheet("Prospectos", widths=col_widths, freeze="A2")
+    ws.header(headers)
 
     # Trader map
-    asigs = AsignacionProspecto.query.filter_by(activo=True).all()
-    tmap  = {}
-    for a in asigs:
-        if a.prospecto_id not in tmap and a.trader:
-            tmap[a.prospecto_id] = a.trader.username
+    tmap = _active_trader_usernames()
 
     # Última actividad por prospecto
     from sqlalchemy import select as sa_select
@@ -2456,7 +2443,7 @@ def api_export_excel():
     )
     amap = {a.prospecto_id: a for a in act_rows}
 
-    for p in prospectos_list:
+    for p in iter_query(prospectos_q):
         ult = amap.get(p.id)
         ws.append([
             p.id, p.razon_social, p.ruc, p.tipo, p.rubro,
@@ -2479,20 +2466,8 @@ def api_export_excel():
             p.actualizado_en.strftime("%Y-%m-%d %H:%M") if p.actualizado_en else "",
         ])
 
-    # Ajustar anchos
-    col_widths = [6,30,14,10,20,15,12,12,25,25,20,30,30,14,14,12,14,8,16,12,20,12,12,14,16,16,16,6,40,15,14,16,40,16,16]
-    for i, w in enumerate(col_widths, 1):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(i)].width = w
-
-    buf = BytesIO()
-    wb.save(buf)
-    buf.seek(0)
     from datetime import date as _date
-    return current_app.response_class(
-        buf.read(),
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment;filename=prospectos_{_date.today()}.xlsx"},
-    )
+    return xl.to_response(f"prospectos_{_date.today()}.xlsx")
 
 
 @prospeccion_bp.route("/api/import-excel", methods=["POST"])
@@ -3295,6 +3270,83 @@ def api_campana_precios_elegibles():
     return jsonify({'ok': True, 'total': len(result), 'prospectos': result})
 
 
+def _prospecto_full_row(p, asigs: dict) -> dict:
+    """Fila completa de un prospecto (api_export_full y job 'prospectos_full')."""
+    contactado = bool(p.fecha_primer_contacto and str(p.fecha_primer_contacto).strip())
+    return {
+        'id':                   p.id,
+        'razon_social':         p.razon_social or '',
+        'ruc':                  p.ruc or '',
+        'tipo':                 p.tipo or '',
+        'rubro':                p.rubro or '',
+        'departamento':         p.departamento or '',
+        'provincia':            p.provincia or '',
+        'distrito':             getattr(p, 'distrito', '') or '',
+        'web':                  getattr(p, 'web', '') or '',
+        'nombre_contacto':      p.nombre_contacto or '',
+        'cargo':                p.cargo or '',
+        'email':                p.email or '',
+        'email_alt':            p.email_alt or '',
+        'telefono':             p.telefono or '',
+        'telefono_alt':         getattr(p, 'telefono_alt', '') or '',
+        'estado_comercial':     p.estado_comercial or '',
+        'nivel_interes':        p.nivel_interes or '',
+        'grupo':                p.grupo or '',
+        'canal':                p.canal or '',
+        'fuente':               p.fuente or '',
+        'prioridad':            getattr(p, 'prioridad', '') or '',
+        'tamano_empresa':       getattr(p, 'tamano_empresa', '') or '',
+        'notas':                (p.notas or '')[:500],
+        'tipo_ultimo_envio':    p.tipo_ultimo_envio or '',
+        'remitente':            p.remitente or '',
+        'bandeja':              p.bandeja or '',
+        'num_contactos':        p.num_contactos or 0,
+        'fecha_primer_contacto':  str(p.fecha_primer_contacto or ''),
+        'fecha_ultimo_contacto':  str(p.fecha_ultimo_contacto or ''),
+        'fecha_proximo_contacto': str(p.fecha_proximo_contacto or ''),
+        'estado_email':         p.estado_email or '',
+        'cliente_lfc':          getattr(p, 'cliente_lfc', '') or '',
+        'contacto_wa':          getattr(p, 'contacto_wa', '') or '',
+        'trader_asignado':      asigs.get(p.id, ''),
+        'contactado':           'SI' if contactado else 'NO',
+        'creado_en':            p.creado_en.strftime('%Y-%m-%d %H:%M') if p.creado_en else '',
+        'actualizado_en':       p.actualizado_en.strftime('%Y-%m-%d %H:%M') if p.actualizado_en else '',
+    }
+
+
+def _active_trader_usernames(pids=None) -> dict:
+    """{prospecto_id: username} de la primera asignación activa."""
+    q = (db.session.query(AsignacionProspecto.prospecto_id, User.username)
+         .join(User, AsignacionProspecto.trader_id == User.id)
+         .filter(AsignacionProspecto.activo == True))
+    if pids is not None:
+        q = q.filter(AsignacionProspecto.prospecto_id.in_(pids))
+    out = {}
+    for prospecto_id, username in q.order_by(AsignacionProspecto.id).all():
+        out.setdefault(prospecto_id, username)
+    return out
+
+
+def build_prospectos_full():
+    """
+    Todos los prospectos con las columnas de api_export_full en un solo .xlsx
+    (job en segundo plano). Retorna (ExcelExport, filename).
+    """
+    from app.services.excel_export import ExcelExport, iter_query
+
+    asigs = _active_trader_usernames()
+    xl = ExcelExport()
+    ws = xl.sheet("Prospectos", freeze="A2")
+    header = None
+    for p in iter_query(Prospecto.query.order_by(Prospecto.id.asc())):
+        row = _prospecto_full_row(p, asigs)
+        if header is None:
+            header = list(row.keys())
+            ws.header(header)
+        ws.append([row[k] for k in header])
+    return xl, f"prospectos_full_{now_peru().strftime('%Y%m%d_%H%M%S')}.xlsx"
+
+
 @prospeccion_bp.route("/api/export-full")
 @csrf.exempt
 def api_export_full():
@@ -3316,57 +3368,8 @@ def api_export_full():
     prospectos = Prospecto.query.order_by(Prospecto.id.asc()).offset(offset).limit(per_page).all()
 
     pids = [p.id for p in prospectos]
-    asigs = {}
-    if pids:
-        for a in AsignacionProspecto.query.filter(
-            AsignacionProspecto.prospecto_id.in_(pids),
-            AsignacionProspecto.activo == True,
-        ).all():
-            if a.prospecto_id not in asigs and a.trader:
-                asigs[a.prospecto_id] = a.trader.username
-
-    rows = []
-    for p in prospectos:
-        contactado = bool(p.fecha_primer_contacto and str(p.fecha_primer_contacto).strip())
-        rows.append({
-            'id':                   p.id,
-            'razon_social':         p.razon_social or '',
-            'ruc':                  p.ruc or '',
-            'tipo':                 p.tipo or '',
-            'rubro':                p.rubro or '',
-            'departamento':         p.departamento or '',
-            'provincia':            p.provincia or '',
-            'distrito':             getattr(p, 'distrito', '') or '',
-            'web':                  getattr(p, 'web', '') or '',
-            'nombre_contacto':      p.nombre_contacto or '',
-            'cargo':                p.cargo or '',
-            'email':                p.email or '',
-            'email_alt':            p.email_alt or '',
-            'telefono':             p.telefono or '',
-            'telefono_alt':         getattr(p, 'telefono_alt', '') or '',
-            'estado_comercial':     p.estado_comercial or '',
-            'nivel_interes':        p.nivel_interes or '',
-            'grupo':                p.grupo or '',
-            'canal':                p.canal or '',
-            'fuente':               p.fuente or '',
-            'prioridad':            getattr(p, 'prioridad', '') or '',
-            'tamano_empresa':       getattr(p, 'tamano_empresa', '') or '',
-            'notas':                (p.notas or '')[:500],
-            'tipo_ultimo_envio':    p.tipo_ultimo_envio or '',
-            'remitente':            p.remitente or '',
-            'bandeja':              p.bandeja or '',
-            'num_contactos':        p.num_contactos or 0,
-            'fecha_primer_contacto':  str(p.fecha_primer_contacto or ''),
-            'fecha_ultimo_contacto':  str(p.fecha_ultimo_contacto or ''),
-            'fecha_proximo_contacto': str(p.fecha_proximo_contacto or ''),
-            'estado_email':         p.estado_email or '',
-            'cliente_lfc':          getattr(p, 'cliente_lfc', '') or '',
-            'contacto_wa':          getattr(p, 'contacto_wa', '') or '',
-            'trader_asignado':      asigs.get(p.id, ''),
-            'contactado':           'SI' if contactado else 'NO',
-            'creado_en':            p.creado_en.strftime('%Y-%m-%d %H:%M') if p.creado_en else '',
-            'actualizado_en':       p.actualizado_en.strftime('%Y-%m-%d %H:%M') if p.actualizado_en else '',
-        })
+    asigs = _active_trader_usernames(pids) if pids else {}
+    rows = [_prospecto_full_row(p, asigs) for p in prospectos]
 
     pages_total = (total + per_page - 1) // per_page
     return jsonify({
@@ -30,10 +30,12 @@ from sqlalchemy import or_
 
 from app.extensions import db
 from app.models import (
-    BankBalance, Operation, AccountingMatch, AccountingBatch,
+    BankBalance, Operation, AccountingMatch,
     BankMovement, DailyClosure, JournalEntry, ExpenseRecord,
 )
 from app.models.user import User
+from app.services.balance_timeline import BalanceTimeline
+from app.services.closure_accumulator import ClosureAccumulator
 from app.utils.formatters import now_peru
 
 _log = logging.getLogger(__name__)
@@ -67,12 +69,9 @@ def _get_system_balances() -> dict:
     """
     Saldos del sistema por banco y moneda — fuente: BankMovement (suma acumulada).
     Coincide con la columna 'Teórico' de Control de Apertura y Cierre.
+    Usa el último checkpoint del ledger + movimientos posteriores (BalanceTimeline).
     """
-    balances = {b: {c: 0.0 for c in CURRENCIES} for b in BANKS}
-    for bk in BANKS:
-        for cur in CURRENCIES:
-            balances[bk][cur] = round(BankMovement.compute_running_balance(bk, cur), 2)
-    return balances
+    return BalanceTimeline.balances_at(now_peru())['by_bank']
 
 
 def _get_open_position() -> dict:
@@ -389,6 +388,28 @@ def api_dashboard():
     })
 
 
+# ── API: Posición histórica (point-in-time) ──────────────────────────────────
+
+@treasury_bp.route('/api/posicion/historica')
+@login_required
+def api_posicion_historica():
+    """
+    Saldos del ledger por banco y moneda a un instante dado.
+    ?ts=YYYY-MM-DDTHH:MM[:SS]  o  ?ts=YYYY-MM-DD (fin del día). Default: ahora.
+    """
+    _require_master()
+    try:
+        ts_str = request.args.get('ts')
+        try:
+            data = BalanceTimeline.balances_at(ts_str or None)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Parámetro ts inválido'}), 400
+        return jsonify({'success': True, **data})
+    except Exception as e:
+        _log.exception('[Treasury] Error en api_posicion_historica')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ── API: Posición ─────────────────────────────────────────────────────────────
 
 @treasury_bp.route('/api/posicion')
@@ -607,6 +628,7 @@ def api_ajuste():
             closure_date   = now_peru().date(),
         )
         db.session.add(mv)
+        ClosureAccumulator.apply_movement(mv)
         db.session.commit()
 
         return jsonify({
@@ -625,88 +647,24 @@ def api_ajuste():
 @treasury_bp.route('/api/cierre/calcular', methods=['POST'])
 @login_required
 def api_cierre_calcular():
+    """
+    Lee el borrador precalculado del día (ClosureAccumulator) y refresca
+    pendientes, amarres abiertos y diferencias. Recalcula todo desde cero solo
+    si el borrador no está sembrado o si se envía {"recalcular": true}.
+    """
     _require_master()
     try:
         data       = request.get_json() or {}
         fecha_str  = data.get('fecha', now_peru().date().isoformat())
         fecha      = date.fromisoformat(fecha_str)
+        recompute  = bool(data.get('recalcular', False))
 
-        start = datetime.combine(fecha, datetime.min.time())
-        end   = start + timedelta(days=1)
-
-        # ── Operaciones completadas en el día ──
-        ops_day = Operation.query.filter(
-            Operation.status == 'Completada',
-            Operation.completed_at >= start,
-            Operation.completed_at <  end,
-        ).all()
-        compras = [o for o in ops_day if o.operation_type == 'Compra']
-        ventas  = [o for o in ops_day if o.operation_type == 'Venta']
-        vol_usd  = sum(float(o.amount_usd or 0) for o in ops_day)
-        buy_usd  = sum(float(o.amount_usd or 0) for o in compras)
-        sell_usd = sum(float(o.amount_usd or 0) for o in ventas)
-        avg_buy  = (sum(float(o.exchange_rate or 0) * float(o.amount_usd or 0) for o in compras) / buy_usd
-                    if buy_usd > 0 else 0)
-        avg_sell = (sum(float(o.exchange_rate or 0) * float(o.amount_usd or 0) for o in ventas) / sell_usd
-                    if sell_usd > 0 else 0)
-
-        # ── Amarres del día ──
-        matches_day = AccountingMatch.query.filter(
-            AccountingMatch.status == 'Activo',
-            AccountingMatch.created_at >= start,
-            AccountingMatch.created_at <  end,
-        ).all()
-        spread_pen = sum(float(m.profit_pen or 0) for m in matches_day)
-
-        # ── Gastos del día ──
-        expenses_pen = _get_today_expenses(fecha)
-
-        # ── Operaciones pendientes ──
-        pending_ops = Operation.query.filter(
-            Operation.status.in_(['Pendiente', 'En proceso'])
-        ).count()
-
-        # ── USD sin amarrar ──
-        open_pos = _get_open_position()
-
-        # ── Amarres activos sin batch cerrado ──
-        open_matches = AccountingMatch.query.filter(
-            AccountingMatch.status == 'Activo',
-        ).join(
-            AccountingBatch, AccountingMatch.batch_id == AccountingBatch.id, isouter=True
-        ).filter(
-            db.or_(AccountingMatch.batch_id.is_(None), AccountingBatch.status != 'Cerrado')
-        ).count()
-
-        # ── Saldos del sistema por banco ──
-        system_balances = _get_system_balances()
-
-        # ── Obtener o crear cierre ──
-        closure = DailyClosure.query.filter_by(closure_date=fecha).first()
-        if not closure:
-            closure = DailyClosure(
-                closure_date = fecha,
-                status       = DailyClosure.STATUS_BORRADOR,
-                created_by   = current_user.id,
-            )
-            db.session.add(closure)
-
-        closure.system_balances        = system_balances
-        closure.operations_completed   = len(ops_day)
-        closure.total_volume_usd       = round(vol_usd,   2)
-        closure.total_bought_usd       = round(buy_usd,   2)
-        closure.total_sold_usd         = round(sell_usd,  2)
-        closure.avg_buy_rate           = round(avg_buy,   4)
-        closure.avg_sell_rate          = round(avg_sell,  4)
-        closure.gross_spread_pen       = round(spread_pen, 2)
-        closure.expenses_pen           = round(expenses_pen, 2)
-        closure.net_profit_pen         = round(spread_pen - expenses_pen, 2)
-        closure.pending_operations     = pending_ops
-        closure.unmatched_completed_usd = round(open_pos['neto_usd'], 2)
-        closure.open_matches           = open_matches
+        closure, recomputed = ClosureAccumulator.calcular(
+            fecha, user_id=current_user.id, recompute=recompute,
+        )
         db.session.commit()
 
-        return jsonify({'success': True, 'cierre': closure.to_dict()})
+        return jsonify({'success': True, 'recalculado': recomputed, 'cierre': closure.to_dict()})
     except Exception as e:
         db.session.rollback()
         _log.exception('[Treasury] Error en api_cierre_calcular')
@@ -779,6 +737,12 @@ def api_cierre_confirmar():
         # Marcar movimientos del día como validados
         BankMovement.query.filter_by(closure_date=fecha).update({'is_validated': True})
 
+        # Checkpoint del ledger al cierre del día (consultas de saldo histórico)
+        try:
+            BalanceTimeline.take_checkpoint(fecha)
+        except Exception as cp_err:
+            _log.warning(f'[Treasury] Checkpoint de saldos no registrado: {cp_err}')
+
         db.session.commit()
 
         return jsonify({
@@ -1146,6 +1110,8 @@ def _exec_traslado(data: dict, user_id: int) -> dict:
     db.session.add(mv_salida)
     db.session.add(mv_entrada)
     db.session.flush()   # obtener IDs
+    ClosureAccumulator.apply_movement(mv_salida)
+    ClosureAccumulator.apply_movement(mv_entrada)
 
     # ── Asiento contable (partida doble) ──────────────────────────────────────
     origin_pcge = _jmap(origin_bank, origin_cur)
@@ -1308,12 +1274,25 @@ def api_anular_traslado(transfer_id):
             else:
                 dest_bb.balance_pen = round(float(dest_bb.balance_pen) - float(t.amount), 2)
 
+        # Quitar los movimientos del traslado del borrador del cierre diario y
+        # de los checkpoints del ledger (ya no cuentan: balance_timeline.counted)
+        movements = [mv for mv in (t.movement_salida, t.movement_entrada) if mv]
+        for mv in movements:
+            ClosureAccumulator.apply_movement(mv, reverse=True)
+        if movements:
+            from app.services.balance_timeline import invalidate_checkpoints
+            invalidate_checkpoints(db.session.connection(), min(mv.movement_date for mv in movements))
+
         # Anular asiento contable
         if t.journal_entry_id:
             from app.models.journal_entry import JournalEntry
             je = JournalEntry.query.get(t.journal_entry_id)
             if je:
-                je.status = 'anulado'
+                je.status      = 'anulado'
+                je.annulled_at = now_peru()
+                ClosureAccumulator.apply_expenses(je.entry_date, je.lines, reverse=True)
+                from app.services.accounting.account_totals import AccountTotalsService
+                AccountTotalsService.apply_entry(je, reverse=True)
 
         t.status        = 'anulado'
         t.anulado_by    = current_user.id
@@ -0,0 +1,362 @@
+"""
+AccountTotalsService — Totales del Libro Diario materializados por período
+===========================================================================
+Estado de Resultados, Balance General y el AuditEngine sumaban líneas del
+Libro Diario por prefijo PCGE (SUM ... LIKE 'prefix%') en cada vista: una
+pasada sobre journal_entry_lines por cada rubro. Aquí los totales viven en
+AccountPeriodTotal, una fila por (período, entry_type, prefijo):
+
+  rollups    niveles PCGE de 1 a 4 dígitos ('6', '68', '681', '6814')
+  cuentas    la cuenta exacta de la línea (is_account=True)
+
+Mantenimiento (mismo patrón que ClosureAccumulator):
+  apply_lines / apply_entry  suman o restan un asiento al crearlo o anularlo,
+  apply_batch                en la transacción del caller. No hacen commit y
+                             nunca lanzan: si algo falla, el período queda
+                             invalidado y se reconstruye en la próxima lectura.
+  invalidate                 para escrituras masivas (UPDATE / DELETE directos).
+  rebuild_period             recalcula un período con UNA consulta agrupada.
+
+AccountingPeriod.totals_built_at marca los períodos al día. Las lecturas
+reconstruyen primero los que estén en NULL (ensure_built). El lock del
+período (FOR UPDATE al reconstruir, FOR SHARE al aplicar) evita perder un
+asiento que se confirma mientras su período se reconstruye.
+
+Lecturas:
+  period_totals(periods)     {(year, month): totales} — comparativos
+  cumulative(corte, year)    acumulado hasta la fecha de corte (Balance)
+  sums(totals, prefix)       Σ debe / Σ haber como LIKE 'prefix%'
+
+Uso CLI:
+  flask rebuild-account-totals [--year 2026]
+"""
+import logging
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+_log = logging.getLogger(__name__)
+
+_ZERO = Decimal('0')
+LEVELS = (1, 2, 3, 4)
+INSERT_CHUNK = 1000
+
+
+def _key(year: int, month: int) -> int:
+    return year * 100 + month
+
+
+def _dec(v) -> Decimal:
+    return Decimal(str(v or 0))
+
+
+def prefixes(code: str) -> list:
+    """'104101' → [('1', False), ('10', False), ('104', False), ('1041', False), ('104101', True)]."""
+    code = (code or '').strip()
+    out = [(code[:n], False) for n in LEVELS if len(code) >= n]
+    out.append((code, True))
+    return out
+
+
+def expand(account_rows) -> dict:
+    """
+    [(account_code, entry_type, debe, haber)] → {(entry_type, prefix, is_account): [debe, haber]}
+    con los rollups de cada cuenta.
+    """
+    out = defaultdict(lambda: [_ZERO, _ZERO])
+    for code, etype, d, h in account_rows:
+        d, h = _dec(d), _dec(h)
+        for prefix, is_account in prefixes(code):
+            acc = out[(etype, prefix, is_account)]
+            acc[0] += d
+            acc[1] += h
+    return dict(out)
+
+
+def upsert_rows(year: int, month: int, deltas: dict, sign: int = 1) -> list:
+    """
+    Filas del upsert de un período ordenadas por su clave de conflicto
+    (entry_type, prefix, is_account): dos asientos concurrentes que tocan los
+    mismos rollups bloquean las filas en el mismo orden y no se interbloquean.
+    """
+    return sorted(({
+        'year': year, 'month': month, 'entry_type': etype or '',
+        'prefix': prefix, 'is_account': is_account,
+        'debe': d * sign, 'haber': h * sign,
+    } for (etype, prefix, is_account), (d, h) in deltas.items()),
+        key=lambda r: (r['entry_type'], r['prefix'], r['is_account']))
+
+
+def sums(totals: dict, prefix: str, entry_types=None) -> tuple:
+    """
+    (Σ debe, Σ haber) de las cuentas que empiezan con prefix sobre un dict de
+    expand() / period_totals() / cumulative(). Prefijos de hasta 4 dígitos
+    leen su rollup; más largos suman las cuentas exactas.
+    """
+    rollup = len(prefix) <= LEVELS[-1]
+    d = h = _ZERO
+    for (etype, p, is_account), (td, th) in totals.items():
+        if entry_types is not None and etype not in entry_types:
+            continue
+        if rollup:
+            if is_account or p != prefix:
+                continue
+        elif not (is_account and p.startswith(prefix)):
+            continue
+        d += td
+        h += th
+    return d, h
+
+
+def saldo(totals: dict, prefix: str, saldo_normal: str = 'deudora', entry_types=None) -> Decimal:
+    """Saldo de sums(): debe − haber ('deudora') o haber − debe ('acreedora')."""
+    d, h = sums(totals, prefix, entry_types)
+    return (d - h) if saldo_normal == 'deudora' else (h - d)
+
+
+def accounts(totals: dict) -> dict:
+    """{(account_code, entry_type): (debe, haber)} — solo cuentas exactas."""
+    return {(p, etype): tuple(v) for (etype, p, is_account), v in totals.items() if is_account}
+
+
+class AccountTotalsService:
+    """Métodos estáticos — no requiere instancia."""
+
+    # ── Mantenimiento ─────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _locked_period(year: int, month: int, shared: bool):
+        from app.models.accounting_period import AccountingPeriod
+
+        return AccountingPeriod.query.filter_by(year=year, month=month).with_for_update(
+            read=shared).first()
+
+    @staticmethod
+    def _upsert(year: int, month: int, deltas: dict, sign: int = 1):
+        """Suma deltas a las filas del período (INSERT ... ON CONFLICT DO UPDATE, en orden de clave)."""
+        from sqlalchemy.dialects.postgresql import insert
+        from app.extensions import db
+        from app.models.account_period_total import AccountPeriodTotal as APT
+
+        rows = upsert_rows(year, month, deltas, sign)
+        if not rows:
+            return
+        t = APT.__table__
+        stmt = insert(t).values(rows)
+        db.session.execute(stmt.on_conflict_do_update(
+            constraint='uq_apt_period_type_prefix',
+            set_={'debe': t.c.debe + stmt.excluded.debe,
+                  'haber': t.c.haber + stmt.excluded.haber},
+        ))
+
+    @staticmethod
+    def apply_lines(entry_date: date, entry_type: str, lines, reverse: bool = False):
+        """
+        Suma (o resta si reverse=True) las líneas de un asiento a los totales
+        de su período. lines: dicts de create_entry u objetos JournalEntryLine.
+        """
+        AccountTotalsService.apply_batch([(entry_date, entry_type, lines)], reverse=reverse)
+
+    @staticmethod
+    def apply_batch(items, reverse: bool = False):
+        """
+        apply_lines() de varios asientos [(entry_date, entry_type, lines)]:
+        un upsert por período (generación masiva), períodos en orden.
+        """
+        from app.extensions import db
+
+        def _get(line, attr):
+            return line.get(attr) if isinstance(line, dict) else getattr(line, attr, None)
+
+        por_periodo = defaultdict(list)
+        for entry_date, entry_type, lines in items:
+            if entry_date is None:
+                continue
+            por_periodo[(entry_date.year, entry_date.month)].extend(
+                (_get(l, 'account_code'), entry_type or '', _get(l, 'debe'), _get(l, 'haber'))
+                for l in lines or ()
+            )
+
+        for (year, month), rows in sorted(por_periodo.items()):
+            try:
+                with db.session.begin_nested():
+                    period = AccountTotalsService._locked_period(year, month, shared=True)
+                    if period is None or period.totals_built_at is None:
+                        continue   # se reconstruye completo en la próxima lectura
+                    AccountTotalsService._upsert(year, month, expand(rows), -1 if reverse else 1)
+            except Exception as exc:
+                _log.warning(f'[AccountTotals] apply {year}/{month:02d} falló: {type(exc).__name__}: {exc}')
+                try:
+                    AccountTotalsService.invalidate(year, month)
+                    _log.warning(f'[AccountTotals] período {year}/{month:02d} invalidado: '
+                                 f'se reconstruye completo en la próxima lectura')
+                except Exception as inv_exc:
+                    _log.error(f'[AccountTotals] invalidate {year}/{month:02d}: {inv_exc}')
+
+    @staticmethod
+    def apply_entry(entry, reverse: bool = False):
+        """apply_lines() con las líneas ya guardadas del asiento (anulaciones)."""
+        from app.models.journal_entry_line import JournalEntryLine as JEL
+
+        lines = JEL.query.with_entities(JEL.account_code, JEL.debe, JEL.haber).filter(
+            JEL.journal_entry_id == entry.id).all()
+        AccountTotalsService.apply_lines(entry.entry_date, entry.entry_type, lines, reverse=reverse)
+
+    @staticmethod
+    def invalidate(year: int, month: int):
+        """Borra los totales del período y lo marca para reconstruir. No hace commit."""
+        from app.models.account_period_total import AccountPeriodTotal as APT
+        from app.models.accounting_period import AccountingPeriod
+
+        APT.query.filter_by(year=year, month=month).delete(synchronize_session=False)
+        AccountingPeriod.query.filter_by(year=year, month=month).update(
+            {'totals_built_at': None}, synchronize_session=False)
+
+    @staticmethod
+    def invalidate_dates(dates):
+        """invalidate() de los períodos de las fechas dadas."""
+        for year, month in {(d.year, d.month) for d in dates if d is not None}:
+            AccountTotalsService.invalidate(year, month)
+
+    @staticmethod
+    def rebuild_period(year: int, month: int) -> int:
+        """
+        Recalcula los totales del período desde el Libro Diario (una consulta
+        agrupada por cuenta y entry_type). No hace commit. Retorna filas escritas.
+        """
+        from sqlalchemy import func, insert
+        from app.extensions import db
+        from app.models.account_period_total import AccountPeriodTotal as APT
+        from app.models.journal_entry import JournalEntry as JE
+        from app.models.journal_entry_line import JournalEntryLine as JEL
+        from app.utils.formatters import now_peru
+        from app.utils.periods import in_month
+
+        period = AccountTotalsService._locked_period(year, month, shared=False)
+        APT.query.filter_by(year=year, month=month).delete(synchronize_session=False)
+        if period is None:
+            return 0
+
+        grouped = db.session.query(
+            JEL.account_code, JE.entry_type, func.sum(JEL.debe), func.sum(JEL.haber),
+        ).join(JE, JEL.journal_entry_id == JE.id).filter(
+            JE.status == 'activo',
+            in_month(JE.entry_date, year, month),
+        ).group_by(JEL.account_code, JE.entry_type).all()
+
+        rows = [{
+            'year': year, 'month': month, 'entry_type': etype or '',
+            'prefix': prefix, 'is_account': is_account, 'debe': d, 'haber': h,
+        } for (etype, prefix, is_account), (d, h) in expand(
+            (code, etype or '', d, h) for code, etype, d, h in grouped
+        ).items()]
+        for i in range(0, len(rows), INSERT_CHUNK):
+            db.session.execute(insert(APT).values(rows[i:i + INSERT_CHUNK]))
+        period.totals_built_at = now_peru()
+        db.session.flush()
+        return len(rows)
+
+    @staticmethod
+    def ensure_built(until=None) -> int:
+        """
+        Reconstruye los períodos sin totales al día (hasta `until`, (year, month)).
+        Commit por período. Retorna cuántos períodos se reconstruyeron.
+        """
+        from app.extensions import db
+        from app.models.accounting_period import AccountingPeriod
+
+        q = db.session.query(AccountingPeriod.year, AccountingPeriod.month).filter(
+            AccountingPeriod.totals_built_at.is_(None))
+        if until is not None:
+            q = q.filter(AccountingPeriod.year * 100 + AccountingPeriod.month <= _key(*until))
+        pending = q.order_by(AccountingPeriod.year, AccountingPeriod.month).all()
+
+        built = 0
+        for year, month in pending:
+            try:
+                period = AccountTotalsService._locked_period(year, month, shared=False)
+                if period is not None and period.totals_built_at is None:
+                    AccountTotalsService.rebuild_period(year, month)
+                    built += 1
+                db.session.commit()
+            except Exception as exc:
+                db.session.rollback()
+                _log.error(f'[AccountTotals] rebuild {year}/{month:02d}: {exc}')
+        if built:
+            _log.info(f'[AccountTotals] {built} período(s) reconstruido(s)')
+        return built
+
+    # ── Lectura ───────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def period_totals(periods, is_account: bool = None) -> dict:
+        """
+        {(year, month): {(entry_type, prefix, is_account): (debe, haber)}} de
+        los períodos pedidos, en una sola consulta (comparativos).
+        """
+        from app.extensions import db
+        from app.models.account_period_total import AccountPeriodTotal as APT
+
+        periods = sorted(set(periods))
+        if not periods:
+            return {}
+        AccountTotalsService.ensure_built(until=periods[-1])
+
+        q = db.session.query(APT.year, APT.month, APT.entry_type, APT.prefix,
+                             APT.is_account, APT.debe, APT.haber).filter(
+            (APT.year * 100 + APT.month).in_([_key(y, m) for y, m in periods]))
+        if is_account is not None:
+            q = q.filter(APT.is_account.is_(is_account))
+
+        out = {p: {} for p in periods}
+        for r in q.all():
+            out[(r.year, r.month)][(r.entry_type, r.prefix, r.is_account)] = (_dec(r.debe), _dec(r.haber))
+        return out
+
+    @staticmethod
+    def cumulative(corte: date, year: int = None) -> dict:
+        """
+        Acumulado de asientos activos con entry_date <= corte (y del año
+        `year` si se indica), sin distinguir entry_type:
+        {(None, prefix, is_account): (debe, haber)}.
+
+        Los meses completos salen de AccountPeriodTotal; si el corte cae a
+        mitad de mes, ese mes se agrega desde el Libro Diario (un solo mes,
+        una consulta agrupada).
+        """
+        from sqlalchemy import func
+        from app.extensions import db
+        from app.models.account_period_total import AccountPeriodTotal as APT
+        from app.models.journal_entry import JournalEntry as JE
+        from app.models.journal_entry_line import JournalEntryLine as JEL
+
+        full_month = corte.day == monthrange(corte.year, corte.month)[1]
+        if full_month:
+            hasta = (corte.year, corte.month)
+        else:
+            hasta = (corte.year - 1, 12) if corte.month == 1 else (corte.year, corte.month - 1)
+        AccountTotalsService.ensure_built(until=hasta)
+
+        q = db.session.query(
+            APT.prefix, APT.is_account, func.sum(APT.debe), func.sum(APT.haber),
+        ).filter(APT.year * 100 + APT.month <= _key(*hasta))
+        if year is not None:
+            q = q.filter(APT.year == year)
+        totals = {(None, p, is_account): [_dec(d), _dec(h)]
+                  for p, is_account, d, h in q.group_by(APT.prefix, APT.is_account).all()}
+
+        if not full_month and (year is None or year == corte.year):
+            parcial = db.session.query(
+                JEL.account_code, func.sum(JEL.debe), func.sum(JEL.haber),
+            ).join(JE, JEL.journal_entry_id == JE.id).filter(
+                JE.status == 'activo',
+                JE.entry_date >= date(corte.year, corte.month, 1),
+                JE.entry_date <= corte,
+            ).group_by(JEL.account_code).all()
+            for k, (d, h) in expand((code, None, d, h) for code, d, h in parcial).items():
+                acc = totals.setdefault(k, [_ZERO, _ZERO])
+                acc[0] += d
+                acc[1] += h
+
+        return {k: tuple(v) for k, v in totals.items()}
@@ -0,0 +1,270 @@
+"""
+BulkJournal — Generación masiva de asientos de operaciones
+===========================================================
+Para períodos retroactivos (operaciones Completadas sin asiento activo).
+create_entry_for_completed_operation() procesa una operación a la vez:
+SELECT FOR UPDATE sobre JournalSequence, INSERT de cabecera, N INSERT de
+líneas y commit por asiento. Aquí, por cada bloque de `chunk_size`
+operaciones:
+
+  1. Se arman todos los asientos en memoria (JournalService.build_operation_entry).
+  2. Se reserva el bloque de números de cada año con un solo lock
+     (JournalService._reserve_entry_numbers).
+  3. Cabeceras con un INSERT multi-fila (RETURNING id) y líneas con otro.
+  4. Commit del bloque.
+
+Reanudable: las pendientes se definen por NOT EXISTS asiento activo y se
+recorren por keyset (completed_at, id); lo ya generado queda fuera, así que
+una corrida interrumpida retoma donde quedó sin duplicar. dry_run arma los
+asientos igual pero no reserva números ni escribe: reporta los mismos conteos.
+
+Uso CLI:
+  flask bulk-journal --year 2026 --month 6           # dry-run por defecto
+  flask bulk-journal --year 2026 --month 6 --apply
+"""
+import logging
+import time
+
+from app.extensions import db
+
+_log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+
+
+def pending_operations_query(year: int = None, month: int = None, desde=None,
+                             operation_ids=None):
+    """Operaciones Completadas (sin demo) sin asiento activo, en orden de completado."""
+    from sqlalchemy import exists
+    from app.models.journal_entry import JournalEntry as JE
+    from app.models.operation import Operation
+    from app.models.user import User
+    from app.utils.periods import in_month, in_year
+
+    q = Operation.query.filter(
+        Operation.status == 'Completada',
+        ~exists().where(
+            JE.source_type == 'operation',
+            JE.source_id == Operation.id,
+            JE.status == 'activo',
+        ),
+    )
+    if year and month:
+        q = q.filter(in_month(Operation.completed_at, year, month))
+    elif year:
+        q = q.filter(in_year(Operation.completed_at, year))
+    if desde is not None:
+        q = q.filter(Operation.completed_at >= desde)
+    if operation_ids is not None:
+        q = q.filter(Operation.id.in_(list(operation_ids)))
+    demo_id = User.get_demo_user_id()
+    if demo_id:
+        q = q.filter(Operation.user_id != demo_id)
+    return q.order_by(Operation.completed_at.asc(), Operation.id.asc())
+
+
+def _build(ops, errores) -> list:
+    """[(operation, spec)] de los asientos que cuadran; el resto va a errores."""
+    from app.services.accounting.journal_service import JournalService, _safe_decimal, TOLERANCIA_ASIENTO
+
+    built = []
+    for op in ops:
+        try:
+            spec = JournalService.build_operation_entry(op)
+        except Exception as exc:
+            errores.append({'operation_id': op.operation_id, 'error': str(exc)})
+            continue
+        if spec is None:
+            errores.append({'operation_id': op.operation_id, 'error': 'amount_pen = 0'})
+            continue
+        lines = spec['lines']
+        debe  = sum(_safe_decimal(l.get('debe', 0)) for l in lines)
+        haber = sum(_safe_decimal(l.get('haber', 0)) for l in lines)
+        if not lines or abs(debe - haber) > TOLERANCIA_ASIENTO:
+            errores.append({'operation_id': op.operation_id,
+                            'error': f'descuadrado D:{debe} H:{haber}'})
+            continue
+        spec['total_debe'], spec['total_haber'] = debe, haber
+        built.append((op, spec))
+    return built
+
+
+def _periods(built, create: bool) -> dict:
+    """{(year, month): AccountingPeriod | None} de las fechas del bloque."""
+    from app.models.accounting_period import AccountingPeriod
+    from app.services.accounting.journal_service import JournalService
+
+    out = {}
+    for _, spec in built:
+        d = spec['entry_date']
+        key = (d.year, d.month)
+        if key in out:
+            continue
+        if create:
+            out[key] = JournalService.get_or_create_period(d)
+        else:
+            out[key] = AccountingPeriod.query.filter_by(year=d.year, month=d.month).first()
+    return out
+
+
+def _insert_chunk(built, periods, created_by) -> int:
+    """Reserva números y escribe cabeceras + líneas con INSERT multi-fila."""
+    from sqlalchemy import insert
+    from app.models.journal_entry import JournalEntry as JE
+    from app.models.journal_entry_line import JournalEntryLine as JEL
+    from app.services.accounting.account_totals import AccountTotalsService
+    from app.services.accounting.journal_service import JournalService, _safe_decimal
+    from app.services.closure_accumulator import ClosureAccumulator
+    from app.utils.formatters import now_peru
+
+    por_anio = {}
+    for item in built:
+        por_anio.setdefault(item[1]['entry_date'].year, []).append(item)
+
+    now = now_peru()
+    headers, specs = [], {}
+    for year in sorted(por_anio):
+        items   = por_anio[year]
+        numbers = JournalService._reserve_entry_numbers(year, len(items))
+        for number, (op, spec) in zip(numbers, items):
+            d = spec['entry_date']
+            headers.append({
+                'entry_number': number,
+                'period_id':    periods[(d.year, d.month)].id,
+                'entry_date':   d,
+                'description':  spec['description'],
+                'entry_type':   spec['entry_type'],
+                'source_type':  spec['source_type'],
+                'source_id':    spec['source_id'],
+                'total_debe':   spec['total_debe'],
+                'total_haber':  spec['total_haber'],
+                'status':       'activo',
+                'created_by':   created_by,
+                'created_at':   now,
+            })
+            specs[number] = spec
+
+    ids = dict(db.session.execute(
+        insert(JE).values(headers).returning(JE.entry_number, JE.id)
+    ).all())
+
+    rows = []
+    for number, spec in specs.items():
+        for i, line in enumerate(spec['lines'], start=1):
+            rows.append({
+                'journal_entry_id': ids[number],
+                'account_code':     line['account_code'],
+                'description':      line.get('description'),
+                'debe':             _safe_decimal(line.get('debe', 0)),
+                'haber':            _safe_decimal(line.get('haber', 0)),
+                'currency':         line.get('currency', 'PEN'),
+                'amount_usd':       _safe_decimal(line['amount_usd']) if line.get('amount_usd') else None,
+                'exchange_rate':    _safe_decimal(line['exchange_rate']) if line.get('exchange_rate') else None,
+                'line_order':       i,
+            })
+        # Mismo efecto que create_entry sobre el cierre diario (gastos 6xxx)
+        ClosureAccumulator.apply_expenses(spec['entry_date'], spec['lines'])
+    if rows:
+        db.session.execute(insert(JEL).values(rows))
+    AccountTotalsService.apply_batch(
+        (spec['entry_date'], spec['entry_type'], spec['lines']) for spec in specs.values())
+    return len(headers)
+
+
+def _after(Operation, completed_at, op_id):
+    """Keyset: operaciones posteriores a (completed_at, id) en el orden de la consulta."""
+    from sqlalchemy import and_, or_
+
+    if completed_at is None:   # NULLS LAST: solo quedan las sin fecha
+        return and_(Operation.completed_at.is_(None), Operation.id > op_id)
+    return or_(
+        Operation.completed_at > completed_at,
+        and_(Operation.completed_at == completed_at, Operation.id > op_id),
+        Operation.completed_at.is_(None),
+    )
+
+
+def run_bulk_operation_entries(year: int = None, month: int = None, desde=None,
+                               operation_ids=None, dry_run: bool = True,
+                               created_by: int = None,
+                               chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Genera los asientos de las operaciones Completadas sin asiento activo.
+
+    Args:
+        year, month:    acota por completed_at (month=None → año completo).
+        desde:          completed_at >= desde.
+        operation_ids:  acota a estas operaciones (Operation.id).
+        dry_run:        si True, no escribe nada — sólo reporta.
+        created_by:     user.id para created_by.
+        chunk_size:     operaciones por bloque (un commit por bloque).
+
+    Returns: {
+        dry_run, total_sin_asiento, generados, omitidos_periodo_cerrado,
+        errores, operaciones_con_error, bloques, elapsed_seconds
+    }
+    """
+    from sqlalchemy.orm import selectinload
+    from app.models.operation import Operation
+
+    t0 = time.perf_counter()
+    base = pending_operations_query(year=year, month=month, desde=desde,
+                                    operation_ids=operation_ids)
+    total = base.count()
+
+    generados = 0
+    cerrados  = 0
+    bloques   = 0
+    errores   = []
+    last      = None   # keyset (completed_at, id) del último bloque
+
+    while True:
+        q = base.options(selectinload(Operation.client))
+        if last is not None:
+            q = q.filter(_after(Operation, *last))
+        ops = q.limit(chunk_size).all()
+        if not ops:
+            break
+        bloques += 1
+        last = (ops[-1].completed_at, ops[-1].id)
+
+        built   = _build(ops, errores)
+        periods = _periods(built, create=not dry_run)
+        abiertos = []
+        for op, spec in built:
+            p = periods[(spec['entry_date'].year, spec['entry_date'].month)]
+            if p is not None and p.status == 'cerrado':
+                cerrados += 1
+            else:
+                abiertos.append((op, spec))
+
+        if dry_run:
+            generados += len(abiertos)
+            continue
+
+        try:
+            if abiertos:
+                generados += _insert_chunk(abiertos, periods, created_by)
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+            _log.error(f'[BulkJournal] bloque {bloques}: {exc}')
+            errores.extend({'operation_id': op.operation_id, 'error': str(exc)}
+                           for op, _ in abiertos)
+
+    elapsed = round(time.perf_counter() - t0, 2)
+    _log.info(
+        f'[BulkJournal] {"dry-run " if dry_run else ""}{generados}/{total} asientos '
+        f'en {bloques} bloque(s), {len(errores)} error(es), {elapsed}s'
+    )
+    return {
+        'dry_run':                  dry_run,
+        'total_sin_asiento':        total,
+        'generados':                generados,
+        'omitidos_periodo_cerrado': cerrados,
+        'errores':                  len(errores),
+        'operaciones_con_error':    [e['operation_id'] for e in errores],
+        'detalle_errores':          errores[:50],
+        'bloques':                  bloques,
+        'elapsed_seconds':          elapsed,
+    }
@@ -0,0 +1,382 @@
+"""
+Cronograma y contabilización en lote de la depreciación
+========================================================
+run_depreciacion_mensual() y /activos-fijos/depreciar recorrían los activos
+uno por uno: cálculo de la cuota, asiento propio (lock de numeración, INSERT
+de cabecera y líneas) y commit por activo. Aquí:
+
+  compute_schedule()  cuotas de TODOS los activos en una pasada, por
+                      columnas (montos → acumulados → valor neto), sin
+                      consultar la base. Lineal: cuota = monthly_depreciation
+                      redondeada; la última cuota absorbe el redondeo y nunca
+                      se deprecia por debajo del valor residual.
+  rebuild_schedule()  guarda el cronograma completo (toda la vida útil
+                      restante) en depreciation_schedule con INSERT
+                      multi-fila. Las cuotas ya contabilizadas no se tocan.
+  post_depreciation() contabiliza las cuotas vencidas a (year, month) con UN
+                      asiento por cuenta 39xx: DEBE 6814 / HABER 39xx, y
+                      actualiza los contadores de los activos.
+  net_book_values()   valor neto por activo a una fecha de corte, leído del
+                      cronograma (Balance General y workbook contable).
+  projection()        gasto de depreciación futuro por mes y cuenta.
+
+Idempotente: una cuota contabilizada queda con posted_at; volver a correr
+el mismo período no genera otro asiento. Los activos con asientos
+individuales previos (source_type='fixed_asset') retoman el cronograma en el
+mes siguiente al último asiento.
+
+Uso CLI:
+  flask depreciation-schedule            # regenera el cronograma pendiente
+"""
+import calendar
+import logging
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal, ROUND_CEILING
+from itertools import accumulate
+
+_log = logging.getLogger(__name__)
+
+CENT        = Decimal('0.01')
+GASTO_CTA   = '6814'
+SOURCE_TYPE = 'depreciacion_lote'
+INSERT_CHUNK = 1000
+
+
+@dataclass
+class AssetState:
+    asset_id:         int
+    deprec_account:   str
+    cost:             Decimal
+    residual:         Decimal
+    monthly:          Decimal
+    remaining_months: int
+    accumulated:      Decimal   # depreciación ya contabilizada
+    start:            int       # month_index() de la primera cuota pendiente
+
+
+def month_index(year: int, month: int) -> int:
+    """(2026, 1) → 24312. Meses consecutivos → índices consecutivos."""
+    return year * 12 + month - 1
+
+
+def from_index(idx: int) -> tuple:
+    """Inversa de month_index(): 24312 → (2026, 1)."""
+    return idx // 12, idx % 12 + 1
+
+
+def cuotas(state: AssetState) -> list:
+    """Cuotas pendientes del activo; suman exactamente costo − residual − acumulado."""
+    pendiente = state.cost - state.residual - state.accumulated
+    n = state.remaining_months
+    if pendiente <= 0 or n <= 0:
+        return []
+    cuota = state.monthly.quantize(CENT)
+    if cuota <= 0:
+        cuota = (pendiente / n).quantize(CENT)
+    k = min(n, int((pendiente / cuota).to_integral_value(ROUND_CEILING))) if cuota > 0 else 1
+    return [cuota] * (k - 1) + [pendiente - cuota * (k - 1)]
+
+
+def compute_schedule(states) -> list:
+    """
+    Filas del cronograma para todos los activos: dicts listos para el INSERT
+    multi-fila (asset_id, year, month, deprec_account, amount, accumulated,
+    net_book_value).
+    """
+    rows = []
+    for s in states:
+        amounts = cuotas(s)
+        acumulados = list(accumulate(amounts, initial=s.accumulated))[1:]
+        for i, (amount, acum) in enumerate(zip(amounts, acumulados)):
+            year, month = from_index(s.start + i)
+            rows.append({
+                'asset_id':       s.asset_id,
+                'year':           year,
+                'month':          month,
+                'deprec_account': s.deprec_account,
+                'amount':         amount,
+                'accumulated':    acum,
+                'net_book_value': s.cost - acum,
+            })
+    return rows
+
+
+def _period_key(DS):
+    return DS.year * 12 + DS.month - 1
+
+
+def _state(asset, posted_idx: dict, legacy_idx: dict) -> AssetState:
+    """Estado del activo para el cronograma: desde su última cuota contabilizada."""
+    d = asset.acquisition_date
+    start = month_index(d.year, d.month) + (asset.months_depreciated or 0)
+    for last in (posted_idx.get(asset.id), legacy_idx.get(asset.id)):
+        if last is not None:
+            start = max(start, last + 1)
+    return AssetState(
+        asset_id=asset.id,
+        deprec_account=asset.deprec_account,
+        cost=Decimal(str(asset.cost_pen)),
+        residual=Decimal(str(asset.residual_value or 0)),
+        monthly=Decimal(str(asset.monthly_depreciation)),
+        remaining_months=asset.remaining_months,
+        accumulated=Decimal(str(asset.accumulated_depreciation or 0)),
+        start=start,
+    )
+
+
+def rebuild_schedule(asset_ids=None, commit: bool = True) -> int:
+    """
+    Regenera las cuotas pendientes (posted_at NULL) de los activos indicados
+    (None → todos). Los activos dados de baja o ya depreciados quedan sin
+    cuotas pendientes. Retorna el número de filas escritas.
+    """
+    from sqlalchemy import func, insert
+    from app.extensions import db
+    from app.models.depreciation_schedule import DepreciationSchedule as DS
+    from app.models.fixed_asset import FixedAsset
+    from app.models.journal_entry import JournalEntry as JE
+
+    q = FixedAsset.query
+    if asset_ids is not None:
+        q = q.filter(FixedAsset.id.in_(list(asset_ids)))
+    assets = q.all()
+    if not assets:
+        return 0
+    ids = [a.id for a in assets]
+
+    DS.query.filter(DS.asset_id.in_(ids), DS.posted_at.is_(None)).delete(synchronize_session=False)
+
+    posted_idx = dict(db.session.query(DS.asset_id, func.max(_period_key(DS))).filter(
+        DS.asset_id.in_(ids), DS.posted_at.isnot(None),
+    ).group_by(DS.asset_id).all())
+    legacy_idx = {
+        source_id: month_index(last.year, last.month)
+        for source_id, last in db.session.query(JE.source_id, func.max(JE.entry_date)).filter(
+            JE.entry_type == 'depreciacion',
+            JE.source_type == 'fixed_asset',
+            JE.source_id.in_(ids),
+            JE.status == 'activo',
+        ).group_by(JE.source_id).all()
+    }
+
+    rows = compute_schedule(_state(a, posted_idx, legacy_idx)
+                            for a in assets if a.status == 'activo')
+    for i in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(insert(DS).values(rows[i:i + INSERT_CHUNK]))
+    if commit:
+        db.session.commit()
+    _log.info(f'[DepreciationSchedule] {len(rows)} cuota(s) para {len(assets)} activo(s)')
+    return len(rows)
+
+
+def ensure_schedule() -> int:
+    """Genera el cronograma de los activos activos que aún no tienen cuotas pendientes."""
+    from sqlalchemy import exists, func
+    from app.extensions import db
+    from app.models.depreciation_schedule import DepreciationSchedule as DS
+    from app.models.fixed_asset import FixedAsset
+
+    ids = [i for (i,) in db.session.query(FixedAsset.id).filter(
+        FixedAsset.status == 'activo',
+        func.coalesce(FixedAsset.months_depreciated, 0) < FixedAsset.useful_life_months,
+        ~exists().where(DS.asset_id == FixedAsset.id, DS.posted_at.is_(None)),
+    ).all()]
+    return rebuild_schedule(ids) if ids else 0
+
+
+def due_rows(year: int, month: int):
+    """[(DepreciationSchedule, FixedAsset)] — cuotas sin contabilizar hasta (year, month)."""
+    from app.extensions import db
+    from app.models.depreciation_schedule import DepreciationSchedule as DS
+    from app.models.fixed_asset import FixedAsset
+
+    return db.session.query(DS, FixedAsset).join(FixedAsset, FixedAsset.id == DS.asset_id).filter(
+        DS.posted_at.is_(None),
+        FixedAsset.status == 'activo',
+        _period_key(DS) <= month_index(year, month),
+    ).order_by(DS.asset_id, DS.year, DS.month).all()
+
+
+def post_depreciation(year: int, month: int, created_by: int = None) -> dict:
+    """
+    Contabiliza las cuotas vencidas a (year, month) — incluidas las de meses
+    anteriores que quedaron sin contabilizar — con un asiento por cuenta 39xx,
+    fechado el último día del mes.
+
+    Cada grupo es una transacción: cuotas marcadas, contadores del activo y
+    asiento se confirman juntos (create_entry hace el commit).
+
+    Returns: {generados, activos, cuotas, omitidos, errores, total_depreciation,
+              period, periodo_cerrado}
+    """
+    from app.extensions import db
+    from app.models.depreciation_schedule import DepreciationSchedule as DS
+    from app.models.fixed_asset import FixedAsset
+    from app.services.accounting.journal_service import JournalService
+    from app.utils.formatters import now_peru
+
+    period_label = f'{year}/{month:02d}'
+    period_date  = date(year, month, calendar.monthrange(year, month)[1])
+    result = {'generados': 0, 'activos': 0, 'cuotas': 0, 'omitidos': 0,
+              'errores': [], 'total_depreciation': 0.0, 'period': period_label,
+              'periodo_cerrado': False}
+
+    ensure_schedule()
+    due = due_rows(year, month)
+    activos = FixedAsset.query.filter(FixedAsset.status == 'activo',
+                                      FixedAsset.acquisition_date <= period_date).count()
+    result['omitidos'] = max(0, activos - len({a.id for _, a in due}))
+    if not due:
+        return result
+
+    period = JournalService.get_or_create_period(period_date)
+    if period.status == 'cerrado':
+        result['periodo_cerrado'] = True
+        result['errores'].append(f'Período {period_label} cerrado')
+        return result
+
+    grupos = {}
+    for row, asset in due:
+        grupos.setdefault(row.deprec_account, []).append((row, asset))
+
+    total = Decimal('0')
+    for cuenta in sorted(grupos):
+        items  = grupos[cuenta]
+        monto  = sum((row.amount for row, _ in items), Decimal('0'))
+        assets = {a.id: a for _, a in items}
+        try:
+            now = now_peru()
+            for row, asset in items:
+                row.posted_at = now
+                asset.months_depreciated = (asset.months_depreciated or 0) + 1
+                asset.accumulated_depreciation = row.accumulated
+            for asset in assets.values():
+                if asset.is_fully_depreciated or asset.net_book_value <= Decimal(str(asset.residual_value or 0)):
+                    asset.status = 'depreciado'
+
+            atrasadas = sum(1 for row, _ in items if (row.year, row.month) != (year, month))
+            entry = JournalService.create_entry(
+                entry_type='depreciacion',
+                description=(
+                    f'Depreciación {period_label} — cuenta {cuenta} '
+                    f'({len(assets)} activo(s)'
+                    + (f', {atrasadas} cuota(s) de meses anteriores' if atrasadas else '')
+                    + ')'
+                ),
+                lines=[
+                    {
+                        'account_code': GASTO_CTA,
+                        'description':  f'Gasto depreciación {cuenta} {period_label}',
+                        'debe':     monto,
+                        'haber':    Decimal('0'),
+                        'currency': 'PEN',
+                    },
+                    {
+                        'account_code': cuenta,
+                        'description':  f'Depreciación acumulada {period_label}',
+                        'debe':     Decimal('0'),
+                        'haber':    monto,
+                        'currency': 'PEN',
+                    },
+                ],
+                source_type=SOURCE_TYPE,
+                entry_date=period_date,
+                created_by=created_by,
+            )
+            if entry is None:
+                db.session.rollback()
+                result['errores'].append(f'{cuenta}: error en JournalService')
+                continue
+
+            DS.query.filter(DS.id.in_([row.id for row, _ in items])).update(
+                {DS.journal_entry_id: entry.id}, synchronize_session=False)
+            db.session.commit()
+
+            result['generados'] += 1
+            result['activos']   += len(assets)
+            result['cuotas']    += len(items)
+            total += monto
+            _log.info(f'[Depreciation] ✅ {cuenta}: {len(assets)} activo(s) '
+                      f'S/ {monto:.2f} → {entry.entry_number}')
+        except Exception as exc:
+            db.session.rollback()
+            result['errores'].append(f'{cuenta}: {exc}')
+            _log.error(f'[Depreciation] ❌ {cuenta}: {exc}')
+
+    result['total_depreciation'] = float(total)
+    return result
+
+
+def net_book_values(corte: date) -> dict:
+    """
+    {asset_id: valor neto} de los activos en uso a la fecha de corte
+    (adquiridos hasta corte y sin baja anterior), según el cronograma:
+    valor neto tras la última cuota hasta el mes de corte; si todas sus
+    cuotas son posteriores, el valor antes de la primera; sin cuotas, el
+    valor neto actual del activo.
+    """
+    from sqlalchemy import and_, func, or_
+    from app.extensions import db
+    from app.models.depreciation_schedule import DepreciationSchedule as DS
+    from app.models.fixed_asset import FixedAsset
+
+    assets = FixedAsset.query.filter(
+        FixedAsset.acquisition_date <= corte,
+        or_(FixedAsset.status != 'baja', FixedAsset.baja_date.is_(None),
+            FixedAsset.baja_date > corte),
+    ).all()
+    if not assets:
+        return {}
+    ids = [a.id for a in assets]
+    key = _period_key(DS)
+
+    def _rows(agg, *filters):
+        sub = db.session.query(DS.asset_id, agg(key).label('k')).filter(
+            DS.asset_id.in_(ids), *filters).group_by(DS.asset_id).subquery()
+        return {r.asset_id: r for r in db.session.query(
+            DS.asset_id, DS.amount, DS.net_book_value,
+        ).join(sub, and_(sub.c.asset_id == DS.asset_id, sub.c.k == key)).all()}
+
+    hasta   = _rows(func.max, key <= month_index(corte.year, corte.month))
+    primera = _rows(func.min)
+
+    out = {}
+    for a in assets:
+        if a.id in hasta:
+            out[a.id] = Decimal(str(hasta[a.id].net_book_value))
+        elif a.id in primera:
+            r = primera[a.id]
+            out[a.id] = Decimal(str(r.net_book_value)) + Decimal(str(r.amount))
+        else:
+            out[a.id] = a.net_book_value
+    return out
+
+
+def projection(year: int, month: int, months: int = 12) -> list:
+    """
+    Gasto de depreciación programado desde (year, month) por `months` meses:
+    [{'year', 'month', 'deprec_account', 'amount', 'activos', 'contabilizado'}].
+    """
+    from sqlalchemy import func
+    from app.extensions import db
+    from app.models.depreciation_schedule import DepreciationSchedule as DS
+
+    desde = month_index(year, month)
+    key   = _period_key(DS)
+    rows = db.session.query(
+        DS.year, DS.month, DS.deprec_account,
+        func.sum(DS.amount).label('amount'),
+        func.count(DS.id).label('activos'),
+        func.count(DS.posted_at).label('contabilizadas'),
+    ).filter(key >= desde, key < desde + months).group_by(
+        DS.year, DS.month, DS.deprec_account,
+    ).order_by(DS.year, DS.month, DS.deprec_account).all()
+    return [{
+        'year':           r.year,
+        'month':          r.month,
+        'deprec_account': r.deprec_account,
+        'amount':         float(r.amount or 0),
+        'activos':        r.activos,
+        'contabilizado':  r.contabilizadas == r.activos,
+    } for r in rows]
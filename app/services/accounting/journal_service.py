@@ -12,6 +12,7 @@ Principio de aislamiento:
   - Un fallo contable NO afecta el flujo de la operación
 """
 import logging
+import uuid
 from datetime import date as date_type
 from app.utils.formatters import now_peru
 from decimal import Decimal
@@ -20,6 +21,10 @@ from app.extensions import db
 
 logger = logging.getLogger(__name__)
 
+# Partida doble: |DEBE − HABER| tolerado por redondeo. Única definición: la
+# importan bulk_journal y audit/reconciliation para que los chequeos no diverjan
+TOLERANCIA_ASIENTO = Decimal('0.01')
+
 # ── Mapeo banco → código PCGE ─────────────────────────────────────────────────
 # QoriCash solo tiene cuentas en BCP, INTERBANK y BANBIF.
 # Cualquier banco externo (BBVA, Scotiabank, etc.) se opera vía transferencia
@@ -141,9 +146,11 @@ class JournalService:
     def close_period(year: int, month: int, user_id: int):
         """
         Cierra un período contable. Un período cerrado no acepta nuevos asientos.
+        Materializa los saldos de cierre por cuenta (arrastre al período siguiente).
         Retorna (success: bool, message: str)
         """
         from app.models.accounting_period import AccountingPeriod
+        from app.services.accounting.period_balances import PeriodBalanceService
 
         period = AccountingPeriod.query.filter_by(year=year, month=month).first()
         if not period:
@@ -154,6 +161,14 @@ class JournalService:
         period.status = 'cerrado'
         period.closed_at = now_peru()
         period.closed_by = user_id
+        db.session.flush()
+
+        try:
+            with db.session.begin_nested():
+                PeriodBalanceService.snapshot_closed_chain(year, month)
+        except Exception as exc:
+            logger.error(f'[Accounting] Saldos de cierre {year}/{month:02d} no materializados: {exc}')
+
         db.session.commit()
         logger.info(f'[Accounting] Período cerrado: {year}/{month:02d} por user_id={user_id}')
         return True, f'Período {period.label} cerrado correctamente'
@@ -184,6 +199,56 @@ class JournalService:
         db.session.flush()
         return f'AS-{year}-{seq.last_number:04d}'
 
+    @staticmethod
+    def provisional_entry_number() -> str:
+        """Número temporal único (TMP-…) hasta assign_entry_number()."""
+        return f'TMP-{uuid.uuid4().hex[:16]}'
+
+    @staticmethod
+    def assign_entry_number(entry) -> str:
+        """
+        Asigna el número definitivo AS-YYYY-NNNN a un asiento creado con
+        provisional_entry_number(). Debe ser el último paso antes del commit:
+        el lock sobre JournalSequence queda retenido solo entre esta llamada y
+        el commit, no durante toda la transacción que arma el asiento. Un
+        rollback libera el número, así que la numeración sigue sin huecos.
+        """
+        entry.entry_number = JournalService._next_entry_number(entry.entry_date.year)
+        db.session.flush()
+        return entry.entry_number
+
+    @staticmethod
+    def _number_at_commit() -> bool:
+        from flask import current_app, has_app_context
+        return not has_app_context() or current_app.config.get('JOURNAL_NUMBER_AT_COMMIT', True)
+
+    @staticmethod
+    def _reserve_entry_numbers(year: int, count: int) -> list:
+        """
+        Reserva un bloque de `count` números consecutivos (AS-YYYY-NNNN) con un
+        único SELECT FOR UPDATE sobre JournalSequence. Pensado para cargas
+        masivas: el caller debe usar todos los números en la misma transacción.
+        """
+        from app.models.journal_sequence import JournalSequence
+
+        if count <= 0:
+            return []
+        seq = (
+            db.session.query(JournalSequence)
+            .filter_by(year=year)
+            .with_for_update()
+            .first()
+        )
+        if not seq:
+            seq = JournalSequence(year=year, last_number=0)
+            db.session.add(seq)
+            db.session.flush()
+
+        first = seq.last_number + 1
+        seq.last_number += count
+        db.session.flush()
+        return [f'AS-{year}-{n:04d}' for n in range(first, first + count)]
+
     # ── Creación de asiento ───────────────────────────────────────────────────
 
     @staticmethod
@@ -238,7 +303,18 @@ class JournalService:
             total_debe  = sum(_safe_decimal(l.get('debe',  0)) for l in lines)
             total_haber = sum(_safe_decimal(l.get('haber', 0)) for l in lines)
 
-            entry_number = JournalService._next_entry_number(entry_date.year)
+            if not lines or abs(total_debe - total_haber) > TOLERANCIA_ASIENTO:
+                logger.error(
+                    f'[Accounting] ❌ Asiento "{entry_type}" descuadrado '
+                    f'(D:{total_debe} H:{total_haber}, {len(lines)} líneas) — no registrado'
+                )
+                return None
+
+            # Número definitivo al final (ver assign_entry_number); con
+            # JOURNAL_NUMBER_AT_COMMIT=false se numera aquí, como antes.
+            at_commit = JournalService._number_at_commit()
+            entry_number = (JournalService.provisional_entry_number() if at_commit
+                            else JournalService._next_entry_number(entry_date.year))
 
             entry = JournalEntry(
                 entry_number=entry_number,
@@ -270,6 +346,18 @@ class JournalService:
                 )
                 db.session.add(jel)
 
+            db.session.flush()
+            JournalService._verify_entry_totals(entry.id)
+
+            # Cierre diario: gastos 6xxx del día (misma transacción que el asiento)
+            from app.services.closure_accumulator import ClosureAccumulator
+            ClosureAccumulator.apply_expenses(entry_date, lines)
+            # Totales por cuenta del período (Estado de Resultados / Balance)
+            from app.services.accounting.account_totals import AccountTotalsService
+            AccountTotalsService.apply_lines(entry_date, entry_type, lines)
+
+            if at_commit:
+                entry_number = JournalService.assign_entry_number(entry)
             db.session.commit()
             logger.info(
                 f'[Accounting] ✅ Asiento {entry_number} | {entry_type} | '
@@ -282,6 +370,36 @@ class JournalService:
             logger.error(f'[Accounting] ❌ Error al crear asiento ({entry_type}): {exc}')
             return None
 
+    @staticmethod
+    def _verify_entry_totals(entry_id: int):
+        """
+        Chequeo diferido de partida doble (equivale a un constraint trigger
+        DEFERRABLE INITIALLY DEFERRED): ya insertadas las líneas y antes del
+        commit, la cabecera debe coincidir con Σ debe / Σ haber de sus líneas
+        y estas deben cuadrar. Una sola consulta agregada; lanza ValueError
+        para que create_entry haga rollback.
+        """
+        from sqlalchemy import func
+        from app.models.journal_entry import JournalEntry
+        from app.models.journal_entry_line import JournalEntryLine
+
+        row = db.session.query(
+            JournalEntry.total_debe, JournalEntry.total_haber,
+            func.coalesce(func.sum(JournalEntryLine.debe), 0),
+            func.coalesce(func.sum(JournalEntryLine.haber), 0),
+        ).outerjoin(
+            JournalEntryLine, JournalEntryLine.journal_entry_id == JournalEntry.id
+        ).filter(JournalEntry.id == entry_id).group_by(JournalEntry.id).one()
+
+        td, th, ld, lh = (_safe_decimal(v) for v in row)
+        if (abs(ld - lh) > TOLERANCIA_ASIENTO or
+                abs(td - ld) > TOLERANCIA_ASIENTO or
+                abs(th - lh) > TOLERANCIA_ASIENTO):
+            raise ValueError(
+                f'partida doble inconsistente: cabecera D:{td} H:{th} '
+                f'vs líneas D:{ld} H:{lh}'
+            )
+
     # ── Hook automático: operación completada ─────────────────────────────────
 
     @staticmethod
@@ -308,158 +426,18 @@ class JournalService:
         Retorna: JournalEntry | None  — NUNCA lanza excepciones.
         """
         try:
-            amount_pen = _safe_decimal(operation.amount_pen)
-            amount_usd = _safe_decimal(operation.amount_usd)
-            tc         = _safe_decimal(operation.exchange_rate)
-
-            if amount_pen <= 0:
-                logger.warning(
-                    f'[Accounting] Op {operation.operation_id}: amount_pen=0, asiento omitido'
-                )
+            spec = JournalService.build_operation_entry(operation)
+            if spec is None:
                 return None
 
-            client      = operation.client
-            client_name = (client.full_name or client.razon_social or client.dni
-                           ) if client else 'Cliente'
-            op_type     = operation.operation_type   # 'Compra' | 'Venta'
-            op_id       = operation.operation_id
-
-            deposits = operation.client_deposits or []   # [{importe, cuenta_cargo, ...}]
-            payments = operation.client_payments or []   # [{importe, cuenta_destino, ...}]
-
-            lines = []
-
-            # ── Función interna: DEBE lines ───────────────────────────────
-            def _debe_lines(items, account_key, currency_in):
-                """
-                Crea líneas DEBE distribuyendo amount_pen entre los ítems.
-                currency_in: 'PEN' o 'USD' (determina el código PCGE a usar).
-                Prioriza qc_bank (banco QoriCash usado) sobre la cuenta del cliente
-                para determinar el código PCGE correcto.
-                """
-                pen_parts = _distribute_pen(items, amount_pen)
-                result = []
-                for item, pen_amt in zip(items, pen_parts):
-                    if pen_amt <= 0:
-                        continue
-                    acct_num = item.get(account_key, '')
-                    # qc_bank = banco de QoriCash que recibió/pagó; tiene prioridad sobre
-                    # la cuenta del cliente para elegir el código PCGE correcto.
-                    qc_bank  = item.get('qc_bank') or ''
-                    bank     = qc_bank or _bank_from_client_accounts(client, acct_num)
-                    pcge     = _map_bank(bank or acct_num, currency_in)
-                    usd_amt  = (pen_amt / tc).quantize(Decimal('0.01')) if tc > 0 else Decimal('0')
-                    result.append({
-                        'account_code': pcge,
-                        'description':  f'Ingreso {currency_in} – {op_id}',
-                        'debe':         pen_amt,
-                        'haber':        Decimal('0'),
-                        'currency':     currency_in,
-                        **(({'amount_usd': usd_amt, 'exchange_rate': tc})
-                           if currency_in == 'USD' else {}),
-                    })
-                return result
-
-            # ── Función interna: HABER lines ──────────────────────────────
-            def _haber_lines(items, account_key, currency_out):
-                pen_parts = _distribute_pen(items, amount_pen)
-                result = []
-                for item, pen_amt in zip(items, pen_parts):
-                    if pen_amt <= 0:
-                        continue
-                    acct_num = item.get(account_key, '')
-                    qc_bank  = item.get('qc_bank') or ''
-                    bank     = qc_bank or _bank_from_client_accounts(client, acct_num)
-                    pcge     = _map_bank(bank or acct_num, currency_out)
-                    usd_amt  = (pen_amt / tc).quantize(Decimal('0.01')) if tc > 0 else Decimal('0')
-                    result.append({
-                        'account_code': pcge,
-                        'description':  f'Egreso {currency_out} – {op_id}',
-                        'debe':         Decimal('0'),
-                        'haber':        pen_amt,
-                        'currency':     currency_out,
-                        **(({'amount_usd': usd_amt, 'exchange_rate': tc})
-                           if currency_out == 'USD' else {}),
-                    })
-                return result
-
-            if op_type == 'Compra':
-                # COMPRA = QoriCash compra USD (recibe USD, entrega PEN)
-                # ── DEBE: USD que ingresaron a QoriCash (cliente abona USD) ──
-                if deposits:
-                    lines += _debe_lines(deposits, 'cuenta_cargo', 'USD')
-                else:
-                    bank    = _bank_from_client_accounts(client, operation.source_account)
-                    qc_bank = getattr(operation, 'source_bank_name', None)
-                    pcge    = _map_bank(qc_bank or bank or operation.source_account, 'USD')
-                    lines.append({'account_code': pcge,
-                                  'description':  f'Ingreso USD – {op_id}',
-                                  'debe': amount_pen, 'haber': Decimal('0'),
-                                  'currency': 'USD',
-                                  'amount_usd': amount_usd, 'exchange_rate': tc})
-
-                # ── HABER: PEN que salieron de QoriCash (QoriCash paga PEN) ─
-                if payments:
-                    lines += _haber_lines(payments, 'cuenta_destino', 'PEN')
-                else:
-                    bank = _bank_from_client_accounts(client, operation.destination_account)
-                    pcge = _map_bank(bank or operation.destination_account, 'PEN')
-                    lines.append({'account_code': pcge,
-                                  'description':  f'Egreso PEN – {op_id}',
-                                  'debe': Decimal('0'), 'haber': amount_pen,
-                                  'currency': 'PEN'})
-
-                description = f'Compra USD – {op_id} – {client_name}'
-
-            else:  # VENTA
-                # VENTA = QoriCash vende USD (entrega USD, recibe PEN)
-                # ── DEBE: PEN que ingresaron a QoriCash (cliente abona PEN) ──
-                if deposits:
-                    lines += _debe_lines(deposits, 'cuenta_cargo', 'PEN')
-                else:
-                    bank = _bank_from_client_accounts(client, operation.source_account)
-                    pcge = _map_bank(bank or operation.source_account, 'PEN')
-                    lines.append({'account_code': pcge,
-                                  'description':  f'Ingreso PEN – {op_id}',
-                                  'debe': amount_pen, 'haber': Decimal('0'),
-                                  'currency': 'PEN'})
-
-                # ── HABER: USD que salieron de QoriCash (QoriCash paga USD) ─
-                if payments:
-                    lines += _haber_lines(payments, 'cuenta_destino', 'USD')
-                else:
-                    bank    = _bank_from_client_accounts(client, operation.destination_account)
-                    pcge    = _map_bank(bank or operation.destination_account, 'USD')
-                    usd_amt = (amount_pen / tc).quantize(Decimal('0.01')) if tc > 0 else amount_usd
-                    lines.append({'account_code': pcge,
-                                  'description':  f'Egreso USD – {op_id}',
-                                  'debe': Decimal('0'), 'haber': amount_pen,
-                                  'currency': 'USD',
-                                  'amount_usd': usd_amt, 'exchange_rate': tc})
-
-                description = f'Venta USD – {op_id} – {client_name}'
-
-            entry_date = (
-                operation.completed_at.date()
-                if operation.completed_at
-                else date_type.today()
-            )
-
+            lines = spec['lines']
             logger.info(
-                f'[Accounting] Op {op_id} ({op_type}): '
+                f'[Accounting] Op {operation.operation_id} ({operation.operation_type}): '
                 f'{len([l for l in lines if l["debe"]>0])} líneas DEBE, '
                 f'{len([l for l in lines if l["haber"]>0])} líneas HABER'
             )
 
-            return JournalService.create_entry(
-                entry_type='operacion_completada',
-                description=description,
-                lines=lines,
-                source_type='operation',
-                source_id=operation.id,
-                entry_date=entry_date,
-                created_by=created_by_id,
-            )
+            return JournalService.create_entry(created_by=created_by_id, **spec)
 
         except Exception as exc:
             logger.error(
@@ -467,3 +445,160 @@ class JournalService:
                 f'(op={getattr(operation, "operation_id", "?")}): {exc}'
             )
             return None
+
+    @staticmethod
+    def build_operation_entry(operation):
+        """
+        Arma en memoria el asiento de una operación Completada (ver
+        create_entry_for_completed_operation) sin tocar la base.
+
+        Retorna dict con los argumentos de create_entry (entry_type,
+        description, lines, source_type, source_id, entry_date) o None si
+        la operación no genera asiento (amount_pen = 0). Puede lanzar
+        excepciones: los callers las aíslan.
+        """
+        amount_pen = _safe_decimal(operation.amount_pen)
+        amount_usd = _safe_decimal(operation.amount_usd)
+        tc         = _safe_decimal(operation.exchange_rate)
+
+        if amount_pen <= 0:
+            logger.warning(
+                f'[Accounting] Op {operation.operation_id}: amount_pen=0, asiento omitido'
+            )
+            return None
+
+        client      = operation.client
+        client_name = (client.full_name or client.razon_social or client.dni
+                       ) if client else 'Cliente'
+        op_type     = operation.operation_type   # 'Compra' | 'Venta'
+        op_id       = operation.operation_id
+
+        deposits = operation.client_deposits or []   # [{importe, cuenta_cargo, ...}]
+        payments = operation.client_payments or []   # [{importe, cuenta_destino, ...}]
+
+        lines = []
+
+        # ── Función interna: DEBE lines ───────────────────────────────
+        def _debe_lines(items, account_key, currency_in):
+            """
+            Crea líneas DEBE distribuyendo amount_pen entre los ítems.
+            currency_in: 'PEN' o 'USD' (determina el código PCGE a usar).
+            Prioriza qc_bank (banco QoriCash usado) sobre la cuenta del cliente
+            para determinar el código PCGE correcto.
+            """
+            pen_parts = _distribute_pen(items, amount_pen)
+            result = []
+            for item, pen_amt in zip(items, pen_parts):
+                if pen_amt <= 0:
+                    continue
+                acct_num = item.get(account_key, '')
+                # qc_bank = banco de QoriCash que recibió/pagó; tiene prioridad sobre
+                # la cuenta del cliente para elegir el código PCGE correcto.
+                qc_bank  = item.get('qc_bank') or ''
+                bank     = qc_bank or _bank_from_client_accounts(client, acct_num)
+                pcge     = _map_bank(bank or acct_num, currency_in)
+                usd_amt  = (pen_amt / tc).quantize(Decimal('0.01')) if tc > 0 else Decimal('0')
+                result.append({
+                    'account_code': pcge,
+                    'description':  f'Ingreso {currency_in} – {op_id}',
+                    'debe':         pen_amt,
+                    'haber':        Decimal('0'),
+                    'currency':     currency_in,
+                    **(({'amount_usd': usd_amt, 'exchange_rate': tc})
+                       if currency_in == 'USD' else {}),
+                })
+            return result
+
+        # ── Función interna: HABER lines ──────────────────────────────
+        def _haber_lines(items, account_key, currency_out):
+            pen_parts = _distribute_pen(items, amount_pen)
+            result = []
+            for item, pen_amt in zip(items, pen_parts):
+                if pen_amt <= 0:
+                    continue
+                acct_num = item.get(account_key, '')
+                qc_bank  = item.get('qc_bank') or ''
+                bank     = qc_bank or _bank_from_client_accounts(client, acct_num)
+                pcge     = _map_bank(bank or acct_num, currency_out)
+                usd_amt  = (pen_amt / tc).quantize(Decimal('0.01')) if tc > 0 else Decimal('0')
+                result.append({
+                    'account_code': pcge,
+                    'description':  f'Egreso {currency_out} – {op_id}',
+                    'debe':         Decimal('0'),
+                    'haber':        pen_amt,
+                    'currency':     currency_out,
+                    **(({'amount_usd': usd_amt, 'exchange_rate': tc})
+                       if currency_out == 'USD' else {}),
+                })
+            return result
+
+        if op_type == 'Compra':
+            # COMPRA = QoriCash compra USD (recibe USD, entrega PEN)
+            # ── DEBE: USD que ingresaron a QoriCash (cliente abona USD) ──
+            if deposits:
+                lines += _debe_lines(deposits, 'cuenta_cargo', 'USD')
+            else:
+                bank    = _bank_from_client_accounts(client, operation.source_account)
+                qc_bank = getattr(operation, 'source_bank_name', None)
+                pcge    = _map_bank(qc_bank or bank or operation.source_account, 'USD')
+                lines.append({'account_code': pcge,
+                              'description':  f'Ingreso USD – {op_id}',
+                              'debe': amount_pen, 'haber': Decimal('0'),
+                              'currency': 'USD',
+                              'amount_usd': amount_usd, 'exchange_rate': tc})
+
+            # ── HABER: PEN que salieron de QoriCash (QoriCash paga PEN) ─
+            if payments:
+                lines += _haber_lines(payments, 'cuenta_destino', 'PEN')
+            else:
+                bank = _bank_from_client_accounts(client, operation.destination_account)
+                pcge = _map_bank(bank or operation.destination_account, 'PEN')
+                lines.append({'account_code': pcge,
+                              'description':  f'Egreso PEN – {op_id}',
+                              'debe': Decimal('0'), 'haber': amount_pen,
+                              'currency': 'PEN'})
+
+            description = f'Compra USD – {op_id} – {client_name}'
+
+        else:  # VENTA
+            # VENTA = QoriCash vende USD (entrega USD, recibe PEN)
+            # ── DEBE: PEN que ingresaron a QoriCash (cliente abona PEN) ──
+            if deposits:
+                lines += _debe_lines(deposits, 'cuenta_cargo', 'PEN')
+            else:
+                bank = _bank_from_client_accounts(client, operation.source_account)
+                pcge = _map_bank(bank or operation.source_account, 'PEN')
+                lines.append({'account_code': pcge,
+                              'description':  f'Ingreso PEN – {op_id}',
+                              'debe': amount_pen, 'haber': Decimal('0'),
+                              'currency': 'PEN'})
+
+            # ── HABER: USD que salieron de QoriCash (QoriCash paga USD) ─
+            if payments:
+                lines += _haber_lines(payments, 'cuenta_destino', 'USD')
+            else:
+                bank    = _bank_from_client_accounts(client, operation.destination_account)
+                pcge    = _map_bank(bank or operation.destination_account, 'USD')
+                usd_amt = (amount_pen / tc).quantize(Decimal('0.01')) if tc > 0 else amount_usd
+                lines.append({'account_code': pcge,
+                              'description':  f'Egreso USD – {op_id}',
+                              'debe': Decimal('0'), 'haber': amount_pen,
+                              'currency': 'USD',
+                              'amount_usd': usd_amt, 'exchange_rate': tc})
+
+            description = f'Venta USD – {op_id} – {client_name}'
+
+        entry_date = (
+            operation.completed_at.date()
+            if operation.completed_at
+            else date_type.today()
+        )
+
+        return {
+            'entry_type':  'operacion_completada',
+            'description': description,
+            'lines':       lines,
+            'source_type': 'operation',
+            'source_id':   operation.id,
+            'entry_date':  entry_date,
+        }
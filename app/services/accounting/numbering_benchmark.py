@@ -0,0 +1,151 @@
+"""
+Benchmark de numeración del Libro Diario
+=========================================
+Mide cuántos asientos por segundo se registran cuando N hilos completan
+"operaciones" a la vez (JournalService.create_entry con las líneas de una
+operación: DEBE 1044 / HABER 1041), con los dos modos de numeración:
+
+  inicio   JOURNAL_NUMBER_AT_COMMIT=false — SELECT FOR UPDATE de
+           JournalSequence al empezar; el lock se retiene durante INSERT de
+           cabecera, líneas, verificación de totales y cierre diario.
+  commit   JOURNAL_NUMBER_AT_COMMIT=true — número provisional y
+           assign_entry_number() justo antes del commit.
+
+Escribe en un año aislado (BENCH_YEAR: su propio período y fila de
+JournalSequence) y lo borra al terminar, así no consume números reales.
+Pensado para staging / local, no para producción.
+
+Uso CLI:
+  flask bench-journal-numbering --threads 8 --per-thread 25
+"""
+import logging
+import time
+from datetime import date
+from decimal import Decimal
+
+from app.extensions import db
+
+_log = logging.getLogger(__name__)
+
+BENCH_YEAR       = 2099
+BENCH_ENTRY_TYPE = 'bench_numeracion'
+
+
+def _lines(i: int) -> list:
+    pen = Decimal('3750.00') + i
+    return [
+        {'account_code': '1044', 'description': f'Ingreso USD – BENCH-{i}',
+         'debe': pen, 'haber': Decimal('0'), 'currency': 'USD',
+         'amount_usd': Decimal('1000.00'), 'exchange_rate': Decimal('3.7500')},
+        {'account_code': '1041', 'description': f'Egreso PEN – BENCH-{i}',
+         'debe': Decimal('0'), 'haber': pen, 'currency': 'PEN'},
+    ]
+
+
+def cleanup():
+    """Borra asientos, líneas, totales por período, secuencia y períodos del año de benchmark."""
+    from app.models.account_period_total import AccountPeriodTotal as APT
+    from app.models.accounting_period import AccountingPeriod
+    from app.models.journal_entry import JournalEntry as JE
+    from app.models.journal_entry_line import JournalEntryLine as JEL
+    from app.models.journal_sequence import JournalSequence
+    from app.utils.periods import in_year
+
+    ajenos = JE.query.filter(in_year(JE.entry_date, BENCH_YEAR),
+                             JE.entry_type != BENCH_ENTRY_TYPE).count()
+    if ajenos:
+        raise RuntimeError(f'{ajenos} asiento(s) reales en {BENCH_YEAR}; no se limpia')
+
+    ids = db.session.query(JE.id).filter(in_year(JE.entry_date, BENCH_YEAR))
+    JEL.query.filter(JEL.journal_entry_id.in_(ids.scalar_subquery())).delete(synchronize_session=False)
+    JE.query.filter(in_year(JE.entry_date, BENCH_YEAR)).delete(synchronize_session=False)
+    APT.query.filter_by(year=BENCH_YEAR).delete(synchronize_session=False)
+    JournalSequence.query.filter_by(year=BENCH_YEAR).delete(synchronize_session=False)
+    AccountingPeriod.query.filter_by(year=BENCH_YEAR).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def _prepare():
+    """Período y fila de secuencia creados antes (evita carreras al crearlos)."""
+    from app.models.journal_sequence import JournalSequence
+    from app.services.accounting.journal_service import JournalService
+
+    JournalService.get_or_create_period(date(BENCH_YEAR, 1, 15))
+    db.session.add(JournalSequence(year=BENCH_YEAR, last_number=0))
+    db.session.commit()
+
+
+def _run_mode(app, number_at_commit: bool, threads: int, per_thread: int) -> dict:
+    from concurrent.futures import ThreadPoolExecutor
+    from app.services.accounting.journal_service import JournalService
+
+    app.config['JOURNAL_NUMBER_AT_COMMIT'] = number_at_commit
+    fecha = date(BENCH_YEAR, 1, 15)
+
+    def _worker(t):
+        ok, lat = 0, []
+        with app.app_context():
+            try:
+                for k in range(per_thread):
+                    t0 = time.perf_counter()
+                    entry = JournalService.create_entry(
+                        entry_type=BENCH_ENTRY_TYPE,
+                        description=f'Benchmark numeración {t}-{k}',
+                        lines=_lines(t * per_thread + k),
+                        source_type='manual',
+                        entry_date=fecha,
+                    )
+                    lat.append((time.perf_counter() - t0) * 1000)
+                    ok += entry is not None
+            finally:
+                db.session.remove()
+        return ok, lat
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(_worker, range(threads)))
+    elapsed = time.perf_counter() - t0
+
+    lat = sorted(x for _, l in results for x in l)
+    ok  = sum(n for n, _ in results)
+    return {
+        'modo':          'commit' if number_at_commit else 'inicio',
+        'asientos':      ok,
+        'segundos':      round(elapsed, 3),
+        'asientos_seg':  round(ok / elapsed, 1) if elapsed else 0,
+        'p50_ms':        round(lat[len(lat) // 2], 1) if lat else 0,
+        'p95_ms':        round(lat[int(len(lat) * 0.95) - 1], 1) if lat else 0,
+    }
+
+
+def run_numbering_benchmark(app, threads: int = 8, per_thread: int = 25) -> dict:
+    """
+    Corre ambos modos (inicio, luego commit) y verifica que la numeración
+    quede sin huecos ni duplicados. Restaura JOURNAL_NUMBER_AT_COMMIT y
+    limpia el año de benchmark aunque falle.
+
+    Returns: {'inicio': {...}, 'commit': {...}, 'speedup', 'sin_huecos'}
+    """
+    from app.models.journal_entry import JournalEntry as JE
+    from app.utils.periods import in_year
+
+    original = app.config.get('JOURNAL_NUMBER_AT_COMMIT', True)
+    cleanup()
+    try:
+        _prepare()
+        antes   = _run_mode(app, False, threads, per_thread)
+        despues = _run_mode(app, True,  threads, per_thread)
+
+        numeros = [n for (n,) in db.session.query(JE.entry_number).filter(
+            in_year(JE.entry_date, BENCH_YEAR)).all()]
+        seq = sorted(int(n.rsplit('-', 1)[1]) for n in numeros if n.startswith('AS-'))
+        sin_huecos = (len(seq) == len(numeros) and seq == list(range(1, len(seq) + 1)))
+    finally:
+        app.config['JOURNAL_NUMBER_AT_COMMIT'] = original
+        db.session.rollback()
+        cleanup()
+
+    speedup = round(despues['asientos_seg'] / antes['asientos_seg'], 2) if antes['asientos_seg'] else None
+    _log.info(f'[NumberingBench] inicio={antes["asientos_seg"]}/s commit={despues["asientos_seg"]}/s '
+              f'speedup={speedup} sin_huecos={sin_huecos}')
+    return {'inicio': antes, 'commit': despues, 'speedup': speedup, 'sin_huecos': sin_huecos}
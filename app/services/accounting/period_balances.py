@@ -0,0 +1,215 @@
+"""
+PeriodBalanceService — Saldos de cierre por cuenta (arrastre entre períodos)
+=============================================================================
+Libro Mayor, Balance de Comprobación y Caja y Bancos necesitan el saldo de
+cada cuenta al inicio del período. Antes se calculaba con un SUM por cuenta
+sobre todo el Libro Diario anterior al período; ahora:
+
+  - close_period escribe AccountPeriodBalance (acumulado al cierre) para el
+    período y para los siguientes ya cerrados que queden encadenados.
+  - reabrir un período borra sus saldos y los de todos los posteriores.
+  - opening_balances(year, month) lee el cierre del mes anterior por clave.
+    Si no existe, parte del último cierre disponible y suma, en UNA consulta
+    agrupada, solo lo registrado entre ese cierre y el inicio del período.
+
+Un período solo se materializa si no hay períodos abiertos anteriores a él:
+mientras un mes previo acepte asientos, su acumulado podría cambiar.
+"""
+import logging
+from calendar import monthrange
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, case
+
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+_ZERO = Decimal('0')
+
+
+def _key(year: int, month: int) -> int:
+    return year * 100 + month
+
+
+def _prev_month(year: int, month: int):
+    return (year - 1, 12) if month == 1 else (year, month - 1)
+
+
+def _next_month(year: int, month: int):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _empty() -> dict:
+    return {'debe': _ZERO, 'haber': _ZERO, 'debe_usd': _ZERO, 'haber_usd': _ZERO}
+
+
+class PeriodBalanceService:
+    """Métodos estáticos — no requiere instancia."""
+
+    # ── Lectura ───────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _journal_totals(date_from=None, date_to=None, codes=None) -> dict:
+        """
+        {account_code: {debe, haber, debe_usd, haber_usd}} de asientos activos
+        con date_from <= entry_date < date_to, en una sola consulta agrupada.
+        """
+        from app.models.journal_entry import JournalEntry
+        from app.models.journal_entry_line import JournalEntryLine as JEL
+
+        q = db.session.query(
+            JEL.account_code,
+            func.sum(JEL.debe).label('d'),
+            func.sum(JEL.haber).label('h'),
+            func.sum(case((JEL.debe  > 0, JEL.amount_usd), else_=0)).label('d_usd'),
+            func.sum(case((JEL.haber > 0, JEL.amount_usd), else_=0)).label('h_usd'),
+        ).join(
+            JournalEntry, JEL.journal_entry_id == JournalEntry.id
+        ).filter(JournalEntry.status == 'activo')
+
+        if date_from is not None:
+            q = q.filter(JournalEntry.entry_date >= date_from)
+        if date_to is not None:
+            q = q.filter(JournalEntry.entry_date < date_to)
+        if codes is not None:
+            q = q.filter(JEL.account_code.in_(list(codes)))
+
+        return {
+            r.account_code: {
+                'debe':      Decimal(str(r.d     or 0)),
+                'haber':     Decimal(str(r.h     or 0)),
+                'debe_usd':  Decimal(str(r.d_usd or 0)),
+                'haber_usd': Decimal(str(r.h_usd or 0)),
+            }
+            for r in q.group_by(JEL.account_code).all()
+        }
+
+    @staticmethod
+    def _latest_snapshot_before(year: int, month: int):
+        """(year, month) del último cierre materializado anterior al período, o None."""
+        from app.models.account_period_balance import AccountPeriodBalance as APB
+
+        k = db.session.query(func.max(APB.year * 100 + APB.month)).filter(
+            APB.year * 100 + APB.month < _key(year, month)
+        ).scalar()
+        return (k // 100, k % 100) if k else None
+
+    @staticmethod
+    def opening_balances(year: int, month: int, codes=None) -> dict:
+        """
+        Saldo acumulado por cuenta al inicio del período (todo lo anterior al día 1).
+        Retorna {account_code: {debe, haber, debe_usd, haber_usd}} (Decimal).
+        """
+        from app.models.account_period_balance import AccountPeriodBalance as APB
+
+        first_day = date(year, month, 1)
+        snap      = PeriodBalanceService._latest_snapshot_before(year, month)
+
+        result = {}
+        date_from = None
+        if snap:
+            q = APB.query.filter_by(year=snap[0], month=snap[1])
+            if codes is not None:
+                q = q.filter(APB.account_code.in_(list(codes)))
+            for r in q.all():
+                result[r.account_code] = {
+                    'debe':      Decimal(str(r.debe      or 0)),
+                    'haber':     Decimal(str(r.haber     or 0)),
+                    'debe_usd':  Decimal(str(r.debe_usd  or 0)),
+                    'haber_usd': Decimal(str(r.haber_usd or 0)),
+                }
+            if snap == _prev_month(year, month):
+                return result
+            ny, nm    = _next_month(*snap)
+            date_from = date(ny, nm, 1)
+
+        gap = PeriodBalanceService._journal_totals(date_from, first_day, codes)
+        for code, t in gap.items():
+            acc = result.setdefault(code, _empty())
+            for k in acc:
+                acc[k] += t[k]
+        return result
+
+    @staticmethod
+    def opening_saldo(openings: dict, code: str, usd: bool = False) -> Decimal:
+        """Saldo neto (debe − haber) de una cuenta a partir de opening_balances()."""
+        o = openings.get(code)
+        if not o:
+            return _ZERO
+        return (o['debe_usd'] - o['haber_usd']) if usd else (o['debe'] - o['haber'])
+
+    # ── Escritura ─────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _has_open_period_before(year: int, month: int) -> bool:
+        from app.models.accounting_period import AccountingPeriod
+
+        return db.session.query(AccountingPeriod.id).filter(
+            AccountingPeriod.year * 100 + AccountingPeriod.month < _key(year, month),
+            AccountingPeriod.status != 'cerrado',
+        ).first() is not None
+
+    @staticmethod
+    def snapshot_period(year: int, month: int) -> int:
+        """
+        Materializa el acumulado al cierre de (year, month). No hace commit.
+        Retorna el número de cuentas escritas (0 si hay un período previo abierto).
+        """
+        from app.models.account_period_balance import AccountPeriodBalance as APB
+
+        if PeriodBalanceService._has_open_period_before(year, month):
+            logger.info(
+                f'[Accounting] Saldos de cierre {year}/{month:02d} no materializados '
+                f'— hay períodos anteriores abiertos'
+            )
+            return 0
+
+        closing = PeriodBalanceService.opening_balances(year, month)
+        last_day = date(year, month, monthrange(year, month)[1])
+        period_totals = PeriodBalanceService._journal_totals(
+            date(year, month, 1), last_day + timedelta(days=1)
+        )
+        for code, t in period_totals.items():
+            acc = closing.setdefault(code, _empty())
+            for k in acc:
+                acc[k] += t[k]
+
+        APB.query.filter_by(year=year, month=month).delete(synchronize_session=False)
+        db.session.bulk_save_objects([
+            APB(year=year, month=month, account_code=code, **vals)
+            for code, vals in closing.items()
+        ])
+        db.session.flush()
+        return len(closing)
+
+    @staticmethod
+    def snapshot_closed_chain(year: int, month: int) -> int:
+        """
+        Materializa (year, month) y los períodos siguientes que ya estaban
+        cerrados (cierre fuera de orden). Se detiene en el primero abierto.
+        """
+        from app.models.accounting_period import AccountingPeriod
+
+        written = PeriodBalanceService.snapshot_period(year, month)
+        if not written and PeriodBalanceService._has_open_period_before(year, month):
+            return 0
+
+        y, m = _next_month(year, month)
+        while True:
+            nxt = AccountingPeriod.query.filter_by(year=y, month=m).first()
+            if not nxt or nxt.status != 'cerrado':
+                break
+            written += PeriodBalanceService.snapshot_period(y, m)
+            y, m = _next_month(y, m)
+        return written
+
+    @staticmethod
+    def invalidate_from(year: int, month: int) -> int:
+        """Borra los saldos de cierre de (year, month) en adelante. No hace commit."""
+        from app.models.account_period_balance import AccountPeriodBalance as APB
+
+        return APB.query.filter(
+            APB.year * 100 + APB.month >= _key(year, month)
+        ).delete(synchronize_session=False)
@@ -5,7 +5,9 @@ Maneja la lógica de amarres contables, neteo y reportes
 """
 from app.extensions import db
 from app.models import Operation, AccountingMatch, AccountingBatch, Client
+from app.services.closure_accumulator import ClosureAccumulator
 from app.utils.formatters import now_peru
+from app.utils.periods import in_date_range
 from sqlalchemy import func, and_, or_
 from sqlalchemy.orm import joinedload
 from datetime import datetime, date
@@ -45,12 +47,12 @@ class AccountingService:
         if fecha_inicio:
             if isinstance(fecha_inicio, str):
                 fecha_inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-            query = query.filter(func.date(Operation.completed_at) >= fecha_inicio)
+            query = query.filter(in_date_range(Operation.completed_at, start=fecha_inicio))
 
         if fecha_fin:
             if isinstance(fecha_fin, str):
                 fecha_fin = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-            query = query.filter(func.date(Operation.completed_at) <= fecha_fin)
+            query = query.filter(in_date_range(Operation.completed_at, end=fecha_fin))
 
         return query.order_by(Operation.completed_at.desc()).all()
 
@@ -215,6 +217,7 @@ class AccountingService:
 
             # ── Actualizar TraderDailyProfit en tiempo real ───────────────────
             AccountingService._apply_trader_profits(match, reverse=False)
+            ClosureAccumulator.apply_match(match)
 
             db.session.commit()
 
@@ -268,6 +271,7 @@ class AccountingService:
 
             # Revertir TraderDailyProfit antes del commit
             AccountingService._apply_trader_profits(match, reverse=True)
+            ClosureAccumulator.apply_match(match, reverse=True)
 
             db.session.commit()
 
@@ -802,12 +806,12 @@ class AccountingService:
         if fecha_inicio:
             if isinstance(fecha_inicio, str):
                 fecha_inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-            operations = operations.filter(func.date(Operation.completed_at) >= fecha_inicio)
+            operations = operations.filter(in_date_range(Operation.completed_at, start=fecha_inicio))
 
         if fecha_fin:
             if isinstance(fecha_fin, str):
                 fecha_fin = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-            operations = operations.filter(func.date(Operation.completed_at) <= fecha_fin)
+            operations = operations.filter(in_date_range(Operation.completed_at, end=fecha_fin))
 
         results = []
         for op, buy_profit, sell_profit in operations.all():
@@ -942,11 +946,11 @@ class AccountingService:
         if fecha_inicio:
             if isinstance(fecha_inicio, str):
                 fecha_inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-            query = query.filter(func.date(AccountingMatch.created_at) >= fecha_inicio)
+            query = query.filter(in_date_range(AccountingMatch.created_at, start=fecha_inicio))
 
         if fecha_fin:
             if isinstance(fecha_fin, str):
                 fecha_fin = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-            query = query.filter(func.date(AccountingMatch.created_at) <= fecha_fin)
+            query = query.filter(in_date_range(AccountingMatch.created_at, end=fecha_fin))
 
         return query.order_by(AccountingMatch.created_at.desc()).all()
@@ -75,6 +75,7 @@ class AccountingAuditAgent(BaseAgent):
             trigger='agent',
             executed_by_id=None,
             auto_depreciate=True,
+            incremental=not force,
         )
         report = engine.run()
 
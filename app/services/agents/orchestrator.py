@@ -32,7 +32,6 @@ ALL_AGENTS = [
 ]
 
 _agent_map = {a.agent_id: a for a in ALL_AGENTS}
-_greenlets = {}  # agent_id → greenlet
 
 
 def _now():
@@ -59,7 +58,10 @@ def start_all_agents(app):
 
 
 def _spawn_agent(app, agent):
-    """Lanza el loop de un agente como greenlet con watchdog."""
+    """
+    Registra el loop de un agente como job del coordinador de schedulers:
+    corre en un solo worker y se respawnea si muere.
+    """
     def _loop():
         # Delay inicial escalonado para no saturar el arranque
         delay = {'lead_discovery': 60, 'data_quality': 90, 'mail_agent': 120,
@@ -88,17 +90,8 @@ def _spawn_agent(app, agent):
                 _log.error(f'[Agent] ❌ {agent.name} loop error: {e}\n{traceback.format_exc()}')
                 eventlet.sleep(60)
 
-    def _watchdog():
-        gt = eventlet.spawn(_loop)
-        _greenlets[agent.agent_id] = gt
-        while True:
-            eventlet.sleep(30)
-            if gt.dead:
-                _log.critical(f'[Watchdog] 🚨 {agent.name} murió — respawneando')
-                gt = eventlet.spawn(_loop)
-                _greenlets[agent.agent_id] = gt
-
-    eventlet.spawn(_watchdog)
+    from app.services.scheduler_coordinator import run_singleton
+    run_singleton(app, f'agent:{agent.agent_id}', _loop)
 
 
 # ── Control manual desde la UI ────────────────────────────────────────────────
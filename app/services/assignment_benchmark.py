@@ -0,0 +1,99 @@
+"""
+Benchmark de la asignación balanceada de operadores
+====================================================
+Compara, con N operadores activos, la asignación anterior contra la actual
+(app/services/operator_assignment.py):
+
+  anterior  SELECT de operadores + un COUNT(*) de 'En proceso' por operador
+            (1 + N consultas)
+  actual    una consulta: operadores LEFT JOIN conteo agrupado + última
+            operación asignada, y pick_operator() en memoria
+
+Si hay menos operadores reales que N, agrega operadores sintéticos dentro de
+una transacción que se revierte al final (nada queda grabado). Mide el mejor
+de `repeat` corridas y cuenta las consultas enviadas a la base.
+Pensado para staging / local.
+
+Uso CLI:
+  flask bench-operator-assignment --operators 5 --operators 25 --operators 100
+"""
+import time
+import uuid
+
+from sqlalchemy import and_, event
+
+from app.extensions import db
+from app.models.operation import Operation
+from app.models.user import User
+
+
+def _legacy_assign():
+    """Algoritmo anterior de OperationService.assign_operator_balanced (sin logs)."""
+    operators = User.query.filter(and_(User.role == 'Operador', User.status == 'Activo')).all()
+    if not operators:
+        return None
+    loads = {
+        op.id: Operation.query.filter(and_(Operation.assigned_operator_id == op.id,
+                                           Operation.status == 'En proceso')).count()
+        for op in operators
+    }
+    return min(loads, key=loads.get)
+
+
+def _current_assign():
+    from app.services.operator_assignment import operator_loads, pick_operator, load_capacity
+    rows = operator_loads()
+    return pick_operator([(op_id, load, last) for op_id, _, load, last in rows], load_capacity())
+
+
+def _measure(fn, repeat: int) -> dict:
+    statements = []
+
+    def _count(*_args, **_kwargs):
+        statements.append(1)
+
+    engine = db.session.get_bind()
+    event.listen(engine, 'before_cursor_execute', _count)
+    try:
+        best = None
+        for _ in range(repeat):
+            db.session.expire_all()
+            statements.clear()
+            t0 = time.perf_counter()
+            fn()
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+    finally:
+        event.remove(engine, 'before_cursor_execute', _count)
+    return {'ms': round(best * 1000, 2), 'consultas': len(statements)}
+
+
+def _add_synthetic_operators(n: int):
+    token = uuid.uuid4().hex[:6]
+    for i in range(n):
+        db.session.add(User(
+            username=f'bench_op_{token}_{i}', email=f'bench_op_{token}_{i}@bench.local',
+            password_hash='!', dni=f'B{token}{i}'[:20], role='Operador', status='Activo',
+        ))
+    db.session.flush()
+
+
+def run_assignment_benchmark(operators=(5, 25, 100), repeat: int = 20) -> list:
+    """[{operadores, anterior, actual, speedup}] para cada cantidad de operadores."""
+    results = []
+    try:
+        for target in sorted(operators):
+            real = User.query.filter(User.role == 'Operador', User.status == 'Activo').count()
+            if real < target:
+                _add_synthetic_operators(target - real)
+            legacy  = _measure(_legacy_assign, repeat)
+            current = _measure(_current_assign, repeat)
+            results.append({
+                'operadores': max(real, target),
+                'anterior': legacy,
+                'actual': current,
+                'speedup': round(legacy['ms'] / current['ms'], 1) if current['ms'] else None,
+            })
+    finally:
+        db.session.rollback()
+    return results
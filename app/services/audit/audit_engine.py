@@ -25,19 +25,73 @@ Módulos de validación:
   6. Cierre diario — validación apertura/cierre
   7. Integridad del período contable
   8. Estado de Resultados del período
+
+Ejecución:
+  a) Depreciación (5) primero y sola: es el único módulo que escribe, y sus
+     asientos deben entrar en partida doble y en el Estado de Resultados.
+  b) AuditPeriodData carga el período una sola vez (loaders en paralelo).
+  c) Los demás módulos corren en paralelo contra esos datos, cada uno sobre
+     su propio borrador; los borradores se aplican al reporte en el orden
+     1–8, así el orden de los hallazgos no depende de cuál termina primero.
+  Los tiempos de cada loader y de cada módulo quedan en AuditReport.timings.
+
+Modo incremental (cron / agente, incremental=True): se fusiona en el reporte
+del período y solo se lee lo cambiado desde la corrida anterior — ver
+incremental.py. Sin estado válido (primera corrida del mes, o la última
+completa tiene más de AUDIT_FULL_EVERY_DAYS) se hace una carga completa.
 """
 import logging
 import time
 from datetime import date, datetime
 from decimal import Decimal
+from functools import partial
+
+from flask import current_app
 
 from app.extensions import db
+from .period_data import AuditPeriodData, run_parallel, sin_comprobante as _sin_comprobante
 
 logger = logging.getLogger(__name__)
 
 # ── Constantes ────────────────────────────────────────────────────────────────
 DEMO_USERNAME = 'demo_trader'
 
+# (módulo, método, datos de AuditPeriodData que necesita) — en orden de reporte
+CHECKS = (
+    ('ops_sin_asiento',        '_check_ops_sin_asiento',        ('operations',)),
+    ('partida_doble',          '_check_partida_doble',          ('entries',)),
+    ('conciliacion',           '_check_conciliacion',           ('sumas_caja', 'bank_balances')),
+    ('gastos_sin_comprobante', '_check_gastos_sin_comprobante', ('expenses',)),
+    ('depreciacion',           '_check_y_depreciar',            None),   # escribe: va aparte
+    ('cierre_diario',          '_check_cierre_diario',          ('cierre',)),
+    ('integridad_periodo',     '_check_integridad_periodo',     ('periodo_exists', 'entries')),
+    ('estado_resultados',      '_calcular_estado_resultados',   ('line_totals',)),
+)
+
+
+class _ReportDraft:
+    """
+    Lo que un módulo escribe en el reporte (campos y hallazgos), para
+    aplicarlo después en orden fijo. Los módulos corren en paralelo y no
+    comparten el AuditReport.
+    """
+
+    def __init__(self):
+        self.__dict__['_fields']    = {}
+        self.__dict__['_hallazgos'] = []
+
+    def __setattr__(self, name, value):
+        self._fields[name] = value
+
+    def add_hallazgo(self, **kwargs):
+        self._hallazgos.append(kwargs)
+
+    def apply(self, report):
+        for name, value in self._fields.items():
+            setattr(report, name, value)
+        for h in self._hallazgos:
+            report.add_hallazgo(**h)
+
 
 class AuditEngine:
     """
@@ -49,13 +103,16 @@ class AuditEngine:
                  audit_date: date = None,
                  trigger: str = 'cron',
                  executed_by_id: int = None,
-                 auto_depreciate: bool = True):
+                 auto_depreciate: bool = True,
+                 incremental: bool = False):
         self.year          = year
         self.month         = month
         self.audit_date    = audit_date or date.today()
         self.trigger       = trigger
         self.executed_by   = executed_by_id
         self.auto_depreciate = auto_depreciate
+        # Fusiona en el reporte del período y evalúa solo lo nuevo (incremental.py)
+        self.incremental   = incremental
 
     # ─────────────────────────────────────────────────────────────────────────
     # Punto de entrada principal
@@ -66,85 +123,123 @@ class AuditEngine:
         Ejecuta la auditoría completa y persiste el AuditReport.
         Retorna la instancia de AuditReport guardada.
         """
-        from app.models.audit_report import (
-            AuditReport, ESTADO_APROBADO,
-            SEVERIDAD_INFO, SEVERIDAD_ALERTA, SEVERIDAD_CRITICO,
-        )
-        from app.models.accounting_period import AccountingPeriod
+        from app.models.audit_report import AuditReport, ESTADO_APROBADO, SEVERIDAD_INFO
+        from . import incremental as inc
 
         start = time.time()
         logger.info(
             f'[AuditEngine] 🔍 Iniciando auditoría {self.year}/{self.month:02d} '
             f'trigger={self.trigger}'
         )
-
-        periodo = AccountingPeriod.query.filter_by(
-            year=self.year, month=self.month
-        ).first()
+        app     = current_app._get_current_object()
+        workers = int(app.config.get('AUDIT_MAX_WORKERS', 3))
         period_label = f'{self.month:02d}/{self.year}'
 
-        # Crear el reporte
-        report = AuditReport(
-            audit_date   = self.audit_date,
-            period_label = period_label,
-            estado       = ESTADO_APROBADO,
-            trigger      = self.trigger,
-            executed_by  = self.executed_by,
-        )
-        db.session.add(report)
-        db.session.flush()
+        # Modo incremental: reporte del período con estado de la corrida anterior
+        report, state = None, None
+        if self.incremental:
+            report = AuditReport.query.filter(
+                AuditReport.period_label == period_label,
+                AuditReport.incremental_json.isnot(None),
+            ).order_by(AuditReport.id.desc()).first()
+            if report is not None:
+                state = report.incremental
+                if not inc.is_valid(state, self.year, self.month,
+                                    int(app.config.get('AUDIT_FULL_EVERY_DAYS', 7))):
+                    state = None
+                report.audit_date    = self.audit_date
+                report.trigger       = self.trigger
+                report.executed_by   = self.executed_by
+                report.error_message = None
+        merging = report is not None
 
-        # ── 1. Operaciones sin asiento ────────────────────────────────────────
-        try:
-            self._check_ops_sin_asiento(report)
-        except Exception as e:
-            logger.error(f'[AuditEngine] check_ops_sin_asiento: {e}')
-
-        # ── 2. Partida doble ─────────────────────────────────────────────────
-        try:
-            self._check_partida_doble(report)
-        except Exception as e:
-            logger.error(f'[AuditEngine] check_partida_doble: {e}')
-
-        # ── 3. Conciliación Tesorería vs Diario ───────────────────────────────
-        try:
-            self._check_conciliacion(report)
-        except Exception as e:
-            logger.error(f'[AuditEngine] check_conciliacion: {e}')
+        # Crear el reporte
+        if report is None:
+            report = AuditReport(
+                audit_date   = self.audit_date,
+                period_label = period_label,
+                estado       = ESTADO_APROBADO,
+                trigger      = self.trigger,
+                executed_by  = self.executed_by,
+            )
+            db.session.add(report)
+            db.session.flush()
 
-        # ── 4. Gastos sin comprobante ─────────────────────────────────────────
-        try:
-            self._check_gastos_sin_comprobante(report)
-        except Exception as e:
-            logger.error(f'[AuditEngine] check_gastos_sin_comprobante: {e}')
+        drafts = {}
+        check_ms = {}
 
-        # ── 5. Depreciación automática ────────────────────────────────────────
+        # ── 5. Depreciación automática (antes de cargar el período) ──────────
+        drafts['depreciacion'] = _ReportDraft()
+        t0 = time.perf_counter()
         try:
-            self._check_y_depreciar(report)
+            self._check_y_depreciar(drafts['depreciacion'])
         except Exception as e:
             logger.error(f'[AuditEngine] check_y_depreciar: {e}')
+        check_ms['depreciacion'] = round((time.perf_counter() - t0) * 1000, 1)
 
-        # ── 6. Cierre diario ──────────────────────────────────────────────────
-        try:
-            self._check_cierre_diario(report)
-        except Exception as e:
-            logger.error(f'[AuditEngine] check_cierre_diario: {e}')
-
-        # ── 7. Integridad del período ─────────────────────────────────────────
-        try:
-            self._check_integridad_periodo(report, periodo)
-        except Exception as e:
-            logger.error(f'[AuditEngine] check_integridad_periodo: {e}')
-
-        # ── 8. Estado de Resultados ───────────────────────────────────────────
-        try:
-            self._calcular_estado_resultados(report)
-        except Exception as e:
-            logger.error(f'[AuditEngine] calcular_estado_resultados: {e}')
+        # ── Carga del período: delta desde la corrida anterior, o completa ───
+        data, new_state, delta = None, None, None
+        if state is not None:
+            try:
+                data, new_state, delta = inc.load_incremental(
+                    app, state, self.year, self.month, self.audit_date, max_workers=workers,
+                )
+            except Exception as e:
+                logger.error(f'[AuditEngine] incremental: {e} — se ejecuta auditoría completa')
+        if data is None:
+            try:
+                bounds = inc.current_bounds()
+            except Exception as e:
+                logger.error(f'[AuditEngine] marcas de agua: {e}')
+                bounds = None
+            data = AuditPeriodData.load(app, self.year, self.month, self.audit_date,
+                                        max_workers=workers, bounds=bounds)
+            for name, exc in data.errors.items():
+                logger.error(f'[AuditEngine] prefetch {name}: {exc}')
+            if bounds and not data.errors:
+                try:
+                    new_state = inc.seed_state(data, bounds)
+                except Exception as e:
+                    logger.error(f'[AuditEngine] estado incremental: {e}')
+
+        # ── 1–4, 6–8 en paralelo ──────────────────────────────────────────────
+        tasks = {}
+        for name, method, requires in CHECKS:
+            if requires is None:
+                continue
+            if not data.loaded(*requires):
+                logger.error(f'[AuditEngine] {method}: datos no disponibles ({", ".join(requires)})')
+                continue
+            drafts[name] = _ReportDraft()
+            tasks[name] = partial(getattr(self, method), drafts[name], data)
+
+        _, errors, timings = run_parallel(tasks, max_workers=workers)
+        check_ms.update(timings)
+        for name, exc in errors.items():
+            logger.error(f'[AuditEngine] check {name}: {exc}')
+
+        if merging:
+            # Los hallazgos del período se regeneran; se conservan los registros
+            # de depreciaciones generadas en corridas anteriores
+            report.reset_hallazgos(keep=[
+                h for h in report.hallazgos
+                if h.get('modulo') == 'Activos Fijos' and h.get('severidad') == SEVERIDAD_INFO
+            ])
+        for name, _, _ in CHECKS:
+            if name in drafts:
+                drafts[name].apply(report)
+        report.incremental = new_state
 
         # ── Finalizar ─────────────────────────────────────────────────────────
         elapsed = round(time.time() - start, 2)
         report.execution_seconds = elapsed
+        report.timings = {
+            'prefetch_ms': data.timings,
+            'checks_ms':   check_ms,
+            'workers':     workers,
+            'modo':        'incremental' if delta is not None else 'completa',
+            'delta':       delta,
+        }
 
         try:
             db.session.commit()
@@ -170,36 +265,14 @@ class AuditEngine:
     # Módulos de validación
     # ─────────────────────────────────────────────────────────────────────────
 
-    def _check_ops_sin_asiento(self, report):
+    def _check_ops_sin_asiento(self, report, data):
         """
         Verifica que todas las operaciones Completadas del período
         tengan su asiento contable generado en el Libro Diario.
         """
         from app.models.audit_report import SEVERIDAD_CRITICO, SEVERIDAD_ALERTA
-        from app.models.operation import Operation
-        from app.models.journal_entry import JournalEntry
-        from app.models.user import User
-        from sqlalchemy import func, extract
-
-        demo_id = User.get_demo_user_id()
-
-        ids_con_asiento = {
-            r[0] for r in db.session.query(JournalEntry.source_id).filter(
-                JournalEntry.source_type == 'operation',
-                JournalEntry.status == 'activo',
-            ).all() if r[0]
-        }
-
-        q = Operation.query.filter(
-            Operation.status == 'Completada',
-            extract('year',  Operation.completed_at) == self.year,
-            extract('month', Operation.completed_at) == self.month,
-            ~Operation.id.in_(ids_con_asiento) if ids_con_asiento else True,
-        )
-        if demo_id:
-            q = q.filter(Operation.user_id != demo_id)
 
-        ops = q.all()
+        ops = [op for op in data.operations if not op.has_entry]
         report.ops_sin_asiento = len(ops)
 
         if ops:
@@ -222,15 +295,15 @@ class AuditEngine:
         else:
             logger.info('[AuditEngine] ✅ Todas las operaciones tienen asiento')
 
-    def _check_partida_doble(self, report):
+    def _check_partida_doble(self, report, data):
         """
         Valida que DEBE == HABER en todos los asientos del período.
         Un asiento descuadrado es un error CRÍTICO.
         """
         from app.models.audit_report import SEVERIDAD_CRITICO
-        from .reconciliation import run_partida_doble_check
+        from .reconciliation import descuadres
 
-        descuadrados = run_partida_doble_check(self.year, self.month)
+        descuadrados = descuadres(data.entries)
         report.asientos_descuadrados = len(descuadrados)
 
         if descuadrados:
@@ -253,15 +326,15 @@ class AuditEngine:
                 ),
             )
 
-    def _check_conciliacion(self, report):
+    def _check_conciliacion(self, report, data):
         """
         Concilia Tesorería (BankBalance) vs Libro Diario (SSoT).
         Detecta diferencias por banco y moneda.
         """
         from app.models.audit_report import SEVERIDAD_ALERTA, SEVERIDAD_CRITICO
-        from .reconciliation import run_conciliacion
+        from .reconciliation import conciliar
 
-        resultado = run_conciliacion()
+        resultado = conciliar(data.saldos_caja, data.bank_balances)
 
         diferencias = [
             (code, data) for code, data in resultado.items()
@@ -300,24 +373,13 @@ class AuditEngine:
         else:
             logger.info('[AuditEngine] ✅ Tesorería concilia con Libro Diario')
 
-    def _check_gastos_sin_comprobante(self, report):
+    def _check_gastos_sin_comprobante(self, report, data):
         """
         Detecta gastos registrados sin comprobante ni proveedor identificado.
         """
         from app.models.audit_report import SEVERIDAD_ALERTA
-        from app.models.expense_record import ExpenseRecord
-        from sqlalchemy import extract
-
-        gastos = ExpenseRecord.query.filter(
-            extract('year',  ExpenseRecord.expense_date) == self.year,
-            extract('month', ExpenseRecord.expense_date) == self.month,
-        ).all()
-
-        sin_comprobante = [
-            g for g in gastos
-            if not g.voucher_number and not g.supplier_ruc
-            and g.expense_type not in ('tributo',)
-        ]
+
+        sin_comprobante = [g for g in data.expenses if _sin_comprobante(g)]
 
         report.gastos_sin_comprobante = len(sin_comprobante)
 
@@ -377,7 +439,8 @@ class AuditEngine:
                     ),
                     detalle=(
                         f'El agente generó automáticamente {resultado["generados"]} '
-                        f'asiento(s) de depreciación para el período '
+                        f'asiento(s) de depreciación ({resultado["activos"]} activo(s)) '
+                        f'para el período '
                         f'{self.month:02d}/{self.year}. '
                         f'Total depreciado: S/ {resultado["total_depreciation"]:,.2f}.'
                     ),
@@ -412,16 +475,13 @@ class AuditEngine:
                 ),
             )
 
-    def _check_cierre_diario(self, report):
+    def _check_cierre_diario(self, report, data):
         """
         Verifica que el día auditado tenga cierre diario validado en Tesorería.
         """
         from app.models.audit_report import SEVERIDAD_ALERTA
-        from app.models.daily_closure import DailyClosure
 
-        cierre = DailyClosure.query.filter_by(
-            closure_date=self.audit_date
-        ).first()
+        cierre = data.cierre
 
         if not cierre:
             report.add_hallazgo(
@@ -435,31 +495,31 @@ class AuditEngine:
                 ),
                 accion='Ir a Finanzas → Control → registrar cierre del día.',
             )
-        elif cierre.status != DailyClosure.STATUS_VALIDADO:
+        elif not cierre['validado']:
             report.add_hallazgo(
                 modulo='Cierre Diario',
                 severidad=SEVERIDAD_ALERTA,
-                titulo=f'Cierre diario {self.audit_date.strftime("%d/%m/%Y")} en estado: {cierre.status}',
+                titulo=f'Cierre diario {self.audit_date.strftime("%d/%m/%Y")} en estado: {cierre["status"]}',
                 detalle=(
                     f'El cierre del día existe pero no ha sido validado por el responsable. '
-                    f'Estado actual: {cierre.status}.'
+                    f'Estado actual: {cierre["status"]}.'
                 ),
                 accion='Ir a Finanzas → Control → validar el cierre del día.',
             )
-        elif cierre.has_discrepancies:
+        elif cierre['has_discrepancies']:
             report.add_hallazgo(
                 modulo='Cierre Diario',
                 severidad=SEVERIDAD_ALERTA,
                 titulo=(
                     f'Cierre diario con discrepancias — '
-                    f'USD {float(cierre.max_discrepancy_usd):,.2f} / '
-                    f'PEN {float(cierre.max_discrepancy_pen):,.2f}'
+                    f'USD {float(cierre["max_discrepancy_usd"]):,.2f} / '
+                    f'PEN {float(cierre["max_discrepancy_pen"]):,.2f}'
                 ),
                 detalle=(
                     f'El cierre del {self.audit_date.strftime("%d/%m/%Y")} '
                     f'fue validado pero registra diferencias entre saldos '
                     f'del sistema y saldos reales. '
-                    f'Razón declarada: {cierre.discrepancy_reason or "no indicada"}.'
+                    f'Razón declarada: {cierre["discrepancy_reason"] or "no indicada"}.'
                 ),
                 accion=(
                     'Verificar movimientos del día y registrar asiento de '
@@ -467,18 +527,15 @@ class AuditEngine:
                 ),
             )
 
-    def _check_integridad_periodo(self, report, periodo):
+    def _check_integridad_periodo(self, report, data):
         """
         Verifica la integridad del período contable:
         - Que el período exista
         - Que no haya asientos en períodos cerrados (excepto reversiones)
         """
         from app.models.audit_report import SEVERIDAD_CRITICO, SEVERIDAD_ALERTA
-        from app.models.journal_entry import JournalEntry
-        from app.models.accounting_period import AccountingPeriod
-        from sqlalchemy import extract
 
-        if not periodo:
+        if not data.periodo_exists:
             report.add_hallazgo(
                 modulo='Período Contable',
                 severidad=SEVERIDAD_ALERTA,
@@ -496,23 +553,10 @@ class AuditEngine:
 
         # Verificar asientos huérfanos (source_id sin operación existente)
         # Solo para asientos de tipo operacion_completada
-        from app.models.operation import Operation
-
-        entry_ids_ops = db.session.query(JournalEntry.source_id).filter(
-            JournalEntry.source_type == 'operation',
-            JournalEntry.status == 'activo',
-            extract('year',  JournalEntry.entry_date) == self.year,
-            extract('month', JournalEntry.entry_date) == self.month,
-        ).all()
-
-        op_ids = {r[0] for r in entry_ids_ops if r[0]}
-        existing_op_ids = {
-            r[0] for r in db.session.query(Operation.id).filter(
-                Operation.id.in_(op_ids)
-            ).all()
-        } if op_ids else set()
-
-        huerfanos = op_ids - existing_op_ids
+        huerfanos = sorted({
+            e.source_id for e in data.entries
+            if e.source_type == 'operation' and e.source_id and not e.source_exists
+        })
         if huerfanos:
             report.add_hallazgo(
                 modulo='Integridad',
@@ -520,13 +564,13 @@ class AuditEngine:
                 titulo=f'{len(huerfanos)} asiento(s) con operación origen eliminada',
                 detalle=(
                     f'Existen asientos que referencian operaciones que ya no '
-                    f'existen en la base de datos: IDs {list(huerfanos)[:10]}. '
+                    f'existen en la base de datos: IDs {huerfanos[:10]}. '
                     'Posible eliminación de operaciones sin anular asientos.'
                 ),
                 accion='Revisar log de auditoría. Anular los asientos huérfanos manualmente.',
             )
 
-    def _calcular_estado_resultados(self, report):
+    def _calcular_estado_resultados(self, report, data):
         """
         Calcula el Estado de Ganancias y Pérdidas del período
         desde el Libro Diario (SSoT) y lo almacena en las métricas del reporte.
@@ -538,29 +582,7 @@ class AuditEngine:
           gastos_depreciacion → entry_type = 'depreciacion'
           perdidas_fx         → cuenta 6762, entry_type = 'calce_netting'
         """
-        from app.models.journal_entry import JournalEntry
-        from app.models.journal_entry_line import JournalEntryLine
-        from sqlalchemy import func, extract
-
-        base_f = [
-            extract('year',  JournalEntry.entry_date) == self.year,
-            extract('month', JournalEntry.entry_date) == self.month,
-            JournalEntry.status == 'activo',
-        ]
-
-        def _sum_cuentas(prefix: str, campo: str,
-                         entry_types=None, excluir: str = None) -> Decimal:
-            filters = base_f + [JournalEntryLine.account_code.like(f'{prefix}%')]
-            if entry_types:
-                filters.append(JournalEntry.entry_type.in_(entry_types))
-            if excluir:
-                filters.append(JournalEntryLine.account_code != excluir)
-            result = db.session.query(
-                func.sum(getattr(JournalEntryLine, campo))
-            ).join(
-                JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-            ).filter(*filters).scalar()
-            return Decimal(str(result or 0))
+        _sum_cuentas = data.sum_lines
 
         # ── Ingresos netos FX ───────────────────────────────────────────────────
         # ingresos = ganancias 7xxx − pérdidas 6762 (calce negativo)
@@ -602,32 +624,10 @@ class AuditEngine:
         report.ir_pago_cuenta_pen = ir_pago
 
         # Desglose por cuenta para metricas_json
-        rows_ing = db.session.query(
-            JournalEntryLine.account_code,
-            func.sum(JournalEntryLine.haber).label('th'),
-            func.sum(JournalEntryLine.debe).label('td'),
-        ).join(
-            JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-        ).filter(
-            JournalEntryLine.account_code.like('7%'),
-            extract('year',  JournalEntry.entry_date) == self.year,
-            extract('month', JournalEntry.entry_date) == self.month,
-            JournalEntry.status == 'activo',
-        ).group_by(JournalEntryLine.account_code).all()
-
-        rows_gas = db.session.query(
-            JournalEntryLine.account_code,
-            JournalEntry.entry_type,
-            func.sum(JournalEntryLine.debe).label('td'),
-            func.sum(JournalEntryLine.haber).label('th'),
-        ).join(
-            JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
-        ).filter(
-            JournalEntryLine.account_code.like('6%'),
-            extract('year',  JournalEntry.entry_date) == self.year,
-            extract('month', JournalEntry.entry_date) == self.month,
-            JournalEntry.status == 'activo',
-        ).group_by(JournalEntryLine.account_code, JournalEntry.entry_type).all()
+        rows_ing = sorted(data.totals_by_account('7').items())
+        rows_gas = sorted(
+            (key, sums) for key, sums in data.line_totals.items() if key[0].startswith('6')
+        )
 
         report.metricas = {
             'year':                  self.year,
@@ -641,24 +641,20 @@ class AuditEngine:
             'ir_1pct':               float(ir_pago),
             'ingresos_detalle': [
                 {
-                    'cuenta': r.account_code,
-                    'monto': float(
-                        max(Decimal(str(r.th or 0)) - Decimal(str(r.td or 0)), Decimal('0'))
-                    ),
+                    'cuenta': cuenta,
+                    'monto': float(max(th - td, Decimal('0'))),
                 }
-                for r in rows_ing
-                if (Decimal(str(r.th or 0)) - Decimal(str(r.td or 0))) > Decimal('0.01')
+                for cuenta, (td, th) in rows_ing
+                if (th - td) > Decimal('0.01')
             ],
             'gastos_detalle': [
                 {
-                    'cuenta':      r.account_code,
-                    'entry_type':  r.entry_type,
-                    'monto': float(
-                        max(Decimal(str(r.td or 0)) - Decimal(str(r.th or 0)), Decimal('0'))
-                    ),
+                    'cuenta':      cuenta,
+                    'entry_type':  entry_type,
+                    'monto': float(max(td - th, Decimal('0'))),
                 }
-                for r in rows_gas
-                if (Decimal(str(r.td or 0)) - Decimal(str(r.th or 0))) > Decimal('0.01')
+                for (cuenta, entry_type), (td, th) in rows_gas
+                if (td - th) > Decimal('0.01')
             ],
         }
 
@@ -0,0 +1,389 @@
+"""
+Auditoría incremental del período
+==================================
+La auditoría diaria (cron / agente) re-auditaba el mes completo en cada
+corrida: el costo crecía con el mes. En modo incremental el AuditReport del
+período guarda en incremental_json las marcas de agua (high-water marks) y el
+estado acumulado, y cada corrida lee solo lo cambiado desde la anterior:
+
+  journal_entries   id > hwm.entry_id        → suman a line_totals / sumas_caja
+                    anulados desde la corrida → restan
+  operations        completed_at > hwm        → ¿tienen asiento?
+  expense_records   id > hwm.expense_id       → ¿tienen comprobante?
+  bank_movements    id > hwm.movement_id      → recargar saldos de Tesorería
+
+Los pendientes (operaciones sin asiento, asientos descuadrados o huérfanos,
+gastos sin comprobante) se guardan por id y se re-evalúan en cada corrida; un
+pendiente resuelto sale del reporte. AuditPeriodData se arma con pendientes +
+novedades + acumulados, y los mismos módulos del AuditEngine producen los
+hallazgos del período completo.
+
+Ventanas de solape: un id menor que la marca puede confirmarse después
+(transacciones concurrentes), así que se relee (hwm − OVERLAP_IDS, ∞) y
+recent_entry_ids evita contar dos veces; las anulaciones se leen desde
+last_run_at − OVERLAP_MINUTES y annulled_seen evita restarlas dos veces.
+
+seed_state() arma el estado desde una carga completa acotada a las marcas
+(current_bounds), de modo que lo contado y las marcas coinciden.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, or_
+
+from app.extensions import db
+from app.utils.formatters import now_peru
+from app.utils.periods import in_month, month_bounds
+from .period_data import (
+    AuditPeriodData, LOADERS, run_parallel, sin_comprobante, asiento_observado,
+    entries_query, operations_query, expenses_query,
+    to_entry, to_operation, to_expense,
+)
+from .reconciliation import CUENTAS_CAJA_BANCO, saldos_tesoreria
+
+STATE_VERSION   = 1
+OVERLAP_IDS     = 200
+OVERLAP_MINUTES = 10
+# IN (...) por consulta al leer líneas de asientos nuevos / anulados
+ID_CHUNK        = 1000
+
+_ZERO4 = (Decimal('0'),) * 4
+
+
+# ── Serialización del estado ──────────────────────────────────────────────────
+
+def _dump_totals(line_totals: dict) -> dict:
+    return {f'{code}|{etype}': [str(d), str(h)] for (code, etype), (d, h) in line_totals.items()}
+
+
+def _load_totals(raw: dict) -> dict:
+    out = {}
+    for key, (d, h) in (raw or {}).items():
+        code, etype = key.split('|', 1)
+        out[(code, etype)] = (Decimal(d), Decimal(h))
+    return out
+
+
+def _dump_sumas(sumas: dict) -> dict:
+    return {code: [str(v) for v in vals] for code, vals in sumas.items()}
+
+
+def _load_sumas(raw: dict) -> dict:
+    return {code: tuple(Decimal(v) for v in vals) for code, vals in (raw or {}).items()}
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _parse(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def is_valid(state: dict, year: int, month: int, full_every_days: int) -> bool:
+    """El estado sirve para una corrida incremental del período (si no, corrida completa)."""
+    if not state or state.get('version') != STATE_VERSION:
+        return False
+    if (state.get('year'), state.get('month')) != (year, month):
+        return False
+    full_at = _parse(state.get('full_run_at'))
+    return bool(full_at) and now_peru() - full_at < timedelta(days=full_every_days)
+
+
+# ── Marcas de agua ────────────────────────────────────────────────────────────
+
+def current_bounds() -> dict:
+    """Marcas actuales: ids máximos de asientos / gastos / movimientos y último completed_at."""
+    from app.models.bank_movement import BankMovement
+    from app.models.expense_record import ExpenseRecord
+    from app.models.journal_entry import JournalEntry
+    from app.models.operation import Operation
+
+    return {
+        'entry_id':        db.session.query(func.max(JournalEntry.id)).scalar() or 0,
+        'expense_id':      db.session.query(func.max(ExpenseRecord.id)).scalar() or 0,
+        'movement_id':     db.session.query(func.max(BankMovement.id)).scalar() or 0,
+        'op_completed_at': db.session.query(func.max(Operation.completed_at)).filter(
+            Operation.status == 'Completada',
+        ).scalar(),
+    }
+
+
+def _recent_entry_ids(hwm: int) -> list:
+    from app.models.journal_entry import JournalEntry
+
+    return [r[0] for r in db.session.query(JournalEntry.id).filter(
+        JournalEntry.id > hwm - OVERLAP_IDS,
+        JournalEntry.id <= hwm,
+        JournalEntry.status == 'activo',
+    ).all()]
+
+
+def _recent_annulled(since: datetime) -> dict:
+    from app.models.journal_entry import JournalEntry
+
+    return {str(i): _iso(at) for i, at in db.session.query(
+        JournalEntry.id, JournalEntry.annulled_at,
+    ).filter(
+        JournalEntry.status == 'anulado',
+        JournalEntry.annulled_at >= since,
+    ).all()}
+
+
+def _pending(data: AuditPeriodData) -> dict:
+    return {
+        'operations': [op.id for op in data.operations if not op.has_entry],
+        'entries':    [e.id for e in data.entries if asiento_observado(e)],
+        'expenses':   [g.id for g in data.expenses if sin_comprobante(g)],
+    }
+
+
+def seed_state(data: AuditPeriodData, bounds: dict) -> dict:
+    """Estado inicial desde una carga completa acotada a `bounds` (AuditPeriodData.load)."""
+    now = now_peru()
+    return {
+        'version':          STATE_VERSION,
+        'year':             data.year,
+        'month':            data.month,
+        'hwm': {
+            'entry_id':        bounds['entry_id'],
+            'expense_id':      bounds['expense_id'],
+            'movement_id':     bounds['movement_id'],
+            'op_completed_at': _iso(bounds['op_completed_at']),
+        },
+        'recent_entry_ids': _recent_entry_ids(bounds['entry_id']),
+        'annulled_seen':    _recent_annulled(now - timedelta(minutes=OVERLAP_MINUTES)),
+        'last_run_at':      _iso(now),
+        'full_run_at':      _iso(now),
+        'runs':             1,
+        'line_totals':      _dump_totals(data.line_totals),
+        'sumas_caja':       _dump_sumas(data.sumas_caja),
+        'bank_balances':    [[n, str(pen), str(usd)] for n, pen, usd in data.bank_balances],
+        'pending':          _pending(data),
+    }
+
+
+# ── Lecturas del delta (cada una en su propia sesión vía run_parallel) ───────
+
+def _chunks(ids: list):
+    for i in range(0, len(ids), ID_CHUNK):
+        yield ids[i:i + ID_CHUNK]
+
+
+def _line_sums(entry_ids: list) -> list:
+    """[(entry_id, cuenta, Σ debe, Σ haber, Σ usd debe, Σ usd haber)] de los asientos dados."""
+    from sqlalchemy import case
+    from app.models.journal_entry_line import JournalEntryLine as JEL
+
+    out = []
+    for chunk in _chunks(entry_ids):
+        out.extend(db.session.query(
+            JEL.journal_entry_id, JEL.account_code,
+            func.sum(JEL.debe), func.sum(JEL.haber),
+            func.sum(case((JEL.debe > 0, JEL.amount_usd))),
+            func.sum(case((JEL.haber > 0, JEL.amount_usd))),
+        ).filter(
+            JEL.journal_entry_id.in_(chunk),
+        ).group_by(JEL.journal_entry_id, JEL.account_code).all())
+    return out
+
+
+def _read_new_entries(state):
+    """Asientos activos confirmados desde la última corrida (+ sus sumas por cuenta)."""
+    from app.models.journal_entry import JournalEntry as JE
+
+    hwm    = state['hwm']['entry_id']
+    recent = set(state.get('recent_entry_ids') or [])
+    rows   = entries_query().filter(JE.id > hwm - OVERLAP_IDS).order_by(JE.id).all()
+    new    = [to_entry(r) for r in rows if r.id not in recent]
+    return new, _line_sums([e.id for e in new])
+
+
+def _read_annulled(state):
+    """Asientos ya contados que se anularon desde la última corrida (+ sus sumas)."""
+    from app.models.journal_entry import JournalEntry as JE
+
+    hwm    = state['hwm']['entry_id']
+    recent = set(state.get('recent_entry_ids') or [])
+    seen   = state.get('annulled_seen') or {}
+    since  = _parse(state['last_run_at']) - timedelta(minutes=OVERLAP_MINUTES)
+
+    rows = db.session.query(JE.id, JE.entry_date, JE.entry_type, JE.annulled_at).filter(
+        JE.status == 'anulado',
+        JE.annulled_at >= since,
+        JE.id <= hwm,
+    ).all()
+    # Contados = id por debajo de la ventana de solape, o dentro y registrado
+    counted = [
+        r for r in rows
+        if str(r.id) not in seen and (r.id <= hwm - OVERLAP_IDS or r.id in recent)
+    ]
+    return counted, _line_sums([r.id for r in counted])
+
+
+def _read_pending_entries(state):
+    from app.models.journal_entry import JournalEntry as JE
+
+    ids = state['pending'].get('entries') or []
+    out = []
+    for chunk in _chunks(ids):
+        out.extend(to_entry(r) for r in entries_query().filter(JE.id.in_(chunk)).all())
+    return out
+
+
+def _read_operations(state, year, month):
+    from app.models.operation import Operation
+
+    pending = state['pending'].get('operations') or []
+    since   = _parse(state['hwm'].get('op_completed_at'))
+    cond    = [Operation.id.in_(pending)] if pending else []
+    if since is not None:
+        cond.append(Operation.completed_at > since - timedelta(minutes=OVERLAP_MINUTES))
+    q = operations_query().filter(in_month(Operation.completed_at, year, month))
+    if since is not None:
+        q = q.filter(or_(*cond))
+    rows = q.order_by(Operation.completed_at, Operation.id).all()
+    last = max((r.completed_at for r in rows), default=None)
+    return [to_operation(r) for r in rows], last
+
+
+def _read_expenses(state, year, month):
+    from app.models.expense_record import ExpenseRecord as ER
+
+    pending = state['pending'].get('expenses') or []
+    hwm     = state['hwm']['expense_id']
+    cond    = [ER.id > hwm - OVERLAP_IDS]
+    if pending:
+        cond.append(ER.id.in_(pending))
+    rows = expenses_query().filter(in_month(ER.expense_date, year, month), or_(*cond)).all()
+    return [to_expense(r) for r in rows], max((r.id for r in rows), default=hwm)
+
+
+def _read_movement_hwm(state):
+    from app.models.bank_movement import BankMovement
+    return db.session.query(func.max(BankMovement.id)).scalar() or 0
+
+
+# ── Corrida incremental ───────────────────────────────────────────────────────
+
+def _apply_sums(sums, entry_info: dict, line_totals: dict, sumas_caja: dict,
+                period: tuple, sign: int) -> bool:
+    """
+    Suma (sign=1) o resta (sign=-1) las sumas por cuenta de asientos a los
+    acumulados. Retorna True si tocó alguna cuenta de Caja y Bancos.
+    """
+    start, end = period
+    touched = False
+    for entry_id, code, d, h, d_usd, h_usd in sums:
+        entry_date, entry_type = entry_info[entry_id]
+        d, h = Decimal(str(d or 0)) * sign, Decimal(str(h or 0)) * sign
+        if start <= entry_date < end:
+            pd, ph = line_totals.get((code, entry_type), (Decimal('0'), Decimal('0')))
+            line_totals[(code, entry_type)] = (pd + d, ph + h)
+        if code in CUENTAS_CAJA_BANCO:
+            vals = (d, h, Decimal(str(d_usd or 0)) * sign, Decimal(str(h_usd or 0)) * sign)
+            sumas_caja[code] = tuple(a + b for a, b in zip(sumas_caja.get(code, _ZERO4), vals))
+            touched = True
+    return touched
+
+
+def _merge(items, key=lambda x: x.id):
+    out = {}
+    for item in items:
+        out[key(item)] = item
+    return list(out.values())
+
+
+def load_incremental(app, state: dict, year: int, month: int, audit_date,
+                     max_workers: int = 3):
+    """
+    Arma AuditPeriodData con pendientes + novedades desde la última corrida.
+    Retorna (data, nuevo_estado, resumen del delta). Cualquier lectura fallida
+    levanta excepción: el estado no avanza y el AuditEngine hace corrida completa.
+    """
+    tasks = {
+        'new_entries':     lambda: _read_new_entries(state),
+        'annulled':        lambda: _read_annulled(state),
+        'pending_entries': lambda: _read_pending_entries(state),
+        'operations':      lambda: _read_operations(state, year, month),
+        'expenses':        lambda: _read_expenses(state, year, month),
+        'movement_hwm':    lambda: _read_movement_hwm(state),
+        'periodo_exists':  lambda: LOADERS['periodo_exists'](year, month, audit_date, {}),
+        'cierre':          lambda: LOADERS['cierre'](year, month, audit_date, {}),
+    }
+    results, errors, timings = run_parallel(tasks, max_workers=max_workers, app=app)
+    if errors:
+        raise RuntimeError('; '.join(f'{n}: {e}' for n, e in errors.items()))
+
+    now    = now_peru()
+    period = month_bounds(year, month)
+    line_totals = _load_totals(state['line_totals'])
+    sumas_caja  = _load_sumas(state['sumas_caja'])
+
+    new_entries, new_sums = results['new_entries']
+    annulled, ann_sums    = results['annulled']
+
+    info = {e.id: (e.entry_date, e.entry_type) for e in new_entries}
+    info.update({r.id: (r.entry_date, r.entry_type) for r in annulled})
+    caja_changed  = _apply_sums(new_sums, info, line_totals, sumas_caja, period, 1)
+    caja_changed |= _apply_sums(ann_sums, info, line_totals, sumas_caja, period, -1)
+
+    hwm = dict(state['hwm'])
+    hwm['entry_id'] = max([hwm['entry_id']] + [e.id for e in new_entries])
+    recent = set(state.get('recent_entry_ids') or []) | {e.id for e in new_entries}
+
+    cutoff = now - timedelta(minutes=OVERLAP_MINUTES)
+    seen = {k: v for k, v in (state.get('annulled_seen') or {}).items() if _parse(v) >= cutoff}
+    seen.update({str(r.id): _iso(r.annulled_at) for r in annulled})
+
+    operations, last_completed = results['operations']
+    if last_completed and (not hwm.get('op_completed_at') or last_completed > _parse(hwm['op_completed_at'])):
+        hwm['op_completed_at'] = _iso(last_completed)
+
+    expenses, expense_hwm = results['expenses']
+    hwm['expense_id'] = max(hwm['expense_id'], expense_hwm)
+
+    # Tesorería: solo se relee si hubo movimientos bancarios o asientos de Caja y Bancos
+    movement_hwm = results['movement_hwm']
+    reload_tes   = caja_changed or movement_hwm > hwm['movement_id']
+    if reload_tes:
+        bank_balances = saldos_tesoreria()
+    else:
+        bank_balances = [(n, Decimal(pen), Decimal(usd)) for n, pen, usd in state['bank_balances']]
+    hwm['movement_id'] = max(hwm['movement_id'], movement_hwm)
+
+    start, end = period
+    data = AuditPeriodData(
+        year=year, month=month, audit_date=audit_date,
+        periodo_exists=results['periodo_exists'],
+        entries=_merge(results['pending_entries'] +
+                       [e for e in new_entries if start <= e.entry_date < end]),
+        line_totals=line_totals,
+        operations=_merge(operations),
+        sumas_caja=sumas_caja,
+        bank_balances=bank_balances,
+        expenses=_merge(expenses),
+        cierre=results['cierre'],
+        timings=timings,
+    )
+
+    new_state = dict(state)
+    new_state.update({
+        'hwm':              hwm,
+        'recent_entry_ids': sorted(i for i in recent if i > hwm['entry_id'] - OVERLAP_IDS),
+        'annulled_seen':    seen,
+        'last_run_at':      _iso(now),
+        'runs':             int(state.get('runs') or 0) + 1,
+        'line_totals':      _dump_totals(line_totals),
+        'sumas_caja':       _dump_sumas(sumas_caja),
+        'bank_balances':    [[n, str(pen), str(usd)] for n, pen, usd in bank_balances],
+        'pending':          _pending(data),
+    })
+    delta = {
+        'asientos_nuevos':   len(new_entries),
+        'asientos_anulados': len(annulled),
+        'operaciones':       len(operations),
+        'gastos':            len(expenses),
+        'tesoreria_releida': reload_tes,
+    }
+    return data, new_state, delta
@@ -0,0 +1,393 @@
+"""
+Modelo del período para el AuditEngine
+=======================================
+Cada módulo de validación consultaba por su cuenta asientos, líneas y
+operaciones del mismo período (≈ 20 consultas, varias sobre todo el Libro
+Diario, y un NOT IN con todos los source_id del Diario). AuditPeriodData los
+trae una sola vez:
+
+  periodo_exists  el AccountingPeriod (year, month) existe
+  entries         asientos activos del período + si su operación origen existe
+                  + Σ debe / Σ haber de sus líneas (mismo GROUP BY)
+  line_totals     Σ debe / Σ haber por (cuenta, entry_type) del período
+                  (AccountPeriodTotal salvo que bounds acote por entry_id)
+  operations      operaciones Completadas del período + si tienen asiento
+                  (EXISTS correlacionado sobre idx_je_source)
+  sumas_caja      acumulados del Diario por cuenta de Caja y Bancos
+                  (saldos_caja: el saldo que se concilia)
+  bank_balances   saldos de Tesorería (BankBalance)
+  expenses        gastos del período
+  cierre          cierre diario de la fecha auditada (o None)
+
+Los loaders son independientes: load() los ejecuta en paralelo, cada uno en
+su propio app context (sesión y conexión propias del pool). Sobre el modelo
+cargado las validaciones no tocan la base; run_parallel() también las
+ejecuta en paralelo y mide cada tarea.
+
+`bounds` acota la carga a lo ya visto por la auditoría incremental
+(incremental.py): entry_id / expense_id máximos y op_completed_at.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+
+
+@dataclass
+class PeriodEntry:
+    id:            int
+    entry_number:  str
+    entry_date:    date
+    entry_type:    str
+    source_type:   str
+    source_id:     int
+    description:   str
+    total_debe:    Decimal
+    total_haber:   Decimal
+    # Solo para source_type='operation': la operación origen existe
+    source_exists: bool = None
+    # Σ debe / Σ haber de journal_entry_lines (None si no se cargaron)
+    lines_debe:    Decimal = None
+    lines_haber:   Decimal = None
+
+
+@dataclass
+class PeriodOperation:
+    id:           int
+    operation_id: str
+    has_entry:    bool
+
+
+@dataclass
+class PeriodExpense:
+    id:             int
+    voucher_number: str
+    supplier_ruc:   str
+    expense_type:   str
+    amount_pen:     Decimal
+
+
+def sin_comprobante(g: PeriodExpense) -> bool:
+    """Gasto sin comprobante ni RUC de proveedor (los tributos no llevan)."""
+    return not g.voucher_number and not g.supplier_ruc and g.expense_type not in ('tributo',)
+
+
+def asiento_observado(e: PeriodEntry) -> bool:
+    """
+    Asiento descuadrado (|DEBE − HABER| > 0.01, en cabecera o en sus líneas;
+    o cabecera distinta de la suma de líneas) o con operación origen inexistente.
+    """
+    tol = Decimal('0.01')
+    if abs(e.total_debe - e.total_haber) > tol:
+        return True
+    if e.lines_debe is not None and e.lines_haber is not None:
+        if (abs(e.lines_debe - e.lines_haber) > tol or
+                abs(e.total_debe - e.lines_debe) > tol or
+                abs(e.total_haber - e.lines_haber) > tol):
+            return True
+    return e.source_type == 'operation' and bool(e.source_id) and not e.source_exists
+
+
+def _dec(value) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 1)
+
+
+def run_parallel(tasks: dict, max_workers: int = 3, app=None):
+    """
+    Ejecuta {nombre: callable} en paralelo (máx. max_workers a la vez).
+    Con `app`, cada tarea corre en su propio app context y libera su sesión
+    al terminar.
+
+    Retorna (resultados, errores, tiempos_ms), los tres indexados por nombre;
+    una tarea que falla aparece solo en errores (no interrumpe a las demás).
+    """
+    def _call(fn):
+        t0 = time.perf_counter()
+        try:
+            if app is None:
+                return fn(), None, _ms(t0)
+            from app.extensions import db
+            with app.app_context():
+                try:
+                    return fn(), None, _ms(t0)
+                finally:
+                    db.session.remove()
+        except Exception as exc:
+            return None, exc, _ms(t0)
+
+    results, errors, timings = {}, {}, {}
+    if not tasks:
+        return results, errors, timings
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks)))) as pool:
+        futures = {pool.submit(_call, fn): name for name, fn in tasks.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            value, exc, elapsed = future.result()
+            timings[name] = elapsed
+            if exc is None:
+                results[name] = value
+            else:
+                errors[name] = exc
+    return results, errors, timings
+
+
+# ── Loaders ───────────────────────────────────────────────────────────────────
+
+def _entry_bound(JE, bounds) -> list:
+    if bounds.get('entry_id') is None:
+        return []
+    return [JE.id <= bounds['entry_id']]
+
+
+def _load_periodo_exists(year, month, audit_date, bounds):
+    from app.extensions import db
+    from app.models.accounting_period import AccountingPeriod
+
+    return db.session.query(AccountingPeriod.id).filter_by(year=year, month=month).first() is not None
+
+
+def entries_query():
+    """
+    Asientos activos (columnas de PeriodEntry) + id de la operación origen si
+    existe + Σ debe / Σ haber de sus líneas, agrupado por asiento.
+    """
+    from sqlalchemy import and_, func
+    from app.extensions import db
+    from app.models.journal_entry import JournalEntry as JE
+    from app.models.journal_entry_line import JournalEntryLine as JEL
+    from app.models.operation import Operation
+
+    return db.session.query(
+        JE.id, JE.entry_number, JE.entry_date, JE.entry_type,
+        JE.source_type, JE.source_id, JE.description,
+        JE.total_debe, JE.total_haber,
+        Operation.id.label('op_id'),
+        func.coalesce(func.sum(JEL.debe), 0).label('lines_debe'),
+        func.coalesce(func.sum(JEL.haber), 0).label('lines_haber'),
+    ).outerjoin(
+        Operation, and_(JE.source_type == 'operation', Operation.id == JE.source_id)
+    ).outerjoin(
+        JEL, JEL.journal_entry_id == JE.id
+    ).filter(JE.status == 'activo').group_by(JE.id, Operation.id)
+
+
+def to_entry(r) -> PeriodEntry:
+    return PeriodEntry(
+        id=r.id, entry_number=r.entry_number, entry_date=r.entry_date,
+        entry_type=r.entry_type, source_type=r.source_type, source_id=r.source_id,
+        description=r.description or '',
+        total_debe=_dec(r.total_debe), total_haber=_dec(r.total_haber),
+        source_exists=(r.op_id is not None) if r.source_type == 'operation' else None,
+        lines_debe=_dec(r.lines_debe), lines_haber=_dec(r.lines_haber),
+    )
+
+
+def operations_query():
+    """
+    Operaciones Completadas (sin el usuario demo) + si tienen asiento activo
+    (EXISTS correlacionado sobre idx_je_source).
+    """
+    from sqlalchemy import exists
+    from app.extensions import db
+    from app.models.journal_entry import JournalEntry as JE
+    from app.models.operation import Operation
+    from app.models.user import User
+
+    has_entry = exists().where(
+        JE.source_type == 'operation',
+        JE.source_id == Operation.id,
+        JE.status == 'activo',
+    )
+    q = db.session.query(
+        Operation.id, Operation.operation_id, Operation.completed_at, has_entry.label('has_entry'),
+    ).filter(Operation.status == 'Completada')
+    demo_id = User.get_demo_user_id()
+    if demo_id:
+        q = q.filter(Operation.user_id != demo_id)
+    return q
+
+
+def to_operation(r) -> PeriodOperation:
+    return PeriodOperation(id=r.id, operation_id=r.operation_id, has_entry=bool(r.has_entry))
+
+
+def expenses_query():
+    from app.extensions import db
+    from app.models.expense_record import ExpenseRecord as ER
+
+    return db.session.query(ER.id, ER.voucher_number, ER.supplier_ruc, ER.expense_type, ER.amount_pen)
+
+
+def to_expense(r) -> PeriodExpense:
+    return PeriodExpense(id=r.id, voucher_number=r.voucher_number, supplier_ruc=r.supplier_ruc,
+                         expense_type=r.expense_type, amount_pen=_dec(r.amount_pen))
+
+
+def _load_entries(year, month, audit_date, bounds):
+    from app.models.journal_entry import JournalEntry as JE
+    from app.utils.periods import in_month
+
+    rows = entries_query().filter(
+        in_month(JE.entry_date, year, month),
+        *_entry_bound(JE, bounds),
+    ).order_by(JE.entry_date, JE.id).all()
+    return [to_entry(r) for r in rows]
+
+
+def _load_line_totals(year, month, audit_date, bounds):
+    if bounds.get('entry_id') is None:
+        # Sin corte por entry_id: los totales materializados del período
+        from app.services.accounting.account_totals import AccountTotalsService, accounts
+        totals = AccountTotalsService.period_totals([(year, month)], is_account=True)
+        return {(code, etype or None): sums for (code, etype), sums in
+                accounts(totals[(year, month)]).items()}
+
+    from sqlalchemy import func
+    from app.extensions import db
+    from app.models.journal_entry import JournalEntry as JE
+    from app.models.journal_entry_line import JournalEntryLine as JEL
+    from app.utils.periods import in_month
+
+    rows = db.session.query(
+        JEL.account_code, JE.entry_type,
+        func.sum(JEL.debe), func.sum(JEL.haber),
+    ).join(
+        JE, JEL.journal_entry_id == JE.id
+    ).filter(
+        JE.status == 'activo',
+        in_month(JE.entry_date, year, month),
+        *_entry_bound(JE, bounds),
+    ).group_by(JEL.account_code, JE.entry_type).all()
+
+    return {(code, etype): (_dec(d), _dec(h)) for code, etype, d, h in rows}
+
+
+def _load_operations(year, month, audit_date, bounds):
+    from app.models.operation import Operation
+    from app.utils.periods import in_month
+
+    q = operations_query().filter(in_month(Operation.completed_at, year, month))
+    if bounds.get('op_completed_at'):
+        q = q.filter(Operation.completed_at <= bounds['op_completed_at'])
+    return [to_operation(r) for r in q.order_by(Operation.completed_at, Operation.id).all()]
+
+
+def _load_sumas_caja(year, month, audit_date, bounds):
+    from .reconciliation import sumas_caja_banco
+    return sumas_caja_banco(max_entry_id=bounds.get('entry_id'))
+
+
+def _load_bank_balances(year, month, audit_date, bounds):
+    from .reconciliation import saldos_tesoreria
+    return saldos_tesoreria()
+
+
+def _load_expenses(year, month, audit_date, bounds):
+    from app.models.expense_record import ExpenseRecord as ER
+    from app.utils.periods import in_month
+
+    q = expenses_query().filter(in_month(ER.expense_date, year, month))
+    if bounds.get('expense_id') is not None:
+        q = q.filter(ER.id <= bounds['expense_id'])
+    return [to_expense(r) for r in q.all()]
+
+
+def _load_cierre(year, month, audit_date, bounds):
+    from app.models.daily_closure import DailyClosure
+
+    c = DailyClosure.query.filter_by(closure_date=audit_date).first()
+    if c is None:
+        return None
+    return {
+        'status':              c.status,
+        'validado':            c.status == DailyClosure.STATUS_VALIDADO,
+        'has_discrepancies':   bool(c.has_discrepancies),
+        'max_discrepancy_usd': _dec(c.max_discrepancy_usd),
+        'max_discrepancy_pen': _dec(c.max_discrepancy_pen),
+        'discrepancy_reason':  c.discrepancy_reason,
+    }
+
+
+# atributo de AuditPeriodData → loader(year, month, audit_date, bounds)
+LOADERS = {
+    'periodo_exists': _load_periodo_exists,
+    'entries':        _load_entries,
+    'line_totals':    _load_line_totals,
+    'operations':     _load_operations,
+    'sumas_caja':     _load_sumas_caja,
+    'bank_balances':  _load_bank_balances,
+    'expenses':       _load_expenses,
+    'cierre':         _load_cierre,
+}
+
+
+@dataclass
+class AuditPeriodData:
+    """Datos del período auditado, cargados una vez y compartidos (solo lectura)."""
+    year:           int
+    month:          int
+    audit_date:     date
+    periodo_exists: bool = None
+    entries:        list = None
+    line_totals:    dict = None
+    operations:     list = None
+    sumas_caja:     dict = None
+    bank_balances:  list = None
+    expenses:       list = None
+    cierre:         dict = None
+    bounds:         dict = field(default_factory=dict)
+    # loader → ms / excepción
+    timings:        dict = field(default_factory=dict)
+    errors:         dict = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, app, year: int, month: int, audit_date: date,
+             max_workers: int = 3, bounds: dict = None) -> 'AuditPeriodData':
+        """Ejecuta los LOADERS en paralelo; los que fallan quedan en errors."""
+        data = cls(year=year, month=month, audit_date=audit_date, bounds=bounds or {})
+        tasks = {
+            name: (lambda fn=fn: fn(year, month, audit_date, data.bounds))
+            for name, fn in LOADERS.items()
+        }
+        results, data.errors, data.timings = run_parallel(tasks, max_workers=max_workers, app=app)
+        for name, value in results.items():
+            setattr(data, name, value)
+        return data
+
+    def loaded(self, *names) -> bool:
+        return not any(n in self.errors for n in names)
+
+    @property
+    def saldos_caja(self) -> dict:
+        from .reconciliation import saldo_caja_banco
+        return {code: saldo_caja_banco(code, s) for code, s in (self.sumas_caja or {}).items()}
+
+    def sum_lines(self, prefix: str, campo: str,
+                  entry_types=None, excluir: str = None) -> Decimal:
+        """Σ debe|haber de las cuentas que empiezan con prefix (como LIKE 'prefix%')."""
+        idx   = 0 if campo == 'debe' else 1
+        total = Decimal('0')
+        for (code, etype), sums in self.line_totals.items():
+            if not code.startswith(prefix):
+                continue
+            if entry_types and etype not in entry_types:
+                continue
+            if excluir and code == excluir:
+                continue
+            total += sums[idx]
+        return total
+
+    def totals_by_account(self, prefix: str) -> dict:
+        """{cuenta: (Σ debe, Σ haber)} de las cuentas con el prefijo, sumando entry_types."""
+        out = {}
+        for (code, _), (d, h) in self.line_totals.items():
+            if code.startswith(prefix):
+                pd, ph = out.get(code, (Decimal('0'), Decimal('0')))
+                out[code] = (pd + d, ph + h)
+        return out
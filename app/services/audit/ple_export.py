@@ -6,7 +6,7 @@ envío de Libros Electrónicos vía PLE o SLE-PLE.
 
 Libros implementados:
   LE0301  — Libro Diario (Formato Simplificado — MYPE hasta 300 UIT)
-  LE0801  — Registro de Ventas e Ingresos  (si aplica)
+  LE0601  — Libro Mayor
   LE0801  — Registro de Compras            (si aplica)
 
 Para QoriCash (casa de cambio exonerada de IGV):
@@ -20,16 +20,21 @@ Estructura Libro Diario Formato Simplificado (LE030100):
   - Periodo    : YYYYMM
   - CUO        : Código Único de Operación (entry_number sin guiones)
   - Indicador  : 1=Activo 2=Anulado 8=Informativo
-"""
-import io
-from datetime import date
-from decimal import Decimal
-
-from app.extensions import db
 
+Generación en streaming:
+  Todos los libros salen del mismo pipeline — una consulta de columnas (sin
+  objetos ORM) recorrida con cursor del servidor en bloques de CHUNK_ROWS
+  filas, formateada línea a línea y codificada a latin-1 en bloques de
+  CHUNK_LINES líneas. stream_ple() entrega esos bytes a un Response de Flask,
+  así un mes con muchos asientos no se materializa completo en memoria.
+"""
 # Código de libro SUNAT para Diario Simplificado
 LIBRO_DIARIO_SIMP = 'LE030100'
 
+# Filas por ida al cursor del servidor / líneas por bloque codificado
+CHUNK_ROWS  = 2000
+CHUNK_LINES = 500
+
 
 def _periodo_str(year: int, month: int) -> str:
     return f'{year}{month:02d}00'
@@ -45,71 +50,108 @@ def _fmt_decimal(val) -> str:
     return f'{float(val or 0):.2f}'
 
 
-def _nombre_cuenta(code: str, catalog: dict) -> str:
-    acc = catalog.get(code)
-    return acc.name if acc else f'Cuenta {code}'
+def _stream_rows(query, chunk_rows: int = CHUNK_ROWS):
+    """Recorre una consulta con cursor del servidor (stream_results + yield_per)."""
+    return query.execution_options(stream_results=True).yield_per(chunk_rows)
 
 
-def export_libro_diario_simplificado(year: int, month: int) -> bytes:
-    """
-    Genera el archivo .txt del Libro Diario Formato Simplificado
-    en el formato PLE de SUNAT.
+def _account_names() -> dict:
+    from app.extensions import db
+    from app.models.accounting_account import AccountingAccount
+    return {
+        code: (name or f'Cuenta {code}').replace('|', ' ')
+        for code, name in db.session.query(AccountingAccount.code, AccountingAccount.name)
+    }
+
+
+def _glosa(text: str, limit: int = 200) -> str:
+    return (text or '')[:limit].replace('|', ' ').replace('\r', ' ').replace('\n', ' ')
 
-    Retorna los bytes del archivo listo para descarga.
+
+def _journal_lines_query(year: int, month: int, order_by_account: bool = False):
+    """Líneas del Diario del período (activas y anuladas) como tuplas de columnas."""
+    from app.extensions import db
+    from app.models.journal_entry import JournalEntry
+    from app.models.journal_entry_line import JournalEntryLine
+    from app.utils.periods import in_month
+
+    q = db.session.query(
+        JournalEntry.entry_number,
+        JournalEntry.entry_date,
+        JournalEntry.description,
+        JournalEntry.status,
+        JournalEntryLine.account_code,
+        JournalEntryLine.description.label('line_desc'),
+        JournalEntryLine.debe,
+        JournalEntryLine.haber,
+    ).join(
+        JournalEntry, JournalEntryLine.journal_entry_id == JournalEntry.id
+    ).filter(
+        in_month(JournalEntry.entry_date, year, month),
+    )
+    order = [
+        JournalEntry.entry_date.asc(), JournalEntry.id.asc(),
+        JournalEntryLine.line_order.asc(), JournalEntryLine.id.asc(),
+    ]
+    if order_by_account:
+        order.insert(0, JournalEntryLine.account_code.asc())
+    return q.order_by(*order)
+
+
+# ── Libros (generadores de líneas str) ───────────────────────────────────────
+
+def iter_libro_diario(year: int, month: int):
+    """
+    Libro Diario Formato Simplificado (LE030100).
 
     Formato por línea (pipe-delimited):
     Periodo|CUO|CorrelativoAsiento|FechaAsiento|CodMoneda|
     CodCuentaContable|DenominacionCuenta|MontoDebe|MontoHaber|
     AjusteIndicador|EstadoOperacion
     """
-    from app.models.journal_entry import JournalEntry
-    from app.models.journal_entry_line import JournalEntryLine
-    from app.models.accounting_account import AccountingAccount
-    from sqlalchemy import extract
-    from sqlalchemy.orm import joinedload
-
     periodo = _periodo_str(year, month)
+    names   = _account_names()
+
+    for r in _stream_rows(_journal_lines_query(year, month)):
+        estado = '1' if r.status == 'activo' else '2'
+        nombre = names.get(r.account_code) or f'Cuenta {r.account_code}'
+        yield (
+            f'{periodo}|{_cuo(r.entry_number)}|M001|{r.entry_date.strftime("%d/%m/%Y")}|PEN|'
+            f'{r.account_code}|{nombre}|'
+            f'{_fmt_decimal(r.debe)}|{_fmt_decimal(r.haber)}|'
+            f'0|{estado}\r\n'
+        )
 
-    catalog = {a.code: a for a in AccountingAccount.query.all()}
 
-    entries = (
-        JournalEntry.query
-        .options(joinedload(JournalEntry.lines))
-        .filter(
-            extract('year',  JournalEntry.entry_date) == year,
-            extract('month', JournalEntry.entry_date) == month,
-        )
-        .order_by(JournalEntry.entry_date.asc(), JournalEntry.id.asc())
-        .all()
-    )
+def iter_libro_mayor(year: int, month: int):
+    """
+    Libro Mayor (LE060100) — movimientos del período agrupados por cuenta.
 
-    buf = io.StringIO()
+    Periodo|CUO|Correlativo|CodCuenta|CodUnidadOp|CentroCosto|Moneda|
+    TipoDocEmisor|NumDocEmisor|TipoComprobante|Serie|Numero|FechaContable|
+    FechaVencimiento|FechaOperacion|Glosa|GlosaReferencial|Debe|Haber|
+    DatoEstructurado|Estado
+    """
+    periodo = _periodo_str(year, month)
 
-    for entry in entries:
-        estado = '1' if entry.status == 'activo' else '2'
-        cuo    = _cuo(entry.entry_number)
-        fecha  = entry.entry_date.strftime('%d/%m/%Y')
-        glosa  = entry.description[:200].replace('|', ' ').replace('\n', ' ')
+    for i, r in enumerate(_stream_rows(_journal_lines_query(year, month, order_by_account=True)), 1):
+        yield _mayor_line(periodo, i, r)
 
-        for line in entry.lines:
-            nombre = _nombre_cuenta(line.account_code, catalog).replace('|', ' ')
-            row = (
-                f'{periodo}|{cuo}|M001|{fecha}|PEN|'
-                f'{line.account_code}|{nombre}|'
-                f'{_fmt_decimal(line.debe)}|{_fmt_decimal(line.haber)}|'
-                f'0|{estado}\r\n'
-            )
-            buf.write(row)
 
-    content = buf.getvalue()
-    buf.close()
-    return content.encode('latin-1', errors='replace')
+def _mayor_line(periodo: str, correlativo: int, r) -> str:
+    """Una línea LE060100 (21 campos) desde una fila de _journal_lines_query()."""
+    estado = '1' if r.status == 'activo' else '2'
+    fecha  = r.entry_date.strftime('%d/%m/%Y')
+    return (
+        f'{periodo}|{_cuo(r.entry_number)}|M{correlativo:06d}|{r.account_code}|||PEN|'
+        f'|||||{fecha}||{fecha}|{_glosa(r.line_desc or r.description)}||'
+        f'{_fmt_decimal(r.debe)}|{_fmt_decimal(r.haber)}||{estado}\r\n'
+    )
 
 
-def export_registro_compras(year: int, month: int) -> bytes:
+def iter_registro_compras(year: int, month: int):
     """
-    Genera el Registro de Compras (LE080100) para QoriCash.
-    Solo incluye facturas de proveedores (voucher_type='factura').
+    Registro de Compras (LE080100) para QoriCash.
 
     Campos SUNAT LE080100:
     Periodo|CUO|CorrelativoAsiento|FechaEmision|FechaVencimiento|
@@ -117,19 +159,26 @@ def export_registro_compras(year: int, month: int) -> bytes:
     NumDocProveedor|NombreProveedor|MontoBI|MontoIGV|MontoTotal|
     MontoISC|MontoOtrosTributos|TotalCP|TipoMoneda|EstadoAnotacion
     """
+    from app.extensions import db
     from app.models.expense_record import ExpenseRecord
-    from sqlalchemy import extract
+    from app.utils.periods import in_month
 
     periodo = _periodo_str(year, month)
 
-    gastos = ExpenseRecord.query.filter(
-        extract('year',  ExpenseRecord.expense_date) == year,
-        extract('month', ExpenseRecord.expense_date) == month,
-    ).order_by(ExpenseRecord.expense_date.asc()).all()
-
-    buf = io.StringIO()
-
-    for i, g in enumerate(gastos, 1):
+    q = db.session.query(
+        ExpenseRecord.expense_date,
+        ExpenseRecord.voucher_type,
+        ExpenseRecord.voucher_number,
+        ExpenseRecord.supplier_ruc,
+        ExpenseRecord.supplier_name,
+        ExpenseRecord.base_pen,
+        ExpenseRecord.igv_pen,
+        ExpenseRecord.amount_pen,
+    ).filter(
+        in_month(ExpenseRecord.expense_date, year, month),
+    ).order_by(ExpenseRecord.expense_date.asc(), ExpenseRecord.id.asc())
+
+    for i, g in enumerate(_stream_rows(q), 1):
         es_factura = (g.voucher_type or '').lower() in ('factura',)
         tipo_cp = '01' if es_factura else '03'  # 01=Factura, 03=Boleta
 
@@ -143,17 +192,54 @@ def export_registro_compras(year: int, month: int) -> bytes:
         numero  = voucher[4:] if len(voucher) > 4 else voucher
         proveedor = (g.supplier_name or 'SIN PROVEEDOR')[:100].replace('|', ' ')
 
-        row = (
+        yield (
             f'{periodo}|M{i:06d}|1|{fecha}|-|'
             f'{tipo_cp}|{serie}|{numero}|'
             f'{ruc_tipo}|{g.supplier_ruc or ""}|{proveedor}|'
             f'{base}|{igv}|{total}|0.00|0.00|{total}|PEN|1\r\n'
         )
-        buf.write(row)
 
-    content = buf.getvalue()
-    buf.close()
-    return content.encode('latin-1', errors='replace')
+
+LIBROS = {
+    'diario':  iter_libro_diario,
+    'mayor':   iter_libro_mayor,
+    'compras': iter_registro_compras,
+}
+
+
+# ── Pipeline de salida ───────────────────────────────────────────────────────
+
+def stream_ple(libro: str, year: int, month: int, chunk_lines: int = CHUNK_LINES):
+    """
+    Genera el archivo PLE del libro como bloques de bytes latin-1.
+    Lanza ValueError si el libro no existe (antes de tocar la base).
+    """
+    try:
+        iter_lines = LIBROS[libro]
+    except KeyError:
+        raise ValueError(f'Libro PLE no soportado: {libro}')
+
+    def _gen():
+        buf = []
+        for line in iter_lines(year, month):
+            buf.append(line)
+            if len(buf) >= chunk_lines:
+                yield ''.join(buf).encode('latin-1', errors='replace')
+                buf.clear()
+        if buf:
+            yield ''.join(buf).encode('latin-1', errors='replace')
+
+    return _gen()
+
+
+def export_libro_diario_simplificado(year: int, month: int) -> bytes:
+    """Libro Diario Simplificado completo en bytes (usa el pipeline de streaming)."""
+    return b''.join(stream_ple('diario', year, month))
+
+
+def export_registro_compras(year: int, month: int) -> bytes:
+    """Registro de Compras completo en bytes (usa el pipeline de streaming)."""
+    return b''.join(stream_ple('compras', year, month))
 
 
 def get_filename(libro: str, year: int, month: int, ruc: str = '20615113698') -> str:
@@ -164,6 +250,8 @@ def get_filename(libro: str, year: int, month: int, ruc: str = '20615113698') ->
     periodo = f'{year}{month:02d}00'
     if libro == 'diario':
         codigo = '030100'
+    elif libro == 'mayor':
+        codigo = '060100'
     elif libro == 'compras':
         codigo = '080100'
     else:
@@ -16,6 +16,7 @@ Cuentas auditadas (PCGE ↔ banco):
 """
 from decimal import Decimal
 from app.extensions import db
+from app.services.accounting.journal_service import TOLERANCIA_ASIENTO
 
 # Umbral de diferencia aceptable (menor a S/ 1.00 o USD 0.50 se ignora)
 UMBRAL_PEN = Decimal('1.00')
@@ -36,70 +37,88 @@ CUENTAS_CAJA_BANCO = {
 }
 
 
-def _saldo_journal(account_code: str) -> Decimal:
+def _dec(value) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+def sumas_caja_banco(max_entry_id: int = None) -> dict:
     """
-    Calcula el saldo acumulado de una cuenta desde el Libro Diario.
-    Para cuentas USD devuelve el saldo en USD (usando amount_usd).
-    Para cuentas PEN devuelve el saldo en PEN.
-    Es la fuente única de verdad.
+    Acumulados del Libro Diario (SSoT) de todas las cuentas de
+    CUENTAS_CAJA_BANCO en una sola consulta agrupada:
+    {cuenta: (Σ debe, Σ haber, Σ amount_usd al debe, Σ amount_usd al haber)}.
+    max_entry_id acota a los asientos con id <= max_entry_id.
+    Las cuentas sin movimientos no aparecen en el resultado.
     """
     from app.models.journal_entry import JournalEntry
     from app.models.journal_entry_line import JournalEntryLine
-    from sqlalchemy import func
+    from sqlalchemy import case, func
+
+    jel = JournalEntryLine
+    q = db.session.query(
+        jel.account_code,
+        func.sum(jel.debe),
+        func.sum(jel.haber),
+        func.sum(case((jel.debe > 0, jel.amount_usd))),
+        func.sum(case((jel.haber > 0, jel.amount_usd))),
+    ).join(
+        JournalEntry, jel.journal_entry_id == JournalEntry.id
+    ).filter(
+        jel.account_code.in_(list(CUENTAS_CAJA_BANCO)),
+        JournalEntry.status == 'activo',
+    )
+    if max_entry_id is not None:
+        q = q.filter(JournalEntry.id <= max_entry_id)
 
-    _, moneda, _ = CUENTAS_CAJA_BANCO.get(account_code, ('', 'PEN', None))
-    is_usd = (moneda == 'USD')
+    return {
+        code: (_dec(d), _dec(h), _dec(d_usd), _dec(h_usd))
+        for code, d, h, d_usd, h_usd in q.group_by(jel.account_code).all()
+    }
 
-    join_cond = JournalEntryLine.journal_entry_id == JournalEntry.id
-    base_filter = [
-        JournalEntryLine.account_code == account_code,
-        JournalEntry.status == 'activo',
-    ]
 
-    if is_usd:
-        d = db.session.query(func.sum(JournalEntryLine.amount_usd)).join(
-            JournalEntry, join_cond
-        ).filter(*base_filter, JournalEntryLine.debe > 0).scalar() or Decimal('0')
+def saldo_caja_banco(account_code: str, sumas: tuple) -> Decimal:
+    """Saldo de la cuenta desde sus sumas: en USD (amount_usd) para cuentas ME, en PEN si no."""
+    d, h, d_usd, h_usd = sumas
+    if CUENTAS_CAJA_BANCO[account_code][1] == 'USD':
+        return d_usd - h_usd
+    return d - h
 
-        h = db.session.query(func.sum(JournalEntryLine.amount_usd)).join(
-            JournalEntry, join_cond
-        ).filter(*base_filter, JournalEntryLine.haber > 0).scalar() or Decimal('0')
-    else:
-        row = db.session.query(
-            func.sum(JournalEntryLine.debe).label('d'),
-            func.sum(JournalEntryLine.haber).label('h'),
-        ).join(JournalEntry, join_cond).filter(*base_filter).first()
-        d = Decimal(str(row.d or 0))
-        h = Decimal(str(row.h or 0))
 
-    return Decimal(str(d)) - Decimal(str(h))
+def saldos_journal_caja_banco() -> dict:
+    """Saldo acumulado del Libro Diario por cuenta de CUENTAS_CAJA_BANCO."""
+    return {code: saldo_caja_banco(code, s) for code, s in sumas_caja_banco().items()}
 
 
-def _saldo_tesoreria(account_code: str) -> Decimal | None:
+def saldos_tesoreria() -> list:
+    """Saldos operativos de Tesorería: [(bank_name, balance_pen, balance_usd)]."""
+    from app.models.bank_balance import BankBalance
+
+    return [
+        (bank_name, _dec(pen), _dec(usd))
+        for bank_name, pen, usd in db.session.query(
+            BankBalance.bank_name, BankBalance.balance_pen, BankBalance.balance_usd,
+        ).all()
+    ]
+
+
+def _saldo_tesoreria(account_code: str, bank_balances: list) -> Decimal | None:
     """
-    Retorna el saldo operativo de Tesorería (BankBalance) para la cuenta dada.
+    Saldo de Tesorería (BankBalance) que corresponde a la cuenta dada.
     Retorna None si no existe registro en BankBalance para esa cuenta.
     """
-    from app.models.bank_balance import BankBalance
-
     _, moneda, banco_key = CUENTAS_CAJA_BANCO.get(account_code, ('', 'PEN', None))
     if not banco_key:
         return None
 
-    bb_all = BankBalance.query.all()
-    for bb in bb_all:
-        bname = bb.bank_name.upper()
+    for bank_name, balance_pen, balance_usd in bank_balances:
+        bname = bank_name.upper()
         if banco_key in bname and moneda in bname:
-            if moneda == 'PEN':
-                return Decimal(str(bb.balance_pen or 0))
-            else:
-                return Decimal(str(bb.balance_usd or 0))
+            return balance_pen if moneda == 'PEN' else balance_usd
     return None
 
 
-def run_conciliacion() -> dict:
+def conciliar(saldos_journal: dict, bank_balances: list) -> dict:
     """
-    Ejecuta la conciliación completa Tesorería vs Libro Diario.
+    Concilia saldos ya cargados (saldos_journal_caja_banco / saldos_tesoreria).
 
     Retorna dict:
     {
@@ -117,8 +136,8 @@ def run_conciliacion() -> dict:
     resultado = {}
 
     for code, (label, moneda, banco_key) in CUENTAS_CAJA_BANCO.items():
-        saldo_j = _saldo_journal(code)
-        saldo_t = _saldo_tesoreria(code)
+        saldo_j = saldos_journal.get(code, Decimal('0'))
+        saldo_t = _saldo_tesoreria(code, bank_balances)
 
         if saldo_j == 0 and saldo_t is None:
             continue  # Cuenta sin actividad — omitir
@@ -154,31 +173,83 @@ def run_conciliacion() -> dict:
     return resultado
 
 
-def run_partida_doble_check(year: int, month: int) -> list:
+def run_conciliacion() -> dict:
     """
-    Verifica que todos los asientos del período cumplan DEBE == HABER.
-    Retorna lista de asientos descuadrados.
+    Ejecuta la conciliación completa Tesorería vs Libro Diario
+    (dos consultas: saldos del Diario agrupados por cuenta y BankBalance).
+    Ver conciliar() para el formato del resultado.
     """
-    from app.models.journal_entry import JournalEntry
-    from sqlalchemy import extract, func
+    return conciliar(saldos_journal_caja_banco(), saldos_tesoreria())
 
-    entradas = JournalEntry.query.filter(
-        extract('year',  JournalEntry.entry_date) == year,
-        extract('month', JournalEntry.entry_date) == month,
-        JournalEntry.status == 'activo',
-    ).all()
 
+def descuadres(entries) -> list:
+    """
+    Asientos con |DEBE − HABER| > 0.01 entre los dados (objetos con
+    entry_number, entry_date, total_debe, total_haber, description).
+    Si además traen lines_debe / lines_haber (Σ de sus líneas), también se
+    reporta el asiento cuyas líneas no cuadran o no coinciden con la cabecera.
+    """
     descuadrados = []
-    for e in entradas:
+    for e in entries:
         diff = abs(Decimal(str(e.total_debe)) - Decimal(str(e.total_haber)))
-        if diff > Decimal('0.01'):
-            descuadrados.append({
+        ld = getattr(e, 'lines_debe', None)
+        lh = getattr(e, 'lines_haber', None)
+        cabecera_ok = True
+        if ld is not None and lh is not None:
+            ld, lh = Decimal(str(ld)), Decimal(str(lh))
+            diff = max(diff, abs(ld - lh))
+            cabecera_ok = (abs(Decimal(str(e.total_debe)) - ld) <= TOLERANCIA_ASIENTO and
+                           abs(Decimal(str(e.total_haber)) - lh) <= TOLERANCIA_ASIENTO)
+        if diff > TOLERANCIA_ASIENTO or not cabecera_ok:
+            item = {
                 'entry_number': e.entry_number,
                 'entry_date':   e.entry_date.isoformat(),
                 'total_debe':   float(e.total_debe),
                 'total_haber':  float(e.total_haber),
                 'diferencia':   float(diff),
-                'description':  e.description[:80],
-            })
-
+                'description':  (e.description or '')[:80],
+            }
+            if ld is not None and lh is not None:
+                item['lines_debe']  = float(ld)
+                item['lines_haber'] = float(lh)
+            descuadrados.append(item)
     return descuadrados
+
+
+def run_partida_doble_check(year: int, month: int = None) -> list:
+    """
+    Verifica que todos los asientos del período (o del año, con month=None)
+    cumplan DEBE == HABER.
+
+    Un solo GROUP BY sobre journal_entry_lines: Σ debe vs Σ haber por asiento,
+    HAVING con diferencia, o con cabecera (total_debe / total_haber) distinta
+    de la suma de sus líneas. La validación de un año completo es un único
+    round-trip; solo viajan los asientos observados.
+    Retorna lista de asientos descuadrados (mismo formato que descuadres()).
+    """
+    from sqlalchemy import func
+    from app.models.journal_entry import JournalEntry as JE
+    from app.models.journal_entry_line import JournalEntryLine as JEL
+    from app.utils.periods import in_month, in_year
+
+    sd = func.coalesce(func.sum(JEL.debe), 0)
+    sh = func.coalesce(func.sum(JEL.haber), 0)
+    periodo = (in_year(JE.entry_date, year) if month is None
+               else in_month(JE.entry_date, year, month))
+
+    rows = db.session.query(
+        JE.entry_number, JE.entry_date, JE.description,
+        JE.total_debe, JE.total_haber,
+        sd.label('lines_debe'), sh.label('lines_haber'),
+    ).outerjoin(
+        JEL, JEL.journal_entry_id == JE.id
+    ).filter(
+        JE.status == 'activo',
+        periodo,
+    ).group_by(JE.id).having(
+        (func.abs(sd - sh) > TOLERANCIA_ASIENTO) |
+        (func.abs(JE.total_debe - sd) > TOLERANCIA_ASIENTO) |
+        (func.abs(JE.total_haber - sh) > TOLERANCIA_ASIENTO)
+    ).order_by(JE.entry_date, JE.entry_number).all()
+
+    return descuadres(rows)
@@ -0,0 +1,281 @@
+"""
+BalanceTimeline — Saldos bancarios a un instante dado (point-in-time)
+======================================================================
+Consulta histórica sobre el ledger BankMovement usando checkpoints
+periódicos (BankBalanceCheckpoint) + deltas, como un log con checkpoints:
+
+    saldo(T) = checkpoint.balance                       (último as_of <= T)
+             + Σ movimientos con as_of < movement_date <= T
+             + Σ movimientos retroactivos (movement_date <= as_of,
+                                            id > checkpoint.last_movement_id)
+
+El costo depende solo de los movimientos posteriores al checkpoint, no del
+largo del historial. Sin checkpoint previo cae al SUM completo hasta T.
+
+Checkpoints:
+  - take_checkpoint()        al confirmar un cierre diario (fin de jornada)
+  - backfill_checkpoints()   CLI `flask balance-checkpoints` para el histórico
+
+Un checkpoint solo es válido mientras el ledger anterior a su as_of no cambie:
+  - Los listeners de BankMovement (app/models/bank_movement.py) borran los
+    checkpoints con as_of >= movement_date cuando un movimiento se inserta con
+    fecha pasada, cambia de monto, fecha o cuenta, o se elimina
+    (invalidate_checkpoints); la próxima consulta cae al checkpoint anterior.
+  - as_of nunca es más reciente que ahora − CHECKPOINT_LAG: un movimiento de
+    una transacción aún abierta (id menor, commit posterior) queda después del
+    checkpoint en vez de perderse.
+
+Los movimientos de un traslado interno anulado no cuentan en ningún saldo
+(counted(): la misma regla en ClosureAccumulator.recompute y en
+BankMovement.compute_running_balance); al anular, el traslado invalida los
+checkpoints desde la fecha de sus movimientos.
+
+Las consultas son de SQLAlchemy Core sobre una conexión (ledger_balances,
+write_checkpoint, invalidate_checkpoints); BalanceTimeline las corre con la
+conexión de db.session.
+"""
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import table, column, select, exists, func, and_, or_
+
+BANKS      = ['BCP', 'INTERBANK', 'BANBIF']
+CURRENCIES = ['USD', 'PEN']
+
+# Margen entre un checkpoint y el presente (transacciones aún sin commit)
+CHECKPOINT_LAG = timedelta(minutes=10)
+
+# Campos de BankMovement que cambian un saldo del ledger
+_LEDGER_FIELDS = ('amount', 'movement_date', 'bank_key', 'currency')
+
+_BM = table(
+    'bank_movements',
+    column('id'), column('bank_key'), column('currency'), column('amount'), column('movement_date'),
+)
+_BBC = table(
+    'bank_balance_checkpoints',
+    column('id'), column('as_of'), column('bank_key'), column('currency'), column('balance'),
+    column('last_movement_id'), column('movements_count'), column('created_at'),
+)
+_IT = table(
+    'internal_transfers',
+    column('status'), column('movement_salida_id'), column('movement_entrada_id'),
+)
+
+
+def _now():
+    from app.utils.formatters import now_peru
+    return now_peru()
+
+
+def _as_datetime(value) -> datetime:
+    """Acepta date (fin del día), datetime o string ISO."""
+    if value is None:
+        return _now()
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value) if 'T' in value or ' ' in value \
+            else date.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value
+    return datetime.combine(value, time.max)
+
+
+# ── Consultas sobre una conexión ────────────────────────────────────────────
+
+def counted(movement_id):
+    """
+    Condición SQL sobre la columna id de bank_movements: el movimiento cuenta
+    en los saldos (no es la salida ni la entrada de un traslado anulado).
+    """
+    return ~exists().where(
+        _IT.c.status == 'anulado',
+        or_(_IT.c.movement_salida_id == movement_id, _IT.c.movement_entrada_id == movement_id),
+    )
+
+
+def latest_checkpoints(conn, ts: datetime) -> dict:
+    """{(bank_key, currency): fila del checkpoint} con el último as_of <= ts."""
+    latest = select(
+        _BBC.c.bank_key, _BBC.c.currency, func.max(_BBC.c.as_of).label('max_as_of'),
+    ).where(_BBC.c.as_of <= ts).group_by(_BBC.c.bank_key, _BBC.c.currency).subquery()
+
+    rows = conn.execute(select(_BBC).join(latest, and_(
+        _BBC.c.bank_key == latest.c.bank_key,
+        _BBC.c.currency == latest.c.currency,
+        _BBC.c.as_of    == latest.c.max_as_of,
+    ))).all()
+    return {(cp.bank_key, cp.currency): cp for cp in rows}
+
+
+def ledger_balances(conn, ts: datetime, max_movement_id: int = None) -> dict:
+    """{(bank_key, currency): saldo} a ts usando checkpoints + deltas."""
+    checkpoints = latest_checkpoints(conn, ts)
+    result = {}
+
+    # Cuentas sin checkpoint: SUM completo hasta ts (un solo GROUP BY)
+    q = select(_BM.c.bank_key, _BM.c.currency, func.sum(_BM.c.amount)).where(
+        _BM.c.movement_date <= ts, counted(_BM.c.id))
+    if max_movement_id is not None:
+        q = q.where(_BM.c.id <= max_movement_id)
+    for bank_key, currency in checkpoints:
+        q = q.where(~and_(_BM.c.bank_key == bank_key, _BM.c.currency == currency))
+    for bank_key, currency, total in conn.execute(q.group_by(_BM.c.bank_key, _BM.c.currency)).all():
+        result[(bank_key, currency)] = float(total or 0)
+
+    # Cuentas con checkpoint: saldo del checkpoint + deltas posteriores
+    for (bank_key, currency), cp in checkpoints.items():
+        dq = select(func.sum(_BM.c.amount)).where(
+            _BM.c.bank_key == bank_key,
+            _BM.c.currency == currency,
+            counted(_BM.c.id),
+            or_(
+                and_(_BM.c.movement_date > cp.as_of, _BM.c.movement_date <= ts),
+                and_(_BM.c.movement_date <= cp.as_of, _BM.c.id > cp.last_movement_id),
+            ),
+        )
+        if max_movement_id is not None:
+            dq = dq.where(_BM.c.id <= max_movement_id)
+        result[(bank_key, currency)] = float(cp.balance or 0) + float(conn.execute(dq).scalar() or 0)
+
+    return result
+
+
+def write_checkpoint(conn, ts: datetime, created_at: datetime = None) -> int:
+    """
+    Registra un checkpoint por cuenta al instante ts (sin aplicar
+    CHECKPOINT_LAG: eso lo decide take_checkpoint). Se apoya en el checkpoint
+    previo, así que su costo también es incremental. Retorna cuántos escribió.
+    """
+    last_id = conn.execute(select(func.max(_BM.c.id))).scalar() or 0
+    counts  = {(bk, cur): int(n or 0) for bk, cur, n in conn.execute(
+        select(_BM.c.bank_key, _BM.c.currency, func.count(_BM.c.id))
+        .where(_BM.c.movement_date <= ts, _BM.c.id <= last_id, counted(_BM.c.id))
+        .group_by(_BM.c.bank_key, _BM.c.currency)
+    ).all()}
+    existing = {(bk, cur) for bk, cur in conn.execute(
+        select(_BBC.c.bank_key, _BBC.c.currency).where(_BBC.c.as_of == ts)
+    ).all()}
+
+    rows = [{
+        'as_of':            ts,
+        'bank_key':         bank_key,
+        'currency':         currency,
+        'balance':          round(balance, 2),
+        'last_movement_id': last_id,
+        'movements_count':  counts.get((bank_key, currency), 0),
+        'created_at':       created_at or ts,
+    } for (bank_key, currency), balance in ledger_balances(conn, ts, max_movement_id=last_id).items()
+        if (bank_key, currency) not in existing]
+    if rows:
+        conn.execute(_BBC.insert(), rows)
+    return len(rows)
+
+
+def invalidate_checkpoints(conn, since: datetime, bank_key: str = None, currency: str = None) -> int:
+    """
+    Borra los checkpoints con as_of >= since (de una cuenta, o de todas):
+    el ledger anterior a su as_of cambió. Retorna cuántos borró.
+    """
+    if since is None:
+        return 0
+    q = _BBC.delete().where(_BBC.c.as_of >= since)
+    if bank_key is not None:
+        q = q.where(_BBC.c.bank_key == bank_key, _BBC.c.currency == currency)
+    return conn.execute(q).rowcount or 0
+
+
+def movement_changed(conn, movement, action: str) -> int:
+    """
+    Listener de BankMovement ('insert' | 'update' | 'delete'): invalidar los
+    checkpoints que ya no cuadran con el ledger. Un insert con la fecha de hoy
+    no toca ninguno (todos son anteriores a ahora − CHECKPOINT_LAG).
+    """
+    from sqlalchemy import inspect
+
+    if action == 'insert':
+        return invalidate_checkpoints(conn, movement.movement_date, movement.bank_key, movement.currency)
+    attrs = inspect(movement).attrs
+    if action == 'update' and not any(attrs[f].history.has_changes() for f in _LEDGER_FIELDS):
+        return 0
+    dates = [d for d in (movement.movement_date, *attrs.movement_date.history.deleted) if d is not None]
+    return invalidate_checkpoints(conn, min(dates)) if dates else 0
+
+
+# ── API (db.session) ────────────────────────────────────────────────────────
+
+class BalanceTimeline:
+    """Métodos estáticos — no requiere instancia."""
+
+    # ── Checkpoints ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def take_checkpoint(as_of=None) -> int:
+        """
+        Registra un checkpoint por cuenta al instante as_of (default: ahora),
+        acotado a ahora − CHECKPOINT_LAG. No hace commit — el caller confirma.
+        Retorna cuántos checkpoints escribió.
+        """
+        from app.extensions import db
+
+        now = _now()
+        ts  = min(_as_datetime(as_of), now - CHECKPOINT_LAG)
+        return write_checkpoint(db.session.connection(), ts, created_at=now)
+
+    @staticmethod
+    def backfill_checkpoints(start: date = None, end: date = None, every_days: int = 1) -> int:
+        """
+        Genera checkpoints de fin de día desde `start` (default: primer
+        movimiento del ledger) hasta `end` (default: ayer), uno cada `every_days`.
+        Hace commit por checkpoint para no retener una transacción larga.
+        """
+        from app.extensions import db
+
+        if start is None:
+            first = db.session.execute(select(func.min(_BM.c.movement_date))).scalar()
+            if first is None:
+                return 0
+            start = first.date()
+        end = end or (_now().date() - timedelta(days=1))
+
+        written = 0
+        day = start
+        while day <= end:
+            written += BalanceTimeline.take_checkpoint(datetime.combine(day, time.max))
+            db.session.commit()
+            day += timedelta(days=max(1, every_days))
+        return written
+
+    # ── Consultas ─────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _balances_at(ts: datetime) -> dict:
+        """{(bank_key, currency): saldo} a ts usando checkpoints + deltas."""
+        from app.extensions import db
+        return ledger_balances(db.session.connection(), ts)
+
+    @staticmethod
+    def balance_at(bank_key: str, currency: str, ts=None) -> float:
+        """Saldo del ledger de una cuenta a un instante dado."""
+        return round(BalanceTimeline._balances_at(_as_datetime(ts)).get((bank_key, currency), 0.0), 2)
+
+    @staticmethod
+    def balances_at(ts=None) -> dict:
+        """
+        Saldos de todas las cuentas a un instante dado.
+
+        Returns:
+            as_of:     instante consultado (ISO)
+            by_bank:   {BCP: {USD: x, PEN: y}, INTERBANK: {...}, BANBIF: {...}}
+            total_usd, total_pen
+        """
+        moment = _as_datetime(ts)
+        by_bank = {b: {c: 0.0 for c in CURRENCIES} for b in BANKS}
+        for (bank_key, currency), bal in BalanceTimeline._balances_at(moment).items():
+            if bank_key in by_bank and currency in CURRENCIES:
+                by_bank[bank_key][currency] = round(bal, 2)
+
+        return {
+            'as_of':     moment.isoformat(),
+            'by_bank':   by_bank,
+            'total_usd': round(sum(b['USD'] for b in by_bank.values()), 2),
+            'total_pen': round(sum(b['PEN'] for b in by_bank.values()), 2),
+        }
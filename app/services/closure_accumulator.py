@@ -0,0 +1,326 @@
+"""
+ClosureAccumulator — Totales precalculados del Cierre Diario
+=============================================================
+Mantiene actualizado el borrador de DailyClosure a medida que ocurren los
+eventos del día, en lugar de reconstruirlo desde cero en cada "Calcular".
+
+Eventos que actualizan el borrador (mismo patrón que TraderDailyProfit):
+  apply_operation  — operación completada (o revertida con reverse=True)
+  apply_movement   — BankMovement registrado / de un traslado anulado (saldos del sistema)
+  apply_match      — amarre creado / anulado (spread bruto del día)
+  apply_expenses   — asiento con cuentas 6xxx creado / anulado (gastos del día)
+
+Reglas:
+  - Solo se actualizan borradores ya "sembrados" (accumulated_at != NULL).
+    Un borrador sin sembrar se recalcula completo en el próximo Calcular.
+  - Un cierre VALIDADO nunca se modifica.
+  - Los métodos apply_* NO hacen commit: participan de la transacción del
+    caller, así el total y el evento que lo origina se confirman juntos.
+  - Nunca lanzan excepciones al caller (un fallo aquí no afecta la operación).
+
+Calcular = lectura del borrador + refresco de contadores puntuales
+(pendientes, amarres abiertos, posición) + diferencias vs saldos reales.
+El recálculo completo solo corre si el borrador no está sembrado o si el
+usuario lo pide explícitamente (recompute=True).
+"""
+import logging
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+
+from app.extensions import db
+from app.utils.formatters import now_peru
+
+_log = logging.getLogger(__name__)
+
+BANKS      = ['BCP', 'INTERBANK', 'BANBIF']
+CURRENCIES = ['USD', 'PEN']
+
+
+def _f(value) -> float:
+    return float(value or 0)
+
+
+class ClosureAccumulator:
+    """Métodos estáticos — no requiere instancia."""
+
+    # ── Borradores ────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _seeded_draft(fecha: date):
+        """Borrador sembrado de la fecha dada, o None si no aplica acumular."""
+        from app.models.daily_closure import DailyClosure
+
+        closure = DailyClosure.query.filter_by(closure_date=fecha).first()
+        if closure is None or closure.is_validated or closure.accumulated_at is None:
+            return None
+        return closure
+
+    @staticmethod
+    def _seeded_drafts_from(fecha: date) -> list:
+        """Borradores sembrados con closure_date >= fecha (saldos acumulados)."""
+        from app.models.daily_closure import DailyClosure
+
+        return DailyClosure.query.filter(
+            DailyClosure.closure_date >= fecha,
+            DailyClosure.status == DailyClosure.STATUS_BORRADOR,
+            DailyClosure.accumulated_at.isnot(None),
+        ).all()
+
+    @staticmethod
+    def invalidate_from(fecha: date) -> int:
+        """
+        Desiembra los borradores con closure_date >= fecha: el próximo Calcular
+        los recalcula completos. Para escrituras masivas al ledger (backfill)
+        en lugar de un apply_movement por movimiento. No hace commit.
+        """
+        from app.models.daily_closure import DailyClosure
+
+        return DailyClosure.query.filter(
+            DailyClosure.closure_date >= fecha,
+            DailyClosure.status == DailyClosure.STATUS_BORRADOR,
+            DailyClosure.accumulated_at.isnot(None),
+        ).update({'accumulated_at': None}, synchronize_session=False)
+
+    # ── Eventos ───────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def apply_operation(operation, reverse: bool = False):
+        """
+        Suma (o resta si reverse=True) una operación completada a los totales
+        del día: conteo, volumen, USD comprado/vendido y TC promedio ponderado.
+        """
+        try:
+            if not operation.completed_at:
+                return
+            closure = ClosureAccumulator._seeded_draft(operation.completed_at.date())
+            if closure is None:
+                return
+
+            sign = -1 if reverse else 1
+            usd  = _f(operation.amount_usd) * sign
+            rate = _f(operation.exchange_rate)
+
+            closure.operations_completed = max(0, (closure.operations_completed or 0) + sign)
+            closure.total_volume_usd     = round(_f(closure.total_volume_usd) + usd, 2)
+
+            if operation.operation_type == 'Compra':
+                prev_usd = _f(closure.total_bought_usd)
+                new_usd  = prev_usd + usd
+                closure.total_bought_usd = round(new_usd, 2)
+                closure.avg_buy_rate     = round(
+                    (_f(closure.avg_buy_rate) * prev_usd + rate * usd) / new_usd, 4
+                ) if new_usd > 0 else 0
+            else:
+                prev_usd = _f(closure.total_sold_usd)
+                new_usd  = prev_usd + usd
+                closure.total_sold_usd = round(new_usd, 2)
+                closure.avg_sell_rate  = round(
+                    (_f(closure.avg_sell_rate) * prev_usd + rate * usd) / new_usd, 4
+                ) if new_usd > 0 else 0
+        except Exception as exc:
+            _log.error(f'[ClosureAccumulator] apply_operation '
+                       f'{getattr(operation, "operation_id", "?")}: {exc}')
+
+    @staticmethod
+    def apply_movement(movement, reverse: bool = False):
+        """
+        Aplica (o quita si reverse=True) un BankMovement a los saldos del
+        sistema de los borradores sembrados desde su fecha (el saldo del
+        sistema es acumulado).
+        """
+        try:
+            if movement.bank_key not in BANKS or movement.currency not in CURRENCIES:
+                return
+            mv_date = movement.closure_date or (movement.movement_date or now_peru()).date()
+            for closure in ClosureAccumulator._seeded_drafts_from(mv_date):
+                balances = closure.system_balances or {}
+                bank     = balances.setdefault(movement.bank_key, {c: 0.0 for c in CURRENCIES})
+                delta    = -_f(movement.amount) if reverse else _f(movement.amount)
+                bank[movement.currency] = round(_f(bank.get(movement.currency)) + delta, 2)
+                closure.system_balances = balances
+        except Exception as exc:
+            _log.error(f'[ClosureAccumulator] apply_movement: {exc}')
+
+    @staticmethod
+    def apply_match(match, reverse: bool = False):
+        """Suma (o resta) la utilidad de un amarre al spread bruto de su día."""
+        try:
+            created = match.created_at or now_peru()
+            closure = ClosureAccumulator._seeded_draft(created.date())
+            if closure is None:
+                return
+            delta = _f(match.profit_pen) * (-1 if reverse else 1)
+            closure.gross_spread_pen = round(_f(closure.gross_spread_pen) + delta, 2)
+            closure.net_profit_pen   = round(
+                _f(closure.gross_spread_pen) - _f(closure.expenses_pen), 2
+            )
+        except Exception as exc:
+            _log.error(f'[ClosureAccumulator] apply_match: {exc}')
+
+    @staticmethod
+    def apply_expenses(entry_date: date, lines, reverse: bool = False):
+        """
+        Suma (o resta) el DEBE de las líneas 6xxx de un asiento a los gastos
+        del día. `lines` acepta dicts (create_entry) o JournalEntryLine.
+        """
+        try:
+            amount = 0.0
+            for line in lines or []:
+                code = line.get('account_code') if isinstance(line, dict) else line.account_code
+                debe = line.get('debe', 0) if isinstance(line, dict) else line.debe
+                if str(code or '').startswith('6'):
+                    amount += _f(debe)
+            if not amount:
+                return
+            closure = ClosureAccumulator._seeded_draft(entry_date)
+            if closure is None:
+                return
+            delta = -amount if reverse else amount
+            closure.expenses_pen   = round(_f(closure.expenses_pen) + delta, 2)
+            closure.net_profit_pen = round(
+                _f(closure.gross_spread_pen) - _f(closure.expenses_pen), 2
+            )
+        except Exception as exc:
+            _log.error(f'[ClosureAccumulator] apply_expenses: {exc}')
+
+    # ── Recalculo completo ────────────────────────────────────────────────────
+
+    @staticmethod
+    def recompute(closure):
+        """
+        Reconstruye los totales del día desde operaciones, amarres, asientos
+        y el ledger. Deja el borrador sembrado (accumulated_at = ahora).
+        """
+        from app.models import (
+            Operation, AccountingMatch, BankMovement, JournalEntry, JournalEntryLine,
+        )
+        from app.services.balance_timeline import counted
+
+        fecha = closure.closure_date
+        start = datetime.combine(fecha, datetime.min.time())
+        end   = start + timedelta(days=1)
+
+        # ── Operaciones completadas en el día (agregado SQL) ──
+        rows = db.session.query(
+            Operation.operation_type,
+            func.count(Operation.id),
+            func.sum(Operation.amount_usd),
+            func.sum(Operation.amount_usd * Operation.exchange_rate),
+        ).filter(
+            Operation.status == 'Completada',
+            Operation.completed_at >= start,
+            Operation.completed_at <  end,
+        ).group_by(Operation.operation_type).all()
+
+        by_type = {t: (int(n or 0), _f(usd), _f(pen)) for t, n, usd, pen in rows}
+        n_buy,  buy_usd,  buy_pen  = by_type.get('Compra', (0, 0.0, 0.0))
+        n_sell, sell_usd, sell_pen = by_type.get('Venta',  (0, 0.0, 0.0))
+
+        # ── Amarres del día ──
+        spread_pen = _f(db.session.query(func.sum(AccountingMatch.profit_pen)).filter(
+            AccountingMatch.status == 'Activo',
+            AccountingMatch.created_at >= start,
+            AccountingMatch.created_at <  end,
+        ).scalar())
+
+        # ── Gastos del día (cuentas 6xxx) ──
+        expenses_pen = _f(db.session.query(func.sum(JournalEntryLine.debe)).join(
+            JournalEntry, JournalEntry.id == JournalEntryLine.journal_entry_id
+        ).filter(
+            JournalEntry.entry_date == fecha,
+            JournalEntry.status == 'activo',
+            JournalEntryLine.account_code.like('6%'),
+        ).scalar())
+
+        # ── Saldos del sistema por banco (ledger, un solo GROUP BY) ──
+        # Los movimientos de un traslado anulado no cuentan (misma regla que BalanceTimeline)
+        balances = {b: {c: 0.0 for c in CURRENCIES} for b in BANKS}
+        for bank_key, currency, total in db.session.query(
+            BankMovement.bank_key, BankMovement.currency, func.sum(BankMovement.amount),
+        ).filter(counted(BankMovement.id)).group_by(BankMovement.bank_key, BankMovement.currency).all():
+            if bank_key in balances and currency in CURRENCIES:
+                balances[bank_key][currency] = round(_f(total), 2)
+
+        closure.system_balances      = balances
+        closure.operations_completed = n_buy + n_sell
+        closure.total_volume_usd     = round(buy_usd + sell_usd, 2)
+        closure.total_bought_usd     = round(buy_usd,  2)
+        closure.total_sold_usd       = round(sell_usd, 2)
+        closure.avg_buy_rate         = round(buy_pen  / buy_usd,  4) if buy_usd  > 0 else 0
+        closure.avg_sell_rate        = round(sell_pen / sell_usd, 4) if sell_usd > 0 else 0
+        closure.gross_spread_pen     = round(spread_pen, 2)
+        closure.expenses_pen         = round(expenses_pen, 2)
+        closure.net_profit_pen       = round(spread_pen - expenses_pen, 2)
+        closure.accumulated_at       = now_peru()
+        return closure
+
+    # ── Calcular ──────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def refresh_live_counters(closure):
+        """Contadores puntuales (no acumulables): pendientes, amarres abiertos, posición."""
+        from app.models import Operation, AccountingMatch, AccountingBatch
+
+        closure.pending_operations = Operation.query.filter(
+            Operation.status.in_(['Pendiente', 'En proceso'])
+        ).count()
+
+        closure.open_matches = AccountingMatch.query.filter(
+            AccountingMatch.status == 'Activo',
+        ).outerjoin(
+            AccountingBatch, AccountingMatch.batch_id == AccountingBatch.id
+        ).filter(
+            db.or_(AccountingMatch.batch_id.is_(None), AccountingBatch.status != 'Cerrado')
+        ).count()
+
+        # USD completado sin amarrar (3 agregados, sin cargar operaciones)
+        compras = _f(db.session.query(func.sum(Operation.amount_usd)).filter(
+            Operation.status == 'Completada', Operation.operation_type == 'Compra',
+        ).scalar())
+        ventas = _f(db.session.query(func.sum(Operation.amount_usd)).filter(
+            Operation.status == 'Completada', Operation.operation_type == 'Venta',
+        ).scalar())
+        matched = _f(db.session.query(func.sum(AccountingMatch.matched_amount_usd)).filter(
+            AccountingMatch.status == 'Activo',
+        ).scalar())
+        closure.unmatched_completed_usd = round(
+            max(0.0, compras - matched) - max(0.0, ventas - matched), 2
+        )
+        return closure
+
+    @staticmethod
+    def calcular(fecha: date, user_id: int = None, recompute: bool = False):
+        """
+        Obtiene (o crea) el borrador del día y lo deja listo para revisión.
+        No hace commit — el caller confirma.
+
+        Returns:
+            (closure, recomputed: bool)
+        """
+        from app.models.daily_closure import DailyClosure
+
+        closure = DailyClosure.query.filter_by(closure_date=fecha).first()
+        if not closure:
+            closure = DailyClosure(
+                closure_date = fecha,
+                status       = DailyClosure.STATUS_BORRADOR,
+                created_by   = user_id,
+            )
+            db.session.add(closure)
+
+        if closure.is_validated:
+            return closure, False
+
+        recomputed = False
+        if recompute or closure.accumulated_at is None:
+            ClosureAccumulator.recompute(closure)
+            recomputed = True
+
+        ClosureAccumulator.refresh_live_counters(closure)
+
+        # Diff contra saldos reales ya ingresados (si los hay)
+        if closure.validated_balances:
+            closure.compute_differences()
+
+        return closure, recomputed
@@ -0,0 +1,241 @@
+"""
+Motor de exportación Excel en streaming (openpyxl write-only)
+==============================================================
+Base común para los reportes .xlsx (Libro Diario, Mayor, Balance, Caja y
+Bancos, LIG, Amarres, historial de operaciones, clientes, prospectos).
+
+  - Workbook(write_only=True): cada fila se serializa al archivo temporal de
+    la hoja al agregarla; la memoria no crece con el número de filas.
+  - Estilos con nombre (NamedStyle) registrados una sola vez por libro: las
+    celdas referencian 'qc_header', 'qc_num', ... en lugar de crear Font /
+    Fill / Border por celda.
+  - iter_query(): recorre consultas con cursor del servidor en bloques.
+  - to_response(): guarda a disco temporal y envía el archivo por bloques
+    (Response de Flask), borrándolo al terminar.
+
+Uso:
+    xl = ExcelExport()
+    ws = xl.sheet('Libro Diario', widths=[16, 12, 48], freeze='A7')
+    ws.title_block([(razon_social, 'qc_company'), (f'RUC: {ruc}', 'qc_center')], ncols=3)
+    ws.header(['N° Asiento', 'Fecha', 'Descripción'])
+    for r in iter_query(q):
+        ws.append([r.entry_number, r.entry_date, r.description], styles=['qc_cell', 'qc_date', 'qc_cell'])
+    return xl.to_response('libro_diario.xlsx')
+
+Restricción de write-only: anchos, freeze y merges se declaran antes o junto
+con las filas (no se puede volver a una celda ya escrita).
+"""
+import os
+import tempfile
+import time
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, Font, Alignment, PatternFill, Border, Side
+from openpyxl.utils import get_column_letter
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Filas por ida al cursor del servidor
+CHUNK_ROWS = 1000
+# Bytes por bloque al enviar el archivo
+SEND_CHUNK = 64 * 1024
+# Filas entre cesiones al hub: bajo eventlet (monkey_patch) time.sleep(0) deja
+# correr a los demás greenlets mientras se arma un libro grande
+YIELD_EVERY = 500
+
+NUM_FMT  = '#,##0.00'
+DATE_FMT = 'DD/MM/YYYY'
+
+_NAVY   = '1B3A6B'
+_thin   = Side(style='thin')
+_soft   = Side(style='thin', color='CCCCCC')
+_BORDER = Border(left=_thin, right=_thin, top=_thin, bottom=_thin)
+_SOFT   = Border(left=_soft, right=_soft, top=_soft, bottom=_soft)
+
+
+def _fill(color: str) -> PatternFill:
+    return PatternFill(start_color=color, end_color=color, fill_type='solid')
+
+
+def _style(name, font=None, fill=None, border=None, alignment=None, number_format=None) -> NamedStyle:
+    ns = NamedStyle(name=name)
+    if font:
+        ns.font = font
+    if fill:
+        ns.fill = fill
+    if border:
+        ns.border = border
+    if alignment:
+        ns.alignment = alignment
+    if number_format:
+        ns.number_format = number_format
+    return ns
+
+
+def _build_styles() -> list:
+    center = Alignment(horizontal='center')
+    wrap_c = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    return [
+        # Encabezado del reporte
+        _style('qc_company',   font=Font(bold=True, size=12), alignment=center),
+        _style('qc_title',     font=Font(bold=True),          alignment=center),
+        _style('qc_center',    alignment=center),
+        _style('qc_company_l', font=Font(bold=True, size=11)),
+        _style('qc_title_l',   font=Font(bold=True, size=12)),
+        _style('qc_muted',     font=Font(size=9, color='555555')),
+        _style('qc_note',      font=Font(italic=True, size=9, color='777777')),
+        # Cabecera de tabla
+        _style('qc_header',    font=Font(bold=True, color='FFFFFF'), fill=_fill(_NAVY),
+               border=_BORDER, alignment=center),
+        _style('qc_header_sm', font=Font(bold=True, color='FFFFFF', size=10), fill=_fill(_NAVY),
+               border=_SOFT, alignment=wrap_c),
+        # Celdas de datos
+        _style('qc_cell',      border=_BORDER),
+        _style('qc_num',       border=_BORDER, number_format=NUM_FMT),
+        _style('qc_date',      border=_BORDER, number_format=DATE_FMT),
+        _style('qc_cell_soft', border=_SOFT),
+        _style('qc_num_soft',  border=_SOFT, number_format=NUM_FMT),
+        _style('qc_cell_even', border=_SOFT, fill=_fill('F4F7FB')),
+        _style('qc_num_even',  border=_SOFT, fill=_fill('F4F7FB'), number_format=NUM_FMT),
+        _style('qc_status_on',  font=Font(bold=True, color='1D7A3A'), border=_SOFT),
+        _style('qc_status_off', font=Font(bold=True, color='888888'), border=_SOFT),
+        # Totales / secciones
+        _style('qc_bold',      font=Font(bold=True)),
+        _style('qc_bold_num',  font=Font(bold=True), number_format=NUM_FMT),
+        _style('qc_section',   font=Font(bold=True), fill=_fill('D6E4F0'), border=_BORDER),
+        _style('qc_section_num', font=Font(bold=True), fill=_fill('D6E4F0'), border=_BORDER,
+               number_format=NUM_FMT),
+        _style('qc_subtotal',  font=Font(bold=True, size=10), fill=_fill('E8EDF4'), border=_SOFT),
+        _style('qc_subtotal_num', font=Font(bold=True, size=10), fill=_fill('E8EDF4'), border=_SOFT,
+               number_format=NUM_FMT),
+        _style('qc_total',     font=Font(bold=True), fill=_fill('E8F5E9'), border=_BORDER),
+        _style('qc_total_num', font=Font(bold=True), fill=_fill('E8F5E9'), border=_BORDER,
+               number_format=NUM_FMT),
+        _style('qc_total_ok',  font=Font(bold=True), fill=_fill('D4EDDA'), number_format=NUM_FMT),
+        _style('qc_total_bad', font=Font(bold=True), fill=_fill('F8D7DA'), number_format=NUM_FMT),
+    ]
+
+
+def iter_query(query, chunk_rows: int = CHUNK_ROWS):
+    """
+    Recorre una consulta SQLAlchemy con cursor del servidor en bloques.
+    No usar con joinedload de colecciones (incompatible con yield_per);
+    preferir consultas de columnas o selectinload.
+    """
+    return query.execution_options(stream_results=True).yield_per(chunk_rows)
+
+
+class SheetWriter:
+    """Hoja write-only con cursor de fila y helpers de encabezado/cabecera."""
+
+    def __init__(self, ws):
+        self.ws      = ws
+        self.row_num = 0
+
+    def _cell(self, value, style):
+        if style is None:
+            return value
+        c = WriteOnlyCell(self.ws, value=value)
+        c.style = style
+        return c
+
+    def append(self, values, style: str = None, styles=None, height: float = None):
+        """
+        Agrega una fila. `style` aplica a todas las celdas; `styles` (lista)
+        define el estilo por columna (None = sin estilo). En write-only el
+        alto se fija antes de append: la fila se escribe al agregarla.
+        """
+        if styles is None:
+            styles = [style] * len(values)
+        if height:
+            self.ws.row_dimensions[self.row_num + 1].height = height
+        self.ws.append([self._cell(v, s) for v, s in zip(values, styles)])
+        self.row_num += 1
+        if self.row_num % YIELD_EVERY == 0:
+            time.sleep(0)
+        return self.row_num
+
+    def blank(self, n: int = 1):
+        for _ in range(n):
+            self.ws.append([])
+            self.row_num += 1
+
+    def merge(self, first_col: int, last_col: int, row: int = None):
+        """Combina columnas de la fila indicada (default: la última escrita)."""
+        r = row or self.row_num
+        self.ws.merged_cells.add(f'{get_column_letter(first_col)}{r}:{get_column_letter(last_col)}{r}')
+
+    def title_block(self, lines, ncols: int = None):
+        """Filas de título [(texto, estilo)], combinadas sobre ncols columnas si se indica."""
+        for text, style in lines:
+            self.append([text], style=style)
+            if ncols and ncols > 1:
+                self.merge(1, ncols)
+
+    def header(self, labels, style: str = 'qc_header', height: float = None):
+        return self.append(list(labels), style=style, height=height)
+
+
+class ExcelExport:
+    """Libro write-only con los estilos con nombre del sistema ya registrados."""
+
+    def __init__(self):
+        self.wb = Workbook(write_only=True)
+        for ns in _build_styles():
+            self.wb.add_named_style(ns)
+        self._sheets = 0
+
+    def sheet(self, title: str, widths=None, freeze: str = None) -> SheetWriter:
+        ws = self.wb.create_sheet(title=title[:31])
+        for i, w in enumerate(widths or [], 1):
+            ws.column_dimensions[get_column_letter(i)].width = w
+        if freeze:
+            ws.freeze_panes = freeze
+        self._sheets += 1
+        return SheetWriter(ws)
+
+    def save(self, path: str):
+        """Guarda el libro en `path` (un libro sin hojas recibe una vacía)."""
+        if not self._sheets:
+            self.sheet('Hoja1')
+        self.wb.save(path)
+
+    def to_response(self, filename: str):
+        """
+        Guarda a un archivo temporal y lo envía por bloques; el archivo se borra
+        al terminar la descarga (o si el cliente la corta).
+        """
+        from flask import Response
+
+        fd, path = tempfile.mkstemp(prefix='qc_export_', suffix='.xlsx')
+        os.close(fd)
+        try:
+            self.save(path)
+            size = os.path.getsize(path)
+        except Exception:
+            os.remove(path)
+            raise
+
+        def _send():
+            try:
+                with open(path, 'rb') as fh:
+                    while True:
+                        chunk = fh.read(SEND_CHUNK)
+                        if not chunk:
+                            break
+                        yield chunk
+            finally:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        return Response(
+            _send(),
+            mimetype=XLSX_MIMETYPE,
+            headers={
+                'Content-Disposition': f'attachment; filename="{filename}"',
+                'Content-Length':      str(size),
+            },
+        )
@@ -0,0 +1,211 @@
+"""
+Motor de expiración por deadline — QoriCash
+===========================================
+Reemplaza el sondeo cada 60 s de operaciones pendientes. Cada operación que
+puede expirar tiene un deadline (created_at + 15 min); el motor los guarda en
+un min-heap, duerme exactamente hasta el más próximo y entonces expira todas
+las operaciones vencidas con un solo UPDATE ... RETURNING.
+
+    engine = ExpiryEngine(expire, load, clock=now_peru)
+    spawn(engine.run_forever)          # carga los deadlines pendientes y espera
+    engine.schedule(op.id, deadline)   # al crear una operación
+
+  - El heap es solo un despertador: expire(now) vuelve a filtrar en SQL por
+    estado, origen y created_at, así que un deadline de una operación que ya
+    pasó a 'En proceso' (o de un INSERT que hizo rollback) no cancela nada.
+  - Cada IDLE_SECONDS (5 min) el motor recarga los deadlines desde la base:
+    así aprende las operaciones creadas en otros workers o scripts (el motor
+    corre en un solo worker, ver scheduler_coordinator.py) con margen de
+    sobra antes de que venzan a los 15 min, y descarta los deadlines
+    obsoletos. No es un sondeo de expiración: solo refresca el heap.
+  - schedule() solo registra mientras run_forever() está corriendo en este
+    proceso; en los demás workers es un no-op.
+  - Las notificaciones (Socket.IO, email, push, WhatsApp) no bloquean el
+    motor: se encolan en un Dispatcher con sus propios workers.
+
+Solo usa la librería estándar; bajo eventlet.monkey_patch(thread=True) la
+cola y el lock son cooperativos (greenlets).
+"""
+import heapq
+import logging
+import queue
+import threading
+import time
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+# Red de seguridad: recargar deadlines desde la base cada 5 min
+IDLE_SECONDS = 300
+
+# Si expire() falla (BD caída), reintentar los vencidos en 30 s
+RETRY_SECONDS = 30
+
+
+class DeadlineHeap:
+    """
+    Min-heap de (deadline, op_id) con borrado perezoso: reprogramar o
+    descartar una operación solo actualiza _deadline; las entradas viejas
+    se ignoran al llegar a la cima.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._deadline = {}        # op_id → deadline vigente
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._deadline)
+
+    def push(self, op_id, deadline) -> bool:
+        """Programar (o reprogramar) op_id. True si pasa a ser el deadline más próximo."""
+        with self._lock:
+            self._deadline[op_id] = deadline
+            heapq.heappush(self._heap, (deadline, op_id))
+            self._prune()
+            return self._heap[0] == (deadline, op_id)
+
+    def discard(self, op_id):
+        with self._lock:
+            self._deadline.pop(op_id, None)
+
+    def next_deadline(self):
+        with self._lock:
+            self._prune()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now) -> list:
+        """Sacar y devolver los op_id con deadline <= now, en orden de deadline."""
+        due = []
+        with self._lock:
+            self._prune()
+            while self._heap and self._heap[0][0] <= now:
+                _, op_id = heapq.heappop(self._heap)
+                del self._deadline[op_id]
+                due.append(op_id)
+                self._prune()
+        return due
+
+    def _prune(self):
+        while self._heap and self._deadline.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+
+class ExpiryEngine:
+    """
+    expire(now) → lista de ids expirados (hace el UPDATE y el commit).
+    load()      → iterable de (op_id, deadline) pendientes (al arrancar y cada idle_seconds).
+    clock()     → "ahora" en la misma zona que los deadlines (now_peru).
+    """
+
+    def __init__(self, expire, load, clock, idle_seconds: float = IDLE_SECONDS):
+        self.heap = DeadlineHeap()
+        self._expire = expire
+        self._load = load
+        self._clock = clock
+        self._idle = idle_seconds
+        self._wake = queue.Queue()
+        self._stopped = False
+        self.running = False
+
+    def schedule(self, op_id, deadline):
+        """Registrar un deadline; despierta al motor si es anterior al que espera."""
+        if not self.running:
+            return
+        if self.heap.push(op_id, deadline):
+            self._wake.put(None)
+
+    def cancel(self, op_id):
+        self.heap.discard(op_id)
+
+    def stop(self):
+        self._stopped = True
+        self._wake.put(None)
+
+    def seconds_until_next(self) -> float:
+        deadline = self.heap.next_deadline()
+        if deadline is None:
+            return self._idle
+        return min(self._idle, max(0.0, (deadline - self._clock()).total_seconds()))
+
+    def tick(self) -> list:
+        """Expirar lo vencido a la fecha. Devuelve los ids expirados."""
+        now = self._clock()
+        due = self.heap.pop_due(now)
+        try:
+            return self._expire(now)
+        except Exception as e:
+            logger.error(f"[EXPIRY] Error expirando operaciones: {e}")
+            retry = now + timedelta(seconds=RETRY_SECONDS)
+            for op_id in due:
+                self.heap.push(op_id, retry)
+            return []
+
+    def reload(self):
+        """Reconstruir el heap con los deadlines pendientes de la base."""
+        heap = DeadlineHeap()
+        for op_id, deadline in self._load():
+            heap.push(op_id, deadline)
+        self.heap = heap
+        logger.debug(f"[EXPIRY] {len(heap)} deadlines pendientes cargados")
+
+    def _safe_reload(self):
+        try:
+            self.reload()
+        except Exception as e:
+            logger.error(f"[EXPIRY] No se pudieron cargar los deadlines: {e}")
+
+    def run_forever(self):
+        self.running = True
+        try:
+            self._safe_reload()
+            loaded_at = time.monotonic()
+            while not self._stopped:
+                try:
+                    self._wake.get(timeout=self.seconds_until_next())
+                    continue              # nuevo deadline más próximo: recalcular la espera
+                except queue.Empty:
+                    pass
+                if self._stopped:
+                    break
+                self.tick()
+                if time.monotonic() - loaded_at >= self._idle:
+                    self._safe_reload()
+                    loaded_at = time.monotonic()
+        finally:
+            self.running = False
+
+
+class Dispatcher:
+    """
+    Cola de trabajos con N workers; handler(item) corre fuera del motor y sus
+    excepciones se registran sin detener al worker.
+    """
+
+    def __init__(self, handler, name: str = 'dispatcher'):
+        self._handler = handler
+        self._name = name
+        self._queue = queue.Queue()
+
+    def submit(self, item):
+        self._queue.put(item)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stop(self, workers: int = 1):
+        for _ in range(workers):
+            self._queue.put(_STOP)
+
+    def run_forever(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            try:
+                self._handler(item)
+            except Exception as e:
+                logger.error(f"[{self._name}] Error procesando {item!r}: {e}")
+
+
+_STOP = object()
@@ -0,0 +1,313 @@
+"""
+ExportJobService — Cola de exportaciones en segundo plano
+==========================================================
+Los exports grandes (workbook contable multi-hoja, historial de operaciones,
+historial de cliente, prospectos completos) corrían dentro del request: con
+timeout de gunicorn de 300s y un solo worker eventlet, bloqueaban al resto.
+
+  POST /exports/api/jobs {kind, params}   → 202 con el job (o el existente)
+  worker (greenlet)                       → arma el .xlsx con el builder del
+                                            kind y lo guarda en EXPORT_DIR
+  socketio 'export_ready' a user_{id}     → el navegador descarga
+  GET /exports/api/jobs/<id>/download     → envía el artefacto
+
+Deduplicación: (kind, parámetros normalizados) → params_hash. Si hay un job
+idéntico en curso o con artefacto vigente (expires_at), se reutiliza y el
+solicitante queda suscrito a la notificación.
+
+Artefactos en disco local con TTL (EXPORT_TTL_MINUTES); purge_expired() los
+borra — corre al encolar y desde el scheduler de expiración.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from datetime import date, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_, text
+
+from app.extensions import db
+from app.models.export_job import (
+    ExportJob, STATUS_PENDIENTE, STATUS_PROCESANDO, STATUS_LISTO, STATUS_ERROR, STATUS_EXPIRADO,
+)
+from app.utils.formatters import now_peru
+
+logger = logging.getLogger(__name__)
+
+# Un job en curso más antiguo que esto se considera huérfano (reinicio del worker)
+STALE_MINUTES = 20
+
+_slots      = None
+_slots_lock = threading.Lock()
+
+
+# ── Normalización de parámetros ───────────────────────────────────────────────
+
+def _iso_date(value):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f'Fecha inválida: {value}')
+
+
+def _with_user(role: str) -> bool:
+    from app.routes.operations import _operations_xl_with_user
+    return _operations_xl_with_user(role)
+
+
+def _params_periodo(raw: dict, user) -> dict:
+    today = date.today()
+    year  = int(raw.get('year')  or today.year)
+    month = int(raw.get('month') or today.month)
+    if not 1 <= month <= 12:
+        raise ValueError('Mes inválido')
+    return {'year': year, 'month': month}
+
+
+def _params_operations_history(raw: dict, user) -> dict:
+    return {
+        'start_date': _iso_date(raw.get('start_date')),
+        'end_date':   _iso_date(raw.get('end_date')),
+        'with_user':  _with_user(user.role),
+    }
+
+
+def _params_client_history(raw: dict, user) -> dict:
+    from app.models.client import Client
+
+    client_id = int(raw.get('client_id') or 0)
+    if not client_id or db.session.get(Client, client_id) is None:
+        raise ValueError('Cliente no encontrado')
+    params = _params_operations_history(raw, user)
+    params['client_id'] = client_id
+    return params
+
+
+def _params_none(raw: dict, user) -> dict:
+    return {}
+
+
+# ── Builders (retornan (ExcelExport, filename)) ───────────────────────────────
+
+def _build_contabilidad(p):
+    from app.routes.contabilidad import build_contabilidad_workbook
+    return build_contabilidad_workbook(p['year'], p['month'])
+
+
+def _build_operations_history(p):
+    from app.routes.operations import build_operations_history
+    return build_operations_history(p['start_date'], p['end_date'], p['with_user'])
+
+
+def _build_client_history(p):
+    from app.routes.clients import build_client_history
+    return build_client_history(p['client_id'], p['start_date'], p['end_date'], p['with_user'])
+
+
+def _build_prospectos_full(p):
+    from app.routes.prospeccion import build_prospectos_full
+    return build_prospectos_full()
+
+
+# kind → roles permitidos (None = cualquier usuario autenticado), params, build
+KINDS = {
+    'contabilidad_excel': {'roles': ('Master',), 'params': _params_periodo,
+                           'build': _build_contabilidad},
+    'operations_history': {'roles': None, 'params': _params_operations_history,
+                           'build': _build_operations_history},
+    'client_history':     {'roles': None, 'params': _params_client_history,
+                           'build': _build_client_history},
+    'prospectos_full':    {'roles': ('Master',), 'params': _params_none,
+                           'build': _build_prospectos_full},
+}
+
+
+def _params_hash(kind: str, params: dict) -> str:
+    raw = json.dumps({'kind': kind, 'params': params}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _export_dir() -> str:
+    path = current_app.config.get('EXPORT_DIR') or os.path.join(tempfile.gettempdir(), 'qoricash_exports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _worker_slots():
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(max(1, int(current_app.config.get('EXPORT_MAX_CONCURRENT', 1))))
+        return _slots
+
+
+def _remove_file(path):
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ExportJobService:
+    """Métodos estáticos — no requiere instancia."""
+
+    @staticmethod
+    def can_request(kind: str, user) -> bool:
+        spec = KINDS.get(kind)
+        return bool(spec) and (spec['roles'] is None or user.role in spec['roles'])
+
+    @staticmethod
+    def enqueue(kind: str, raw_params: dict, user):
+        """
+        Encola un export o reutiliza uno idéntico en curso / vigente.
+        Retorna (job, created). ValueError si el kind o los parámetros son
+        inválidos; PermissionError si el rol no puede pedir ese export.
+        """
+        spec = KINDS.get(kind)
+        if not spec:
+            raise ValueError(f'Tipo de exportación desconocido: {kind}')
+        if not ExportJobService.can_request(kind, user):
+            raise PermissionError('No autorizado para esta exportación')
+
+        params = spec['params'](raw_params or {}, user)
+        p_hash = _params_hash(kind, params)
+        now    = now_peru()
+
+        ExportJobService.purge_expired()
+
+        # Serializa solicitudes idénticas concurrentes (doble click)
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text('SELECT pg_advisory_xact_lock(:k)'), {'k': int(p_hash[:15], 16)})
+
+        job = ExportJob.query.filter(
+            ExportJob.params_hash == p_hash,
+            or_(
+                and_(ExportJob.status == STATUS_LISTO, ExportJob.expires_at > now),
+                and_(ExportJob.status.in_([STATUS_PENDIENTE, STATUS_PROCESANDO]),
+                     ExportJob.created_at > now - timedelta(minutes=STALE_MINUTES)),
+            ),
+        ).order_by(ExportJob.created_at.desc()).first()
+
+        if job:
+            job.add_subscriber(user.id)
+            db.session.commit()
+            return job, False
+
+        job = ExportJob(
+            id               = uuid.uuid4().hex,
+            kind             = kind,
+            params_json      = json.dumps(params, sort_keys=True),
+            params_hash      = p_hash,
+            status           = STATUS_PENDIENTE,
+            requested_by     = user.id,
+            subscribers_json = json.dumps([user.id]),
+            created_at       = now,
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        app = current_app._get_current_object()
+        threading.Thread(target=ExportJobService._run, args=(app, job.id), daemon=True).start()
+        return job, True
+
+    @staticmethod
+    def _run(app, job_id: str):
+        """Worker: genera el artefacto y notifica. Máx. EXPORT_MAX_CONCURRENT a la vez."""
+        with app.app_context():
+            slots = _worker_slots()
+        with slots:
+            with app.app_context():
+                job = None
+                try:
+                    job = db.session.get(ExportJob, job_id)
+                    if job is None or job.status != STATUS_PENDIENTE:
+                        return
+                    job.status     = STATUS_PROCESANDO
+                    job.started_at = now_peru()
+                    db.session.commit()
+
+                    xl, filename = KINDS[job.kind]['build'](job.params)
+                    path = os.path.join(_export_dir(), f'{job.id}.xlsx')
+                    tmp  = path + '.part'
+                    try:
+                        xl.save(tmp)
+                        os.replace(tmp, path)
+                    finally:
+                        _remove_file(tmp)
+
+                    ttl = int(app.config.get('EXPORT_TTL_MINUTES', 30))
+                    job.filename    = filename
+                    job.file_path   = path
+                    job.size_bytes  = os.path.getsize(path)
+                    job.status      = STATUS_LISTO
+                    job.finished_at = now_peru()
+                    job.expires_at  = job.finished_at + timedelta(minutes=ttl)
+                    db.session.commit()
+                    logger.info(f'[EXPORT] {job.kind} {job.id} listo ({job.size_bytes} bytes)')
+                except Exception as e:
+                    logger.error(f'[EXPORT] {job_id} error: {e}', exc_info=True)
+                    db.session.rollback()
+                    job = db.session.get(ExportJob, job_id)
+                    if job is not None:
+                        job.status      = STATUS_ERROR
+                        job.error       = str(e)[:1000]
+                        job.finished_at = now_peru()
+                        db.session.commit()
+                finally:
+                    if job is not None and job.status in (STATUS_LISTO, STATUS_ERROR):
+                        from app.services.notification_service import NotificationService
+                        NotificationService.notify_export_ready(job)
+                    db.session.remove()
+
+    @staticmethod
+    def get_for_user(job_id: str, user):
+        """Job visible para el usuario (suscriptor o Master); None si no."""
+        job = db.session.get(ExportJob, job_id)
+        if job is None:
+            return None
+        if user.role == 'Master' or user.id in job.subscribers:
+            return job
+        return None
+
+    @staticmethod
+    def list_for_user(user, limit: int = 20) -> list:
+        """Jobs recientes del usuario (por suscripción)."""
+        jobs = ExportJob.query.filter(
+            ExportJob.created_at > now_peru() - timedelta(days=1),
+        ).order_by(ExportJob.created_at.desc()).limit(200).all()
+        return [j for j in jobs if user.id in j.subscribers][:limit]
+
+    @staticmethod
+    def purge_expired() -> int:
+        """
+        Borra artefactos vencidos y marca sus jobs como expirados; los jobs en
+        curso huérfanos (worker reiniciado) pasan a error. Hace commit.
+        """
+        now  = now_peru()
+        jobs = ExportJob.query.filter(
+            ExportJob.status == STATUS_LISTO, ExportJob.expires_at <= now,
+        ).all()
+        for job in jobs:
+            _remove_file(job.file_path)
+            job.status    = STATUS_EXPIRADO
+            job.file_path = None
+
+        stale = ExportJob.query.filter(
+            ExportJob.status.in_([STATUS_PENDIENTE, STATUS_PROCESANDO]),
+            ExportJob.created_at <= now - timedelta(minutes=STALE_MINUTES),
+        ).all()
+        for job in stale:
+            job.status      = STATUS_ERROR
+            job.error       = 'Interrumpido (reinicio del servidor)'
+            job.finished_at = now
+
+        if jobs or stale:
+            db.session.commit()
+        return len(jobs)
@@ -680,6 +680,7 @@ class FinanceEngine:
         """
         from app.models import BankBalance, BankMovement
         from app.config.bank_accounts import ALLOWED_BANK_NAMES
+        from app.services.closure_accumulator import ClosureAccumulator
         from app.utils.formatters import now_peru
 
         activated = []
@@ -724,6 +725,7 @@ class FinanceEngine:
                     created_by     = user_id,
                 )
                 db.session.add(mv)
+                ClosureAccumulator.apply_movement(mv)
                 activated.append(f'{acct_name}: apertura {currency} {bal_cache:,.2f}')
 
             except Exception as exc:
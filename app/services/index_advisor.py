@@ -0,0 +1,348 @@
+"""
+Asesor de índices — QoriCash
+============================
+Captura las consultas reales que la app envía a una tabla (por defecto
+operations) y propone índices compuestos o parciales para sus formas más
+costosas.
+
+  1. Captura: con QUERY_CAPTURE_FILE=/tmp/consultas.json la app engancha un
+     QueryCapture al engine (before/after_cursor_execute) y al salir guarda
+     cada forma de consulta (SQL normalizado) con llamadas, tiempo total y
+     un ejemplo de parámetros. Varios procesos acumulan en el mismo archivo.
+  2. Propuesta: predicates() extrae de cada forma las columnas filtradas por
+     igualdad, IN, rango y ORDER BY; propose() arma el índice (igualdad →
+     IN → rango/orden), lo vuelve parcial si la columna de estado solo se
+     consulta con estados activos (WHERE status IN ('Pendiente','En proceso')),
+     descarta los que ya cubre un índice existente y ordena por tiempo total.
+  3. Verificación: explain_compare() corre EXPLAIN ANALYZE de la consulta más
+     lenta de cada propuesta antes y después de crear el índice dentro de una
+     transacción que se revierte. CREATE INDEX bloquea escrituras en la tabla
+     hasta el rollback: usar en staging / local.
+
+Uso CLI:
+  QUERY_CAPTURE_FILE=/tmp/consultas.json flask run      # o una corrida de tests
+  flask index-advisor /tmp/consultas.json --explain
+"""
+import json
+import os
+import re
+import time
+from collections import namedtuple
+
+# Valores de status que justifican un índice parcial: pocas filas vivas frente
+# a un histórico de Completada/Cancelado/Expirada que crece sin límite.
+PARTIAL_FILTERS = {'status': ('Pendiente', 'En proceso')}
+
+IndexProposal = namedtuple('IndexProposal', 'name table columns where calls total_ms shapes')
+
+_BIND      = re.compile(r"%\(\w+\)s|%s|\?|:\w+|\$\d+")
+_LITERAL   = re.compile(r"'(?:[^']|'')*'")
+_NUMBER    = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST   = re.compile(r"IN \((?:\?(?:, )?)+\)", re.IGNORECASE)
+_SPACES    = re.compile(r"\s+")
+_VALUE     = r"(%\(\w+\)s|%s|\?|:\w+|\$\d+|'(?:[^']|'')*'|-?\d+(?:\.\d+)?)"
+
+
+def fingerprint(sql: str) -> str:
+    """SQL sin parámetros ni literales: una clave por forma de consulta."""
+    out = _LITERAL.sub('?', sql)
+    out = _BIND.sub('?', out)
+    out = _NUMBER.sub('?', out)
+    out = _SPACES.sub(' ', out).strip()
+    return _IN_LIST.sub('IN (...)', out)
+
+
+def _col(table: str) -> str:
+    return rf'(?<![\w.]){re.escape(table)}(?:_\d+)?\."?(\w+)"?'
+
+
+def _value(token: str, params):
+    """Valor de un placeholder o literal (None si no se puede resolver)."""
+    if token.startswith("'"):
+        return token[1:-1].replace("''", "'")
+    m = re.fullmatch(r'%\((\w+)\)s|:(\w+)', token)
+    if m and isinstance(params, dict):
+        return params.get(m.group(1) or m.group(2))
+    if re.fullmatch(r'-?\d+(?:\.\d+)?', token):
+        return token
+    return None
+
+
+def predicates(sql: str, table: str = 'operations', params=None) -> dict:
+    """
+    Columnas de `table` usadas por la consulta:
+      {'eq': [...], 'in': [...], 'range': [...], 'order': [...], 'values': {col: {valores}}}
+    Solo cuentan comparaciones contra parámetros o literales (no joins).
+    """
+    col = _col(table)
+    found = {'eq': [], 'in': [], 'range': [], 'order': [], 'values': {}}
+
+    def _add(kind, name):
+        if name not in found[kind]:
+            found[kind].append(name)
+
+    for m in re.finditer(rf'{col}\s*=\s*{_VALUE}', sql):
+        _add('eq', m.group(1))
+        found['values'].setdefault(m.group(1), set()).add(_value(m.group(2), params))
+    for m in re.finditer(rf'{col}\s+IN\s*\(((?:\s*{_VALUE}\s*,?)+)\)', sql, re.IGNORECASE):
+        _add('in', m.group(1))
+        tokens = re.findall(_VALUE, m.group(2))
+        found['values'].setdefault(m.group(1), set()).update(_value(t, params) for t in tokens)
+    for m in re.finditer(rf'{col}\s*(?:<=|>=|<|>|\s+BETWEEN\b)', sql, re.IGNORECASE):
+        _add('range', m.group(1))
+    order = re.search(r'\bORDER BY\b(.*?)(?:\bLIMIT\b|\bOFFSET\b|\bFOR UPDATE\b|\)|$)', sql,
+                      re.IGNORECASE | re.DOTALL)
+    if order:
+        for m in re.finditer(col, order.group(1)):
+            _add('order', m.group(1))
+
+    for kind in ('in', 'range', 'order'):
+        found[kind] = [c for c in found[kind] if c not in found['eq']]
+    found['range'] = [c for c in found['range'] if c not in found['in']]
+    return found
+
+
+def index_name(table: str, columns, where: str = None) -> str:
+    name = f"ix_{table}_{'_'.join(columns)}" + ('_activas' if where else '')
+    return name[:63]
+
+
+def _candidate(pred: dict, partial_filters: dict):
+    """(columnas, where) del índice para una forma de consulta, o None."""
+    where = None
+    eq, in_ = list(pred['eq']), list(pred['in'])
+    for column, allowed in partial_filters.items():
+        values = pred['values'].get(column)
+        if values and None not in values and values <= set(allowed):
+            quoted = ', '.join("'" + v.replace("'", "''") + "'" for v in allowed)
+            where = f'{column} IN ({quoted})'
+            # Con un solo valor la columna ya no distingue filas dentro del parcial
+            if len(values) == 1:
+                eq = [c for c in eq if c != column]
+                in_ = [c for c in in_ if c != column]
+            break
+    tail = pred['range'][:1] or pred['order'][:1]
+    columns = tuple(eq + in_ + [c for c in tail if c not in eq + in_])
+    if not columns:
+        return None
+    return columns, where
+
+
+def _covered(columns, where, existing) -> bool:
+    """Un índice existente con el mismo prefijo y sin condición (o la misma) ya sirve."""
+    for ex_columns, ex_where in existing:
+        if tuple(ex_columns[:len(columns)]) == tuple(columns) and (ex_where is None or ex_where == where):
+            return True
+    return False
+
+
+def propose(shapes: dict, table: str = 'operations', existing=(), min_calls: int = 1,
+            partial_filters: dict = None) -> list:
+    """
+    shapes: {fingerprint: {'sql', 'params', 'calls', 'total_ms'}} (QueryCapture.shapes)
+    existing: [(columnas, where | None)] de los índices actuales de la tabla.
+    Devuelve [IndexProposal] ordenado por tiempo total descendente.
+    """
+    partial_filters = PARTIAL_FILTERS if partial_filters is None else partial_filters
+    existing = [(tuple(c), w) for c, w in existing]
+    grouped = {}
+    for key, shape in shapes.items():
+        if shape['calls'] < min_calls:
+            continue
+        cand = _candidate(predicates(shape['sql'], table, shape.get('params')), partial_filters)
+        if cand is None or _covered(cand[0], cand[1], existing):
+            continue
+        g = grouped.setdefault(cand, {'calls': 0, 'total_ms': 0.0, 'shapes': []})
+        g['calls'] += shape['calls']
+        g['total_ms'] += shape['total_ms']
+        g['shapes'].append(key)
+
+    # Un índice más largo con el mismo prefijo y condición sirve también al corto
+    for (columns, where) in list(grouped):
+        for (other, other_where) in grouped:
+            if other != columns and other_where == where and other[:len(columns)] == columns:
+                g, into = grouped.pop((columns, where)), grouped[(other, other_where)]
+                into['calls'] += g['calls']
+                into['total_ms'] += g['total_ms']
+                into['shapes'] += g['shapes']
+                break
+
+    proposals = [
+        IndexProposal(index_name(table, columns, where), table, columns, where,
+                      g['calls'], round(g['total_ms'], 2), g['shapes'])
+        for (columns, where), g in grouped.items()
+    ]
+    return sorted(proposals, key=lambda p: (-p.total_ms, p.name))
+
+
+def ddl(proposal: IndexProposal) -> str:
+    sql = (f"CREATE INDEX IF NOT EXISTS {proposal.name} "
+           f"ON {proposal.table} ({', '.join(proposal.columns)})")
+    return sql + (f" WHERE {proposal.where}" if proposal.where else '')
+
+
+# ── Captura ──────────────────────────────────────────────────────────────────
+
+class QueryCapture:
+    """Acumula las formas de consulta sobre `table` que pasan por un engine."""
+
+    def __init__(self, table: str = 'operations'):
+        self.table = table
+        self.shapes = {}
+        self._engine = None
+        self._pattern = re.compile(rf'\b(?:FROM|JOIN|UPDATE)\s+"?{re.escape(table)}"?\b', re.IGNORECASE)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_index_advisor_t0', []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get('_index_advisor_t0')
+        t0 = stack.pop() if stack else None
+        if t0 is None or executemany or not self._pattern.search(statement):
+            return
+        self.record(statement, parameters, (time.perf_counter() - t0) * 1000)
+
+    def record(self, statement: str, parameters, ms: float):
+        key = fingerprint(statement)
+        shape = self.shapes.get(key)
+        if shape is None:
+            params = parameters if isinstance(parameters, dict) else None
+            shape = self.shapes[key] = {
+                'sql': statement,
+                'params': json.loads(json.dumps(params, default=str)) if params else None,
+                'calls': 0, 'total_ms': 0.0,
+            }
+        shape['calls'] += 1
+        shape['total_ms'] += ms
+
+    def attach(self, engine):
+        from sqlalchemy import event
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+        self._engine = engine
+
+    def detach(self):
+        from sqlalchemy import event
+        if self._engine is not None:
+            event.remove(self._engine, 'before_cursor_execute', self._before)
+            event.remove(self._engine, 'after_cursor_execute', self._after)
+            self._engine = None
+
+    def save(self, path: str):
+        """Acumular en `path` (suma llamadas y tiempos de capturas anteriores)."""
+        merged = load_shapes(path) if os.path.exists(path) else {}
+        for key, shape in self.shapes.items():
+            if key in merged:
+                merged[key]['calls'] += shape['calls']
+                merged[key]['total_ms'] += shape['total_ms']
+            else:
+                merged[key] = shape
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'table': self.table, 'shapes': merged}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+
+def load_shapes(*paths) -> dict:
+    """Unir las formas de uno o más archivos de captura."""
+    shapes = {}
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for key, shape in json.load(f).get('shapes', {}).items():
+                if key in shapes:
+                    shapes[key]['calls'] += shape['calls']
+                    shapes[key]['total_ms'] += shape['total_ms']
+                else:
+                    shapes[key] = shape
+    return shapes
+
+
+def start_capture(app):
+    """Si QUERY_CAPTURE_FILE está definida, capturar las consultas de este proceso."""
+    import atexit
+    import logging
+
+    path = os.environ.get('QUERY_CAPTURE_FILE')
+    if not path:
+        return None
+    from app.extensions import db
+
+    capture = QueryCapture(os.environ.get('QUERY_CAPTURE_TABLE', 'operations'))
+    with app.app_context():
+        capture.attach(db.engine)
+
+    def _save():
+        try:
+            capture.save(path)
+        except Exception as e:
+            logging.warning(f'[IndexAdvisor] No se pudo guardar la captura en {path}: {e}')
+
+    atexit.register(_save)
+    logging.info(f'[IndexAdvisor] Capturando consultas sobre {capture.table} en {path}')
+    return capture
+
+
+# ── Índices existentes y EXPLAIN ─────────────────────────────────────────────
+
+def existing_indexes(conn, table: str = 'operations') -> list:
+    """[(columnas, where | None)] de los índices actuales de la tabla en PostgreSQL."""
+    from sqlalchemy import text
+
+    rows = conn.execute(text("""
+        SELECT array_agg(a.attname ORDER BY k.ord) AS columns,
+               pg_get_expr(i.indpred, i.indrelid) AS predicate
+          FROM pg_index i
+          JOIN pg_class t ON t.oid = i.indrelid
+          CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+          JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+         WHERE t.relname = :table
+           AND NOT (0 = ANY (i.indkey::int2[]))          -- índices por expresión: se omiten
+         GROUP BY i.indexrelid, i.indpred, i.indrelid
+    """), {'table': table}).all()
+    return [(tuple(r.columns), _normalize_predicate(r.predicate)) for r in rows]
+
+
+def _normalize_predicate(predicate):
+    """pg_get_expr escribe IN como '= ANY (ARRAY[...])'; llevarlo a la forma de propose()."""
+    if not predicate:
+        return None
+    m = re.fullmatch(r"\(?\(?(\w+)\)?::text = ANY \(\(?ARRAY\[(.*)\]\)?(?:::text\[\])?\)\)?", predicate)
+    if m:
+        values = re.findall(r"'((?:[^']|'')*)'", m.group(2))
+        return f"{m.group(1)} IN ({', '.join(repr(v) for v in values)})"
+    return predicate
+
+
+def _explain(conn, sql: str, params) -> dict:
+    statement = f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}'
+    result = conn.exec_driver_sql(statement, params) if params else conn.exec_driver_sql(statement)
+    plan = result.scalar()
+    plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+    indexes = set()
+
+    def _walk(node):
+        if node.get('Index Name'):
+            indexes.add(node['Index Name'])
+        for child in node.get('Plans', []):
+            _walk(child)
+
+    _walk(plan['Plan'])
+    return {'ms': round(plan['Execution Time'], 3), 'indices': sorted(indexes)}
+
+
+def explain_compare(engine, proposal: IndexProposal, shape: dict) -> dict:
+    """
+    EXPLAIN ANALYZE de `shape` sin y con el índice propuesto. Todo ocurre en
+    una transacción que se revierte: ni el índice ni los efectos quedan.
+    """
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            before = _explain(conn, shape['sql'], shape.get('params'))
+            conn.execute(text(ddl(proposal)))
+            after = _explain(conn, shape['sql'], shape.get('params'))
+        finally:
+            trans.rollback()
+    return {'antes': before, 'despues': after}
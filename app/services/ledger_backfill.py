@@ -54,13 +54,17 @@ def _banco_acct_name(banco_key: str, currency: str) -> str:
     return f"{banco_key} {currency}"
 
 
-def _resolve_movements(operation) -> list:
+def _resolve_movements(operation, attributed_rows: dict = None) -> list:
     """
     Determina qué BankMovement crear para una operación completada.
 
     Replica la lógica de BankBalance.apply_operation() pero sólo
     devuelve una lista de specs — no escribe nada.
 
+    Los abonos/pagos atribuidos por banco salen de las tablas hijas
+    (operation_children.attributed), sin decodificar los JSON; run_backfill
+    los consulta de una vez para todo el lote y los pasa en attributed_rows.
+
     Cada spec: {
         'acct_name':  str,   # 'BCP USD (…)'
         'bank_key':   str,   # 'BCP'
@@ -68,15 +72,15 @@ def _resolve_movements(operation) -> list:
         'delta':      float, # positivo=entrada, negativo=salida
     }
     """
+    from app.services.operation_children import FLOW, attributed
+
+    if attributed_rows is None:
+        attributed_rows = attributed([operation.id])
+
     specs = []
     usd   = float(operation.amount_usd or 0)
     pen   = float(operation.amount_pen or 0)
 
-    _payments = operation.client_payments or []
-    _deposits = operation.client_deposits or []
-    _has_pay_banks = any(p.get('qc_bank') for p in _payments)
-    _has_dep_banks = any(d.get('qc_bank') for d in _deposits)
-
     def _fallback_banco():
         """Banco desde la cuenta origen del cliente."""
         try:
@@ -110,67 +114,15 @@ def _resolve_movements(operation) -> list:
             'delta':     round(delta, 2),
         })
 
-    if operation.operation_type == 'Compra':
-        # USD entra a QoriCash (depósitos del cliente)
-        if _has_dep_banks:
-            _ua = 0.0
-            for dep in _deposits:
-                _b = (_normalize_banco(dep.get('qc_bank', ''))
-                      or _normalize_banco(dep.get('cuenta_cargo', '')))
-                _amt = float(dep.get('importe', 0))
-                if _b and _amt > 0:
-                    _add(_b, 'USD', +_amt)
-                    _ua += _amt
-            if _ua == 0 and usd > 0:
-                _add(_fallback_banco(), 'USD', +usd)
+    # Compra: USD entra (abonos), PEN sale (pagos) — Venta: PEN entra, USD sale
+    for side, fallback in (('deposit', _fallback_banco), ('payment', _fallback_banco_dest)):
+        currency, sign = FLOW[(side, operation.operation_type)]
+        rows = attributed_rows.get((operation.id, side))
+        if rows:
+            for banco, amount in rows:
+                _add(banco, currency, sign * amount)
         else:
-            _add(_fallback_banco(), 'USD', +usd)
-
-        # PEN sale de QoriCash (pagos al cliente)
-        if _has_pay_banks:
-            _pa = 0.0
-            for pay in _payments:
-                _b = (_normalize_banco(pay.get('qc_bank', ''))
-                      or _normalize_banco(pay.get('cuenta_destino', '')))
-                _amt = float(pay.get('importe', 0))
-                if _b and _amt > 0:
-                    _add(_b, 'PEN', -_amt)
-                    _pa += _amt
-            if _pa == 0 and pen > 0:
-                _add(_fallback_banco_dest(), 'PEN', -pen)
-        else:
-            _add(_fallback_banco_dest(), 'PEN', -pen)
-
-    else:  # Venta
-        # PEN entra a QoriCash (depósitos del cliente)
-        if _has_dep_banks:
-            _pa = 0.0
-            for dep in _deposits:
-                _b = (_normalize_banco(dep.get('qc_bank', ''))
-                      or _normalize_banco(dep.get('cuenta_cargo', '')))
-                _amt = float(dep.get('importe', 0))
-                if _b and _amt > 0:
-                    _add(_b, 'PEN', +_amt)
-                    _pa += _amt
-            if _pa == 0 and pen > 0:
-                _add(_fallback_banco(), 'PEN', +pen)
-        else:
-            _add(_fallback_banco(), 'PEN', +pen)
-
-        # USD sale de QoriCash (pagos al cliente)
-        if _has_pay_banks:
-            _ua = 0.0
-            for pay in _payments:
-                _b = (_normalize_banco(pay.get('qc_bank', ''))
-                      or _normalize_banco(pay.get('cuenta_destino', '')))
-                _amt = float(pay.get('importe', 0))
-                if _b and _amt > 0:
-                    _add(_b, 'USD', -_amt)
-                    _ua += _amt
-            if _ua == 0 and usd > 0:
-                _add(_fallback_banco_dest(), 'USD', -usd)
-        else:
-            _add(_fallback_banco_dest(), 'USD', -usd)
+            _add(fallback(), currency, sign * (usd if currency == 'USD' else pen))
 
     return specs
 
@@ -252,6 +204,11 @@ def run_backfill(dry_run: bool = True,
     movements_created = 0
     errors        = []
     dry_run_preview = []  # para dry_run
+    first_closure = None  # día más antiguo escrito (borradores del cierre a recalcular)
+
+    # Abonos/pagos atribuidos por banco de todo el lote, en una consulta por tabla
+    from app.services.operation_children import attributed
+    attributed_rows = attributed(op.id for op in ops_all if op.id not in existing_op_ids)
 
     for op in ops_all:
         if op.id in existing_op_ids:
@@ -259,7 +216,7 @@ def run_backfill(dry_run: bool = True,
             continue
 
         try:
-            specs = _resolve_movements(op)
+            specs = _resolve_movements(op, attributed_rows)
         except Exception as exc:
             errors.append(f'op {op.operation_id}: resolve error — {exc}')
             continue
@@ -320,6 +277,7 @@ def run_backfill(dry_run: bool = True,
                 )
                 db.session.add(mv)
                 movements_created += 1
+            first_closure = min(first_closure or closure_dt, closure_dt)
 
             ops_processed += 1
 
@@ -330,6 +288,11 @@ def run_backfill(dry_run: bool = True,
 
     if not dry_run:
         try:
+            # Un apply_movement por movimiento histórico sería una consulta de
+            # borradores por fila: se desiembran y el próximo Calcular los rehace
+            if first_closure is not None:
+                from app.services.closure_accumulator import ClosureAccumulator
+                ClosureAccumulator.invalidate_from(first_closure)
             db.session.commit()
         except Exception as exc:
             db.session.rollback()
@@ -648,6 +648,29 @@ class NotificationService:
         except Exception as e:
             logger.error(f'[NOTIF] notify_new_wa_message error: {e}')
 
+    @staticmethod
+    def notify_export_ready(job):
+        """Export en segundo plano terminado (ExportJob): aviso a cada suscriptor."""
+        try:
+            ok = job.status == 'listo'
+            data = {
+                'job_id':       job.id,
+                'kind':         job.kind,
+                'status':       job.status,
+                'filename':     job.filename,
+                'download_url': f'/exports/api/jobs/{job.id}/download' if ok else None,
+                'error':        None if ok else (job.error or 'Error al generar el archivo'),
+            }
+            title   = '📥 Exportación lista' if ok else '⚠️ Exportación fallida'
+            message = job.filename if ok else data['error']
+            for user_id in job.subscribers:
+                _emit_to_user('export_ready', data, user_id)
+                _save_to_db_user(user_id, title, message,
+                                 'success' if ok else 'danger', 'export', data['download_url'])
+                _push_unread_count(user_id)
+        except Exception as e:
+            logger.error(f'[NOTIF] notify_export_ready error: {e}')
+
     @staticmethod
     def notify_operation_expired(operation):
         try:
@@ -0,0 +1,524 @@
+"""
+Tablas hijas de Operation (app/models/operation_child.py)
+==========================================================
+Mantiene operation_deposits / operation_payments / operation_proofs /
+operation_logs como copia indexada de las columnas *_json de Operation:
+
+  sync_operation()  — listener after_insert/after_update de Operation: si el
+                      flush cambió una columna *_json, reescribe sus filas
+                      hijas con la misma conexión (misma transacción). Si
+                      falla, encola en el outbox la resincronización de esa
+                      operación (resync()).
+  backfill()        — reconstruye todas las filas desde los JSON (CLI, o en
+                      segundo plano en un solo worker: start_backfill()).
+
+Las lecturas nunca reconstruyen: mientras las tablas hijas no estén listas
+(is_ready()) calculan lo mismo desde las columnas *_json.
+
+y expone la atribución de abonos/pagos por banco de QoriCash como agregados
+SQL, para no decodificar JSON operación por operación:
+
+  bank_flows()      — Σ por (banco, moneda) sobre un filtro de operaciones.
+  attributed()      — mismo criterio, desglosado por operación.
+
+Regla de atribución (la de siempre en position.py / ledger_backfill.py):
+un lado (abonos o pagos) se atribuye fila por fila si alguna fila trae
+qc_bank y lo atribuido suma > 0; si no, el caller imputa el monto completo
+de la operación a su banco de fallback (cuenta origen / destino del cliente).
+
+Uso CLI:
+  flask backfill-operation-children
+"""
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+_log = logging.getLogger(__name__)
+
+READY_KEY = 'OPERATION_CHILDREN_READY'
+
+# Topic del outbox para resincronizar una operación cuyo listener falló
+RESYNC_TOPIC = 'operation_children_sync'
+
+# Lease del backfill en segundo plano (scheduler_leases): un solo worker
+BACKFILL_JOB = 'operation_children_backfill'
+BACKFILL_LEASE_SECONDS = 3600
+
+# Mismo mapa que ledger_backfill._ALIASES (el orden importa: 'BANBIF' contiene 'BIF')
+_BANK_ALIASES = {
+    'BCP': 'BCP', 'CREDITO': 'BCP', 'CRÉDITO': 'BCP',
+    'INTERBANK': 'INTERBANK', 'IBK': 'INTERBANK',
+    'BANBIF': 'BANBIF', 'BIF': 'BANBIF',
+}
+
+# (lado, operation_type) → (moneda, signo para QoriCash)
+FLOW = {
+    ('deposit', 'Compra'): ('USD', +1),
+    ('deposit', 'Venta'):  ('PEN', +1),
+    ('payment', 'Compra'): ('PEN', -1),
+    ('payment', 'Venta'):  ('USD', -1),
+}
+
+
+def normalize_bank(name) -> str:
+    """'Banco de Crédito BCP …' → 'BCP'. '' si está vacío o no se reconoce."""
+    if not isinstance(name, str) or not name.strip():
+        return ''
+    u = name.upper()
+    for alias, banco in _BANK_ALIASES.items():
+        if alias in u:
+            return banco
+    return ''
+
+
+def _amount(value) -> Decimal:
+    try:
+        return Decimal(str(value if value is not None else 0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
+    except (InvalidOperation, ValueError):
+        return Decimal('0.00')
+
+
+def _text(value, size: int):
+    if value is None or value == '':
+        return None
+    return str(value)[:size]
+
+
+def _datetime(value):
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value):
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _present(value) -> bool:
+    return bool(value.strip()) if isinstance(value, str) else bool(value)
+
+
+def _bank_fields(item: dict, account_key: str) -> dict:
+    qc_bank = item.get('qc_bank') or None
+    account = item.get(account_key) or None
+    bank_key = normalize_bank(qc_bank) or normalize_bank(account)
+    return {
+        'qc_bank':  _text(qc_bank, 50),
+        'account':  _text(account, 200),
+        'bank_key': bank_key,
+        'external': not bank_key and (_present(qc_bank) or _present(account)),
+    }
+
+
+def _items(items):
+    return [i for i in (items or []) if isinstance(i, dict)]
+
+
+def deposit_rows(items) -> list:
+    """client_deposits → filas de operation_deposits (sin operation_id)"""
+    return [dict(position=n, amount=_amount(d.get('importe')),
+                 reference=_text(d.get('codigo_operacion'), 100),
+                 data=json.dumps(d, ensure_ascii=False, default=str),
+                 **_bank_fields(d, 'cuenta_cargo'))
+            for n, d in enumerate(_items(items))]
+
+
+def payment_rows(items) -> list:
+    """client_payments → filas de operation_payments (sin operation_id)"""
+    return [dict(position=n, amount=_amount(p.get('importe')),
+                 data=json.dumps(p, ensure_ascii=False, default=str),
+                 **_bank_fields(p, 'cuenta_destino'))
+            for n, p in enumerate(_items(items))]
+
+
+def proof_rows(items) -> list:
+    """operator_proofs → filas de operation_proofs (sin operation_id)"""
+    return [dict(position=n, url=_text(p.get('comprobante_url'), 500),
+                 comment=p.get('comentario') or None,
+                 data=json.dumps(p, ensure_ascii=False, default=str))
+            for n, p in enumerate(_items(items))]
+
+
+def log_rows(items) -> list:
+    """modification_logs → filas de operation_logs (sin operation_id)"""
+    return [dict(position=n, logged_at=_datetime(l.get('fecha')),
+                 user_id=_int(l.get('usuario_id')), field=_text(l.get('campo'), 100),
+                 data=json.dumps(l, ensure_ascii=False, default=str))
+            for n, l in enumerate(_items(items))]
+
+
+# columna *_json de Operation → (tabla hija, builder)
+COLUMNS = {
+    'client_deposits_json':   ('operation_deposits', deposit_rows),
+    'client_payments_json':   ('operation_payments', payment_rows),
+    'operator_proofs_json':   ('operation_proofs',   proof_rows),
+    'modification_logs_json': ('operation_logs',     log_rows),
+}
+
+
+def _decode(raw) -> list:
+    try:
+        value = json.loads(raw or '[]')
+    except (TypeError, ValueError):
+        return []
+    return value if isinstance(value, list) else []
+
+
+# ── Sincronización ──────────────────────────────────────────────────────────
+
+def _tables() -> dict:
+    from app.models.operation_child import (
+        OperationDeposit, OperationPayment, OperationProof, OperationLog,
+    )
+    return {m.__tablename__: m.__table__
+            for m in (OperationDeposit, OperationPayment, OperationProof, OperationLog)}
+
+
+def _write(connection, tables: dict, column: str, op_ids, raw_by_op: dict):
+    """Borra e inserta las filas hijas de `column` para op_ids."""
+    table_name, build = COLUMNS[column]
+    table = tables[table_name]
+    connection.execute(table.delete().where(table.c.operation_id.in_(list(op_ids))))
+    rows = [dict(r, operation_id=op_id)
+            for op_id in op_ids for r in build(_decode(raw_by_op.get(op_id)))]
+    if rows:
+        connection.execute(table.insert(), rows)
+    return len(rows)
+
+
+def sync_operation(connection, operation):
+    """
+    Listener after_insert / after_update de Operation: reescribe las tablas
+    hijas de las columnas *_json que cambiaron en este flush. Corre en un
+    SAVEPOINT: si falla, la operación se guarda igual, se registra el error y
+    se encola su resincronización (_mark_dirty).
+    """
+    from sqlalchemy import inspect
+
+    state = inspect(operation)
+    changed = [c for c in COLUMNS if state.attrs[c].history.has_changes()]
+    if not changed:
+        return
+    try:
+        tables = _tables()
+        with connection.begin_nested():
+            for column in changed:
+                _write(connection, tables, column, [operation.id],
+                       {operation.id: getattr(operation, column)})
+    except Exception as e:
+        _log.error(f'[OperationChildren] sync op={operation.id}: {e}')
+        _mark_dirty(connection, operation.id)
+
+
+def _mark_dirty(connection, operation_id):
+    """
+    Encolar en el outbox (misma transacción que la operación) la
+    resincronización de operation_id; hasta que se procese, is_ready() es
+    False y las lecturas usan los JSON. Si ni eso se puede, quitar READY_KEY.
+    """
+    from sqlalchemy import text
+    from app.utils.formatters import now_peru
+
+    now = now_peru()
+    try:
+        with connection.begin_nested():
+            connection.execute(text("""
+                INSERT INTO outbox_events (topic, idempotency_key, group_key, operation_id, payload_json,
+                                           status, attempts, available_at, created_at)
+                VALUES (:topic, :key, :group, :op, '{}', 'pendiente', 0, :now, :now)
+                ON CONFLICT (idempotency_key) DO NOTHING
+            """), {'topic': RESYNC_TOPIC, 'key': f'{RESYNC_TOPIC}:{operation_id}:{now:%Y%m%d%H%M%S%f}',
+                   'group': f'operation:{operation_id}', 'op': operation_id, 'now': now})
+    except Exception as e:
+        _log.error(f'[OperationChildren] no se pudo encolar resync op={operation_id}: {e}')
+        try:
+            connection.execute(text('DELETE FROM system_config WHERE key = :k'), {'k': READY_KEY})
+        except Exception:
+            pass
+
+
+def resync(operation_id) -> bool:
+    """Reescribir las filas hijas de una operación desde sus *_json (handler del outbox)."""
+    from sqlalchemy import select
+    from app.extensions import db
+    from app.models.operation import Operation
+
+    row = db.session.execute(
+        select(*[getattr(Operation, c) for c in COLUMNS]).where(Operation.id == operation_id)
+    ).first()
+    if row is None:
+        return False
+    tables, conn = _tables(), db.session.connection()
+    for i, column in enumerate(COLUMNS):
+        _write(conn, tables, column, [operation_id], {operation_id: row[i]})
+    return True
+
+
+def backfill(batch: int = 500) -> dict:
+    """
+    Reconstruye todas las filas hijas desde las columnas *_json, por bloques
+    de `batch` operaciones (keyset sobre id, un commit por bloque). Al
+    terminar marca READY_KEY en SystemConfig y da por hechas las
+    resincronizaciones encoladas antes de empezar. Idempotente.
+    Hace commit: solo desde el CLI o start_backfill(), nunca en un request.
+    """
+    from sqlalchemy import select, text
+    from app.extensions import db
+    from app.models.operation import Operation
+    from app.models.system_config import SystemConfig
+    from app.utils.formatters import now_peru
+
+    started = now_peru()
+
+    tables = _tables()
+    cols = [getattr(Operation, c) for c in COLUMNS]
+    counts = {name: 0 for name, _ in COLUMNS.values()}
+    last_id, operaciones = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(Operation.id, *cols).where(Operation.id > last_id)
+            .order_by(Operation.id).limit(batch)
+        ).all()
+        if not rows:
+            break
+        ids = [r[0] for r in rows]
+        conn = db.session.connection()
+        for i, column in enumerate(COLUMNS, start=1):
+            counts[COLUMNS[column][0]] += _write(conn, tables, column, ids,
+                                                 {r[0]: r[i] for r in rows})
+        db.session.commit()
+        operaciones += len(rows)
+        last_id = ids[-1]
+
+    SystemConfig.set(READY_KEY, '1', 'Tablas hijas de operaciones reconstruidas (operation_children.backfill)')
+    db.session.execute(text(
+        "UPDATE outbox_events SET status = 'hecho', processed_at = :now, last_error = NULL "
+        "WHERE topic = :topic AND status <> 'hecho' AND created_at <= :started"
+    ), {'now': now_peru(), 'topic': RESYNC_TOPIC, 'started': started})
+    db.session.commit()
+    return {'operaciones': operaciones, **counts}
+
+
+def is_ready() -> bool:
+    """¿Se puede leer de las tablas hijas? Backfill hecho y sin resincronizaciones pendientes."""
+    from sqlalchemy import text
+    from app.extensions import db
+    from app.models.system_config import SystemConfig
+
+    if SystemConfig.get(READY_KEY) != '1':
+        return False
+    return db.session.execute(text(
+        "SELECT 1 FROM outbox_events WHERE topic = :topic AND status <> 'hecho' LIMIT 1"
+    ), {'topic': RESYNC_TOPIC}).first() is None
+
+
+def start_backfill(app):
+    """
+    Si falta READY_KEY, reconstruir en segundo plano en un solo worker (lease
+    BACKFILL_JOB en scheduler_leases); mientras tanto las lecturas usan los JSON.
+    """
+    import eventlet
+
+    def _run():
+        from app.extensions import db
+        from app.models.system_config import SystemConfig
+        from app.services.scheduler_coordinator import try_acquire, release, holder
+
+        with app.app_context():
+            try:
+                if SystemConfig.get(READY_KEY) == '1':
+                    return
+                with db.engine.begin() as conn:
+                    if not try_acquire(conn, BACKFILL_JOB, holder(), lease_seconds=BACKFILL_LEASE_SECONDS):
+                        return
+                try:
+                    r = backfill()
+                    _log.info(f'[OperationChildren] Backfill completo: {r}')
+                finally:
+                    with db.engine.begin() as conn:
+                        release(conn, BACKFILL_JOB, holder())
+            except Exception as e:
+                _log.error(f'[OperationChildren] Backfill en segundo plano falló: {e}')
+            finally:
+                db.session.remove()
+
+    eventlet.spawn(_run)
+
+
+# ── Atribución por banco (SQL) ──────────────────────────────────────────────
+
+def _sides():
+    from app.models.operation_child import OperationDeposit, OperationPayment
+    return (('deposit', OperationDeposit), ('payment', OperationPayment))
+
+
+def _attributable(model, unknown_bank: str):
+    from sqlalchemy import or_
+    if unknown_bank:
+        return or_(model.bank_key != '', model.external)
+    return model.bank_key != ''
+
+
+def _qualified(model, op_ids, unknown_bank: str):
+    """Subconsulta: operaciones cuyo lado se atribuye fila por fila."""
+    from sqlalchemy import select, func, case, and_
+
+    attributable = and_(_attributable(model, unknown_bank), model.amount > 0)
+    return (select(model.operation_id.label('op_id'))
+            .where(model.operation_id.in_(op_ids))
+            .group_by(model.operation_id)
+            .having(func.max(case((func.coalesce(model.qc_bank, '') != '', 1), else_=0)) == 1)
+            .having(func.sum(case((attributable, model.amount), else_=0)) > 0)
+            .subquery())
+
+
+def _bank(bank_key, external, unknown_bank: str) -> str:
+    return bank_key or (unknown_bank if external else '')
+
+
+# ── Atribución desde los JSON (mientras las tablas hijas no están listas) ──
+
+def _attribute_side(rows, unknown_bank: str):
+    """
+    Misma regla que _qualified() sobre las filas de deposit_rows() /
+    payment_rows() de un lado: [(banco, monto)] en orden de posición, o None
+    si el lado va a fallback.
+    """
+    if not any(r['qc_bank'] for r in rows):
+        return None
+    groups = {}
+    for r in rows:
+        if r['amount'] > 0 and (r['bank_key'] or (unknown_bank and r['external'])):
+            key = (r['bank_key'], r['external'])
+            groups[key] = groups.get(key, Decimal('0')) + r['amount']
+    if sum(groups.values()) <= 0:
+        return None
+    return [(_bank(bank_key, external, unknown_bank), float(total))
+            for (bank_key, external), total in groups.items()]
+
+
+def _from_json(conditions, unknown_bank: str) -> list:
+    """[(operation_id, operation_type, lado, atribución | None)] leyendo los *_json."""
+    from sqlalchemy import select
+    from app.extensions import db
+    from app.models.operation import Operation
+
+    ops = db.session.execute(
+        select(Operation.id, Operation.operation_type,
+               Operation.client_deposits_json, Operation.client_payments_json).where(*conditions)
+    ).all()
+    out = []
+    for side, build, i in (('deposit', deposit_rows, 2), ('payment', payment_rows, 3)):
+        out += [(op[0], op[1], side, _attribute_side(build(_decode(op[i])), unknown_bank))
+                for op in ops]
+    return out
+
+
+def bank_flows(conditions, unknown_bank: str = '') -> tuple:
+    """
+    Flujos por banco de QoriCash de las operaciones que cumplen `conditions`
+    (condiciones SQLAlchemy sobre Operation), agregados en SQL.
+
+    unknown_bank: banco al que van las filas con banco informado pero no
+    reconocido ('' → no se atribuyen; position.py usa 'INTERBANK').
+
+    Retorna (flows, fallback):
+      flows     {(banco, moneda): delta}  — + entra a QoriCash, − sale
+      fallback  [(operation_id, lado)]    — lado 'deposit' | 'payment' sin
+                banco atribuible: el caller imputa el monto completo
+    """
+    from sqlalchemy import select, func
+    from app.extensions import db
+    from app.models.operation import Operation
+
+    if not is_ready():
+        flows, fallback = {}, []
+        for op_id, op_type, side, banks in _from_json(conditions, unknown_bank):
+            if banks is None:
+                fallback.append((op_id, side))
+                continue
+            currency, sign = FLOW[(side, op_type)]
+            for bank, amount in banks:
+                flows[(bank, currency)] = flows.get((bank, currency), 0.0) + sign * amount
+        return flows, fallback
+
+    op_ids = select(Operation.id).where(*conditions)
+    flows, fallback = {}, []
+    for side, model in _sides():
+        ok = _qualified(model, op_ids, unknown_bank)
+        rows = db.session.execute(
+            select(Operation.operation_type, model.bank_key, model.external, func.sum(model.amount))
+            .join(Operation, Operation.id == model.operation_id)
+            .join(ok, ok.c.op_id == model.operation_id)
+            .where(_attributable(model, unknown_bank), model.amount > 0)
+            .group_by(Operation.operation_type, model.bank_key, model.external)
+        ).all()
+        for op_type, bank_key, external, total in rows:
+            currency, sign = FLOW[(side, op_type)]
+            key = (_bank(bank_key, external, unknown_bank), currency)
+            flows[key] = flows.get(key, 0.0) + sign * float(total)
+        fallback += [(op_id, side) for op_id in db.session.execute(
+            select(Operation.id).where(*conditions, Operation.id.not_in(select(ok.c.op_id)))
+        ).scalars()]
+    return flows, fallback
+
+
+def attributed(op_ids, unknown_bank: str = '') -> dict:
+    """
+    Como bank_flows() pero por operación, para las operaciones op_ids:
+    {(operation_id, lado): [(banco, monto), ...]}. Los lados ausentes van a
+    fallback (monto completo de la operación).
+    """
+    from sqlalchemy import select, func
+    from app.extensions import db
+    from app.models.operation import Operation
+
+    op_ids = list(op_ids)
+    result = {}
+    if not op_ids:
+        return result
+    if not is_ready():
+        return {(op_id, side): banks
+                for op_id, _, side, banks in _from_json([Operation.id.in_(op_ids)], unknown_bank)
+                if banks is not None}
+    for side, model in _sides():
+        ok = _qualified(model, op_ids, unknown_bank)
+        rows = db.session.execute(
+            select(model.operation_id, model.bank_key, model.external, func.sum(model.amount))
+            .join(ok, ok.c.op_id == model.operation_id)
+            .where(_attributable(model, unknown_bank), model.amount > 0)
+            .group_by(model.operation_id, model.bank_key, model.external)
+            .order_by(model.operation_id, func.min(model.position))
+        ).all()
+        for op_id, bank_key, external, total in rows:
+            result.setdefault((op_id, side), []).append(
+                (_bank(bank_key, external, unknown_bank), float(total)))
+    return result
+
+
+def fallback_movements(fallback, origin_bank, dest_bank) -> list:
+    """
+    (operation_id, lado) de bank_flows() → [(banco, moneda, delta)] por el
+    monto completo, con el banco de fallback del caller: origin_bank(op)
+    para abonos, dest_bank(op) para pagos.
+    """
+    from sqlalchemy.orm import selectinload
+    from app.models.operation import Operation
+
+    if not fallback:
+        return []
+    ops = {op.id: op for op in Operation.query.options(selectinload(Operation.client))
+           .filter(Operation.id.in_({op_id for op_id, _ in fallback})).all()}
+    out = []
+    for op_id, side in fallback:
+        op = ops[op_id]
+        currency, sign = FLOW[(side, op.operation_type)]
+        amount = float(op.amount_usd if currency == 'USD' else op.amount_pen)
+        bank = origin_bank(op) if side == 'deposit' else dest_bank(op)
+        out.append((bank, currency, sign * amount))
+    return out
@@ -0,0 +1,239 @@
+"""
+Efectos de los cambios de estado de una operación — QoriCash
+=============================================================
+Qué se encola en el outbox (app/services/outbox.py) en cada transición y
+cómo se ejecuta cada efecto. La transición (estado + auditoría + cierre
+diario) y sus efectos se graban en el mismo commit; el request responde sin
+esperar a NubeFact, al SMTP ni a WhatsApp.
+
+  COMPLETE_EFFECTS  /api/complete (operador finaliza)
+  STATUS_EFFECTS    OperationService.update_operation_status → Completada
+  ASSIGN_EFFECTS    /api/send_to_process (operador asignado)
+
+Todos los efectos de una operación comparten group_key, así que se ejecutan
+en el orden de la tupla: asiento → saldos → referido → factura → email...
+
+Cada handler recibe (operation_id, payload) y lanza excepción para pedir
+reintento; los que crean registros verifican antes si ya existen.
+
+Aparte, operation_children encola 'operation_children_sync' cuando falla la
+sincronización de las tablas hijas de una operación.
+"""
+import logging
+
+from app.services.outbox import handler, enqueue
+
+logger = logging.getLogger(__name__)
+
+COMPLETE_EFFECTS = ('journal_entry', 'bank_balance', 'referral_benefit', 'invoice',
+                    'completed_email', 'whatsapp_completed', 'notify_completed', 'risk_profile')
+STATUS_EFFECTS   = ('journal_entry', 'bank_balance', 'referral_benefit', 'invoice',
+                    'compliance_analysis', 'notify_completed')
+ASSIGN_EFFECTS   = ('notify_assigned',)
+
+
+def completion(operation) -> str:
+    """
+    Transición de una completación concreta. Una operación revertida y vuelta
+    a completar tiene otro completed_at, así que sus efectos se encolan de nuevo.
+    """
+    return f'Completada@{operation.completed_at:%Y%m%d%H%M%S%f}'
+
+
+def enqueue_effects(operation, effects, transition: str, actor_id: int = None, **payload):
+    """
+    Encolar `effects` de la operación en la transacción en curso.
+    transition identifica el cambio (p. ej. completion(operation)) para la
+    clave de idempotencia: '<topic>:<operation.id>:<transition>'.
+    """
+    for topic in effects:
+        enqueue(topic,
+                key=f'{topic}:{operation.id}:{transition}',
+                group=f'operation:{operation.id}',
+                operation_id=operation.id,
+                payload={'actor_id': actor_id, **payload})
+
+
+def _operation(operation_id):
+    from app.extensions import db
+    from app.models.operation import Operation
+    operation = db.session.get(Operation, operation_id)
+    if operation is None:
+        logger.warning(f'[OUTBOX] Operación {operation_id} ya no existe; efecto omitido')
+    return operation
+
+
+def _completed(operation_id):
+    """La operación solo si sigue Completada (pudo revertirse antes de que corra el efecto)"""
+    operation = _operation(operation_id)
+    if operation is not None and operation.status != 'Completada':
+        logger.warning(f'[OUTBOX] {operation.operation_id} ya no está Completada '
+                       f'({operation.status}); efecto omitido')
+        return None
+    return operation
+
+
+@handler('journal_entry')
+def _journal_entry(operation_id, payload):
+    """CONTABILIDAD: asiento automático de la operación completada"""
+    from app.models.journal_entry import JournalEntry
+    from app.services.accounting.journal_service import JournalService
+
+    operation = _completed(operation_id)
+    if operation is None:
+        return
+    # El contra-asiento de una reversión también es source_type='operation': no cuenta
+    if JournalEntry.query.filter(JournalEntry.source_type == 'operation',
+                                 JournalEntry.source_id == operation.id,
+                                 JournalEntry.status == 'activo',
+                                 JournalEntry.entry_type != 'reversal_operacion').first():
+        logger.info(f'[Accounting] {operation.operation_id} ya tiene asiento; no se duplica')
+        return
+    if JournalService.build_operation_entry(operation) is None:
+        return                                  # amount_pen = 0: no genera asiento
+    # create_entry_for_completed_operation no lanza: None es un error a reintentar
+    if JournalService.create_entry_for_completed_operation(operation, created_by_id=payload.get('actor_id')) is None:
+        raise RuntimeError(f'Asiento {operation.operation_id}: no se pudo crear')
+
+
+@handler('bank_balance')
+def _bank_balance(operation_id, payload):
+    """SALDOS BANCARIOS: movimientos del ledger y BankBalance al completar"""
+    from app.models.bank_balance import BankBalance
+    from app.models.bank_movement import BankMovement
+
+    operation = _completed(operation_id)
+    if operation is None:
+        return
+    # Solo los movimientos de esta completación (una reversión no los elimina)
+    moves = BankMovement.query.filter(BankMovement.source_type == 'operation',
+                                      BankMovement.operation_id == operation.id,
+                                      BankMovement.created_at >= operation.completed_at)
+    if moves.count():
+        logger.info(f'[Treasury] {operation.operation_id} ya tiene movimientos; no se duplican')
+        return
+    BankBalance.apply_operation(operation)
+
+    # Validación post-completado: detectar si apply_operation falló silenciosamente
+    mv_count = moves.count()
+    if mv_count == 0:
+        logger.error(
+            f'[Treasury] ALERTA: {operation.operation_id} completada sin BankMovements. '
+            f'Posible constraint activo en bank_balances o banco no determinable.'
+        )
+    else:
+        logger.info(f'[Treasury] OK: {operation.operation_id} → {mv_count} movimiento(s) en ledger.')
+
+
+@handler('referral_benefit')
+def _referral_benefit(operation_id, payload):
+    """Beneficio de referido; no se otorga si la operación se revirtió"""
+    from app.services.referral_service import referral_service
+
+    operation = _completed(operation_id)
+    if operation is not None:
+        referral_service.grant_referral_benefit(operation)
+
+
+@handler('invoice')
+def _invoice(operation_id, payload):
+    """Factura electrónica (NubeFact); un error de NubeFact se reintenta"""
+    from app.services.invoice_service import InvoiceService
+
+    operation = _completed(operation_id)
+    if operation is None:
+        return
+    if not InvoiceService.is_enabled():
+        logger.warning(f'[OPERATION-{operation.operation_id}] Facturacion electronica DESHABILITADA en configuracion')
+        return
+    success, message, invoice = InvoiceService.generate_invoice_for_operation(operation.id)
+    if not success:
+        raise RuntimeError(f'Factura {operation.operation_id}: {message}')
+    logger.info(f'[OPERATION-{operation.operation_id}] Factura generada: {invoice.invoice_number if invoice else "-"}')
+
+
+@handler('completed_email')
+def _completed_email(operation_id, payload):
+    from app.services.email_service import EmailService
+
+    operation = _operation(operation_id)
+    if operation is None:
+        return
+    success, message = EmailService.send_completed_operation_email(operation)
+    if not success:
+        raise RuntimeError(f'Email {operation.operation_id}: {message}')
+    logger.info(f'[COMPLETE] Email enviado para {operation.operation_id}')
+
+
+@handler('whatsapp_completed')
+def _whatsapp_completed(operation_id, payload):
+    """WhatsApp al cliente con la plantilla aprobada por Meta"""
+    from app.services.wa_bot import wa_notify_operacion_completada
+
+    operation = _operation(operation_id)
+    if operation is None:
+        return
+    client = operation.client
+    titular = (client.full_name or client.razon_social) if client else operation.operation_id
+    emails = [e.strip() for e in (getattr(client, 'email', '') or '').split(';') if e.strip() and '@' in e]
+    wa_notify_operacion_completada(client, operation.operation_id, titular,
+                                   emails[0] if emails else 'correo registrado')
+    logger.info(f'[COMPLETE] WhatsApp template enviado para {operation.operation_id}')
+
+
+@handler('notify_completed')
+def _notify_completed(operation_id, payload):
+    """Notificación persistente + web push a Master/Operador y aviso al cliente web"""
+    from app.services.notification_service import NotificationService
+
+    operation = _operation(operation_id)
+    if operation is not None:
+        NotificationService.notify_operation_completed(operation)
+
+
+@handler('risk_profile')
+def _risk_profile(operation_id, payload):
+    from app.services.compliance_service import ComplianceService
+
+    operation = _operation(operation_id)
+    if operation is not None:
+        ComplianceService.update_client_risk_profile(operation.client_id, user_id=None, auto_commit=True)
+
+
+@handler('compliance_analysis')
+def _compliance_analysis(operation_id, payload):
+    """COMPLIANCE: análisis de la operación y perfil de riesgo del cliente"""
+    from app.services.compliance_service import ComplianceService
+
+    operation = _operation(operation_id)
+    if operation is None:
+        return
+    alerts, risk_score = ComplianceService.analyze_operation(operation.id)
+    logger.info(f'Compliance analysis for {operation.operation_id}: {len(alerts)} alerts, risk_score={risk_score}')
+    ComplianceService.update_client_risk_profile(operation.client_id, payload.get('actor_id'))
+
+    critical = [a for a in alerts if a.severity == 'Crítica']
+    if critical:
+        logger.warning(f'ALERTA CRÍTICA: Operación {operation.operation_id} generó {len(critical)} alerta(s) crítica(s)')
+
+
+@handler('notify_assigned')
+def _notify_assigned(operation_id, payload):
+    """Notificación persistente + web push al operador asignado"""
+    from app.extensions import db
+    from app.models.user import User
+    from app.services.notification_service import NotificationService
+
+    operation = _operation(operation_id)
+    operator = db.session.get(User, payload.get('operator_id')) if payload.get('operator_id') else None
+    if operation is not None and operator is not None:
+        NotificationService.notify_operation_assigned(operation, operator)
+
+
+@handler('operation_children_sync')
+def _operation_children_sync(operation_id, payload):
+    """Tablas hijas (depósitos/pagos) de una operación cuyo listener falló"""
+    from app.services.operation_children import resync
+
+    if resync(operation_id):
+        logger.info(f'[OperationChildren] Resincronizada operación {operation_id}')
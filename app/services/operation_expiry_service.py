@@ -1,5 +1,10 @@
 """
 Servicio para expirar operaciones automáticamente
+
+Las operaciones pendientes de web/app/plataforma expiran a los 15 minutos.
+start_engine() lanza el motor por deadline (expiry_engine.ExpiryEngine), que
+despierta exactamente al vencer la próxima operación y las cancela en un
+solo UPDATE ... RETURNING; las notificaciones van a un dispatcher aparte.
 """
 import logging
 import os
@@ -18,127 +23,228 @@ OPERATION_TIMEOUT_MINUTES = 15
 # Hora de cierre diario (22:00 hora Perú)
 END_OF_DAY_HOUR = 22
 
+# Canales cuyas operaciones expiran por tiempo ('sistema' no expira)
+EXPIRING_ORIGINS = ('web', 'app', 'plataforma')
+
+CANCELLATION_REASON = "Tiempo límite de carga de comprobante expirado"
+
+# Workers del dispatcher de notificaciones de expiración
+NOTIFY_WORKERS = 2
+
+# Motor por deadline (app/services/expiry_engine.py), uno por proceso
+_engine = None
+_dispatcher = None
+
 
 class OperationExpiryService:
     """Servicio para manejar expiración automática de operaciones"""
 
     @staticmethod
-    def expire_old_operations():
+    def _expirable(now):
         """
-        Buscar y cancelar operaciones pendientes que hayan excedido el tiempo límite
+        Condiciones de una operación que expira por tiempo límite.
 
-        Returns:
-            int: Número de operaciones canceladas
+        IMPORTANTE: Solo cancelar operaciones de canales web, app y plataforma.
+        Las operaciones de 'sistema' (creadas por Trader) NO se cancelan automáticamente.
+        PROTECCIÓN: Solo considerar operaciones creadas en las últimas 24 horas;
+        esto evita cancelar operaciones viejas con timestamps en hora de Perú.
         """
-        try:
-            # Calcular fecha límite (15 minutos atrás desde ahora)
-            cutoff_time = now_peru() - timedelta(minutes=OPERATION_TIMEOUT_MINUTES)
-
-            # PROTECCIÓN: Solo considerar operaciones creadas en las últimas 24 horas
-            # Esto evita cancelar operaciones viejas con timestamps en hora de Perú
-            protection_cutoff = now_peru() - timedelta(hours=24)
-
-            # Buscar operaciones pendientes creadas antes del cutoff_time
-            # pero DESPUÉS del protection_cutoff (últimas 24 horas)
-            # IMPORTANTE: Solo cancelar operaciones de canales web, app y plataforma
-            # Las operaciones de 'sistema' (creadas por Trader) NO se cancelan automáticamente
-            expired_operations = Operation.query.filter(
-                Operation.status == 'Pendiente',
-                Operation.created_at < cutoff_time,
-                Operation.created_at > protection_cutoff,  # Solo últimas 24 horas
-                Operation.origen.in_(['web', 'app', 'plataforma'])  # Excluir 'sistema'
-            ).all()
+        return (
+            Operation.status == 'Pendiente',
+            Operation.origen.in_(EXPIRING_ORIGINS),
+            Operation.created_at > now - timedelta(hours=24),
+        )
 
-            if not expired_operations:
-                return 0
+    @staticmethod
+    def deadline_for(operation):
+        """Momento en que la operación expira, o None si no expira por tiempo"""
+        if operation.status != 'Pendiente' or operation.origen not in EXPIRING_ORIGINS or not operation.created_at:
+            return None
+        return operation.created_at + timedelta(minutes=OPERATION_TIMEOUT_MINUTES)
 
-            expired_count = 0
+    @staticmethod
+    def pending_deadlines():
+        """(id, deadline) de las operaciones pendientes que pueden expirar (carga inicial del motor)"""
+        rows = db.session.query(Operation.id, Operation.created_at).filter(
+            *OperationExpiryService._expirable(now_peru())
+        ).all()
+        return [(op_id, created_at + timedelta(minutes=OPERATION_TIMEOUT_MINUTES)) for op_id, created_at in rows]
 
-            for operation in expired_operations:
-                try:
-                    # LOG: Información detallada de la operación que se va a cancelar
-                    logger.info(f"🔍 EXPIRANDO: {operation.operation_id} | Origen: {operation.origen} | Creada: {operation.created_at} | Cutoff: {cutoff_time}")
+    @staticmethod
+    def expire_due_operations(now=None):
+        """
+        Cancelar en un solo UPDATE ... RETURNING todas las operaciones pendientes
+        que hayan excedido el tiempo límite, y hacer commit.
 
-                    # Cambiar estado a Cancelado (como solicitado por el usuario)
-                    operation.status = 'Cancelado'
-                    operation.updated_at = now_peru()
+        Returns:
+            list[int]: ids de las operaciones canceladas
+        """
+        from sqlalchemy import update, case, or_
+
+        now = now or now_peru()
+        cutoff_time = now - timedelta(minutes=OPERATION_TIMEOUT_MINUTES)
+        reason = f"[SISTEMA] {CANCELLATION_REASON}"
+
+        stmt = (
+            update(Operation)
+            .where(*OperationExpiryService._expirable(now), Operation.created_at <= cutoff_time)
+            .values(
+                status='Cancelado',
+                updated_at=now,
+                notes=case(
+                    (or_(Operation.notes.is_(None), Operation.notes == ''), reason),
+                    else_=Operation.notes + '\n\n' + reason,
+                ),
+            )
+            .returning(Operation.id, Operation.operation_id)
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            rows = db.session.execute(stmt).all()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
 
-                    # Agregar motivo de cancelación en notas
-                    cancellation_reason = "Tiempo límite de carga de comprobante expirado"
-                    if operation.notes:
-                        operation.notes = f"{operation.notes}\n\n[SISTEMA] {cancellation_reason}"
-                    else:
-                        operation.notes = f"[SISTEMA] {cancellation_reason}"
+        for _, operation_id in rows:
+            logger.info(f"⏱️ Operación {operation_id} cancelada automáticamente por tiempo límite expirado")
+        if rows:
+            logger.info(f"✅ {len(rows)} operaciones canceladas automáticamente por tiempo límite expirado")
+        return [op_id for op_id, _ in rows]
 
-                    # Guardar en base de datos
-                    db.session.commit()
+    @staticmethod
+    def expire_old_operations():
+        """
+        Buscar y cancelar operaciones pendientes que hayan excedido el tiempo límite.
+        Las notificaciones se encolan en el dispatcher si el motor está corriendo;
+        si no (scripts, flask shell), se envían aquí mismo.
 
-                    logger.info(f"⏱️ Operación {operation.operation_id} cancelada automáticamente por tiempo límite expirado (creada: {operation.created_at})")
+        Returns:
+            int: Número de operaciones canceladas
+        """
+        try:
+            ids = OperationExpiryService.expire_due_operations()
+        except Exception as e:
+            logger.error(f"Error en expire_old_operations: {str(e)}")
+            import traceback
+            logger.error(traceback.format_exc())
+            return 0
 
-                    # Enviar notificación Socket.IO al cliente (app móvil)
-                    try:
-                        NotificationService.notify_operation_expired(operation)
-                        logger.info(f"📡 Notificación Socket.IO enviada para operación {operation.operation_id}")
-                    except Exception as notif_error:
-                        logger.error(f"❌ Error enviando notificación Socket.IO: {str(notif_error)}")
+        for op_id in ids:
+            if _dispatcher is not None:
+                _dispatcher.submit(op_id)
+            else:
+                operation = db.session.get(Operation, op_id)
+                if operation:
+                    OperationExpiryService.notify_expired(operation)
+        return len(ids)
 
-                    # Enviar correo electrónico al cliente
-                    try:
-                        from app.services.email_service import EmailService
-                        success, message = EmailService.send_operation_expired_email(operation)
-                        if success:
-                            logger.info(f"📧 Email de cancelación enviado para operación {operation.operation_id}")
-                        else:
-                            logger.warning(f"⚠️ No se pudo enviar email para operación {operation.operation_id}: {message}")
-                    except Exception as email_error:
-                        logger.error(f"❌ Error enviando email de expiración: {str(email_error)}")
-
-                    # Enviar Push Notification (Expo) al cliente
-                    try:
-                        from app.services.push_notification_service import PushNotificationService
-                        if operation.client and operation.client.push_notification_token:
-                            push_result = PushNotificationService.send_operation_expired_push(operation.client)
-                            if push_result.get('success'):
-                                logger.info(f"📲 Push notification enviada para operación {operation.operation_id}")
-                            else:
-                                logger.warning(f"⚠️ No se pudo enviar push: {push_result.get('error')}")
-                        else:
-                            logger.info(f"ℹ️ Cliente sin token push registrado para operación {operation.operation_id}")
-                    except Exception as push_error:
-                        logger.error(f"❌ Error enviando push notification: {str(push_error)}")
+    @staticmethod
+    def notify_expired(operation):
+        """Avisar al cliente (Socket.IO, email, push, WhatsApp) que su operación expiró"""
+        # Enviar notificación Socket.IO al cliente (app móvil)
+        try:
+            NotificationService.notify_operation_expired(operation)
+            logger.info(f"📡 Notificación Socket.IO enviada para operación {operation.operation_id}")
+        except Exception as notif_error:
+            logger.error(f"❌ Error enviando notificación Socket.IO: {str(notif_error)}")
 
-                    # Notificar al cliente vía WhatsApp
-                    try:
-                        from app.services.wa_bot import wa_notify_client_buttons
-                        titular = operation.client.full_name if operation.client else operation.operation_id
-                        wa_notify_client_buttons(
-                            operation.client,
-                            f'⏱️ Tu operación *{operation.operation_id}* a nombre de *{titular}* fue cancelada automáticamente '
-                            f'porque no se registró la transferencia dentro del plazo de *15 minutos*.\n\n'
-                            f'Puedes iniciar una nueva cotización cuando lo desees o hablar con un asesor.',
-                            [{'id': 'btn_asesor', 'title': '💬 Hablar con asesor'}]
-                        )
-                    except Exception as wa_err:
-                        logger.warning(f"[EXPIRY] Error WA para {operation.operation_id}: {wa_err}")
+        # Enviar correo electrónico al cliente
+        try:
+            from app.services.email_service import EmailService
+            success, message = EmailService.send_operation_expired_email(operation)
+            if success:
+                logger.info(f"📧 Email de cancelación enviado para operación {operation.operation_id}")
+            else:
+                logger.warning(f"⚠️ No se pudo enviar email para operación {operation.operation_id}: {message}")
+        except Exception as email_error:
+            logger.error(f"❌ Error enviando email de expiración: {str(email_error)}")
+
+        # Enviar Push Notification (Expo) al cliente
+        try:
+            from app.services.push_notification_service import PushNotificationService
+            if operation.client and operation.client.push_notification_token:
+                push_result = PushNotificationService.send_operation_expired_push(operation.client)
+                if push_result.get('success'):
+                    logger.info(f"📲 Push notification enviada para operación {operation.operation_id}")
+                else:
+                    logger.warning(f"⚠️ No se pudo enviar push: {push_result.get('error')}")
+            else:
+                logger.info(f"ℹ️ Cliente sin token push registrado para operación {operation.operation_id}")
+        except Exception as push_error:
+            logger.error(f"❌ Error enviando push notification: {str(push_error)}")
+
+        # Notificar al cliente vía WhatsApp
+        try:
+            from app.services.wa_bot import wa_notify_client_buttons
+            titular = operation.client.full_name if operation.client else operation.operation_id
+            wa_notify_client_buttons(
+                operation.client,
+                f'⏱️ Tu operación *{operation.operation_id}* a nombre de *{titular}* fue cancelada automáticamente '
+                f'porque no se registró la transferencia dentro del plazo de *{OPERATION_TIMEOUT_MINUTES} minutos*.\n\n'
+                f'Puedes iniciar una nueva cotización cuando lo desees o hablar con un asesor.',
+                [{'id': 'btn_asesor', 'title': '💬 Hablar con asesor'}]
+            )
+        except Exception as wa_err:
+            logger.warning(f"[EXPIRY] Error WA para {operation.operation_id}: {wa_err}")
 
-                    expired_count += 1
+    @staticmethod
+    def schedule(operation):
+        """Registrar el deadline de una operación recién creada en el motor (si corre en este proceso)"""
+        if _engine is None:
+            return
+        deadline = OperationExpiryService.deadline_for(operation)
+        if deadline is not None:
+            _engine.schedule(operation.id, deadline)
 
-                except Exception as op_error:
-                    logger.error(f"Error expirando operación {operation.operation_id}: {str(op_error)}")
-                    db.session.rollback()
-                    continue
+    @staticmethod
+    def start_engine(app):
+        """
+        Crear el motor de expiración por deadline y lanzar los workers de
+        notificación. El loop del motor corre como job 'operation_expiry' en
+        un solo worker (scheduler_coordinator). Idempotente por proceso.
+        """
+        global _engine, _dispatcher
+        if _engine is not None:
+            return _engine
 
-            if expired_count > 0:
-                logger.info(f"✅ {expired_count} operaciones canceladas automáticamente por tiempo límite expirado")
+        import eventlet
+        from app.services.expiry_engine import ExpiryEngine, Dispatcher
+        from app.services.scheduler_coordinator import run_singleton
 
-            return expired_count
+        def _expire(now):
+            with app.app_context():
+                try:
+                    ids = OperationExpiryService.expire_due_operations(now)
+                finally:
+                    db.session.remove()
+            for op_id in ids:
+                _dispatcher.submit(op_id)
+            return ids
+
+        def _load():
+            with app.app_context():
+                try:
+                    return OperationExpiryService.pending_deadlines()
+                finally:
+                    db.session.remove()
 
-        except Exception as e:
-            logger.error(f"Error en expire_old_operations: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-            db.session.rollback()
-            return 0
+        def _notify(op_id):
+            with app.app_context():
+                try:
+                    operation = db.session.get(Operation, op_id)
+                    if operation:
+                        OperationExpiryService.notify_expired(operation)
+                finally:
+                    db.session.remove()
+
+        _dispatcher = Dispatcher(_notify, name='EXPIRY-NOTIFY')
+        for _ in range(NOTIFY_WORKERS):
+            eventlet.spawn(_dispatcher.run_forever)
+        _engine = ExpiryEngine(_expire, _load, clock=now_peru)
+        run_singleton(app, 'operation_expiry', _engine.run_forever)
+        logger.info("[EXPIRY] 🚀 Motor de expiración por deadline registrado")
+        return _engine
 
     @staticmethod
     def cancel_end_of_day_operations():
@@ -134,7 +134,121 @@ class OperationService:
             priority_order,  # Primero por prioridad (En proceso = 0)
             Operation.created_at.desc()  # Luego por fecha descendente
         ).all()
-    
+
+    @staticmethod
+    def history_query(current_user, filters=None):
+        """
+        Consulta del historial de operaciones, acotada por rol y filtrada en el
+        servidor. Proyecta solo las columnas que muestra la tabla del historial
+        (sin cargar Operation/Client completos ni sus relaciones).
+
+        Alcance por rol:
+            - Trader/App/Web: operaciones de los clientes que registró el usuario
+            - Otros roles: todas, excepto las del usuario demo
+
+        Args:
+            current_user: Usuario que consulta
+            filters: dict opcional con
+                status    — estado exacto ('Pendiente', 'Completada', ...)
+                client_id — ID de cliente
+                trader_id — usuario que registró la operación (solo roles globales)
+                date_from / date_to — date, rango inclusivo sobre created_at
+                q         — texto: código de operación, documento o nombre del cliente
+
+        Returns:
+            Query: filas (id, operation_id, client_id, amount_usd, ..., user_email)
+        """
+        from datetime import timedelta
+        from sqlalchemy import or_
+        from app.models.user import User
+
+        filters = filters or {}
+
+        query = db.session.query(
+            Operation.id,
+            Operation.operation_id,
+            Operation.client_id,
+            Operation.operation_type,
+            Operation.amount_usd,
+            Operation.exchange_rate,
+            Operation.base_rate,
+            Operation.pips,
+            Operation.amount_pen,
+            Operation.status,
+            Operation.created_at,
+            Client.dni.label('client_dni'),
+            Client.document_type.label('client_document_type'),
+            Client.razon_social.label('client_razon_social'),
+            Client.apellido_paterno.label('client_apellido_paterno'),
+            Client.apellido_materno.label('client_apellido_materno'),
+            Client.nombres.label('client_nombres'),
+            User.email.label('user_email'),
+        ).join(Client, Operation.client_id == Client.id
+        ).outerjoin(User, Operation.user_id == User.id)
+
+        if current_user.role in ['Trader', 'App', 'Web']:
+            query = query.filter(Client.created_by == current_user.id)
+        else:
+            demo_id = User.get_demo_user_id()
+            if demo_id:
+                # IS DISTINCT FROM: conserva las operaciones sin usuario (app móvil)
+                query = query.filter(Operation.user_id.is_distinct_from(demo_id))
+            if filters.get('trader_id'):
+                query = query.filter(Operation.user_id == filters['trader_id'])
+
+        if filters.get('status'):
+            query = query.filter(Operation.status == filters['status'])
+        if filters.get('client_id'):
+            query = query.filter(Operation.client_id == filters['client_id'])
+        if filters.get('date_from'):
+            query = query.filter(Operation.created_at >= filters['date_from'])
+        if filters.get('date_to'):
+            query = query.filter(Operation.created_at < filters['date_to'] + timedelta(days=1))
+
+        # Cada palabra debe aparecer en el código, el documento o algún campo del nombre
+        for term in (filters.get('q') or '').split():
+            like = f'%{term}%'
+            query = query.filter(or_(
+                Operation.operation_id.ilike(like),
+                Client.dni.ilike(like),
+                Client.razon_social.ilike(like),
+                Client.apellido_paterno.ilike(like),
+                Client.apellido_materno.ilike(like),
+                Client.nombres.ilike(like),
+            ))
+
+        return query
+
+    @staticmethod
+    def history_row(row, with_user=False):
+        """Fila proyectada de history_query() → dict para la tabla del historial"""
+        if row.client_document_type == 'RUC':
+            client_name = row.client_razon_social.upper() if row.client_razon_social else None
+        else:
+            parts = [p.upper() for p in (row.client_apellido_paterno,
+                                         row.client_apellido_materno,
+                                         row.client_nombres) if p]
+            client_name = ' '.join(parts) if parts else None
+
+        data = {
+            'id': row.id,
+            'operation_id': row.operation_id,
+            'client_id': row.client_id,
+            'client_name': client_name,
+            'client_dni': row.client_dni,
+            'operation_type': row.operation_type,
+            'amount_usd': float(row.amount_usd),
+            'exchange_rate': float(row.exchange_rate),
+            'base_rate': float(row.base_rate) if row.base_rate is not None else None,
+            'pips': float(row.pips) if row.pips is not None else None,
+            'amount_pen': float(row.amount_pen),
+            'status': row.status,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+        }
+        if with_user:
+            data['user_email'] = row.user_email
+        return data
+
     @staticmethod
     def create_operation(current_user, client_id, operation_type, amount_usd, exchange_rate,
                         source_account=None, destination_account=None, notes=None, origen='sistema',
@@ -391,123 +505,22 @@ class OperationService:
             notes=notes
         )
 
-        # Commit único para operation y audit_log juntos
-        db.session.commit()
-
-        # Otorgar beneficio de referido si la operación se completó
+        # Cierre diario: acumular la operación en el borrador del día
         if new_status == 'Completada':
-            try:
-                from app.services.referral_service import referral_service
-                referral_service.grant_referral_benefit(operation)
-            except Exception as e:
-                logger.warning(f"⚠️ Error al otorgar beneficio de referido: {str(e)}")
+            from app.services.closure_accumulator import ClosureAccumulator
+            ClosureAccumulator.apply_operation(operation)
 
-        # Enviar email si la operación se completó
-        if new_status == 'Completada':
-            # Generar factura electrónica
-            invoice_generated = False
-            try:
-                from app.services.invoice_service import InvoiceService
-                import logging
-                logger = logging.getLogger(__name__)
-
-                logger.info(f'[OPERATION-{operation.operation_id}] ========== INICIANDO PROCESO DE FACTURACIÓN ==========')
-
-                if InvoiceService.is_enabled():
-                    logger.info(f'[OPERATION-{operation.operation_id}] ✅ Facturación electrónica HABILITADA')
-                    logger.info(f'[OPERATION-{operation.operation_id}] Generando factura electrónica...')
-
-                    success, message, invoice = InvoiceService.generate_invoice_for_operation(operation.id)
-
-                    if success and invoice:
-                        logger.info(f'[OPERATION-{operation.operation_id}] ✅ ÉXITO: Factura generada: {invoice.invoice_number}')
-                        logger.info(f'[OPERATION-{operation.operation_id}] PDF URL: {invoice.nubefact_enlace_pdf}')
-                        invoice_generated = True
-                    else:
-                        logger.error(f'[OPERATION-{operation.operation_id}] ❌ ERROR al generar factura: {message}')
-                else:
-                    logger.warning(f'[OPERATION-{operation.operation_id}] ⚠️ Facturación electrónica DESHABILITADA en configuración')
-                    logger.warning(f'[OPERATION-{operation.operation_id}] Verifica NUBEFACT_ENABLED en variables de entorno')
+            # Efectos (asiento, saldos, referido, factura, compliance, notificación)
+            # al outbox, en la misma transacción; los ejecuta el dispatcher
+            from app.services.operation_effects import enqueue_effects, completion, STATUS_EFFECTS
+            enqueue_effects(operation, STATUS_EFFECTS, completion(operation), actor_id=current_user.id)
 
-                logger.info(f'[OPERATION-{operation.operation_id}] ========== FIN PROCESO DE FACTURACIÓN ==========')
-
-            except Exception as e:
-                # Log el error pero no falla la operación
-                import logging
-                logging.error(f'[OPERATION-{operation.operation_id}] ❌ EXCEPCIÓN al generar factura: {str(e)}')
-                logging.exception(e)
-
-            # Email de completada: enviado por la ruta complete_operation (operations.py)
-            # NO enviar aquí para evitar duplicados
-
-            # COMPLIANCE: Análisis automático de la operación
-            try:
-                from app.services.compliance_service import ComplianceService
-                import logging
-                logger = logging.getLogger(__name__)
-
-                # Analizar operación para detectar patrones sospechosos
-                alerts, risk_score = ComplianceService.analyze_operation(operation.id)
-
-                logger.info(f'Compliance analysis for {operation.operation_id}: {len(alerts)} alerts, risk_score={risk_score}')
-
-                # Actualizar perfil de riesgo del cliente
-                ComplianceService.update_client_risk_profile(operation.client_id, current_user.id)
-
-                # Log para Middle Office si hay alertas críticas
-                critical_alerts = [a for a in alerts if a.severity == 'Crítica']
-                if critical_alerts:
-                    logger.warning(f'ALERTA CRÍTICA: Operación {operation.operation_id} generó {len(critical_alerts)} alerta(s) crítica(s)')
-
-            except Exception as e:
-                # Log el error pero no falla la operación
-                import logging
-                logging.error(f'Error en análisis de compliance para {operation.operation_id}: {str(e)}')
+        # Commit único para operation, audit_log, cierre y outbox juntos
+        db.session.commit()
 
-        # CONTABILIDAD: Asiento automático al completar — completamente aislado
-        # Un fallo aquí NUNCA afecta el estado de la operación (ya fue commiteado)
-        if new_status == 'Completada':
-            try:
-                from app.services.accounting.journal_service import JournalService
-                JournalService.create_entry_for_completed_operation(
-                    operation,
-                    created_by_id=current_user.id,
-                )
-            except Exception as e:
-                import logging
-                logging.error(
-                    f'[Accounting] Error al registrar asiento contable '
-                    f'para {operation.operation_id}: {str(e)}'
-                )
-
-        # SALDOS BANCARIOS: Actualizar balance automáticamente al completar
         if new_status == 'Completada':
-            try:
-                from app.models.bank_balance import BankBalance
-                BankBalance.apply_operation(operation)
-            except Exception as e:
-                import logging
-                logging.error(f'[BankBalance] Error en auto-update para {operation.operation_id}: {str(e)}')
-
-            # Validación post-completado: verificar que BankMovements fueron creados
-            try:
-                import logging
-                from app.models.bank_movement import BankMovement
-                mv_count = BankMovement.query.filter_by(
-                    source_type='operation', operation_id=operation.id
-                ).count()
-                if mv_count == 0:
-                    logging.error(
-                        f'[Treasury] ALERTA: Operación {operation.operation_id} completada '
-                        f'sin BankMovements en ledger. Verificar constraints y apply_operation.'
-                    )
-                else:
-                    logging.info(
-                        f'[Treasury] OK: {operation.operation_id} generó {mv_count} movimiento(s).'
-                    )
-            except Exception as _ve:
-                import logging
-                logging.warning(f'[Treasury] No se pudo validar movimientos para {operation.operation_id}: {_ve}')
+            from app.services.outbox import wake
+            wake()
 
         return True, f'Estado actualizado a {new_status}', operation
     
@@ -712,55 +725,14 @@ class OperationService:
         """
         Asignar un operador de forma balanceada
 
-        Algoritmo:
-        1. Obtener todos los usuarios con rol "Operador" activos
-        2. Contar cuántas operaciones "En proceso" tiene cada uno asignadas
-        3. Asignar al operador con menos operaciones asignadas
+        Algoritmo (app/services/operator_assignment.py):
+        1. Una consulta: operadores activos LEFT JOIN su conteo de operaciones
+           "En proceso" y la última operación que se les asignó
+        2. Elegir la menor carga relativa (carga + 1) / capacidad
+        3. Empates: el operador que recibió una operación hace más tiempo
 
         Returns:
             int: ID del operador asignado, o None si no hay operadores disponibles
         """
-        import logging
-        logger = logging.getLogger(__name__)
-
-        from app.models.user import User
-
-        logger.info("🔍 Buscando operadores activos...")
-
-        # Obtener todos los operadores activos
-        operators = User.query.filter(
-            and_(
-                User.role == 'Operador',
-                User.status == 'Activo'
-            )
-        ).all()
-
-        logger.info(f"📊 Operadores encontrados: {len(operators)}")
-
-        if not operators:
-            logger.warning("⚠️ ADVERTENCIA: No hay operadores activos disponibles para asignar")
-            return None
-
-        # Log de operadores encontrados
-        for op in operators:
-            logger.info(f"  👤 Operador ID={op.id}, Usuario={op.username}, Email={op.email}")
-
-        # Contar operaciones en proceso asignadas a cada operador
-        operator_loads = {}
-        for operator in operators:
-            count = Operation.query.filter(
-                and_(
-                    Operation.assigned_operator_id == operator.id,
-                    Operation.status == 'En proceso'
-                )
-            ).count()
-            operator_loads[operator.id] = count
-            logger.info(f"  📈 Operador ID={operator.id} ({operator.username}): {count} operaciones en proceso")
-
-        # Encontrar el operador con menos carga
-        min_load_operator_id = min(operator_loads, key=operator_loads.get)
-        min_load = operator_loads[min_load_operator_id]
-
-        logger.info(f"✅ Asignando operador: ID={min_load_operator_id}, Carga actual={min_load} operaciones")
-
-        return min_load_operator_id
+        from app.services.operator_assignment import assign_operator
+        return assign_operator()
@@ -0,0 +1,118 @@
+"""
+Asignación balanceada de operadores — QoriCash
+===============================================
+Al enviar una operación a proceso se elige el operador activo con menor
+carga relativa. Una sola consulta trae, por operador:
+
+    load  operaciones 'En proceso' asignadas (LEFT JOIN al conteo agrupado)
+    last  id de la última operación que se le asignó (round-robin)
+
+y pick_operator() decide en memoria:
+
+  - Carga relativa = (load + 1) / capacidad: la carga que tendría si recibe
+    esta operación. Con capacidad 2 un operador recibe el doble que uno con
+    capacidad 1; capacidad 0 lo deja fuera de la asignación automática.
+  - Empates → el que recibió una operación hace más tiempo (o nunca), así
+    los operadores con la misma carga se turnan en vez de cargar siempre al
+    de menor id.
+
+La capacidad sale de SystemConfig OPERATOR_CAPACITY, un JSON
+{"<user_id>": peso}; los operadores que no figuran tienen peso 1.
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+CAPACITY_KEY     = 'OPERATOR_CAPACITY'
+DEFAULT_CAPACITY = 1.0
+
+
+def parse_capacity(raw) -> dict:
+    """'{"5": 2, "9": 0.5}' → {5: 2.0, 9: 0.5}; entradas inválidas se ignoran."""
+    try:
+        data = json.loads(raw) if raw else {}
+    except (TypeError, ValueError):
+        return {}
+    out = {}
+    for key, value in (data.items() if isinstance(data, dict) else ()):
+        try:
+            weight = float(value)
+            out[int(key)] = weight if weight >= 0 else DEFAULT_CAPACITY
+        except (TypeError, ValueError):
+            continue
+    return out
+
+
+def pick_operator(rows, capacity: dict = None):
+    """
+    rows: iterable de (operator_id, load, last_assigned_id | None).
+    Devuelve el operator_id elegido, o None si nadie tiene capacidad.
+    """
+    capacity = capacity or {}
+    best, best_key = None, None
+    for operator_id, load, last in rows:
+        weight = capacity.get(operator_id, DEFAULT_CAPACITY)
+        if weight <= 0:
+            continue
+        key = ((load + 1) / weight, last or 0, operator_id)
+        if best_key is None or key < best_key:
+            best, best_key = operator_id, key
+    return best
+
+
+def operator_loads() -> list:
+    """(operator_id, username, load, last_assigned_id) de los operadores activos, en una consulta."""
+    from sqlalchemy import func
+    from app.extensions import db
+    from app.models.operation import Operation
+    from app.models.user import User
+
+    in_process = (
+        db.session.query(Operation.assigned_operator_id.label('operator_id'),
+                         func.count().label('load'))
+        .filter(Operation.status == 'En proceso', Operation.assigned_operator_id.isnot(None))
+        .group_by(Operation.assigned_operator_id)
+        .subquery()
+    )
+    last_assigned = (
+        db.session.query(func.max(Operation.id))
+        .filter(Operation.assigned_operator_id == User.id)
+        .correlate(User)
+        .scalar_subquery()
+    )
+    load = func.coalesce(in_process.c.load, 0)
+    return (
+        db.session.query(User.id, User.username, load, last_assigned)
+        .outerjoin(in_process, in_process.c.operator_id == User.id)
+        .filter(User.role == 'Operador', User.status == 'Activo')
+        .order_by(load, User.id)
+        .all()
+    )
+
+
+def load_capacity() -> dict:
+    from app.models.system_config import SystemConfig
+    return parse_capacity(SystemConfig.get(CAPACITY_KEY))
+
+
+def assign_operator():
+    """ID del operador elegido para la próxima operación en proceso, o None."""
+    rows = operator_loads()
+    if not rows:
+        logger.warning("⚠️ ADVERTENCIA: No hay operadores activos disponibles para asignar")
+        return None
+
+    capacity = load_capacity()
+    chosen = pick_operator([(op_id, load, last) for op_id, _, load, last in rows], capacity)
+    if chosen is None:
+        logger.warning("⚠️ ADVERTENCIA: Ningún operador activo tiene capacidad asignada")
+        return None
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for op_id, username, load, last in rows:
+            logger.debug(f"  📈 Operador ID={op_id} ({username}): {load} en proceso, "
+                         f"capacidad {capacity.get(op_id, DEFAULT_CAPACITY)}, última asignada {last}")
+    chosen_load = next(load for op_id, _, load, _ in rows if op_id == chosen)
+    logger.info(f"✅ Asignando operador: ID={chosen}, Carga actual={chosen_load} operaciones")
+    return chosen
@@ -0,0 +1,272 @@
+"""
+Cola de trabajo del operador — QoriCash
+=======================================
+Reemplaza el sondeo de /api/check_pending_operations (cada 60 s, con
+to_dict completo de cada operación y should_alert por aritmética de minutos).
+El servidor mantiene la cola de cada operador —sus operaciones 'En proceso',
+marcadas como vencidas desde los ALERT_MINUTES— y la empuja por Socket.IO a
+la sala user_{id} con el evento 'cola_operador':
+
+    {'type': 'snapshot', 'operations': [...]}      al pedir 'cola_operador_sync'
+    {'type': 'diff', 'upsert': [...], 'remove': [ids]}
+    {'type': 'alerta', 'operations': [...]}        a los 10, 20, 30... min
+
+  - Diffs: el listener after_update de Operation anota los operadores
+    afectados (anterior y actual) en session.info; after_commit los pasa a
+    un Dispatcher que recarga la operación y emite upsert o remove. Nada se
+    emite si la transacción hace rollback.
+  - Alertas: un ExpiryEngine (app/services/expiry_engine.py) con el próximo
+    múltiplo de ALERT_MINUTES de cada operación como deadline; corre como job
+    'operator_queue_alerts' del coordinador (un solo worker) y recarga desde
+    la base cada RELOAD_SECONDS (las asignaciones hechas en otros workers).
+"""
+import logging
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+ALERT_MINUTES = 10
+
+# Recarga de las operaciones en proceso (asignaciones hechas en otros workers)
+RELOAD_SECONDS = 60
+
+EVENT = 'cola_operador'
+
+_PENDING_KEY = 'operator_queue_changes'
+
+# Uno por proceso (start_queue)
+_dispatcher = None
+_engine = None
+_alerted = {}           # op_id → último tramo de ALERT_MINUTES alertado
+
+
+# ── Lógica pura ─────────────────────────────────────────────────────────────
+
+def belongs(operation) -> bool:
+    """¿La operación está en la cola de su operador asignado?"""
+    return operation.status == 'En proceso' and bool(operation.assigned_operator_id)
+
+
+def minutes_in_process(since, now) -> int:
+    if not since:
+        return 0
+    return max(0, int((now - since).total_seconds() // 60))
+
+
+def alert_slot(since, now) -> int:
+    """Tramo de ALERT_MINUTES alcanzado: 0 antes de los 10 min, 1 a los 10, 2 a los 20..."""
+    return minutes_in_process(since, now) // ALERT_MINUTES
+
+
+def next_alert(since, now):
+    """Momento de la próxima alerta: el siguiente múltiplo de ALERT_MINUTES desde since."""
+    return since + timedelta(minutes=ALERT_MINUTES * (alert_slot(since, now) + 1))
+
+
+def entry(operation, now) -> dict:
+    """Fila compacta de la cola (no el to_dict completo)."""
+    client = operation.client
+    minutes = minutes_in_process(operation.in_process_since, now)
+    return {
+        'id':                      operation.id,
+        'operation_id':            operation.operation_id,
+        'status':                  operation.status,
+        'client_name':             (client.full_name if client else None) or 'N/A',
+        'operation_type':          operation.operation_type,
+        'amount_usd':              float(operation.amount_usd or 0),
+        'amount_pen':              float(operation.amount_pen or 0),
+        'assigned_operator_id':    operation.assigned_operator_id,
+        'in_process_since':        operation.in_process_since.isoformat() if operation.in_process_since else None,
+        'time_in_process_minutes': minutes,
+        'overdue':                 minutes >= ALERT_MINUTES,
+    }
+
+
+def diff_for(op_id, row, operators) -> dict:
+    """
+    {operator_id: mensaje} para los operadores afectados por un cambio.
+    row: entry() de la operación si sigue en alguna cola, o None.
+    """
+    out = {}
+    for operator_id in operators:
+        if row is not None and row['assigned_operator_id'] == operator_id:
+            out[operator_id] = {'type': 'diff', 'upsert': [row], 'remove': []}
+        else:
+            out[operator_id] = {'type': 'diff', 'upsert': [], 'remove': [op_id]}
+    return out
+
+
+def due_alerts(rows, alerted: dict):
+    """
+    rows: entry() de las operaciones vencidas. Devuelve ({operator_id: [rows]}
+    a alertar, alerted actualizado): cada operación se alerta una vez por tramo.
+    """
+    by_operator, current = {}, {}
+    for row in rows:
+        slot = row['time_in_process_minutes'] // ALERT_MINUTES
+        if slot < 1 or not row['in_process_since']:
+            continue
+        current[row['id']] = slot
+        if alerted.get(row['id']) != slot:
+            by_operator.setdefault(row['assigned_operator_id'], []).append(row)
+    return by_operator, current
+
+
+# ── Seguimiento de cambios (listener de Operation) ──────────────────────────
+
+def track(operation):
+    """after_update de Operation: anotar los operadores cuya cola puede cambiar."""
+    if _dispatcher is None:
+        return
+    from sqlalchemy import inspect
+    from sqlalchemy.orm import object_session
+
+    hist = inspect(operation).attrs.assigned_operator_id.history
+    operators = {o for o in (*hist.deleted, operation.assigned_operator_id) if o}
+    session = object_session(operation)
+    if not operators or session is None:
+        return
+    session.info.setdefault(_PENDING_KEY, {}).setdefault(operation.id, set()).update(operators)
+
+    if _engine is not None and belongs(operation) and operation.in_process_since:
+        from app.utils.formatters import now_peru
+        _engine.schedule(operation.id, next_alert(operation.in_process_since, now_peru()))
+
+
+def _after_commit(session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    if changes and _dispatcher is not None:
+        for op_id, operators in changes.items():
+            _dispatcher.submit((op_id, frozenset(operators)))
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+# ── Consultas y emisión ─────────────────────────────────────────────────────
+
+def _emit(operator_id, message):
+    from app.extensions import socketio
+    try:
+        socketio.emit(EVENT, message, namespace='/', room=f'user_{operator_id}')
+    except Exception as e:
+        logger.error(f'[QUEUE] emit a user_{operator_id} falló: {e}')
+
+
+def _in_process():
+    from sqlalchemy.orm import joinedload
+    from app.models.operation import Operation
+
+    return Operation.query.options(joinedload(Operation.client)).filter(
+        Operation.status == 'En proceso',
+        Operation.assigned_operator_id.isnot(None),
+    )
+
+
+def snapshot(operator_id) -> list:
+    """Cola completa de un operador (al conectar o reconectar el socket)."""
+    from app.models.operation import Operation
+    from app.utils.formatters import now_peru
+
+    now = now_peru()
+    ops = _in_process().filter(Operation.assigned_operator_id == operator_id) \
+                       .order_by(Operation.in_process_since.asc()).all()
+    return [entry(op, now) for op in ops]
+
+
+def _push(item):
+    """Worker del Dispatcher: emitir el diff de una operación a sus operadores."""
+    from app.extensions import db
+    from app.models.operation import Operation
+    from app.utils.formatters import now_peru
+
+    op_id, operators = item
+    try:
+        operation = db.session.get(Operation, op_id)
+        row = entry(operation, now_peru()) if operation is not None and belongs(operation) else None
+        for operator_id, message in diff_for(op_id, row, operators).items():
+            _emit(operator_id, message)
+    finally:
+        db.session.remove()
+
+
+def _start_of_day(now):
+    """Las alertas solo cubren operaciones del día (las de días anteriores siguen en la cola)"""
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _alert(now) -> list:
+    """Alertar las operaciones que cruzaron un múltiplo de ALERT_MINUTES. Devuelve sus ids."""
+    global _alerted
+    from app.extensions import db
+    from app.models.operation import Operation
+
+    try:
+        ops = _in_process().filter(
+            Operation.in_process_since <= now - timedelta(minutes=ALERT_MINUTES),
+            Operation.created_at >= _start_of_day(now)).all()
+        rows = [entry(op, now) for op in ops]
+    finally:
+        db.session.remove()
+    by_operator, _alerted = due_alerts(rows, _alerted)
+    for operator_id, alert_rows in by_operator.items():
+        _emit(operator_id, {'type': 'alerta', 'operations': alert_rows})
+        logger.info(f'[QUEUE] ⏰ {len(alert_rows)} operación(es) vencida(s) para operador {operator_id}')
+    for op in ops:
+        _engine.schedule(op.id, next_alert(op.in_process_since, now))
+    return [row['id'] for alert_rows in by_operator.values() for row in alert_rows]
+
+
+def _load_alerts():
+    """(op_id, próxima alerta) de todas las operaciones en proceso."""
+    from app.extensions import db
+    from app.models.operation import Operation
+    from app.utils.formatters import now_peru
+
+    now = now_peru()
+    try:
+        rows = db.session.query(Operation.id, Operation.in_process_since).filter(
+            Operation.status == 'En proceso',
+            Operation.assigned_operator_id.isnot(None),
+            Operation.in_process_since.isnot(None),
+            Operation.created_at >= _start_of_day(now),
+        ).all()
+    finally:
+        db.session.remove()
+    return [(op_id, next_alert(since, now)) for op_id, since in rows]
+
+
+def start_queue(app):
+    """Registrar los listeners de sesión, el dispatcher de diffs y el motor de alertas."""
+    global _dispatcher, _engine
+    if _dispatcher is not None:
+        return
+
+    import eventlet
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    from app.services.expiry_engine import ExpiryEngine, Dispatcher
+    from app.services.scheduler_coordinator import run_singleton
+    from app.utils.formatters import now_peru
+
+    def _push_in_context(item):
+        with app.app_context():
+            _push(item)
+
+    def _alert_in_context(now):
+        with app.app_context():
+            return _alert(now)
+
+    def _load_in_context():
+        with app.app_context():
+            return _load_alerts()
+
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _dispatcher = Dispatcher(_push_in_context, name='QUEUE')
+    eventlet.spawn(_dispatcher.run_forever)
+    _engine = ExpiryEngine(_alert_in_context, _load_in_context, clock=now_peru,
+                           idle_seconds=RELOAD_SECONDS)
+    run_singleton(app, 'operator_queue_alerts', _engine.run_forever)
+    logger.info('[QUEUE] 🚀 Cola de operadores por Socket.IO registrada')
@@ -0,0 +1,226 @@
+"""
+Outbox transaccional — QoriCash
+================================
+Los efectos secundarios de un cambio de estado (asiento, saldos, factura,
+email, WhatsApp, push, compliance) ya no corren dentro del request: se
+encolan como filas de outbox_events en la misma transacción del cambio y un
+dispatcher en segundo plano los ejecuta.
+
+    enqueue('invoice', key='invoice:42:Completada@20261019101500000000', group='operation:42', operation_id=42)
+    db.session.commit()          # estado + efectos, atómico
+    wake()                       # despertar al dispatcher de este proceso
+
+  - Idempotencia: idempotency_key es único (INSERT ... ON CONFLICT DO NOTHING);
+    reencolar el mismo efecto no lo duplica. Los handlers además verifican si
+    el efecto ya existe (asiento, movimientos, factura) antes de repetirlo.
+  - Orden: un evento solo se toma cuando los anteriores de su group_key ya
+    terminaron (hecho o fallido), así el email sale después de la factura.
+  - Reintentos: un handler que lanza excepción se reprograma con backoff
+    (retry_delay) hasta MAX_ATTEMPTS; luego queda 'fallido'. Un evento en
+    'procesando' por más de STALE_SECONDS (worker muerto) se vuelve a tomar.
+  - Entrega al-menos-una-vez: si el proceso muere después del efecto y antes
+    de marcarlo 'hecho', el efecto se repite.
+
+El dispatcher corre como job 'outbox' del coordinador de schedulers (un solo
+worker); los demás lo encuentran por sondeo cada POLL_SECONDS.
+Handlers de operaciones: app/services/operation_effects.py.
+"""
+import json
+import logging
+import queue
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS  = 2
+BATCH_SIZE    = 20
+WORKERS       = 4
+MAX_ATTEMPTS  = 6
+STALE_SECONDS = 600
+
+HANDLERS = {}           # topic → fn(operation_id, payload)
+
+_wake = queue.Queue()
+
+
+def handler(topic: str):
+    """Decorador: registrar el handler de un topic."""
+    def _register(fn):
+        HANDLERS[topic] = fn
+        return fn
+    return _register
+
+
+def retry_delay(attempts: int) -> int:
+    """Segundos hasta el próximo intento: 30 s, 90 s, 4.5 min, 13.5 min, 40 min, 1 h."""
+    return min(30 * 3 ** max(attempts - 1, 0), 3600)
+
+
+def enqueue(topic: str, key: str, group: str, operation_id: int = None, payload: dict = None):
+    """
+    Agregar un efecto a la transacción en curso de db.session (no hace commit).
+    Si idempotency_key ya existe no hace nada.
+    """
+    from sqlalchemy.dialects.postgresql import insert
+    from app.extensions import db
+    from app.models.outbox_event import OutboxEvent, STATUS_PENDIENTE
+    from app.utils.formatters import now_peru
+
+    now = now_peru()
+    db.session.execute(
+        insert(OutboxEvent.__table__).values(
+            topic=topic, idempotency_key=key, group_key=group, operation_id=operation_id,
+            payload_json=json.dumps(payload or {}, default=str),
+            status=STATUS_PENDIENTE, attempts=0, available_at=now, created_at=now,
+        ).on_conflict_do_nothing(index_elements=['idempotency_key'])
+    )
+
+
+def wake():
+    """Despertar al dispatcher si corre en este proceso (si no, lo verá en el próximo sondeo)."""
+    if _wake.empty():
+        _wake.put(None)
+
+
+# ── Despacho ─────────────────────────────────────────────────────────────────
+
+def claim(limit: int = BATCH_SIZE) -> list:
+    """Tomar eventos disponibles en su propia transacción (requiere app context)."""
+    from app.extensions import db
+    from app.utils.formatters import now_peru
+
+    with db.engine.begin() as conn:
+        return claim_rows(conn, now_peru(), limit)
+
+
+def claim_rows(conn, now, limit: int = BATCH_SIZE) -> list:
+    """
+    Tomar hasta `limit` eventos disponibles (uno por grupo, el más antiguo) y
+    marcarlos 'procesando'. FOR UPDATE SKIP LOCKED: seguro con varios despachadores.
+    """
+    from datetime import timedelta
+    from sqlalchemy import text
+
+    rows = conn.execute(text("""
+            UPDATE outbox_events
+               SET status = 'procesando', locked_at = :now, attempts = attempts + 1
+             WHERE id IN (
+                SELECT e.id FROM outbox_events e
+                 WHERE ((e.status = 'pendiente' AND e.available_at <= :now)
+                        OR (e.status = 'procesando' AND e.locked_at < :stale))
+                   AND NOT EXISTS (
+                        SELECT 1 FROM outbox_events p
+                         WHERE p.group_key = e.group_key AND p.id < e.id
+                           AND p.status IN ('pendiente', 'procesando'))
+                 ORDER BY e.id
+                 LIMIT :limit
+                 FOR UPDATE SKIP LOCKED)
+            RETURNING id, topic, group_key, operation_id, payload_json, attempts
+    """), {'now': now, 'stale': now - timedelta(seconds=STALE_SECONDS), 'limit': limit}).mappings().all()
+    out = []
+    for r in sorted(rows, key=lambda r: r['id']):
+        try:
+            payload = json.loads(r['payload_json'] or '{}')
+        except (TypeError, ValueError):
+            payload = {}
+        out.append({**r, 'payload': payload})
+    return out
+
+
+def _finish(event: dict, error: str = None, final: bool = False):
+    from datetime import timedelta
+    from sqlalchemy import text
+    from app.extensions import db
+    from app.utils.formatters import now_peru
+
+    now = now_peru()
+    if error is None:
+        sql, params = ("UPDATE outbox_events SET status = 'hecho', processed_at = :now, last_error = NULL "
+                       "WHERE id = :id"), {'now': now, 'id': event['id']}
+    elif final or event['attempts'] >= MAX_ATTEMPTS:
+        sql, params = ("UPDATE outbox_events SET status = 'fallido', processed_at = :now, last_error = :err "
+                       "WHERE id = :id"), {'now': now, 'err': error, 'id': event['id']}
+        logger.error(f"[OUTBOX] ❌ {event['topic']} #{event['id']} falló definitivamente: {error}")
+    else:
+        retry = now + timedelta(seconds=retry_delay(event['attempts']))
+        sql, params = ("UPDATE outbox_events SET status = 'pendiente', available_at = :retry, last_error = :err "
+                       "WHERE id = :id"), {'retry': retry, 'err': error, 'id': event['id']}
+        logger.warning(f"[OUTBOX] {event['topic']} #{event['id']} intento {event['attempts']} falló, "
+                       f"reintento {retry:%H:%M:%S}: {error}")
+    with db.engine.begin() as conn:
+        conn.execute(text(sql), params)
+
+
+def process(event: dict) -> bool:
+    """Ejecutar un evento ya tomado (requiere app context). True si terminó bien."""
+    from app.extensions import db
+
+    fn = HANDLERS.get(event['topic'])
+    if fn is None:
+        _finish(event, f"Sin handler para el topic {event['topic']!r}", final=True)
+        return False
+    try:
+        fn(event['operation_id'], event['payload'])
+        db.session.commit()
+        error = None
+    except Exception as e:
+        db.session.rollback()
+        error = f'{type(e).__name__}: {e}'[:2000]
+    finally:
+        db.session.remove()
+    _finish(event, error)
+    return error is None
+
+
+def _load_handlers():
+    import app.services.operation_effects  # noqa: F401  (registra los handlers)
+
+
+def drain(max_events: int = None) -> dict:
+    """Procesar en este proceso lo disponible ahora (CLI). Requiere app context."""
+    _load_handlers()
+    done = failed = 0
+    while max_events is None or done + failed < max_events:
+        batch = claim(BATCH_SIZE if max_events is None else min(BATCH_SIZE, max_events - done - failed))
+        if not batch:
+            break
+        for event in batch:
+            if process(event):
+                done += 1
+            else:
+                failed += 1
+    return {'hechos': done, 'con_error': failed}
+
+
+def start_dispatcher(app):
+    """Registrar el dispatcher como job único entre workers."""
+    from app.services.scheduler_coordinator import run_singleton
+
+    def _process_in_context(event):
+        with app.app_context():
+            try:
+                process(event)
+            except Exception as e:
+                logger.error(f"[OUTBOX] Error marcando {event['topic']} #{event['id']}: {e}")
+
+    def loop():
+        import eventlet
+
+        _load_handlers()
+        pool = eventlet.GreenPool(WORKERS)
+        logger.info("[OUTBOX] ✅ Dispatcher iniciado")
+        while True:
+            try:
+                with app.app_context():
+                    batch = claim()
+            except Exception as e:
+                logger.error(f"[OUTBOX] ❌ Error tomando eventos: {e}")
+                batch = []
+            if batch:
+                list(pool.imap(_process_in_context, batch))
+                continue
+            try:
+                _wake.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                pass
+
+    run_singleton(app, 'outbox', loop)
@@ -0,0 +1,199 @@
+"""
+Coordinador de schedulers entre workers — QoriCash
+===================================================
+Los loops en segundo plano (precios, noticias, FX monitor, expiración de
+operaciones, lead hunter, agentes) se lanzaban en cada proceso: con
+WEB_CONCURRENCY > 1 se multiplicaban el scraping, las expiraciones y los
+correos. Ahora cada loop es un job con lease en la tabla scheduler_leases:
+
+    run_singleton(app, 'market_prices', loop)
+
+  - Un greenlet por proceso renueva cada RENEW_SECONDS los leases de todos
+    sus jobs con un INSERT ... ON CONFLICT DO UPDATE que solo gana si el
+    lease es propio o ya venció (reloj de la base).
+  - El worker que tiene el lease corre el loop; si el greenlet del loop
+    muere, lo respawnea en la siguiente ronda (reemplaza a los watchdogs).
+  - Si el worker muere, su lease vence a los LEASE_SECONDS y otro worker lo
+    toma en la ronda siguiente (failover < LEASE_SECONDS + RENEW_SECONDS).
+  - Si no puede renovar (BD caída), detiene el loop antes de que su lease
+    venza en la base, así dos workers nunca lo corren a la vez.
+
+leases() alimenta GET /api/system/schedulers (dashboard).
+"""
+import atexit
+import logging
+import os
+import socket
+import time
+import uuid
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 45
+RENEW_SECONDS = 15
+
+START = 'start'
+STOP  = 'stop'
+
+_holder = None          # (pid, 'host:pid:token') — se recalcula tras un fork
+_slots = {}             # job → JobSlot
+_app = None
+_coordinator = None
+
+
+def holder() -> str:
+    """Identificador de este worker (host:pid:token)."""
+    global _holder
+    pid = os.getpid()
+    if _holder is None or _holder[0] != pid:
+        _holder = (pid, f'{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:6]}')
+    return _holder[1]
+
+
+# ── SQL ──────────────────────────────────────────────────────────────────────
+
+def try_acquire(conn, job: str, holder_id: str, lease_seconds: int = LEASE_SECONDS) -> bool:
+    """Tomar o renovar el lease de `job`. True si queda en manos de holder_id."""
+    row = conn.execute(text("""
+        INSERT INTO scheduler_leases (job, holder, acquired_at, renewed_at, expires_at)
+        VALUES (:job, :holder, LOCALTIMESTAMP, LOCALTIMESTAMP,
+                LOCALTIMESTAMP + make_interval(secs => :ttl))
+        ON CONFLICT (job) DO UPDATE SET
+            holder      = EXCLUDED.holder,
+            acquired_at = CASE WHEN scheduler_leases.holder = EXCLUDED.holder
+                               THEN scheduler_leases.acquired_at ELSE EXCLUDED.acquired_at END,
+            renewed_at  = EXCLUDED.renewed_at,
+            expires_at  = EXCLUDED.expires_at
+        WHERE scheduler_leases.holder = EXCLUDED.holder
+           OR scheduler_leases.expires_at < LOCALTIMESTAMP
+        RETURNING holder
+    """), {'job': job, 'holder': holder_id, 'ttl': lease_seconds}).first()
+    return row is not None
+
+
+def release(conn, job: str, holder_id: str):
+    """Soltar el lease (solo si es propio) para que otro worker lo tome de inmediato."""
+    conn.execute(text("DELETE FROM scheduler_leases WHERE job = :job AND holder = :holder"),
+                 {'job': job, 'holder': holder_id})
+
+
+def leases(conn) -> list:
+    """Estado de todos los jobs: quién los tiene y si el lease está vigente."""
+    rows = conn.execute(text("""
+        SELECT job, holder, acquired_at, renewed_at, expires_at,
+               expires_at >= LOCALTIMESTAMP AS alive
+        FROM scheduler_leases ORDER BY job
+    """)).mappings().all()
+    return [dict(r) for r in rows]
+
+
+# ── Estado por job ───────────────────────────────────────────────────────────
+
+class JobSlot:
+    """
+    Un job registrado en este proceso. decide() traduce el resultado de la
+    renovación en START / STOP / None.
+    """
+
+    def __init__(self, job: str, fn):
+        self.job = job
+        self.fn = fn
+        self.greenlet = None
+        self.held_until = 0.0     # monotonic: hasta cuándo el lease es seguro sin renovar
+
+    @property
+    def running(self) -> bool:
+        return self.greenlet is not None and not self.greenlet.dead
+
+    def decide(self, acquired, now: float):
+        """
+        acquired: True / False según la renovación, None si falló la consulta.
+        now: time.monotonic().
+        """
+        if acquired is None:
+            # Sin respuesta de la base: seguir hasta antes de que el lease venza allá
+            return STOP if self.running and now >= self.held_until else None
+        if acquired:
+            self.held_until = now + LEASE_SECONDS - RENEW_SECONDS
+            return None if self.running else START
+        return STOP if self.running else None
+
+
+# ── Runtime (greenlets) ──────────────────────────────────────────────────────
+
+def run_singleton(app, job: str, fn):
+    """
+    Registrar `fn` (loop que no retorna) como job único entre workers.
+    Arranca el coordinador de este proceso en la primera llamada.
+    """
+    global _app, _coordinator
+    import eventlet
+
+    if job in _slots:
+        return
+    _slots[job] = JobSlot(job, fn)
+    if _coordinator is None:
+        _app = app
+        _coordinator = eventlet.spawn(_coordinator_loop)
+        atexit.register(_release_all)
+
+
+def held_jobs() -> list:
+    """Jobs que este proceso está corriendo ahora."""
+    return sorted(job for job, slot in _slots.items() if slot.running)
+
+
+def _renew_all() -> dict:
+    from app.extensions import db
+    me = holder()
+    with _app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                return {job: try_acquire(conn, job, me) for job in list(_slots)}
+        finally:
+            db.session.remove()
+
+
+def _coordinator_loop():
+    import eventlet
+
+    logger.info(f"[SCHEDULER] ✅ Coordinador de jobs iniciado ({holder()})")
+    while True:
+        try:
+            result = _renew_all()
+        except Exception as e:
+            logger.error(f"[SCHEDULER] ❌ No se pudieron renovar los leases: {e}")
+            result = {}
+        now = time.monotonic()
+        for job, slot in list(_slots.items()):
+            was_started = slot.greenlet is not None
+            action = slot.decide(result.get(job), now)
+            if action == START:
+                if was_started:
+                    logger.critical(f"[SCHEDULER] 🚨 {job} murió — respawneando")
+                else:
+                    logger.info(f"[SCHEDULER] ▶️ {job} asignado a este worker ({holder()})")
+                slot.greenlet = eventlet.spawn(slot.fn)
+            elif action == STOP:
+                logger.warning(f"[SCHEDULER] ⏹️ {job} sin lease — deteniendo en este worker")
+                slot.greenlet.kill()
+                slot.greenlet = None
+        eventlet.sleep(RENEW_SECONDS)
+
+
+def _release_all():
+    """Al salir el worker, soltar sus leases para que el failover sea inmediato."""
+    held = held_jobs()
+    if not held or _app is None:
+        return
+    try:
+        from app.extensions import db
+        with _app.app_context():
+            with db.engine.begin() as conn:
+                for job in held:
+                    release(conn, job, holder())
+        logger.info(f"[SCHEDULER] Leases liberados: {', '.join(held)}")
+    except Exception as e:
+        logger.warning(f"[SCHEDULER] No se pudieron liberar los leases: {e}")
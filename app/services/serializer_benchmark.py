@@ -0,0 +1,64 @@
+"""
+Benchmark del serializador de operaciones
+==========================================
+Compara, sobre las últimas N operaciones, el formato actual de las listas
+(to_dict(include_relations=True)) contra el formato compacto v1
+(app/utils/compact.py):
+
+  to_dict    formato actual: alias duplicados + todos los JSON decodificados
+  todos      compacto con fields=* (mismos datos, sin alias)
+  registros  compacto con los campos pedidos (default: COMPACT_DEFAULT)
+  columnar   compacto en arreglos, mismos campos
+
+Mide serialización + json.dumps (el mejor de `repeat` corridas, con la caché
+de JSON de cada operación vaciada antes de cada corrida) y el tamaño del
+cuerpo. Solo lectura.
+
+Uso CLI:
+  flask bench-operation-serializer --limit 1000 --fields id,operation_id,status
+"""
+import json
+import time
+
+from sqlalchemy.orm import selectinload
+
+from app.models.operation import Operation
+from app.utils.compact import pack, parse_fields
+
+
+def _measure(operations, build, repeat: int) -> dict:
+    best = None
+    for _ in range(repeat):
+        for op in operations:
+            op.__dict__.pop('_json_cache', None)
+        t0 = time.perf_counter()
+        body = json.dumps(build(), default=str)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return {'ms': round(best * 1000, 1), 'kb': round(len(body.encode('utf-8')) / 1024, 1)}
+
+
+def run_serializer_benchmark(limit: int = 1000, fields: str = None, repeat: int = 3) -> dict:
+    operations = Operation.query.options(
+        selectinload(Operation.client), selectinload(Operation.user),
+        selectinload(Operation.invoices),
+    ).order_by(Operation.created_at.desc(), Operation.id.desc()).limit(limit).all()
+
+    getters = Operation.COMPACT_FIELDS
+    chosen  = parse_fields(fields, getters, Operation.COMPACT_DEFAULT)
+    every   = list(getters)
+
+    r = {
+        'operaciones': len(operations),
+        'campos': chosen,
+        'to_dict': _measure(operations, lambda: [op.to_dict(include_relations=True) for op in operations], repeat),
+        'todos': _measure(operations, lambda: pack(operations, every, getters), repeat),
+        'registros': _measure(operations, lambda: pack(operations, chosen, getters), repeat),
+        'columnar': _measure(operations, lambda: pack(operations, chosen, getters, columnar=True), repeat),
+    }
+    base = r['to_dict']
+    for modo in ('todos', 'registros', 'columnar'):
+        m = r[modo]
+        m['tamaño_pct'] = round(100 * m['kb'] / base['kb'], 1) if base['kb'] else None
+        m['speedup'] = round(base['ms'] / m['ms'], 1) if m['ms'] else None
+    return r
@@ -44,6 +44,18 @@ def handle_disconnect():
         logger.info(f'Usuario {current_user.username} desconectado')
 
 
+@socketio.on('cola_operador_sync')
+def handle_operator_queue_sync():
+    """Enviar la cola completa del operador (al conectar o reconectar); luego llegan diffs"""
+    if not current_user.is_authenticated or current_user.role != 'Operador':
+        return
+    from app.services.operator_queue import EVENT, snapshot
+    try:
+        emit(EVENT, {'type': 'snapshot', 'operations': snapshot(current_user.id)})
+    except Exception as e:
+        logger.error(f'Error al enviar cola del operador {current_user.id}: {str(e)}')
+
+
 @socketio.on('join_client_room')
 def handle_join_client_room(data):
     """
@@ -1,7 +1,7 @@
 /**
  * QoriCash Trading V2 - Common JavaScript Functions
  * Funciones comunes reutilizables en todo el sistema
- * VERSION: 20260527_v13
+ * VERSION: 20261019_v14
  */
 
 console.log('🔔 QoriCash Common.js cargado - Versión: 20251219_v7_simple (Alertas cada 10min)');
@@ -153,6 +153,9 @@ function connectSocketIO() {
         console.log('✅ Conexión establecida:', data);
     });
 
+    // Cola de trabajo del Operador (snapshot, diffs y alertas de vencidas)
+    socket.on('cola_operador', applyOperatorQueue);
+
     // ============================================
     // EVENTOS DE OPERACIONES
     // ============================================
@@ -446,6 +449,21 @@ function connectSocketIO() {
         qoriToast({ title: data.title || 'Notificación', message: data.message || '', type: data.type || 'info' });
     });
 
+    // Export en segundo plano terminado (ExportJobService)
+    socket.on('export_ready', function(data) {
+        if (data.status === 'listo') {
+            qoriToast({ title: '📥 Exportación lista', message: data.filename || '', type: 'success', url: data.download_url, duration: 10000 });
+            // Descarga automática solo en la pestaña que pidió el export
+            if (window._qoriExportJobs[data.job_id]) {
+                delete window._qoriExportJobs[data.job_id];
+                window.location.href = data.download_url;
+            }
+        } else {
+            delete window._qoriExportJobs[data.job_id];
+            qoriToast({ title: '⚠️ Exportación fallida', message: data.error || '', type: 'danger', duration: 8000 });
+        }
+    });
+
     // ============================================
     // EVENTOS DE ASIGNACIÓN DE OPERACIONES
     // ============================================
@@ -561,6 +579,36 @@ function showNotification(message, type = 'info', duration = 5000) {
     }
 }
 
+/**
+ * qoriExport — Export pesado en segundo plano (POST /exports/api/jobs).
+ * Si ya existe un artefacto vigente con los mismos parámetros lo descarga de
+ * inmediato; si no, espera el evento socket 'export_ready' (room user_{id}).
+ */
+window._qoriExportJobs = window._qoriExportJobs || {};
+function qoriExport(kind, params) {
+    const csrfToken = $('meta[name="csrf-token"]').attr('content');
+    return fetch('/exports/api/jobs', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken },
+        body: JSON.stringify({ kind: kind, params: params || {} }),
+    })
+    .then(function(r) { return r.json().then(function(data) { return { ok: r.ok, data: data }; }); })
+    .then(function(res) {
+        if (!res.ok || !res.data.success) {
+            showNotification(res.data.message || 'No se pudo iniciar la exportación', 'danger');
+            return;
+        }
+        const job = res.data.job;
+        if (job.status === 'listo' && job.download_url) {
+            window.location.href = job.download_url;
+            return;
+        }
+        window._qoriExportJobs[job.id] = true;
+        qoriToast({ title: '⏳ Exportación en curso', message: 'Te avisaremos cuando el archivo esté listo', type: 'info' });
+    })
+    .catch(function() { showNotification('No se pudo iniciar la exportación', 'danger'); });
+}
+
 /**
  * Mostrar alerta (toast notification) - Fallback
  */
@@ -1108,89 +1156,46 @@ $(document).ready(function() {
 // SISTEMA DE NOTIFICACIONES PARA OPERADOR
 // ============================================
 
-let pendingOperationsCheckInterval = null;
-let alertedOperationsMap = new Map(); // Rastrear operaciones alertadas con su último tiempo
+let operatorQueue = new Map(); // Cola del operador (id → fila), mantenida por el servidor
 let isModalCurrentlyShowing = false; // Prevenir múltiples modales simultáneos
 
 /**
- * Iniciar monitoreo de operaciones pendientes (solo para Operador)
+ * Iniciar la cola de trabajo del Operador.
+ * Sin polling: al conectar (y reconectar) el socket se pide el snapshot y
+ * luego el servidor empuja diffs y alertas por el evento 'cola_operador'.
  */
 function initPendingOperationsMonitor() {
-    console.log('🔔 Iniciando monitoreo de operaciones pendientes para Operador');
-
-    // Verificar inmediatamente al cargar
-    checkPendingOperations();
-
-    // Verificar cada 1 minuto (60000 ms)
-    pendingOperationsCheckInterval = setInterval(function() {
-        checkPendingOperations();
-    }, 60000);
-}
-
-/**
- * Verificar operaciones pendientes de atención
- */
-function checkPendingOperations() {
-    // Si ya hay un modal mostrándose, no verificar
-    if (isModalCurrentlyShowing) {
-        console.log('Modal ya está visible, omitiendo verificación');
-        return;
+    console.log('🔔 Iniciando cola de trabajo del Operador (Socket.IO)');
+    document.addEventListener('socketConnected', requestOperatorQueue);
+    if (socket && socket.connected) {
+        requestOperatorQueue();
     }
+}
 
-    ajaxRequest('/operations/api/check_pending_operations', 'GET', null, function(response) {
-        if (response.success && response.count > 0) {
-            const operationsToAlert = [];
-
-            // Filtrar operaciones que realmente necesitan alerta ahora
-            response.pending_operations.forEach(function(operation) {
-                const timeInProcess = operation.time_in_process_minutes;
-                const opId = operation.operation_id;
-
-                // Lógica de alerta:
-                // - Primera alerta a los 10 minutos exactos
-                // - Alertas subsiguientes cada 10 minutos (20, 30, 40, etc.)
-                const shouldAlert = (timeInProcess % 10 === 0);
-
-                if (shouldAlert) {
-                    // Verificar si ya fue alertada en este tiempo específico
-                    const lastAlertedTime = alertedOperationsMap.get(opId);
-
-                    // Solo alertar si:
-                    // 1. Nunca ha sido alertada, O
-                    // 2. El tiempo actual es diferente al último tiempo alertado
-                    if (!lastAlertedTime || lastAlertedTime !== timeInProcess) {
-                        operationsToAlert.push(operation);
-                        // Registrar que esta operación será alertada en este minuto
-                        alertedOperationsMap.set(opId, timeInProcess);
-                    }
-                }
-            });
-
-            // Si hay operaciones para alertar, mostrar modal
-            if (operationsToAlert.length > 0) {
-                showPendingOperationsAlert(operationsToAlert);
-            }
-
-            // Limpiar operaciones completadas del mapa de rastreo
-            cleanupAlertedOperationsMap(response.pending_operations);
-        }
-    }, function(error) {
-        console.error('Error al verificar operaciones pendientes:', error);
-    });
+function requestOperatorQueue() {
+    if (socket) socket.emit('cola_operador_sync');
 }
 
 /**
- * Limpiar el mapa de operaciones alertadas para remover operaciones que ya no están en proceso
+ * Aplicar un mensaje 'cola_operador': snapshot | diff | alerta
  */
-function cleanupAlertedOperationsMap(currentOperations) {
-    const currentOpIds = new Set(currentOperations.map(op => op.operation_id));
-
-    // Eliminar operaciones que ya no están en la lista
-    for (let [opId, time] of alertedOperationsMap.entries()) {
-        if (!currentOpIds.has(opId)) {
-            alertedOperationsMap.delete(opId);
+function applyOperatorQueue(data) {
+    if (!data) return;
+
+    if (data.type === 'snapshot') {
+        operatorQueue = new Map((data.operations || []).map(op => [op.id, op]));
+    } else if (data.type === 'diff') {
+        (data.remove || []).forEach(id => operatorQueue.delete(id));
+        (data.upsert || []).forEach(op => operatorQueue.set(op.id, op));
+    } else if (data.type === 'alerta') {
+        (data.operations || []).forEach(op => operatorQueue.set(op.id, op));
+        // El servidor alerta una sola vez cada 10 minutos por operación
+        if (!isModalCurrentlyShowing && data.operations && data.operations.length > 0) {
+            showPendingOperationsAlert(data.operations);
         }
     }
+
+    document.dispatchEvent(new CustomEvent('operatorQueueChanged', { detail: operatorQueue }));
 }
 
 /**
@@ -0,0 +1,67 @@
+"""
+Formato compacto para listas de operaciones (v1).
+
+to_dict() repite casi cada campo con un alias para el frontend
+(amount_usd/monto_dolares, status/estado, ...) y agrega abonos, pagos y logs
+decodificados en cada fila. Las listas aceptan, opt-in:
+
+    ?fields=id,operation_id,status          → registros con solo esos campos
+    {"format": "compact", "v": 1, "fields": [...],
+     "records": [{"id": 12, "operation_id": "EXP-1012", "status": "completado"}]}
+
+    ?format=columnar[&fields=...]           → filas como arreglos
+    {"format": "columnar", "v": 1, "fields": [...],
+     "rows": [[12, "EXP-1012", "completado"], ...]}
+
+Cada campo tiene su getter, así solo se calcula lo pedido (los JSON de abonos
+y pagos no se decodifican si no se piden). Sin ?fields ni ?format el endpoint
+responde como siempre.
+"""
+
+COMPACT_VERSION = 1
+
+
+def parse_fields(raw, getters: dict, default) -> list:
+    """
+    'id,status,foo,id' → ['id', 'status']: ignora desconocidos y repetidos,
+    respeta el orden pedido. Vacío, '*' o sin campos válidos → default.
+    """
+    if raw and raw.strip() == '*':
+        return list(getters)
+    fields = []
+    for name in (raw or '').split(','):
+        name = name.strip()
+        if name in getters and name not in fields:
+            fields.append(name)
+    return fields or list(default)
+
+
+def pack(objs, fields: list, getters: dict, columnar: bool = False) -> dict:
+    """Serializa objs con los getters de fields, como registros o columnar."""
+    fns = [getters[f] for f in fields]
+    if columnar:
+        return {
+            'format': 'columnar',
+            'v': COMPACT_VERSION,
+            'fields': fields,
+            'rows': [[fn(o) for fn in fns] for o in objs],
+        }
+    return {
+        'format': 'compact',
+        'v': COMPACT_VERSION,
+        'fields': fields,
+        'records': [{f: fn(o) for f, fn in zip(fields, fns)} for o in objs],
+    }
+
+
+def compact_payload(objs, args, getters: dict, default) -> dict:
+    """
+    Respuesta compacta según los query params (args: request.args o dict).
+    Retorna None si el request no la pidió — el caller usa to_dict().
+    """
+    fmt = (args.get('format') or '').lower()
+    raw = args.get('fields')
+    if not raw and fmt not in ('compact', 'columnar'):
+        return None
+    return pack(objs, parse_fields(raw, getters, default), getters,
+                columnar=(fmt == 'columnar'))
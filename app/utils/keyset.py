@@ -0,0 +1,98 @@
+"""
+Paginación por keyset ("seek") y conteo estimado.
+
+OFFSET obliga a la base a leer y descartar todas las filas anteriores, así que
+cada página es más lenta que la previa. Con keyset la página siguiente se pide
+"después de la última fila vista" sobre un orden único e indexado:
+
+    q = q.filter(seek((JournalEntry.entry_date, JournalEntry.id), cursor))
+    q.order_by(JournalEntry.entry_date, JournalEntry.id).limit(n + 1)
+
+El cursor viaja como texto opaco ('2026-06-15~1234'); decode_cursor() lo
+convierte de vuelta a tupla con los tipos de `kinds`.
+
+estimate_count() reemplaza el COUNT(*) exacto por la estimación del
+planificador de PostgreSQL (EXPLAIN); solo cuenta exacto si el resultado es
+chico.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import text, tuple_
+
+_SEP = '~'
+
+_PARSERS = {
+    int:      int,
+    str:      str,
+    date:     date.fromisoformat,
+    datetime: datetime.fromisoformat,
+    Decimal:  Decimal,
+}
+
+
+def encode_cursor(values) -> str:
+    """(date(2026, 6, 15), 1234) → '2026-06-15~1234'."""
+    return _SEP.join(v.isoformat() if hasattr(v, 'isoformat') else str(v) for v in values)
+
+
+def decode_cursor(token: str, kinds) -> tuple:
+    """
+    '2026-06-15~1234' con kinds=(date, int) → (date(2026, 6, 15), 1234).
+    Retorna None si el token está vacío o no es válido (→ primera página).
+    """
+    if not token:
+        return None
+    parts = token.split(_SEP)
+    if len(parts) != len(kinds):
+        return None
+    try:
+        return tuple(_PARSERS[k](p) for k, p in zip(kinds, parts))
+    except (ValueError, ArithmeticError, KeyError):
+        return None
+
+
+def seek(columns, cursor, backwards: bool = False):
+    """(col1, col2) > (v1, v2) — o < con backwards — como comparación de filas."""
+    row = tuple_(*columns)
+    return row < tuple_(*cursor) if backwards else row > tuple_(*cursor)
+
+
+def page_window(rows: list, limit: int, backwards: bool = False):
+    """
+    Recorta el resultado de una consulta con limit + 1.
+    Retorna (filas en orden ascendente, hay_más_en_la_dirección_pedida).
+    """
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows = rows[::-1]
+    return rows, more
+
+
+def estimate_count(query, exact_below: int = 1000) -> tuple:
+    """
+    Retorna (n, exacto). Usa las filas estimadas por EXPLAIN (PostgreSQL);
+    si la estimación es menor que exact_below, o la base no es PostgreSQL,
+    hace el COUNT(*) exacto, que en ese tamaño es barato.
+    """
+    session = query.session
+    bind    = session.get_bind()
+    if bind.dialect.name == 'postgresql':
+        try:
+            sql = query.order_by(None).statement.compile(
+                dialect=bind.dialect, compile_kwargs={'literal_binds': True})
+            # SAVEPOINT: si EXPLAIN falla no aborta la transacción del request
+            with session.begin_nested():
+                plan = session.execute(
+                    text('EXPLAIN (FORMAT JSON) ' + str(sql).replace(':', r'\:'))
+                ).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimated = int(plan[0]['Plan']['Plan Rows'])
+            if estimated >= exact_below:
+                return estimated, False
+        except Exception:
+            pass
+    return query.order_by(None).count(), True
@@ -0,0 +1,55 @@
+"""
+Códigos de operación EXP-NNNN desde una secuencia de PostgreSQL.
+
+Leer el último EXP-% y sumarle uno es una carrera: dos creaciones simultáneas
+(web, plataforma, app móvil, bot de WhatsApp) leen el mismo último código y
+una de las dos choca con el UNIQUE de operation_id. nextval() es atómico, no
+toma locks de fila ni espera al commit de la otra transacción:
+
+    code = next_code(db.session.connection())      # 'EXP-1043'
+
+Una creación que hace rollback deja un hueco en la numeración (igual que
+cualquier secuencia); los códigos de operación no necesitan ser correlativos
+sin huecos, a diferencia de los números de asiento (JournalSequence).
+
+ensure_sequence() crea la secuencia si falta y la adelanta al mayor código
+EXP existente; nunca la retrocede, así que es seguro correrla en cada arranque.
+"""
+import re
+
+from sqlalchemy import text
+
+SEQUENCE = 'operation_code_seq'
+PREFIX   = 'EXP-'
+FIRST    = 1001
+
+_CODE_RE = re.compile(r'^EXP-(\d+)$')
+
+
+def format_code(number: int) -> str:
+    return f'{PREFIX}{number}'
+
+
+def parse_code(code) -> int:
+    """'EXP-1043' → 1043; None si no tiene el formato."""
+    m = _CODE_RE.match(code or '')
+    return int(m.group(1)) if m else None
+
+
+def ensure_sequence(conn, sequence: str = SEQUENCE, table: str = 'operations'):
+    """CREATE SEQUENCE IF NOT EXISTS + setval al mayor EXP-NNNN de `table`."""
+    conn.execute(text(
+        f"CREATE SEQUENCE IF NOT EXISTS {sequence} MINVALUE {FIRST - 1} START {FIRST - 1}"
+    ))
+    conn.execute(text(f"""
+        SELECT setval('{sequence}', GREATEST(
+            (SELECT COALESCE(MAX(CAST(substring(operation_id FROM '^EXP-([0-9]+)$') AS BIGINT)), {FIRST - 1})
+               FROM {table}),
+            (SELECT last_value FROM {sequence})
+        ), true)
+    """))
+
+
+def next_code(conn, sequence: str = SEQUENCE) -> str:
+    """Siguiente código: nextval() atómico, sin lecturas previas."""
+    return format_code(conn.execute(text(f"SELECT nextval('{sequence}')")).scalar())
@@ -0,0 +1,64 @@
+"""
+Rangos de período para filtros SQL "sargables".
+
+`extract('year', col) == y AND extract('month', col) == m` obliga a evaluar la
+función en cada fila y no puede usar índices sobre la columna. Estos helpers
+traducen el período a un rango semiabierto [inicio, fin) que sí los usa:
+
+    q.filter(in_month(JournalEntry.entry_date, year, month))
+    q.filter(in_year(JournalEntry.entry_date, year))
+    q.filter(in_date_range(Operation.completed_at, fecha_inicio, fecha_fin))
+
+Funcionan con columnas Date y DateTime: para DateTime los límites se pasan
+como datetime a medianoche, así un timestamp del último día queda incluido.
+"""
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import and_
+from sqlalchemy.types import DateTime
+
+
+def month_bounds(year: int, month: int):
+    """(primer día del mes, primer día del mes siguiente)."""
+    start = date(year, month, 1)
+    end   = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def year_bounds(year: int):
+    """(1 de enero, 1 de enero del año siguiente)."""
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def _bound(column, value: date):
+    if isinstance(getattr(column, 'type', None), DateTime) and not isinstance(value, datetime):
+        return datetime.combine(value, time.min)
+    return value
+
+
+def in_range(column, start: date, end: date):
+    """column >= start AND column < end (semiabierto)."""
+    return and_(column >= _bound(column, start), column < _bound(column, end))
+
+
+def in_month(column, year: int, month: int):
+    """Filtro del mes (year, month) sobre una columna Date/DateTime."""
+    return in_range(column, *month_bounds(year, month))
+
+
+def in_year(column, year: int):
+    """Filtro del año calendario sobre una columna Date/DateTime."""
+    return in_range(column, *year_bounds(year))
+
+
+def in_date_range(column, start: date = None, end: date = None):
+    """
+    Reemplazo de `func.date(col) >= start` / `func.date(col) <= end`:
+    ambos extremos inclusivos por día; cualquiera puede ser None.
+    """
+    conds = []
+    if start is not None:
+        conds.append(column >= _bound(column, start))
+    if end is not None:
+        conds.append(column < _bound(column, end + timedelta(days=1)))
+    return and_(*conds) if conds else and_(True)
@@ -12,6 +12,8 @@ Parámetros opcionales (variables de entorno):
   AUDIT_YEAR   — año a auditar (default: año actual Lima)
   AUDIT_MONTH  — mes a auditar (default: mes actual Lima)
   AUTO_DEPRECIATE — 'true'/'false' (default: 'true')
+  AUDIT_FULL      — 'true' re-audita el período completo (default: incremental,
+                    solo lo cambiado desde la corrida anterior)
 
 Salida:
   Imprime resumen en stdout (visible en logs de Render).
@@ -63,9 +65,11 @@ def main():
     year  = int(os.environ.get('AUDIT_YEAR',  now.year))
     month = int(os.environ.get('AUDIT_MONTH', now.month))
     auto_d = os.environ.get('AUTO_DEPRECIATE', 'true').lower() == 'true'
+    full   = os.environ.get('AUDIT_FULL', 'false').lower() == 'true'
 
     logger.info(f'Período auditado: {month:02d}/{year}')
     logger.info(f'Depreciación automática: {auto_d}')
+    logger.info(f'Modo: {"completo" if full else "incremental"}')
 
     with app.app_context():
         from app.services.audit.audit_engine import AuditEngine
@@ -77,6 +81,7 @@ def main():
             trigger='cron',
             executed_by_id=None,
             auto_depreciate=auto_d,
+            incremental=not full,
         )
 
         try:
@@ -103,7 +108,8 @@ def main():
         logger.info(f'Utilidad   : S/ {float(report.utilidad_neta_pen or 0):>12,.2f}')
         logger.info(f'IR 1% MYPE : S/ {float(report.ir_pago_cuenta_pen or 0):>12,.2f}')
         logger.info(f'─────────────────────────────────────────────────────')
-        logger.info(f'Tiempo ejecución    : {float(report.execution_seconds or 0):.2f}s')
+        logger.info(f'Tiempo ejecución    : {float(report.execution_seconds or 0):.2f}s '
+                    f'({report.timings.get("modo", "completa")})')
         logger.info(f'Reporte ID          : {report.id}')
         logger.info(f'{"="*60}\n')
 
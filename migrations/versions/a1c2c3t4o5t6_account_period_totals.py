@@ -0,0 +1,47 @@
+"""Add account_period_totals (totales por período y prefijo PCGE)
+
+Revision ID: a1c2c3t4o5t6
+Revises: d1e2p3r4e5c6
+Create Date: 2026-10-19
+
+Σ debe / Σ haber por (período, entry_type, prefijo PCGE de 1–4 dígitos o
+cuenta exacta), mantenidos por AccountTotalsService. accounting_periods
+gana totals_built_at (NULL → el período se reconstruye en la próxima lectura).
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'a1c2c3t4o5t6'
+down_revision = 'd1e2p3r4e5c6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS account_period_totals (
+            id         SERIAL PRIMARY KEY,
+            year       INTEGER NOT NULL,
+            month      INTEGER NOT NULL,
+            entry_type VARCHAR(30) NOT NULL DEFAULT '',
+            prefix     VARCHAR(20) NOT NULL,
+            is_account BOOLEAN NOT NULL DEFAULT FALSE,
+            debe       NUMERIC(18, 2) NOT NULL DEFAULT 0,
+            haber      NUMERIC(18, 2) NOT NULL DEFAULT 0,
+            CONSTRAINT uq_apt_period_type_prefix UNIQUE (year, month, entry_type, prefix, is_account)
+        )
+    """))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_apt_prefix_period "
+        "ON account_period_totals (prefix, is_account, year, month)"
+    ))
+    conn.execute(text(
+        "ALTER TABLE accounting_periods ADD COLUMN IF NOT EXISTS totals_built_at TIMESTAMP WITHOUT TIME ZONE"
+    ))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("ALTER TABLE accounting_periods DROP COLUMN IF EXISTS totals_built_at"))
+    conn.execute(text("DROP TABLE IF EXISTS account_period_totals"))
@@ -0,0 +1,40 @@
+"""Add account_period_balances (carry-forward de saldos por cuenta)
+
+Revision ID: a1p2b3a4l5s6
+Revises: b1b2c3k4p5t6
+Create Date: 2026-10-19
+
+Acumulado DEBE/HABER por cuenta PCGE al cierre de cada período contable.
+Lo escribe JournalService.close_period y se borra al reabrir; Libro Mayor,
+Balance de Comprobación y Caja y Bancos leen de aquí el saldo anterior.
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'a1p2b3a4l5s6'
+down_revision = 'b1b2c3k4p5t6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS account_period_balances (
+            id           SERIAL PRIMARY KEY,
+            year         INTEGER NOT NULL,
+            month        INTEGER NOT NULL,
+            account_code VARCHAR(10) NOT NULL,
+            debe         NUMERIC(18,2) NOT NULL DEFAULT 0,
+            haber        NUMERIC(18,2) NOT NULL DEFAULT 0,
+            debe_usd     NUMERIC(18,2) NOT NULL DEFAULT 0,
+            haber_usd    NUMERIC(18,2) NOT NULL DEFAULT 0,
+            computed_at  TIMESTAMP WITHOUT TIME ZONE,
+            CONSTRAINT uq_apb_period_account UNIQUE (year, month, account_code)
+        )
+    """))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP TABLE IF EXISTS account_period_balances"))
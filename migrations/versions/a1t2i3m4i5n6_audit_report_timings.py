@@ -0,0 +1,29 @@
+"""Add audit_reports.timings_json (tiempos por módulo del AuditEngine)
+
+Revision ID: a1t2i3m4i5n6
+Revises: e1x2p3o4r5t6
+Create Date: 2026-10-19
+
+El AuditEngine carga el período una vez (AuditPeriodData) y ejecuta los
+módulos en paralelo; timings_json guarda cuánto tardó cada loader y cada
+módulo de validación.
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'a1t2i3m4i5n6'
+down_revision = 'e1x2p3o4r5t6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text(
+        "ALTER TABLE audit_reports ADD COLUMN IF NOT EXISTS timings_json TEXT DEFAULT '{}'"
+    ))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text('ALTER TABLE audit_reports DROP COLUMN IF EXISTS timings_json'))
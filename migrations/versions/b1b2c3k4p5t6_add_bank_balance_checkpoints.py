@@ -0,0 +1,44 @@
+"""Add bank_balance_checkpoints (point-in-time ledger balances)
+
+Revision ID: b1b2c3k4p5t6
+Revises: c1a2c3u4m5l6
+Create Date: 2026-10-19
+
+Checkpoints periódicos del saldo de cada cuenta según BankMovement. Con ellos
+BalanceTimeline responde saldos a cualquier instante sumando solo los
+movimientos posteriores al último checkpoint.
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'b1b2c3k4p5t6'
+down_revision = 'c1a2c3u4m5l6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS bank_balance_checkpoints (
+            id               SERIAL PRIMARY KEY,
+            as_of            TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            bank_key         VARCHAR(20) NOT NULL,
+            currency         VARCHAR(3)  NOT NULL,
+            balance          NUMERIC(15,2) NOT NULL DEFAULT 0,
+            last_movement_id INTEGER NOT NULL DEFAULT 0,
+            movements_count  INTEGER NOT NULL DEFAULT 0,
+            created_at       TIMESTAMP WITHOUT TIME ZONE,
+            CONSTRAINT uq_bbc_account_as_of UNIQUE (bank_key, currency, as_of)
+        )
+    """))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_bbc_account_as_of "
+        "ON bank_balance_checkpoints (bank_key, currency, as_of)"
+    ))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP INDEX IF EXISTS ix_bbc_account_as_of"))
+    conn.execute(text("DROP TABLE IF EXISTS bank_balance_checkpoints"))
@@ -0,0 +1,30 @@
+"""Add accumulated_at to daily_closures (precomputed closure totals)
+
+Revision ID: c1a2c3u4m5l6
+Revises: d1c2a3j4a5d6
+Create Date: 2026-10-19
+
+ClosureAccumulator mantiene los totales del borrador de cierre al completar
+operaciones y registrar movimientos. accumulated_at marca el último recálculo
+completo; mientras sea NULL, "Calcular" reconstruye el borrador desde cero.
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'c1a2c3u4m5l6'
+down_revision = 'd1c2a3j4a5d6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text(
+        "ALTER TABLE daily_closures ADD COLUMN IF NOT EXISTS "
+        "accumulated_at TIMESTAMP WITHOUT TIME ZONE"
+    ))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("ALTER TABLE daily_closures DROP COLUMN IF EXISTS accumulated_at"))
@@ -0,0 +1,45 @@
+"""Add depreciation_schedule (cronograma de depreciación precalculado)
+
+Revision ID: d1e2p3r4e5c6
+Revises: i1n2c3a4u5d6
+Create Date: 2026-10-19
+
+Una fila por activo fijo y mes con cuota, acumulado y valor neto. La genera
+depreciation_schedule.rebuild_schedule(); run_depreciacion_mensual la
+contabiliza con un asiento consolidado por cuenta 39xx.
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'd1e2p3r4e5c6'
+down_revision = 'i1n2c3a4u5d6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS depreciation_schedule (
+            id               SERIAL PRIMARY KEY,
+            asset_id         INTEGER NOT NULL REFERENCES fixed_assets(id) ON DELETE CASCADE,
+            year             INTEGER NOT NULL,
+            month            INTEGER NOT NULL,
+            deprec_account   VARCHAR(10) NOT NULL,
+            amount           NUMERIC(18, 2) NOT NULL,
+            accumulated      NUMERIC(18, 2) NOT NULL,
+            net_book_value   NUMERIC(18, 2) NOT NULL,
+            journal_entry_id INTEGER REFERENCES journal_entries(id),
+            posted_at        TIMESTAMP WITHOUT TIME ZONE,
+            CONSTRAINT uq_depreciation_schedule_asset_month UNIQUE (asset_id, year, month)
+        )
+    """))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_depreciation_schedule_period "
+        "ON depreciation_schedule (year, month)"
+    ))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP TABLE IF EXISTS depreciation_schedule"))
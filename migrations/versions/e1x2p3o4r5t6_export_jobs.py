@@ -0,0 +1,47 @@
+"""Add export_jobs (exportaciones en segundo plano)
+
+Revision ID: e1x2p3o4r5t6
+Revises: p1r2a3n4g5e6
+Create Date: 2026-10-19
+
+Tabla de ExportJobService: exports .xlsx generados fuera del request, con
+artefacto en disco (TTL) y deduplicación por params_hash.
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'e1x2p3o4r5t6'
+down_revision = 'p1r2a3n4g5e6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            id               VARCHAR(32) PRIMARY KEY,
+            kind             VARCHAR(40) NOT NULL,
+            params_json      TEXT DEFAULT '{}',
+            params_hash      VARCHAR(64) NOT NULL,
+            status           VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+            requested_by     INTEGER REFERENCES users(id),
+            subscribers_json TEXT DEFAULT '[]',
+            filename         VARCHAR(200),
+            file_path        VARCHAR(500),
+            size_bytes       INTEGER,
+            error            TEXT,
+            created_at       TIMESTAMP WITHOUT TIME ZONE,
+            started_at       TIMESTAMP WITHOUT TIME ZONE,
+            finished_at      TIMESTAMP WITHOUT TIME ZONE,
+            expires_at       TIMESTAMP WITHOUT TIME ZONE
+        )
+    """))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_export_jobs_hash_status ON export_jobs (params_hash, status)"
+    ))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP TABLE IF EXISTS export_jobs"))
@@ -0,0 +1,34 @@
+"""Add audit_reports.incremental_json + índice de anulaciones
+
+Revision ID: i1n2c3a4u5d6
+Revises: a1t2i3m4i5n6
+Create Date: 2026-10-19
+
+Auditoría incremental (app/services/audit/incremental.py): el reporte del
+período guarda marcas de agua, acumulados y pendientes; cada corrida lee los
+asientos anulados desde la anterior (índice parcial sobre annulled_at).
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'i1n2c3a4u5d6'
+down_revision = 'a1t2i3m4i5n6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text(
+        "ALTER TABLE audit_reports ADD COLUMN IF NOT EXISTS incremental_json TEXT"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_je_annulled_at ON journal_entries (annulled_at) "
+        "WHERE status = 'anulado'"
+    ))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text('DROP INDEX IF EXISTS ix_je_annulled_at'))
+    conn.execute(text('ALTER TABLE audit_reports DROP COLUMN IF EXISTS incremental_json'))
@@ -0,0 +1,52 @@
+"""Composite and partial indexes for the operations access patterns
+
+Revision ID: i1x2a3d4v5s6
+Revises: o1u2t3b4o5x6
+Create Date: 2026-10-19
+
+Derivados de leer el código de las consultas sobre operations (listados,
+dashboard, expiración, asignación y contabilidad); NO se eligieron con
+`flask index-advisor` sobre consultas capturadas ni se midieron: al
+escribirlos no había una base PostgreSQL con datos reales. No hay tiempos
+EXPLAIN antes/después.
+
+  (status, created_at)             listados y dashboard por estado y fecha
+  (client_id, status)              operaciones de un cliente por estado
+  (assigned_operator_id, status)   carga 'En proceso' por operador
+  (status, completed_at)           contabilidad / tesorería por fecha de cierre
+  (origen, created_at) WHERE status IN ('Pendiente', 'En proceso')
+                                   expiración y bandejas de trabajo; el
+                                   parcial solo indexa las operaciones vivas
+
+Pendiente validarlos en staging con tráfico capturado (QUERY_CAPTURE_FILE):
+  flask index-advisor /tmp/consultas.json --explain
+y quitar los que el advisor no confirme.
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'i1x2a3d4v5s6'
+down_revision = 'o1u2t3b4o5x6'
+branch_labels = None
+depends_on    = None
+
+INDEXES = (
+    ('ix_operations_status_created_at', '(status, created_at)'),
+    ('ix_operations_client_id_status', '(client_id, status)'),
+    ('ix_operations_assigned_operator_id_status', '(assigned_operator_id, status)'),
+    ('ix_operations_status_completed_at', '(status, completed_at)'),
+    ('ix_operations_origen_created_at_activas',
+     "(origen, created_at) WHERE status IN ('Pendiente', 'En proceso')"),
+)
+
+
+def upgrade():
+    conn = op.get_bind()
+    for name, definition in INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON operations {definition}"))
+
+
+def downgrade():
+    conn = op.get_bind()
+    for name, _ in INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
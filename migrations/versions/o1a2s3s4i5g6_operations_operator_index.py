@@ -0,0 +1,28 @@
+"""Add (assigned_operator_id, id) index for balanced operator assignment
+
+Revision ID: o1a2s3s4i5g6
+Revises: s1c2h3l4e5a6
+Create Date: 2026-10-19
+
+operator_assignment.operator_loads() busca la última operación asignada a
+cada operador (MAX(id) por assigned_operator_id) para desempatar por turno.
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'o1a2s3s4i5g6'
+down_revision = 's1c2h3l4e5a6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_operations_operator_id ON operations (assigned_operator_id, id)"
+    ))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP INDEX IF EXISTS ix_operations_operator_id"))
@@ -0,0 +1,72 @@
+"""Add operation child tables (deposits, payments, proofs, logs)
+
+Revision ID: o1c2h3i4l5d6
+Revises: o1p2h3i4s5t6
+Create Date: 2026-10-19
+
+Copia indexada de client_deposits_json / client_payments_json /
+operator_proofs_json / modification_logs_json. Las filas se llenan con
+`flask backfill-operation-children` (o al arrancar la app, una vez).
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'o1c2h3i4l5d6'
+down_revision = 'o1p2h3i4s5t6'
+branch_labels = None
+depends_on    = None
+
+_TABLES = {
+    'operation_deposits': """
+        amount       NUMERIC(15, 2) NOT NULL DEFAULT 0,
+        qc_bank      VARCHAR(50),
+        account      VARCHAR(200),
+        bank_key     VARCHAR(20) NOT NULL DEFAULT '',
+        external     BOOLEAN NOT NULL DEFAULT FALSE,
+        reference    VARCHAR(100),""",
+    'operation_payments': """
+        amount       NUMERIC(15, 2) NOT NULL DEFAULT 0,
+        qc_bank      VARCHAR(50),
+        account      VARCHAR(200),
+        bank_key     VARCHAR(20) NOT NULL DEFAULT '',
+        external     BOOLEAN NOT NULL DEFAULT FALSE,""",
+    'operation_proofs': """
+        url          VARCHAR(500),
+        comment      TEXT,""",
+    'operation_logs': """
+        logged_at    TIMESTAMP WITHOUT TIME ZONE,
+        user_id      INTEGER,
+        field        VARCHAR(100),""",
+}
+
+
+def upgrade():
+    conn = op.get_bind()
+    for table, columns in _TABLES.items():
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id           SERIAL PRIMARY KEY,
+                operation_id INTEGER NOT NULL REFERENCES operations(id) ON DELETE CASCADE,
+                position     INTEGER NOT NULL,{columns}
+                data         TEXT NOT NULL DEFAULT '{{}}'
+            )
+        """))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_operation_id ON {table} (operation_id)"
+        ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_operation_deposits_bank ON operation_deposits (bank_key, operation_id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_operation_payments_bank ON operation_payments (bank_key, operation_id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_operation_logs_user ON operation_logs (user_id, logged_at)"
+    ))
+
+
+def downgrade():
+    conn = op.get_bind()
+    for table in reversed(list(_TABLES)):
+        conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+    conn.execute(text("DELETE FROM system_config WHERE key = 'OPERATION_CHILDREN_READY'"))
@@ -0,0 +1,33 @@
+"""Add operation_code_seq for EXP-NNNN operation codes
+
+Revision ID: o1c2o3d4e5s6
+Revises: o1c2h3i4l5d6
+Create Date: 2026-10-19
+
+Operation.generate_operation_id() toma el número de nextval() en lugar de
+leer el último código; la secuencia arranca en el mayor EXP-NNNN existente.
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'o1c2o3d4e5s6'
+down_revision = 'o1c2h3i4l5d6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text("CREATE SEQUENCE IF NOT EXISTS operation_code_seq MINVALUE 1000 START 1000"))
+    conn.execute(text("""
+        SELECT setval('operation_code_seq', GREATEST(
+            (SELECT COALESCE(MAX(CAST(substring(operation_id FROM '^EXP-([0-9]+)$') AS BIGINT)), 1000)
+               FROM operations),
+            (SELECT last_value FROM operation_code_seq)
+        ), true)
+    """))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP SEQUENCE IF EXISTS operation_code_seq"))
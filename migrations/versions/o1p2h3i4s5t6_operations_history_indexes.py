@@ -0,0 +1,33 @@
+"""Add keyset indexes for the operations history
+
+Revision ID: o1p2h3i4s5t6
+Revises: a1c2c3t4o5t6
+Create Date: 2026-10-19
+
+El historial se pagina por (created_at, id) descendente; los Trader lo ven
+acotado a sus clientes, de ahí el índice por client_id.
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'o1p2h3i4s5t6'
+down_revision = 'a1c2c3t4o5t6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_operations_created_id ON operations (created_at, id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_operations_client_created_id "
+        "ON operations (client_id, created_at, id)"
+    ))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP INDEX IF EXISTS ix_operations_client_created_id"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_operations_created_id"))
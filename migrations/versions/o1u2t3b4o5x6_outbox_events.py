@@ -0,0 +1,48 @@
+"""Add outbox_events for operation side effects
+
+Revision ID: o1u2t3b4o5x6
+Revises: o1a2s3s4i5g6
+Create Date: 2026-10-19
+
+Los efectos de completar / enviar a proceso una operación (asiento, saldos,
+factura, email, WhatsApp, notificaciones, compliance) se graban aquí en la
+misma transacción y los ejecuta app/services/outbox.py.
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'o1u2t3b4o5x6'
+down_revision = 'o1a2s3s4i5g6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS outbox_events (
+            id              SERIAL PRIMARY KEY,
+            topic           VARCHAR(60) NOT NULL,
+            idempotency_key VARCHAR(160) NOT NULL UNIQUE,
+            group_key       VARCHAR(80) NOT NULL,
+            operation_id    INTEGER REFERENCES operations(id) ON DELETE CASCADE,
+            payload_json    TEXT NOT NULL DEFAULT '{}',
+            status          VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+            attempts        INTEGER NOT NULL DEFAULT 0,
+            available_at    TIMESTAMP NOT NULL,
+            locked_at       TIMESTAMP,
+            last_error      TEXT,
+            created_at      TIMESTAMP NOT NULL,
+            processed_at    TIMESTAMP
+        )
+    """))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_outbox_events_status_available ON outbox_events (status, available_at)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_outbox_events_group ON outbox_events (group_key, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_outbox_events_operation_id ON outbox_events (operation_id)"))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP TABLE IF EXISTS outbox_events"))
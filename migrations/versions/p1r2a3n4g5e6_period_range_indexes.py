@@ -0,0 +1,42 @@
+"""Composite indexes for sargable period filters
+
+Revision ID: p1r2a3n4g5e6
+Revises: a1p2b3a4l5s6
+Create Date: 2026-10-19
+
+Los filtros por período pasan de extract(year/month) a rangos semiabiertos
+(app.utils.periods), que sí pueden usar índices sobre la fecha:
+  - journal_entries (status, entry_date)
+  - journal_entry_lines (account_code, journal_entry_id)
+  - expense_records (expense_date)
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 'p1r2a3n4g5e6'
+down_revision = 'a1p2b3a4l5s6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_je_status_date "
+        "ON journal_entries (status, entry_date)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_jel_account_entry "
+        "ON journal_entry_lines (account_code, journal_entry_id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_expense_records_expense_date "
+        "ON expense_records (expense_date)"
+    ))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP INDEX IF EXISTS ix_expense_records_expense_date"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_jel_account_entry"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_je_status_date"))
@@ -0,0 +1,35 @@
+"""Add scheduler_leases for single-worker background jobs
+
+Revision ID: s1c2h3l4e5a6
+Revises: o1c2o3d4e5s6
+Create Date: 2026-10-19
+
+Cada loop en segundo plano (mercado, FX monitor, expiración, lead hunter,
+agentes) corre solo en el worker que tiene su lease vigente; ver
+app/services/scheduler_coordinator.py.
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision      = 's1c2h3l4e5a6'
+down_revision = 'o1c2o3d4e5s6'
+branch_labels = None
+depends_on    = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS scheduler_leases (
+            job         VARCHAR(80) PRIMARY KEY,
+            holder      VARCHAR(120) NOT NULL,
+            acquired_at TIMESTAMP NOT NULL,
+            renewed_at  TIMESTAMP NOT NULL,
+            expires_at  TIMESTAMP NOT NULL
+        )
+    """))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP TABLE IF EXISTS scheduler_leases"))
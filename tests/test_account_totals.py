@@ -0,0 +1,65 @@
+"""
+Totales por período y prefijo PCGE (app/services/accounting/account_totals.py).
+
+  - prefixes(): rollups de 1 a 4 dígitos + la cuenta exacta.
+  - sums() sobre expand() da lo mismo que SUM ... WHERE account_code LIKE
+    'prefix%', para prefijos cortos (rollup) y largos (cuentas exactas), y
+    filtrando por entry_type.
+  - upsert_rows(): filas en orden de clave de conflicto, sin importar el
+    orden de las líneas del asiento (evita interbloqueos entre asientos).
+"""
+import os
+import importlib.util
+import random
+from decimal import Decimal
+
+# Cargar account_totals.py directamente (evita ejecutar app/__init__.py con Flask/eventlet)
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'app', 'services', 'accounting', 'account_totals.py')
+_spec = importlib.util.spec_from_file_location('account_totals', _path)
+account_totals = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(account_totals)
+
+D = Decimal
+
+
+def test_prefixes_rollup_levels():
+    assert account_totals.prefixes('104101') == [
+        ('1', False), ('10', False), ('104', False), ('1041', False), ('104101', True)]
+    assert account_totals.prefixes('121') == [
+        ('1', False), ('12', False), ('121', False), ('121', True)]
+
+
+def test_sums_match_like_prefix():
+    rnd = random.Random(7)
+    codes = ['1011', '1041', '104101', '104102', '121', '1213', '4211', '6391', '6762', '6814', '7711']
+    types = ['operacion_completada', 'gasto', 'calce_netting', 'depreciacion']
+    lines = [(rnd.choice(codes), rnd.choice(types),
+              D(rnd.randint(0, 50000)) / 100, D(rnd.randint(0, 50000)) / 100)
+             for _ in range(400)]
+    totals = account_totals.expand(lines)
+
+    def like(prefix, entry_types=None):
+        sel = [l for l in lines if l[0].startswith(prefix)
+               and (entry_types is None or l[1] in entry_types)]
+        return sum((l[2] for l in sel), D('0')), sum((l[3] for l in sel), D('0'))
+
+    for prefix in ('1', '10', '104', '1041', '10410', '104101', '12', '121', '6', '68', '7'):
+        assert account_totals.sums(totals, prefix) == like(prefix)
+    assert account_totals.sums(totals, '6', entry_types=('gasto',)) == like('6', ('gasto',))
+    assert account_totals.saldo(totals, '7', 'acreedora') == like('7')[1] - like('7')[0]
+
+    cuentas = account_totals.accounts(totals)
+    assert {code for code, _ in cuentas} == set(codes)
+
+
+def test_upsert_rows_sorted_by_conflict_key():
+    a = account_totals.expand([('6814', 'gasto', D('10'), D('0')), ('1041', 'gasto', D('0'), D('10'))])
+    b = account_totals.expand([('1041', 'gasto', D('0'), D('10')), ('6814', 'gasto', D('10'), D('0'))])
+    assert list(a) != list(b)
+
+    rows_a = account_totals.upsert_rows(2026, 10, a)
+    rows_b = account_totals.upsert_rows(2026, 10, b, sign=-1)
+    keys = [(r['entry_type'], r['prefix'], r['is_account']) for r in rows_a]
+    assert keys == sorted(keys) == [(r['entry_type'], r['prefix'], r['is_account']) for r in rows_b]
+    assert rows_b[-1]['debe'] == -rows_a[-1]['debe'] and rows_a[0]['year'] == 2026
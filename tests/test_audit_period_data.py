@@ -0,0 +1,104 @@
+"""
+Modelo del período del AuditEngine (app/services/audit/period_data.py).
+
+  - run_parallel(): una tarea que falla no interrumpe a las demás y todas
+    quedan medidas.
+  - asiento_observado(): también compara cabecera vs Σ de líneas.
+  - sum_lines() / totals_by_account() reproducen los SUM ... LIKE 'prefix%'
+    que el Estado de Resultados hacía contra la base.
+"""
+import os
+import importlib.util
+import time
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+# Cargar period_data.py directamente (evita ejecutar app/__init__.py con Flask/eventlet)
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'app', 'services', 'audit', 'period_data.py')
+_spec = importlib.util.spec_from_file_location('period_data', _path)
+period_data = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(period_data)
+
+D = Decimal
+
+
+def _boom():
+    raise RuntimeError('sin conexión')
+
+
+def test_run_parallel_isolates_errors_and_times_every_task():
+    tasks = {
+        'a':    lambda: 1,
+        'slow': lambda: time.sleep(0.02) or 2,
+        'bad':  _boom,
+    }
+    results, errors, timings = period_data.run_parallel(tasks, max_workers=3)
+
+    assert results == {'a': 1, 'slow': 2}
+    assert set(errors) == {'bad'} and 'sin conexión' in str(errors['bad'])
+    assert set(timings) == {'a', 'slow', 'bad'}
+    assert timings['slow'] >= 15
+
+
+def test_run_parallel_runs_tasks_concurrently():
+    tasks = {f't{i}': (lambda: time.sleep(0.05)) for i in range(3)}
+    t0 = time.perf_counter()
+    period_data.run_parallel(tasks, max_workers=3)
+    assert time.perf_counter() - t0 < 0.12
+
+
+@pytest.fixture
+def data():
+    d = period_data.AuditPeriodData(year=2026, month=3, audit_date=date(2026, 3, 31))
+    d.line_totals = {
+        ('7711', 'operacion'):      (D('10.00'),  D('500.00')),
+        ('7711', 'calce_netting'):  (D('0'),      D('50.00')),
+        ('6762', 'calce_netting'):  (D('80.00'),  D('0')),
+        ('6361', 'gasto'):          (D('120.00'), D('20.00')),
+        ('6814', 'depreciacion'):   (D('30.00'),  D('0')),
+        ('1041', 'operacion'):      (D('999.00'), D('1.00')),
+    }
+    return d
+
+
+def test_sum_lines_prefix_and_entry_types(data):
+    assert data.sum_lines('7', 'haber') == D('550.00')
+    assert data.sum_lines('7', 'debe') == D('10.00')
+    assert data.sum_lines('6762', 'debe', entry_types=('calce_netting',)) == D('80.00')
+    assert data.sum_lines('6', 'debe', entry_types=('gasto', 'manual')) == D('120.00')
+    assert data.sum_lines('6', 'debe', excluir='6762') == D('150.00')
+
+
+def test_totals_by_account_merges_entry_types(data):
+    assert data.totals_by_account('7') == {'7711': (D('10.00'), D('550.00'))}
+    assert set(data.totals_by_account('6')) == {'6762', '6361', '6814'}
+
+
+def test_loaded_reflects_loader_errors(data):
+    data.errors = {'cierre': RuntimeError('x')}
+    assert data.loaded('entries', 'line_totals')
+    assert not data.loaded('entries', 'cierre')
+
+
+def test_flag_predicates_used_for_pending_items():
+    PE, PX = period_data.PeriodEntry, period_data.PeriodExpense
+    ok = PE(1, 'A-1', date(2026, 3, 2), 'operacion', 'operation', 7, '', D('10'), D('10'), True)
+    off = PE(2, 'A-2', date(2026, 3, 2), 'manual', None, None, '', D('10'), D('9.5'))
+    orphan = PE(3, 'A-3', date(2026, 3, 2), 'operacion', 'operation', 8, '', D('5'), D('5'), False)
+    assert [period_data.asiento_observado(e) for e in (ok, off, orphan)] == [False, True, True]
+
+    assert period_data.sin_comprobante(PX(1, None, None, 'servicio', D('50')))
+    assert not period_data.sin_comprobante(PX(2, None, None, 'tributo', D('50')))
+    assert not period_data.sin_comprobante(PX(3, 'F001-1', None, 'servicio', D('50')))
+
+
+def test_asiento_observado_checks_lines_against_header():
+    PE = period_data.PeriodEntry
+    args = (1, 'A-1', date(2026, 3, 2), 'manual', None, None, '')
+    ok       = PE(*args, D('10'), D('10'), None, D('10'), D('10'))
+    lineas   = PE(*args, D('10'), D('10'), None, D('10'), D('8'))
+    cabecera = PE(*args, D('10'), D('10'), None, D('12'), D('12'))
+    assert [period_data.asiento_observado(e) for e in (ok, lineas, cabecera)] == [False, True, True]
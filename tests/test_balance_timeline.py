@@ -0,0 +1,157 @@
+"""
+Saldos point-in-time del ledger (app/services/balance_timeline.py).
+
+  - checkpoint + deltas da el mismo saldo que el SUM completo.
+  - Editar el monto o la fecha de un movimiento anterior a un checkpoint, o
+    borrarlo, invalida los checkpoints afectados (listeners de BankMovement)
+    y el saldo vuelve a cuadrar con el SUM completo.
+  - Un movimiento insertado con fecha pasada también los invalida.
+  - counted(): los movimientos de un traslado anulado no cuentan.
+"""
+import os
+import importlib.util
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+sa = pytest.importorskip('sqlalchemy')
+from sqlalchemy.orm import Session, declarative_base
+
+# Cargar balance_timeline.py directamente (evita ejecutar app/__init__.py con Flask/eventlet)
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'app', 'services', 'balance_timeline.py')
+_spec = importlib.util.spec_from_file_location('balance_timeline', _path)
+bt = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(bt)
+
+Base = declarative_base()
+
+
+class Movement(Base):
+    __tablename__ = 'bank_movements'
+    id            = sa.Column(sa.Integer, primary_key=True)
+    bank_key      = sa.Column(sa.String(20), nullable=False)
+    currency      = sa.Column(sa.String(3), nullable=False)
+    amount        = sa.Column(sa.Numeric(15, 2), nullable=False)
+    movement_date = sa.Column(sa.DateTime, nullable=False)
+
+
+class Checkpoint(Base):
+    __tablename__ = 'bank_balance_checkpoints'
+    id               = sa.Column(sa.Integer, primary_key=True)
+    as_of            = sa.Column(sa.DateTime, nullable=False)
+    bank_key         = sa.Column(sa.String(20), nullable=False)
+    currency         = sa.Column(sa.String(3), nullable=False)
+    balance          = sa.Column(sa.Numeric(15, 2), nullable=False)
+    last_movement_id = sa.Column(sa.Integer, nullable=False)
+    movements_count  = sa.Column(sa.Integer, nullable=False)
+    created_at       = sa.Column(sa.DateTime)
+
+
+class Transfer(Base):
+    __tablename__ = 'internal_transfers'
+    id                  = sa.Column(sa.Integer, primary_key=True)
+    status              = sa.Column(sa.String(20), nullable=False)
+    movement_salida_id  = sa.Column(sa.Integer)
+    movement_entrada_id = sa.Column(sa.Integer)
+
+
+# Mismos listeners que app/models/bank_movement.py
+for _action in ('insert', 'update', 'delete'):
+    sa.event.listen(Movement, f'after_{_action}',
+                    lambda mapper, conn, target, _a=_action: bt.movement_changed(conn, target, _a))
+
+DAY = datetime(2026, 10, 1, 12, 0)
+CP  = datetime(2026, 10, 5, 23, 59, 59)
+
+
+@pytest.fixture
+def session():
+    engine = sa.create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as s:
+        s.add_all([Movement(bank_key='BCP', currency='USD', amount=Decimal(a),
+                            movement_date=DAY + timedelta(days=d))
+                   for a, d in (('1000', 0), ('-250', 2), ('400', 6))])
+        s.commit()
+        bt.write_checkpoint(s.connection(), CP)
+        s.commit()
+        yield s
+
+
+def _full_sum(s, ts):
+    return float(s.query(sa.func.sum(Movement.amount)).filter(
+        Movement.bank_key == 'BCP', Movement.currency == 'USD', Movement.movement_date <= ts).scalar() or 0)
+
+
+def _balance(s, ts):
+    return bt.ledger_balances(s.connection(), ts).get(('BCP', 'USD'), 0.0)
+
+
+def test_checkpoint_plus_deltas_matches_full_sum(session):
+    assert session.query(Checkpoint).one().balance == Decimal('750.00')
+    ts = DAY + timedelta(days=10)
+    assert _balance(session, ts) == _full_sum(session, ts) == 1150.0
+
+
+def test_editing_a_movement_before_the_checkpoint_invalidates_it(session):
+    mv = session.query(Movement).filter_by(amount=Decimal('-250')).one()
+    mv.amount = Decimal('-300')
+    session.commit()
+
+    assert session.query(Checkpoint).count() == 0
+    ts = DAY + timedelta(days=10)
+    assert _balance(session, ts) == _full_sum(session, ts) == 1100.0
+
+
+def test_moving_a_movement_across_the_checkpoint_and_deleting(session):
+    late = session.query(Movement).filter_by(amount=Decimal('400')).one()
+    late.movement_date = DAY + timedelta(days=1)          # ahora antes del checkpoint
+    session.commit()
+    assert session.query(Checkpoint).count() == 0
+    assert _balance(session, CP) == _full_sum(session, CP) == 1150.0
+
+    bt.write_checkpoint(session.connection(), CP)
+    session.delete(session.query(Movement).filter_by(amount=Decimal('1000')).one())
+    session.commit()
+    assert session.query(Checkpoint).count() == 0
+    assert _balance(session, CP) == 150.0
+
+
+def test_backdated_insert_invalidates_only_its_account(session):
+    session.add(Movement(bank_key='BCP', currency='PEN', amount=Decimal('10'), movement_date=DAY))
+    session.commit()
+    bt.write_checkpoint(session.connection(), CP + timedelta(days=1))
+    session.commit()
+
+    session.add(Movement(bank_key='BCP', currency='USD', amount=Decimal('5'), movement_date=DAY))
+    session.commit()
+    assert {(c.bank_key, c.currency) for c in session.query(Checkpoint)} == {('BCP', 'PEN')}
+    ts = DAY + timedelta(days=10)
+    assert _balance(session, ts) == _full_sum(session, ts) == 1155.0
+
+    # Un movimiento de hoy (posterior a todo checkpoint) no invalida nada
+    session.add(Movement(bank_key='BCP', currency='PEN', amount=Decimal('1'), movement_date=ts))
+    session.commit()
+    assert session.query(Checkpoint).count() == 1
+
+
+def test_annulled_transfer_movements_are_not_counted(session):
+    out = Movement(bank_key='BCP', currency='USD', amount=Decimal('-100'), movement_date=DAY)
+    inc = Movement(bank_key='BANBIF', currency='USD', amount=Decimal('100'), movement_date=DAY)
+    session.add_all([out, inc])
+    session.flush()
+    t = Transfer(status='activo', movement_salida_id=out.id, movement_entrada_id=inc.id)
+    session.add(t)
+    session.commit()
+    ts = DAY + timedelta(days=10)
+    assert _balance(session, ts) == 1050.0
+    assert bt.ledger_balances(session.connection(), ts)[('BANBIF', 'USD')] == 100.0
+
+    t.status = 'anulado'
+    bt.invalidate_checkpoints(session.connection(), DAY)
+    session.commit()
+    assert _balance(session, ts) == 1150.0
+    assert ('BANBIF', 'USD') not in bt.ledger_balances(session.connection(), ts)
+    assert session.query(sa.func.count(Movement.id)).filter(bt.counted(Movement.id)).scalar() == 3
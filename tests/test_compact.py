@@ -0,0 +1,58 @@
+"""
+Formato compacto de listas (app/utils/compact.py).
+
+  - parse_fields: ignora desconocidos y repetidos, '*' → todos, vacío → default.
+  - compact_payload: sin ?fields ni ?format → None (respuesta de siempre);
+    registros y columnar llevan los mismos valores, solo se llaman los getters
+    pedidos.
+"""
+import os
+import importlib.util
+
+# Cargar compact.py directamente (evita ejecutar app/__init__.py con Flask/eventlet)
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app', 'utils', 'compact.py')
+_spec = importlib.util.spec_from_file_location('compact', _path)
+compact = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(compact)
+
+
+_calls = []
+
+
+def _getter(name):
+    def fn(row):
+        _calls.append(name)
+        return row[name]
+    return fn
+
+
+GETTERS = {name: _getter(name) for name in ('id', 'operation_id', 'status', 'client_deposits')}
+DEFAULT = ('id', 'status')
+ROWS = [
+    {'id': 1, 'operation_id': 'EXP-1001', 'status': 'completado', 'client_deposits': [{'importe': 10}]},
+    {'id': 2, 'operation_id': 'EXP-1002', 'status': 'pendiente', 'client_deposits': []},
+]
+
+
+def test_parse_fields():
+    assert compact.parse_fields('status, foo,id,status', GETTERS, DEFAULT) == ['status', 'id']
+    assert compact.parse_fields('*', GETTERS, DEFAULT) == list(GETTERS)
+    assert compact.parse_fields('', GETTERS, DEFAULT) == ['id', 'status']
+    assert compact.parse_fields('foo,bar', GETTERS, DEFAULT) == ['id', 'status']
+
+
+def test_compact_payload_formats():
+    assert compact.compact_payload(ROWS, {}, GETTERS, DEFAULT) is None
+
+    _calls.clear()
+    rec = compact.compact_payload(ROWS, {'fields': 'operation_id,status'}, GETTERS, DEFAULT)
+    assert rec == {
+        'format': 'compact', 'v': compact.COMPACT_VERSION, 'fields': ['operation_id', 'status'],
+        'records': [{'operation_id': 'EXP-1001', 'status': 'completado'},
+                    {'operation_id': 'EXP-1002', 'status': 'pendiente'}],
+    }
+    assert 'client_deposits' not in _calls
+
+    col = compact.compact_payload(ROWS, {'format': 'columnar'}, GETTERS, DEFAULT)
+    assert col['format'] == 'columnar' and col['fields'] == ['id', 'status']
+    assert col['rows'] == [[1, 'completado'], [2, 'pendiente']]
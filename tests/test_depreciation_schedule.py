@@ -0,0 +1,61 @@
+"""
+Cronograma de depreciación (app/services/accounting/depreciation_schedule.py).
+
+  - Las cuotas suman exactamente costo − residual − acumulado: la última
+    absorbe el redondeo y el valor neto termina en el residual.
+  - El cronograma retoma desde lo ya contabilizado (meses y acumulado) y
+    cruza el cambio de año.
+"""
+import os
+import importlib.util
+from decimal import Decimal
+
+# Cargar depreciation_schedule.py directamente (evita ejecutar app/__init__.py con Flask/eventlet)
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'app', 'services', 'accounting', 'depreciation_schedule.py')
+_spec = importlib.util.spec_from_file_location('depreciation_schedule', _path)
+ds = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ds)
+
+D = Decimal
+
+
+def _state(**kw):
+    base = dict(asset_id=1, deprec_account='3961', cost=D('1000.00'), residual=D('0'),
+                monthly=D('333.3333'), remaining_months=3, accumulated=D('0'),
+                start=ds.month_index(2026, 1))
+    base.update(kw)
+    return ds.AssetState(**base)
+
+
+def test_last_instalment_absorbs_rounding():
+    assert ds.cuotas(_state()) == [D('333.33'), D('333.33'), D('333.34')]
+
+    # Cuota redondeada hacia arriba: no se pasa del valor residual
+    s = _state(cost=D('101.00'), residual=D('1.00'), monthly=D('33.3350'))
+    amounts = ds.cuotas(s)
+    assert amounts == [D('33.34'), D('33.34'), D('33.32')]
+    rows = ds.compute_schedule([s])
+    assert rows[-1]['net_book_value'] == D('1.00')
+
+    assert ds.cuotas(_state(accumulated=D('1000.00'))) == []
+    assert ds.cuotas(_state(remaining_months=0)) == []
+
+
+def test_schedule_resumes_from_posted_state_across_years():
+    s1 = _state(cost=D('4800.00'), monthly=D('100.0000'), remaining_months=46,
+                accumulated=D('200.00'), start=ds.month_index(2026, 11))
+    s2 = _state(asset_id=2, deprec_account='3951', cost=D('600.00'), monthly=D('5.0000'),
+                remaining_months=120, start=ds.month_index(2027, 3))
+    rows = ds.compute_schedule([s1, s2])
+
+    a1 = [r for r in rows if r['asset_id'] == 1]
+    assert len(a1) == 46
+    assert [(r['year'], r['month']) for r in a1[:3]] == [(2026, 11), (2026, 12), (2027, 1)]
+    assert a1[0]['accumulated'] == D('300.00') and a1[0]['net_book_value'] == D('4500.00')
+    assert a1[-1]['net_book_value'] == D('0.00')
+    assert (a1[-1]['year'], a1[-1]['month']) == (2030, 8)
+
+    a2 = [r for r in rows if r['asset_id'] == 2]
+    assert sum(r['amount'] for r in a2) == D('600.00')
+    assert {r['deprec_account'] for r in a2} == {'3951'}
@@ -0,0 +1,89 @@
+"""
+Motor de expiración por deadline (app/services/expiry_engine.py).
+
+  - DeadlineHeap: orden por deadline, reprogramar / descartar sin dejar
+    entradas vivas duplicadas.
+  - ExpiryEngine: despierta al vencer el deadline (no al idle), y un deadline
+    más próximo registrado mientras espera lo despierta antes.
+  - Dispatcher: un handler que falla no detiene al worker.
+"""
+import os
+import time
+import threading
+import importlib.util
+from datetime import datetime, timedelta
+
+# Cargar expiry_engine.py directamente (evita ejecutar app/__init__.py con Flask/eventlet)
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'app', 'services', 'expiry_engine.py')
+_spec = importlib.util.spec_from_file_location('expiry_engine', _path)
+ee = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ee)
+
+T0 = datetime(2026, 10, 19, 10, 0)
+
+
+def test_heap_orders_and_reschedules():
+    h = ee.DeadlineHeap()
+    assert h.push(1, T0 + timedelta(minutes=15)) is True
+    assert h.push(2, T0 + timedelta(minutes=5)) is True
+    assert h.push(3, T0 + timedelta(minutes=10)) is False
+    h.push(2, T0 + timedelta(minutes=20))          # reprogramada: la entrada vieja se ignora
+    h.discard(3)
+    assert len(h) == 2
+    assert h.next_deadline() == T0 + timedelta(minutes=15)
+    assert h.pop_due(T0 + timedelta(minutes=16)) == [1]
+    assert h.pop_due(T0 + timedelta(minutes=30)) == [2]
+    assert h.next_deadline() is None and len(h) == 0
+
+
+def _run(engine):
+    t = threading.Thread(target=engine.run_forever, daemon=True)
+    t.start()
+    return t
+
+
+def test_engine_wakes_at_deadline_and_on_earlier_schedule():
+    calls = []
+    engine = ee.ExpiryEngine(expire=lambda now: calls.append(now) or [],
+                             load=lambda: [(1, datetime.now() + timedelta(seconds=30))],
+                             clock=datetime.now, idle_seconds=60)
+    t = _run(engine)
+    try:
+        time.sleep(0.05)
+        assert calls == []                         # espera el deadline de 30 s
+        deadline = datetime.now() + timedelta(seconds=0.2)
+        engine.schedule(2, deadline)               # más próximo: debe despertar antes
+        time.sleep(0.5)
+        assert len(calls) == 1
+        assert deadline <= calls[0] < deadline + timedelta(seconds=0.2)
+        assert engine.heap.next_deadline() is not None  # el de 30 s sigue programado
+    finally:
+        engine.stop()
+        t.join(1)
+
+
+def test_failed_expire_is_retried():
+    engine = ee.ExpiryEngine(expire=lambda now: 1 / 0, load=list,
+                             clock=lambda: T0, idle_seconds=60)
+    engine.heap.push(7, T0)
+    assert engine.tick() == []
+    assert engine.heap.next_deadline() == T0 + timedelta(seconds=ee.RETRY_SECONDS)
+
+
+def test_dispatcher_survives_handler_errors():
+    seen = []
+
+    def handler(item):
+        if item == 'boom':
+            raise RuntimeError(item)
+        seen.append(item)
+
+    d = ee.Dispatcher(handler)
+    t = threading.Thread(target=d.run_forever, daemon=True)
+    t.start()
+    for item in ('a', 'boom', 'b'):
+        d.submit(item)
+    d.stop()
+    t.join(1)
+    assert seen == ['a', 'b'] and not t.is_alive()
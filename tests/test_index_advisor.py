@@ -0,0 +1,92 @@
+"""
+Asesor de índices (app/services/index_advisor.py).
+
+  - fingerprint(): misma forma para distintos parámetros y largos de IN.
+  - predicates(): igualdad, IN, rango y ORDER BY contra parámetros/literales.
+  - propose(): orden de columnas, índice parcial para estados activos,
+    descarte de lo ya cubierto y fusión por prefijo.
+"""
+import os
+import json
+import importlib.util
+
+# Cargar index_advisor.py directamente (evita ejecutar app/__init__.py con Flask/eventlet)
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'app', 'services', 'index_advisor.py')
+_spec = importlib.util.spec_from_file_location('index_advisor', _path)
+ia = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ia)
+
+EXPIRY = ("SELECT operations.id FROM operations WHERE operations.status = %(status_1)s "
+          "AND operations.origen IN (%(origen_1_1)s, %(origen_1_2)s) AND operations.created_at > %(created_at_1)s")
+CLIENT = ("SELECT operations.id FROM operations WHERE operations.client_id = %(client_id_1)s "
+          "AND operations.status IN (%(status_1_1)s, %(status_1_2)s) ORDER BY operations.created_at DESC "
+          "LIMIT %(param_1)s")
+CLOSING = ("SELECT count(*) FROM operations WHERE operations.status = 'Completada' "
+           "AND operations.completed_at >= %(d1)s AND operations.completed_at < %(d2)s")
+
+
+def test_fingerprint_ignores_values():
+    a = ia.fingerprint("SELECT * FROM operations WHERE operations.id IN (%(a)s, %(b)s) AND x = 'v' LIMIT 5")
+    b = ia.fingerprint("SELECT *\n FROM operations WHERE operations.id IN (%(a)s) AND x = 'w' LIMIT 20")
+    assert a == b == "SELECT * FROM operations WHERE operations.id IN (...) AND x = ? LIMIT ?"
+
+
+def test_predicates():
+    p = ia.predicates(EXPIRY, params={'status_1': 'Pendiente'})
+    assert (p['eq'], p['in'], p['range']) == (['status'], ['origen'], ['created_at'])
+    assert p['values']['status'] == {'Pendiente'}
+
+    p = ia.predicates(CLIENT, params={'status_1_1': 'Pendiente', 'status_1_2': 'En proceso'})
+    assert (p['eq'], p['in'], p['order']) == (['client_id'], ['status'], ['created_at'])
+
+    join = ia.predicates("SELECT 1 FROM operations JOIN clients ON operations.client_id = clients.id")
+    assert join['eq'] == []
+
+
+def _capture(*queries):
+    cap = ia.QueryCapture()
+    for sql, params, ms in queries:
+        cap.record(sql, params, ms)
+    return json.loads(json.dumps(cap.shapes))
+
+
+def test_propose_composite_and_partial():
+    shapes = _capture(
+        (EXPIRY, {'status_1': 'Pendiente', 'origen_1_1': 'web', 'origen_1_2': 'app'}, 4.0),
+        (CLIENT, {'client_id_1': 7, 'status_1_1': 'Pendiente', 'status_1_2': 'En proceso'}, 2.0),
+        (CLOSING, {'d1': '2026-01-01', 'd2': '2026-02-01'}, 9.0),
+        (CLOSING.replace('< %(d2)s', '<= %(d2)s'), {'d1': '2026-01-01', 'd2': '2026-02-01'}, 1.0),
+        ("SELECT * FROM operations WHERE operations.client_id = %(c)s", {'c': 7}, 0.5),
+    )
+    got = [(p.columns, p.where, p.calls) for p in ia.propose(shapes, existing=[(('client_id',), None)])]
+    active = "status IN ('Pendiente', 'En proceso')"
+    assert got == [
+        (('status', 'completed_at'), None, 2),
+        (('origen', 'created_at'), active, 1),               # status único: sale de la clave
+        (('client_id', 'status', 'created_at'), active, 1),
+    ]
+
+    covered = ia.propose(shapes, existing=[(('client_id',), None), (('status', 'completed_at', 'id'), None),
+                                           (('origen', 'created_at'), active)])
+    assert [p.columns for p in covered] == [('client_id', 'status', 'created_at')]
+
+
+def test_ddl_and_predicate_normalization():
+    p = ia.IndexProposal('ix_operations_origen_created_at_activas', 'operations', ('origen', 'created_at'),
+                         "status IN ('Pendiente', 'En proceso')", 1, 1.0, [])
+    assert ia.ddl(p) == ("CREATE INDEX IF NOT EXISTS ix_operations_origen_created_at_activas ON operations "
+                         "(origen, created_at) WHERE status IN ('Pendiente', 'En proceso')")
+    pg = ("((status)::text = ANY ((ARRAY['Pendiente'::character varying, "
+          "'En proceso'::character varying])::text[]))")
+    assert ia._normalize_predicate(pg) == p.where
+
+
+def test_capture_save_accumulates(tmp_path):
+    path = str(tmp_path / 'consultas.json')
+    for _ in range(2):
+        cap = ia.QueryCapture()
+        cap.record(EXPIRY, {'status_1': 'Pendiente'}, 1.5)
+        cap.save(path)
+    (shape,) = ia.load_shapes(path).values()
+    assert shape['calls'] == 2 and shape['total_ms'] == 3.0
@@ -0,0 +1,87 @@
+"""
+Paginación por keyset (app/utils/keyset.py).
+
+  - Cursores: ida y vuelta, y tokens inválidos → primera página.
+  - Recorrer el Libro Diario hacia adelante y hacia atrás con seek() visita
+    cada asiento una sola vez, aun con varias filas en la misma fecha.
+  - estimate_count() fuera de PostgreSQL cuenta exacto.
+"""
+import os
+import importlib.util
+from datetime import date
+
+import pytest
+
+sa = pytest.importorskip('sqlalchemy')
+from sqlalchemy.orm import Session
+
+# Cargar keyset.py directamente (evita ejecutar app/__init__.py con Flask/eventlet)
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app', 'utils', 'keyset.py')
+_spec = importlib.util.spec_from_file_location('keyset', _path)
+keyset = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(keyset)
+
+
+_meta = sa.MetaData()
+journal_entries = sa.Table(
+    'journal_entries', _meta,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('entry_date', sa.Date, nullable=False),
+)
+
+
+@pytest.fixture
+def session():
+    engine = sa.create_engine('sqlite://')
+    _meta.create_all(engine)
+    with engine.begin() as conn:
+        # 3 asientos por día, ids intercalados entre fechas
+        rows = [{'id': i, 'entry_date': date(2026, 6, 1 + (i * 7) % 10)} for i in range(1, 31)]
+        conn.execute(journal_entries.insert(), rows)
+    with Session(engine) as s:
+        yield s
+
+
+def test_cursor_roundtrip_and_invalid_tokens():
+    token = keyset.encode_cursor((date(2026, 6, 15), 1234))
+    assert token == '2026-06-15~1234'
+    assert keyset.decode_cursor(token, (date, int)) == (date(2026, 6, 15), 1234)
+    for bad in ('', None, '2026-06-15', '2026-13-01~1', 'x~1', '2026-06-15~abc'):
+        assert keyset.decode_cursor(bad, (date, int)) is None
+
+
+def _page(session, cursor=None, backwards=False, limit=7):
+    je  = journal_entries.c
+    q   = session.query(je.entry_date, je.id)
+    if cursor is not None:
+        q = q.filter(keyset.seek((je.entry_date, je.id), cursor, backwards=backwards))
+    order = (je.entry_date.desc(), je.id.desc()) if backwards else (je.entry_date, je.id)
+    return keyset.page_window(q.order_by(*order).limit(limit + 1).all(), limit, backwards)
+
+
+def test_seek_walks_every_row_once_in_both_directions(session):
+    expected = sorted((r.entry_date, r.id) for r in session.query(journal_entries).all())
+
+    seen, cursor, pages = [], None, []
+    while True:
+        rows, more = _page(session, cursor)
+        pages.append(rows)
+        seen.extend((r.entry_date, r.id) for r in rows)
+        if not more:
+            break
+        cursor = (rows[-1].entry_date, rows[-1].id)
+    assert seen == expected
+    assert len(pages) == 5
+
+    # Desde la última página hacia atrás: las mismas filas, en el mismo orden
+    back, cursor = [], (pages[-1][0].entry_date, pages[-1][0].id)
+    while cursor is not None:
+        rows, more = _page(session, cursor, backwards=True)
+        back.insert(0, rows)
+        cursor = (rows[0].entry_date, rows[0].id) if more else None
+    assert [(r.entry_date, r.id) for p in back for r in p] == expected[:-len(pages[-1])]
+
+
+def test_estimate_count_is_exact_outside_postgres(session):
+    q = session.query(journal_entries).filter(journal_entries.c.entry_date >= date(2026, 6, 5))
+    assert keyset.estimate_count(q) == (q.count(), True)
@@ -0,0 +1,71 @@
+"""
+Tablas hijas de operaciones (app/services/operation_children.py).
+
+  - Los abonos/pagos se normalizan al banco de QoriCash desde qc_bank o, si
+    falta, desde la cuenta del cliente; un banco informado pero no
+    reconocido queda como external (position.py lo imputa a INTERBANK).
+  - Importes inválidos → 0, elementos que no son dict se ignoran, y el
+    elemento original se conserva completo en data.
+"""
+import os
+import json
+import importlib.util
+from datetime import datetime
+from decimal import Decimal
+
+# Cargar operation_children.py directamente (evita ejecutar app/__init__.py con Flask/eventlet)
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'app', 'services', 'operation_children.py')
+_spec = importlib.util.spec_from_file_location('operation_children', _path)
+oc = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(oc)
+
+
+def test_deposit_and_payment_rows_normalize_bank():
+    deposits = [
+        {'importe': 1000, 'qc_bank': 'BCP', 'cuenta_cargo': 'INTERBANK - 200-300'},
+        {'importe': '250.505', 'cuenta_cargo': 'Banco de Crédito - 191-22'},
+        {'importe': 'abc', 'cuenta_cargo': 'BBVA - 0011'},
+        {'importe': 10},
+        'basura',
+    ]
+    rows = oc.deposit_rows(deposits)
+    assert [(r['position'], r['bank_key'], r['external']) for r in rows] == [
+        (0, 'BCP', False), (1, 'BCP', False), (2, '', True), (3, '', False),
+    ]
+    assert [r['amount'] for r in rows] == [Decimal('1000.00'), Decimal('250.51'),
+                                           Decimal('0.00'), Decimal('10.00')]
+    assert json.loads(rows[0]['data']) == deposits[0]
+
+    pays = oc.payment_rows([{'importe': 3750, 'cuenta_destino': 'BanBif USD 007'}])
+    assert pays[0]['bank_key'] == 'BANBIF' and pays[0]['account'] == 'BanBif USD 007'
+    assert oc.FLOW[('payment', 'Compra')] == ('PEN', -1)
+
+
+def test_proof_and_log_rows():
+    proofs = oc.proof_rows([{'comprobante_url': 'https://x/1.png', 'comentario': 'ok'}])
+    assert proofs[0]['url'] == 'https://x/1.png' and proofs[0]['comment'] == 'ok'
+
+    logs = oc.log_rows([
+        {'fecha': '2026-10-19T10:30:00', 'usuario_id': 7, 'campo': 'status'},
+        {'fecha': 'ayer', 'usuario_id': 'x', 'campo': None},
+    ])
+    assert (logs[0]['logged_at'], logs[0]['user_id'], logs[0]['field']) == (
+        datetime(2026, 10, 19, 10, 30), 7, 'status')
+    assert (logs[1]['logged_at'], logs[1]['user_id'], logs[1]['field']) == (None, None, None)
+
+
+def test_attribute_side_from_json_mirrors_sql_rule():
+    rows = oc.deposit_rows([
+        {'importe': 600, 'qc_bank': 'BCP'},
+        {'importe': 100, 'qc_bank': 'BBVA'},
+        {'importe': 300, 'qc_bank': 'BCP'},
+        {'importe': 0, 'qc_bank': 'Interbank'},
+    ])
+    assert oc._attribute_side(rows, '') == [('BCP', 900.0)]
+    assert oc._attribute_side(rows, 'INTERBANK') == [('BCP', 900.0), ('INTERBANK', 100.0)]
+
+    # sin qc_bank o sin monto atribuible → fallback
+    assert oc._attribute_side(oc.deposit_rows([{'importe': 50, 'cuenta_cargo': 'BCP 191'}]), '') is None
+    assert oc._attribute_side(oc.deposit_rows([{'importe': 50, 'qc_bank': 'BBVA'}]), '') is None
+    assert oc._attribute_side([], 'INTERBANK') is None
@@ -0,0 +1,48 @@
+"""
+Asignación balanceada de operadores (app/services/operator_assignment.py).
+
+  - Menor carga relativa (load + 1) / capacidad; capacidad 0 excluye.
+  - Empates por turno: gana quien recibió una operación hace más tiempo.
+  - OPERATOR_CAPACITY inválido no rompe la asignación.
+"""
+import os
+import importlib.util
+
+# Cargar operator_assignment.py directamente (evita ejecutar app/__init__.py con Flask/eventlet)
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'app', 'services', 'operator_assignment.py')
+_spec = importlib.util.spec_from_file_location('operator_assignment', _path)
+oa = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(oa)
+
+
+def test_least_loaded_and_round_robin_ties():
+    rows = [(1, 2, 500), (2, 1, 900), (3, 1, 300)]
+    assert oa.pick_operator(rows) == 3                       # empate en 1: 3 recibió hace más
+    assert oa.pick_operator([(1, 0, 500), (2, 0, None)]) == 2  # nunca asignado va primero
+
+    # Simular envíos sucesivos con la misma carga: se turnan
+    loads, last, seq = {1: 0, 2: 0, 3: 0}, {1: None, 2: None, 3: None}, []
+    for op_id in range(1000, 1006):
+        chosen = oa.pick_operator([(o, 0, last[o]) for o in loads])
+        last[chosen] = op_id
+        seq.append(chosen)
+    assert seq == [1, 2, 3, 1, 2, 3]
+
+
+def test_weighted_by_capacity():
+    capacity = {1: 2, 2: 1, 3: 0}
+    loads = {1: 0, 2: 0, 3: 0}
+    last = {o: None for o in loads}
+    for op_id in range(1, 31):
+        chosen = oa.pick_operator([(o, loads[o], last[o]) for o in loads], capacity)
+        loads[chosen] += 1
+        last[chosen] = op_id
+    assert loads == {1: 20, 2: 10, 3: 0}
+    assert oa.pick_operator([(3, 0, None)], capacity) is None
+
+
+def test_parse_capacity():
+    assert oa.parse_capacity('{"5": 2, "9": "0.5", "x": 3, "7": "abc", "8": -1}') == {5: 2.0, 9: 0.5, 8: 1.0}
+    assert oa.parse_capacity('no-json') == {} and oa.parse_capacity(None) == {}
+    assert oa.parse_capacity('[1, 2]') == {}
@@ -0,0 +1,66 @@
+"""
+Cola de trabajo del operador (app/services/operator_queue.py).
+
+  - Tramos de alerta: a los 10, 20, 30... minutos en proceso.
+  - diff_for(): upsert al operador actual, remove al anterior.
+  - due_alerts(): una alerta por operación y tramo.
+"""
+import os
+import importlib.util
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+# Cargar operator_queue.py directamente (evita ejecutar app/__init__.py con Flask/eventlet)
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'app', 'services', 'operator_queue.py')
+_spec = importlib.util.spec_from_file_location('operator_queue', _path)
+oq = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(oq)
+
+SINCE = datetime(2026, 10, 19, 9, 0)
+
+
+def _op(op_id=1, operator=7, status='En proceso', since=SINCE):
+    client = SimpleNamespace(full_name='PEREZ ROJAS JUAN')
+    return SimpleNamespace(id=op_id, operation_id=f'EXP-{1000 + op_id}', status=status, client=client,
+                           operation_type='Compra', amount_usd=100, amount_pen=375.5,
+                           assigned_operator_id=operator, in_process_since=since)
+
+
+def test_alert_slots():
+    at = lambda minutes, seconds=0: SINCE + timedelta(minutes=minutes, seconds=seconds)
+    assert [oq.alert_slot(SINCE, at(m)) for m in (0, 9, 10, 19, 20, 35)] == [0, 0, 1, 1, 2, 3]
+    assert oq.next_alert(SINCE, at(3)) == at(10)
+    assert oq.next_alert(SINCE, at(10)) == at(20)        # justo al alertar: la siguiente
+    assert oq.next_alert(SINCE, at(29, 59)) == at(30)
+
+
+def test_entry_and_membership():
+    row = oq.entry(_op(), SINCE + timedelta(minutes=12))
+    assert row['time_in_process_minutes'] == 12 and row['overdue'] is True
+    assert row['client_name'] == 'PEREZ ROJAS JUAN' and row['amount_usd'] == 100.0
+    assert oq.belongs(_op()) and not oq.belongs(_op(status='Completada')) and not oq.belongs(_op(operator=None))
+
+
+def test_diff_on_reassign_and_completion():
+    row = oq.entry(_op(operator=8), SINCE)
+    diffs = oq.diff_for(1, row, {7, 8})                  # reasignada de 7 a 8
+    assert diffs[8] == {'type': 'diff', 'upsert': [row], 'remove': []}
+    assert diffs[7] == {'type': 'diff', 'upsert': [], 'remove': [1]}
+    assert oq.diff_for(1, None, {8}) == {8: {'type': 'diff', 'upsert': [], 'remove': [1]}}   # completada
+
+
+def test_due_alerts_once_per_slot():
+    now = SINCE + timedelta(minutes=10)
+    rows = [oq.entry(_op(1, 7), now), oq.entry(_op(2, 9, since=SINCE + timedelta(minutes=5)), now)]
+    by_operator, alerted = oq.due_alerts(rows, {})
+    assert [r['id'] for r in by_operator[7]] == [1] and 9 not in by_operator
+    assert alerted == {1: 1}
+
+    again, alerted = oq.due_alerts(rows, alerted)        # mismo tramo: no repite
+    assert again == {}
+
+    later = SINCE + timedelta(minutes=20)
+    rows = [oq.entry(_op(1, 7), later), oq.entry(_op(2, 9, since=SINCE + timedelta(minutes=5)), later)]
+    by_operator, alerted = oq.due_alerts(rows, alerted)
+    assert sorted(by_operator) == [7, 9] and alerted == {1: 2, 2: 1}
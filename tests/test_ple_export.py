@@ -0,0 +1,49 @@
+"""
+Exportador PLE (app/services/audit/ple_export.py).
+
+  - Cada línea del Libro Mayor (LE060100) tiene exactamente 21 campos, con
+    FechaContable, FechaOperacion, Glosa, Debe, Haber y Estado en su
+    posición; SUNAT rechaza el archivo completo si una línea se corre.
+"""
+import os
+import importlib.util
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+# Cargar ple_export.py directamente (evita ejecutar app/__init__.py con Flask/eventlet)
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'app', 'services', 'audit', 'ple_export.py')
+_spec = importlib.util.spec_from_file_location('ple_export', _path)
+ple = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ple)
+
+
+def _row(**kw):
+    base = dict(entry_number='AS-2026-0007', entry_date=date(2026, 10, 5), description='Compra USD',
+                status='activo', account_code='1041', line_desc='Egreso PEN | OP-1',
+                debe=Decimal('0'), haber=Decimal('3750.5'))
+    return SimpleNamespace(**{**base, **kw})
+
+
+def test_libro_mayor_line_has_21_fields_in_place():
+    line = ple._mayor_line(ple._periodo_str(2026, 10), 3, _row())
+    assert line.endswith('\r\n')
+    fields = line.rstrip('\r\n').split('|')
+
+    assert len(fields) == 21
+    assert fields[:4] == ['20261000', 'AS20260007', 'M000003', '1041']
+    assert fields[6] == 'PEN'
+    assert fields[12] == '05/10/2026'          # FechaContable
+    assert fields[13] == ''                    # FechaVencimiento
+    assert fields[14] == '05/10/2026'          # FechaOperacion
+    assert fields[15] == 'Egreso PEN   OP-1'   # Glosa (sin pipes)
+    assert fields[17:19] == ['0.00', '3750.50']
+    assert fields[20] == '1'
+
+
+def test_libro_mayor_annulled_line_uses_header_glosa():
+    fields = ple._mayor_line('20261000', 1, _row(status='anulado', line_desc=None)) \
+        .rstrip('\r\n').split('|')
+    assert len(fields) == 21
+    assert fields[15] == 'Compra USD' and fields[20] == '2'